@@ -0,0 +1,184 @@
+"""Admission control: public reads can't crowd out marshals' writes.
+
+During the finish rush spectators reload ``/results`` far more often than
+marshals submit entries, and every request holds a server thread. With
+``ADMISSION_ENABLED`` each request is put in a class before it runs:
+
+  write  logged-in users and every non-GET request; always admitted
+  read   anonymous GET requests; at most ``ADMISSION_READ_LIMIT`` at a time
+
+A read that finds all read slots taken waits in a bounded queue
+(``ADMISSION_READ_QUEUE`` requests, at most ``ADMISSION_READ_WAIT_MS``).
+When it can't get a slot it is shed: pages in ``ADMISSION_STALE_ENDPOINTS``
+get the last copy this process served (marked with ``X-Stale: 1``), anything
+else gets a 503 with ``Retry-After``. Keep ``ADMISSION_READ_LIMIT`` below the
+number of server threads, so there are always threads left for writes.
+
+Active and queued requests per class and the shed counts are on
+``/admin/admission``.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, current_app, g, request, session
+
+READ = 'read'
+WRITE = 'write'
+
+
+class Gate:
+    """A concurrency limit with a bounded wait queue; limit 0 admits everything."""
+
+    def __init__(self, limit=0, max_queue=0):
+        self.limit = limit
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.peak_active = 0
+        self.peak_waiting = 0
+        self.admitted = 0
+        self.shed = 0
+
+    def _admit(self):
+        self.active += 1
+        self.admitted += 1
+        self.peak_active = max(self.peak_active, self.active)
+        return True
+
+    def acquire(self, timeout):
+        """Take a slot, waiting up to timeout seconds; False when the request should be shed."""
+        with self._cond:
+            if not self.limit or self.active < self.limit:
+                return self._admit()
+            if self.waiting >= self.max_queue or timeout <= 0:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            try:
+                if self._cond.wait_for(lambda: self.active < self.limit, timeout):
+                    return self._admit()
+                self.shed += 1
+                return False
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {'limit': self.limit, 'active': self.active, 'waiting': self.waiting,
+                    'peak_active': self.peak_active, 'peak_waiting': self.peak_waiting,
+                    'admitted': self.admitted, 'shed': self.shed}
+
+
+class StaleCopies:
+    """The last successful response per URL, to hand out to readers that were shed."""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.served = 0
+        self._lock = threading.Lock()
+        self._copies = OrderedDict()
+
+    def put(self, key, body, mimetype):
+        with self._lock:
+            self._copies[key] = (body, mimetype)
+            self._copies.move_to_end(key)
+            while len(self._copies) > self.max_entries:
+                self._copies.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            copy = self._copies.get(key)
+            if copy is not None:
+                self.served += 1
+            return copy
+
+
+gates = {READ: Gate(), WRITE: Gate()}
+stale_copies = StaleCopies()
+
+
+def init_app(flask_app):
+    config = flask_app.config
+    config.setdefault('ADMISSION_ENABLED', os.environ.get('ADMISSION_ENABLED', '').lower() in ('1', 'true', 'yes'))
+    config.setdefault('ADMISSION_READ_LIMIT', int(os.environ.get('ADMISSION_READ_LIMIT', 8)))
+    config.setdefault('ADMISSION_READ_QUEUE', int(os.environ.get('ADMISSION_READ_QUEUE', 16)))
+    config.setdefault('ADMISSION_READ_WAIT_MS', float(os.environ.get('ADMISSION_READ_WAIT_MS', 500)))
+    config.setdefault('ADMISSION_RETRY_AFTER', int(os.environ.get('ADMISSION_RETRY_AFTER', 5)))
+    config.setdefault('ADMISSION_STALE_ENDPOINTS', ('results', 'leaderboard_api'))
+    flask_app.before_request(admit)
+    flask_app.after_request(keep_stale_copy)
+    flask_app.teardown_request(release)
+
+
+def classify():
+    """The admission class of the current request; None for requests that aren't limited."""
+    if request.endpoint in (None, 'static'):
+        return None
+    if session.get('user_id') or request.method not in ('GET', 'HEAD'):
+        return WRITE
+    return READ
+
+
+def _configure(config):
+    gate = gates[READ]
+    gate.limit = int(config['ADMISSION_READ_LIMIT'])
+    gate.max_queue = int(config['ADMISSION_READ_QUEUE'])
+
+
+def admit():
+    config = current_app.config
+    if not config.get('ADMISSION_ENABLED'):
+        return None
+    request_class = classify()
+    if request_class is None:
+        return None
+    _configure(config)
+    wait = float(config['ADMISSION_READ_WAIT_MS']) / 1000.0 if request_class == READ else 0
+    if gates[request_class].acquire(wait):
+        g.admission_class = request_class
+        return None
+    return shed_response()
+
+
+def shed_response():
+    retry_after = str(int(current_app.config['ADMISSION_RETRY_AFTER']))
+    copy = None
+    if request.endpoint in current_app.config['ADMISSION_STALE_ENDPOINTS']:
+        copy = stale_copies.get(request.full_path)
+    if copy is not None:
+        body, mimetype = copy
+        response = Response(body, mimetype=mimetype)
+        response.headers['X-Stale'] = '1'
+    else:
+        response = Response("Het is even te druk. Probeer het over een paar seconden opnieuw.\n",
+                            status=503, mimetype='text/plain')
+    response.headers['Retry-After'] = retry_after
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def keep_stale_copy(response):
+    if (g.get('admission_class') == READ and response.status_code == 200 and not response.is_streamed
+            and request.endpoint in current_app.config['ADMISSION_STALE_ENDPOINTS']):
+        stale_copies.put(request.full_path, response.get_data(), response.mimetype)
+    return response
+
+
+def release(e=None):
+    request_class = g.pop('admission_class', None)
+    if request_class is not None:
+        gates[request_class].release()
+
+
+def stats():
+    return {'enabled': bool(current_app.config.get('ADMISSION_ENABLED')),
+            'read': gates[READ].stats(), 'write': gates[WRITE].stats(),
+            'stale_served': stale_copies.served}
@@ -1,10 +1,31 @@
 import sqlite3
 import click # For CLI commands
-from flask import Flask, render_template, request, redirect, url_for, g, current_app, session # Added session
+from flask import Flask, render_template, request, redirect, url_for, g, current_app, session, send_from_directory, flash, jsonify # Added session
 from datetime import datetime
 import os # Import os module
 from functools import wraps # Added wraps
 from werkzeug.security import check_password_hash, generate_password_hash
+import profiling
+import purge
+import admission
+import archive
+import backup
+import cache
+import checkpoints
+import leaderboard
+import listing
+import maintenance
+import participants
+import pings
+import replica
+import repositories
+import scoring
+import search
+import seasons
+import shards
+import splits
+import tracks
+import writer
 
 app = Flask(__name__)
 
@@ -15,33 +36,227 @@ app.secret_key = os.environ.get('FLASK_SECRET_KEY', os.urandom(24))
 database_actual_path = os.environ.get('DATABASE_PATH', 'foxhunt.db')
 app.config.setdefault('DATABASE_FILENAME', database_actual_path) # Use determined path
 app.config.setdefault('MAX_ODOMETER_READING', 1000) # Changed to int
+# Group commit: batch concurrent entry writes into one transaction (see writer.py)
+app.config.setdefault('GROUP_COMMIT_ENABLED', os.environ.get('GROUP_COMMIT_ENABLED', '1').lower() in ('1', 'true', 'yes'))
+app.config.setdefault('GROUP_COMMIT_MAX_BATCH', int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 100)))
+app.config.setdefault('GROUP_COMMIT_MAX_DELAY_MS', float(os.environ.get('GROUP_COMMIT_MAX_DELAY_MS', 5)))
+app.config.setdefault('GROUP_COMMIT_TIMEOUT', 30)
+# Completed vossenjachten moved out of the hot database by `flask archive-hunts` (see archive.py)
+app.config.setdefault('ARCHIVE_DATABASE', os.environ.get('ARCHIVE_DATABASE_PATH', os.path.join(os.path.dirname(os.path.abspath(database_actual_path)), 'archive.db')))
+# Season points for dense rank 1, 2, 3, ... in each vossenjacht of a season
+app.config.setdefault('SEASON_POINTS', seasons.parse_points_scheme(os.environ.get('SEASON_POINTS')))
 
 
 def get_db():
     if 'db' not in g:
-        db_path = current_app.config.get('DATABASE', current_app.config['DATABASE_FILENAME'])
+        # The shard for this request's hunt or club; the main database when sharding is off (see shards.py)
+        g.shard_key = shards.current_key(current_app.config)
+        db_path = shards.shard_path(current_app.config, g.shard_key)
         g.db = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
         g.db.row_factory = sqlite3.Row
         g.db.execute("PRAGMA foreign_keys = ON;") # Enforce FKs for every connection
+        if g.shard_key is not None:
+            shards.prepare(g.db, current_app.config, db_path)
     return g.db
 
+def memory_backend():
+    return current_app.config['REPOSITORY_BACKEND'] == 'memory'
+
+def get_repositories(db=None):
+    # Entries, vossenjachten, users, participants, seasons and checkpoints of this request's database (see repositories.py)
+    if memory_backend():
+        # The database served from RAM: loaded into this process once, changes are not written back
+        db = get_db() # Resolves this request's shard
+        store = repositories.get_store(shards.shard_path(current_app.config, g.shard_key), db)
+        return repositories.memory(store, current_app.config['SEASON_POINTS'])
+    return repositories.sqlite(db if db is not None else get_db(), points_scheme=current_app.config['SEASON_POINTS'],
+                               archive_path=current_app.config['ARCHIVE_DATABASE'])
+
+class HuntWrite:
+    # A write job for run_write that changes entries of the given vossenjachten
+    def __init__(self, fn, hunt_ids=()):
+        self.fn = fn
+        self.hunt_ids = tuple(hunt_id for hunt_id in hunt_ids if hunt_id is not None)
+        self.app = None # Set when the job runs on the writer thread, which has no app context of its own
+
+    def __call__(self, conn):
+        if self.app is None:
+            return self.fn(conn)
+        with self.app.app_context():
+            return self.fn(conn)
+
+def get_read_db():
+    # Public pages read from the read-only replica when enabled; logged-in users keep using the
+    # primary so they always see their own writes
+    if session.get('user_id') or shards.current_key(current_app.config) is not None:
+        return get_db()
+    current_replica = replica.get_replica(current_app.config)
+    if current_replica is None or not current_replica.is_ready():
+        return get_db()
+    if 'read_db' not in g:
+        g.read_db = current_replica.connect()
+        g.replica_lag = current_replica.lag_seconds()
+        g.replica_refreshed_at = current_replica.refreshed_at
+    return g.read_db
+
+def mark_replica_dirty():
+    current_replica = replica.get_replica(current_app.config)
+    if current_replica is not None:
+        current_replica.mark_dirty()
+
+def refresh_hunts(conn, hunt_ids):
+    # Keep the stored per-hunt ranks and season standings in sync; runs inside the write transaction
+    if memory_backend():
+        return # The memory store re-ranks on every change and computes season standings when read
+    for vj_id in sorted(set(hunt_ids)):
+        scoring.recompute_hunt_ranks(conn, vj_id)
+        seasons.update_hunt_points(conn, vj_id, current_app.config['SEASON_POINTS'])
+    # Tells the caches of every worker which hunts changed (see cache.py)
+    cache.bump(conn, hunt_ids)
+
+def get_hunt_cache():
+    # This process's cache for the request's database, checked for other connections' writes once per request.
+    # None when caching is off, and for replica reads, which lag behind the versions the cache follows.
+    if 'hunt_cache' not in g:
+        get_db()
+        g.hunt_cache = None
+        # The memory backend answers from RAM already
+        if 'read_db' not in g and not memory_backend():
+            g.hunt_cache = cache.get_cache(shards.shard_path(current_app.config, g.shard_key))
+            if g.hunt_cache is not None:
+                g.hunt_cache.check()
+    return g.hunt_cache
+
+def cached(key, hunt_id, compute):
+    # compute() through the hunt cache; hunt_id None for values that span all hunts
+    hunt_cache = get_hunt_cache()
+    if hunt_cache is None:
+        return compute()
+    return hunt_cache.get_or_set(key, hunt_id, compute)
+
+def _refresh_hunts_before_commit(conn, done):
+    # Writer hook: recompute each touched hunt once per batch instead of once per entry
+    hunt_ids = set()
+    for job, _ in done:
+        hunt_ids.update(getattr(job, 'hunt_ids', ()))
+    refresh_hunts(conn, hunt_ids)
+
+def get_entry_writer():
+    # In-memory databases are private to one connection, so they can't use the writer thread
+    get_db() # Resolves (and migrates) this request's shard
+    db_path = shards.shard_path(current_app.config, g.shard_key)
+    if not current_app.config.get('GROUP_COMMIT_ENABLED') or db_path == ':memory:':
+        return None
+    # One writer per shard file, so a busy club doesn't queue behind another
+    attach = {shards.CATALOG_SCHEMA: shards.catalog_path(current_app.config)} if g.shard_key is not None else None
+    entry_writer = writer.get_writer(db_path,
+                                     max_batch=current_app.config['GROUP_COMMIT_MAX_BATCH'],
+                                     max_delay=current_app.config['GROUP_COMMIT_MAX_DELAY_MS'] / 1000.0,
+                                     attach=attach)
+    if not getattr(entry_writer, 'refresh_hook_installed', False):
+        flask_app = current_app._get_current_object()
+        def refresh_in_app_context(conn, done):
+            # The writer thread has no app context of its own
+            with flask_app.app_context():
+                _refresh_hunts_before_commit(conn, done)
+        def mark_replica_in_app_context(done):
+            with flask_app.app_context():
+                mark_replica_dirty()
+        entry_writer.before_commit_hooks.append(refresh_in_app_context)
+        entry_writer.after_commit_hooks.append(mark_replica_in_app_context)
+        entry_writer.refresh_hook_installed = True
+    return entry_writer
+
+def run_write(job, hunt_ids=()):
+    # Runs job(conn) and returns its result once committed, through the group-commit writer when enabled
+    if memory_backend():
+        # Applied to the memory store right away; nothing is written to SQLite
+        return job(None)
+    job = HuntWrite(job, hunt_ids)
+    entry_writer = get_entry_writer()
+    if entry_writer is None:
+        db = get_db()
+        try:
+            result = job(db)
+            refresh_hunts(db, job.hunt_ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        mark_replica_dirty()
+        return result
+    # Jobs build their repositories from the app config (get_repositories)
+    job.app = current_app._get_current_object()
+    return entry_writer.submit(job).result(timeout=current_app.config['GROUP_COMMIT_TIMEOUT'])
+
+def start_purge(kind, target, fn):
+    # Runs fn(db, job) as a chunked purge in the background (see purge.py); in-memory databases purge right away
+    db = get_db()
+    db_path = shards.shard_path(current_app.config, g.shard_key)
+    job = purge.PurgeJob(kind, target, fn, db_path, vacuum_pages=int(current_app.config['PURGE_VACUUM_PAGES']),
+                         pause=float(current_app.config['PURGE_PAUSE_MS']) / 1000.0, user_id=session.get('user_id'))
+    purger = purge.get_purger(current_app._get_current_object())
+    if db_path == ':memory:':
+        return purger.run_now(job, db)
+    return purger.submit(job)
+
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
         db.close()
-
-def init_db():
-    db = get_db()
-    # Enable foreign key support
-    db.execute("PRAGMA foreign_keys = ON;")
-    db.executescript('''
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        read_db.close()
+
+def add_replica_headers(response):
+    # Lets clients (and monitoring) see how far behind a replica-served page is
+    if 'replica_lag' in g:
+        response.headers['X-Replica-Lag'] = f"{g.replica_lag:.1f}"
+    return response
+
+def inject_replica_status():
+    if 'replica_refreshed_at' not in g:
+        return {}
+    return {'replica_status': {
+        'refreshed_at': datetime.fromtimestamp(g.replica_refreshed_at).strftime('%H:%M:%S'),
+        'lag_seconds': int(g.replica_lag),
+    }}
+
+USERS_SCHEMA_SQL = '''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
             password_hash TEXT NOT NULL,
             role TEXT NOT NULL CHECK (role IN ('admin', 'moderator'))
         );
+'''
 
+# The listing sort columns are NOT NULL, so keyset pages compare and seek on the raw indexed columns
+# (see listing.py); migrate_db rebuilds tables created while they were nullable
+ENTRIES_SCHEMA_SQL = '''
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            start_km REAL NOT NULL,
+            end_km REAL NOT NULL,
+            arrival_time_last_fox TEXT NOT NULL,
+            calculated_km REAL NOT NULL,
+            duration_minutes INTEGER NOT NULL,
+            vossenjacht_id INTEGER,
+            user_id INTEGER,
+            arrival_minutes INTEGER NOT NULL DEFAULT -1, -- arrival_time_last_fox as minutes since midnight (-1: filled by trigger)
+            hunt_rank INTEGER NOT NULL DEFAULT 0, -- Dense rank within the vossenjacht, maintained on every write (0: not ranked yet)
+            participant_id INTEGER, -- Normalised participant (see participants.py)
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (vossenjacht_id) REFERENCES vossenjachten (id),
+            FOREIGN KEY (participant_id) REFERENCES participants (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        );
+'''
+ENTRIES_NOT_NULL_COLUMNS = ('arrival_minutes', 'hunt_rank', 'created_at')
+
+# Everything that belongs to hunts; shard files get this part only (see shards.py)
+HUNT_SCHEMA_SQL = '''
         CREATE TABLE IF NOT EXISTS vossenjachten (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -50,35 +265,388 @@ def init_db():
             status TEXT NOT NULL DEFAULT 'active' CHECK (status IN ('active', 'completed')),
             type TEXT NOT NULL CHECK (type IN ('kilometers', 'time', 'both')),
             start_time TEXT, -- New column
+            start_minutes INTEGER, -- start_time as minutes since midnight
+            max_odometer_reading INTEGER, -- Overrides MAX_ODOMETER_READING for this hunt when set
             FOREIGN KEY (creator_id) REFERENCES users (id)
         );
 
-        CREATE TABLE IF NOT EXISTS entries (
+''' + ENTRIES_SCHEMA_SQL + '''
+        CREATE TABLE IF NOT EXISTS seasons (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
-            start_km REAL NOT NULL,
-            end_km REAL NOT NULL,
-            arrival_time_last_fox TEXT NOT NULL,
-            calculated_km REAL NOT NULL,
-            duration_minutes INTEGER NOT NULL,
-            vossenjacht_id INTEGER,
-            user_id INTEGER,
-            FOREIGN KEY (vossenjacht_id) REFERENCES vossenjachten (id),
-            FOREIGN KEY (user_id) REFERENCES users (id)
+            creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            creator_id INTEGER NOT NULL,
+            FOREIGN KEY (creator_id) REFERENCES users (id)
         );
-    ''')
+
+        CREATE TABLE IF NOT EXISTS season_vossenjachten (
+            season_id INTEGER NOT NULL,
+            vossenjacht_id INTEGER NOT NULL,
+            PRIMARY KEY (season_id, vossenjacht_id),
+            FOREIGN KEY (season_id) REFERENCES seasons (id),
+            FOREIGN KEY (vossenjacht_id) REFERENCES vossenjachten (id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_season_vossenjachten_vj ON season_vossenjachten (vossenjacht_id);
+
+        -- Points per participant per hunt of a season (see seasons.py)
+        CREATE TABLE IF NOT EXISTS season_points (
+            season_id INTEGER NOT NULL,
+            vossenjacht_id INTEGER NOT NULL,
+            participant_key TEXT NOT NULL,
+            points INTEGER NOT NULL,
+            PRIMARY KEY (season_id, vossenjacht_id, participant_key)
+        );
+
+        -- Running season totals, updated incrementally from season_points
+        CREATE TABLE IF NOT EXISTS season_standings (
+            season_id INTEGER NOT NULL,
+            participant_key TEXT NOT NULL,
+            participant_name TEXT NOT NULL,
+            points INTEGER NOT NULL,
+            hunts INTEGER NOT NULL,
+            PRIMARY KEY (season_id, participant_key)
+        );
+        CREATE INDEX IF NOT EXISTS idx_season_standings_points ON season_standings (season_id, points DESC);
+'''
+
+def init_db():
+    db = get_db()
+    # Only takes effect in a new database; lets purges return free pages without a full VACUUM (see purge.py)
+    db.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+    # Enable foreign key support
+    db.execute("PRAGMA foreign_keys = ON;")
+    db.executescript(USERS_SCHEMA_SQL + HUNT_SCHEMA_SQL)
+    migrate_db(db)
+    shards.install_catalog(db)
+    db.commit()
+    if replica.get_replica(current_app.config) is not None:
+        # The replica copies a snapshot while writers commit, which needs WAL (see replica.py)
+        replica.enable_wal(db, busy_timeout_ms=5000)
+
+def init_shard_db(db):
+    # Schema and migrations of a shard file; its users live in the catalog
+    db.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+    db.execute("PRAGMA foreign_keys = ON;")
+    db.executescript(shards.shard_schema(HUNT_SCHEMA_SQL))
+    migrate_db(db)
     db.commit()
 
+def add_column_if_missing(db, table, column, definition):
+    columns = {row['name'] for row in db.execute(f'PRAGMA table_info({table})')}
+    if column in columns:
+        return False
+    db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+def rebuild_entries_not_null(db):
+    # SQLite can't add NOT NULL to existing columns: copy entries into a table with the current definition.
+    # Foreign keys are off meanwhile (dropping the old table must not cascade into tracks and splits), and
+    # the legacy rename keeps SQLite from re-checking triggers that refer to entries while it is gone.
+    # The table's indexes and triggers go with it; migrate_db creates them again.
+    columns = {row['name']: row['notnull'] for row in db.execute('PRAGMA table_info(entries)')}
+    if all(columns.get(column) for column in ENTRIES_NOT_NULL_COLUMNS):
+        return False
+    create_sql = ENTRIES_SCHEMA_SQL.replace('EXISTS entries (', 'EXISTS entries_rebuilt (')
+    if not any(row['table'] == 'users' for row in db.execute('PRAGMA foreign_key_list(entries)')):
+        create_sql = shards.shard_schema(create_sql)
+    copied = ', '.join(name for name in columns if name not in ENTRIES_NOT_NULL_COLUMNS)
+    has_sequence = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone()
+    sequence = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'entries'").fetchone() if has_sequence else None
+    foreign_keys = db.execute('PRAGMA foreign_keys').fetchone()[0]
+    db.commit()
+    db.execute('PRAGMA foreign_keys = OFF')
+    db.execute('PRAGMA legacy_alter_table = ON')
+    try:
+        db.executescript(f'''
+            BEGIN;
+            {create_sql}
+            INSERT INTO entries_rebuilt ({copied}, arrival_minutes, hunt_rank, created_at)
+            SELECT {copied}, COALESCE(arrival_minutes, -1), COALESCE(hunt_rank, 0), COALESCE(created_at, CURRENT_TIMESTAMP)
+            FROM entries;
+            DROP TABLE entries;
+            ALTER TABLE entries_rebuilt RENAME TO entries;
+            COMMIT;
+        ''')
+        if sequence is not None:
+            # Ids of deleted entries are not handed out again
+            db.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'entries'", (sequence['seq'],))
+            db.commit()
+    finally:
+        db.execute('PRAGMA legacy_alter_table = OFF')
+        db.execute(f'PRAGMA foreign_keys = {"ON" if foreign_keys else "OFF"}')
+    return True
+
+def migrate_db(db):
+    # Bring databases created by older versions up to the current schema
+    add_column_if_missing(db, 'vossenjachten', 'start_minutes', 'INTEGER')
+    add_column_if_missing(db, 'vossenjachten', 'max_odometer_reading', 'INTEGER')
+    add_column_if_missing(db, 'entries', 'arrival_minutes', 'INTEGER')
+    add_column_if_missing(db, 'entries', 'hunt_rank', 'INTEGER')
+    add_column_if_missing(db, 'entries', 'participant_id', 'INTEGER REFERENCES participants (id)')
+    # ALTER TABLE can't add a CURRENT_TIMESTAMP default; backfilled below, rebuild_entries_not_null adds it
+    add_column_if_missing(db, 'entries', 'created_at', 'TIMESTAMP')
+
+    # Backfill rows written before the integer columns existed
+    db.execute(f"UPDATE vossenjachten SET start_minutes = {scoring.hhmm_to_minutes_sql('start_time')}"
+               " WHERE start_minutes IS NULL AND start_time IS NOT NULL")
+    db.execute(f"UPDATE entries SET arrival_minutes = {scoring.hhmm_to_minutes_sql('arrival_time_last_fox')}"
+               " WHERE arrival_minutes IS NULL OR arrival_minutes < 0")
+    # Entries from before created_at existed are dated by their vossenjacht
+    vossenjacht_columns = {row['name'] for row in db.execute('PRAGMA table_info(vossenjachten)')}
+    hunt_date_sql = ('(SELECT creation_date FROM vossenjachten WHERE id = entries.vossenjacht_id)'
+                     if 'creation_date' in vossenjacht_columns else 'NULL')
+    db.execute(f"UPDATE entries SET created_at = COALESCE({hunt_date_sql}, CURRENT_TIMESTAMP) WHERE created_at IS NULL")
+    rebuild_entries_not_null(db)
+
+    # Keep the integer time columns in sync when rows are written without them
+    start_minutes_sql = scoring.hhmm_to_minutes_sql('NEW.start_time')
+    arrival_minutes_sql = scoring.hhmm_to_minutes_sql('NEW.arrival_time_last_fox')
+    db.executescript(f'''
+        CREATE INDEX IF NOT EXISTS idx_entries_vossenjacht ON entries (vossenjacht_id);
+
+        -- One row per person, matched on the normalised name (see participants.py)
+        CREATE TABLE IF NOT EXISTS participants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL UNIQUE,
+            creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_entries_participant ON entries (participant_id);
+
+        -- Settings page: one index per sortable column with the id as tie-breaker, walked as
+        -- ORDER BY ... LIMIT from the cursor (see listing.SORT_COLUMNS); the first one serves a hunt's ranking
+        CREATE INDEX IF NOT EXISTS idx_entries_vossenjacht_rank ON entries (vossenjacht_id, hunt_rank, id);
+        CREATE INDEX IF NOT EXISTS idx_entries_created ON entries (created_at, id);
+        CREATE INDEX IF NOT EXISTS idx_entries_rank ON entries (hunt_rank, id);
+        CREATE INDEX IF NOT EXISTS idx_entries_name ON entries (name, id);
+        CREATE INDEX IF NOT EXISTS idx_entries_km ON entries (calculated_km, id);
+        CREATE INDEX IF NOT EXISTS idx_entries_duration ON entries (duration_minutes, id);
+        CREATE INDEX IF NOT EXISTS idx_entries_arrival ON entries (arrival_minutes, id);
+
+        CREATE TRIGGER IF NOT EXISTS vossenjachten_start_minutes_insert AFTER INSERT ON vossenjachten
+        WHEN NEW.start_minutes IS NULL AND NEW.start_time IS NOT NULL
+        BEGIN
+            UPDATE vossenjachten SET start_minutes = {start_minutes_sql} WHERE id = NEW.id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS vossenjachten_start_minutes_update AFTER UPDATE OF start_time ON vossenjachten
+        BEGIN
+            UPDATE vossenjachten SET start_minutes = {start_minutes_sql} WHERE id = NEW.id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS entries_arrival_minutes_insert AFTER INSERT ON entries
+        WHEN NEW.arrival_minutes < 0
+        BEGIN
+            UPDATE entries SET arrival_minutes = {arrival_minutes_sql} WHERE id = NEW.id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS entries_arrival_minutes_update AFTER UPDATE OF arrival_time_last_fox ON entries
+        BEGIN
+            UPDATE entries SET arrival_minutes = {arrival_minutes_sql} WHERE id = NEW.id;
+        END;
+    ''')
+
+    if 'creation_date' in vossenjacht_columns:
+        # Vossenjachten overview: newest first, optionally per status or creator (see listing.py)
+        db.executescript('''
+            CREATE INDEX IF NOT EXISTS idx_vossenjachten_created ON vossenjachten (creation_date, id);
+            CREATE INDEX IF NOT EXISTS idx_vossenjachten_status_created ON vossenjachten (status, creation_date, id);
+            CREATE INDEX IF NOT EXISTS idx_vossenjachten_creator_created ON vossenjachten (creator_id, creation_date, id);
+        ''')
+    stale_hunts = db.execute(
+        'SELECT DISTINCT vossenjacht_id FROM entries WHERE hunt_rank = 0 AND vossenjacht_id IS NOT NULL'
+    ).fetchall()
+    for row in stale_hunts:
+        scoring.recompute_hunt(db, row['vossenjacht_id'])
+    # Link free-text names to participants, deduplicating on the normalised name
+    participants.backfill(db)
+    # Full-text index for the settings search box (skipped when SQLite lacks FTS5)
+    search.install(db)
+    # Per-hunt change counters for the worker caches
+    cache.install(db)
+    # Uploaded GPS tracks of entries
+    tracks.install(db)
+    # Stored live car positions
+    pings.install(db)
+    # Fox and checkpoint locations with their R*Tree (skipped when SQLite lacks it)
+    checkpoints.install(db)
+    # Split times per entry and checkpoint
+    splits.install(db)
+
 @click.command('init-db')
 def init_db_command():
     init_db()
     click.echo('Initialized the database.')
 
+@click.command('recalc-scores')
+@click.option('--vj-id', type=int, default=None, help='Only recalculate this vossenjacht.')
+@click.option('--chunk-size', type=int, default=1000, show_default=True, help='Entries per transaction.')
+def recalc_scores_command(vj_id, chunk_size):
+    # Recompute calculated_km/duration_minutes after MAX_ODOMETER_READING or rule changes
+    totals = scoring.recalc_scores(get_db(), current_app.config['MAX_ODOMETER_READING'], vj_id=vj_id,
+                                   chunk_size=chunk_size, refresh=refresh_hunts)
+    click.echo(f"Recalculated {totals['rows']} entries in {totals['hunts']} vossenjacht(en), {totals['updated']} changed.")
+
+@click.command('archive-hunts')
+@click.option('--before', required=True, help='Archive completed vossenjachten created before this date (YYYY-MM-DD).')
+@click.option('--chunk-size', type=int, default=1000, show_default=True, help='Entries per transaction.')
+def archive_hunts_command(before, chunk_size):
+    # Move old completed hunts into ARCHIVE_DATABASE to keep the hot database small
+    try:
+        before = listing.parse_date(before)
+    except ValueError:
+        raise click.BadParameter('Use YYYY-MM-DD.', param_hint='--before')
+    db = get_db()
+    skipped = db.execute(
+        "SELECT COUNT(*) FROM vossenjachten WHERE status = 'completed' AND creation_date < ?"
+        " AND id IN (SELECT vossenjacht_id FROM season_vossenjachten)", (before,)
+    ).fetchone()[0]
+    totals = archive.archive_hunts(db, current_app.config['ARCHIVE_DATABASE'], before, chunk_size=chunk_size)
+    if totals['hunts']:
+        cache.bump(db, [cache.ALL_HUNTS])
+        db.commit()
+    click.echo(f"Archived {totals['hunts']} vossenjacht(en) with {totals['entries']} entries into {current_app.config['ARCHIVE_DATABASE']}.")
+    if skipped:
+        click.echo(f"Skipped {skipped} vossenjacht(en) that belong to a season.")
+
+@click.command('backup')
+@click.option('--list', 'list_only', is_flag=True, help='List the stored backups instead of making one.')
+@click.option('--shard', default=None, help='Back up this club shard (into BACKUP_DIR/KEY) instead of the main database.')
+def backup_command(list_only, shard):
+    # Online snapshot through the SQLite backup API; safe while the app is writing
+    options = backup.options_from_config(current_app.config)
+    if shard:
+        options['backup_dir'] = os.path.join(options['backup_dir'], shard)
+    if list_only:
+        for item in backup.list_backups(options['backup_dir']):
+            click.echo(f"{item['filename']}  {item['size']} bytes  {datetime.fromtimestamp(item['modified']):%Y-%m-%d %H:%M:%S}")
+        return
+    try:
+        db_path = shards.shard_path(current_app.config, shard)
+        result = backup.create_backup(db_path, **options)
+    except shards.ShardError as e:
+        raise click.ClickException(str(e))
+    except (backup.BackupError, sqlite3.Error, OSError) as e:
+        raise click.ClickException(f"Backup failed: {e}")
+    click.echo(f"Backup written to {result['path']} ({result['size']} bytes, {result['elapsed']:.1f}s).")
+
+@click.command('db-maintain')
+@click.option('--shard', default=None, help='Only maintain this club shard (default: the main database and every shard).')
+@click.option('--analyze', is_flag=True, help='Run a full ANALYZE instead of PRAGMA optimize.')
+@click.option('--force', is_flag=True, help='Run even while a vossenjacht is taking entries.')
+@click.option('--convert-vacuum', is_flag=True,
+              help='Switch databases created before incremental vacuum over, with a one-time full VACUUM.')
+def db_maintain_command(shard, analyze, force, convert_vacuum):
+    # Statistics, incremental vacuum, WAL checkpoint and an integrity check; see maintenance.py
+    try:
+        paths = [shards.shard_path(current_app.config, shard)] if shard else maintenance.database_paths(current_app.config)
+    except shards.ShardError as e:
+        raise click.ClickException(str(e))
+    options = maintenance.options_from_config(current_app.config)
+    failed = False
+    for db_path in paths:
+        try:
+            result = maintenance.run(db_path, options, force=force, analyze=analyze, convert_vacuum=convert_vacuum,
+                                     log=click.echo)
+        except sqlite3.Error as e:
+            raise click.ClickException(f"Maintenance of {db_path} failed: {e}")
+        failed = failed or not result['ok']
+        if not result['skipped']:
+            click.echo(f"Maintained {db_path}: {sum(s['seconds'] for s in result['steps']):.2f}s, {result['freed_bytes']} bytes freed.")
+    if failed:
+        raise click.ClickException('Integrity check found problems; restore a backup (see flask restore).')
+
+@click.command('restore')
+@click.argument('backup_file')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def restore_command(backup_file, yes):
+    # Accepts a path or the name of a file in BACKUP_DIR
+    backup_path = backup_file
+    if not os.path.exists(backup_path):
+        backup_path = os.path.join(current_app.config['BACKUP_DIR'], backup_file)
+    db_path = current_app.config.get('DATABASE', current_app.config['DATABASE_FILENAME'])
+    if not yes:
+        click.confirm(f"Replace the contents of {db_path} with {backup_path}?", abort=True)
+    try:
+        backup.restore_backup(backup_path, db_path, pages=int(current_app.config['BACKUP_PAGES']),
+                              sleep=float(current_app.config['BACKUP_SLEEP_MS']) / 1000.0)
+    except (backup.BackupError, sqlite3.Error, OSError) as e:
+        raise click.ClickException(f"Restore failed: {e}")
+    click.echo(f"Restored {db_path} from {backup_path}.")
+
+@click.command('shard-add')
+@click.argument('key')
+@click.argument('name')
+@click.option('--path', default=None, help='Database file for the shard (default: SHARD_DIR/KEY.db).')
+def shard_add_command(key, name, path):
+    # Register a club shard and create its database file
+    try:
+        path = shards.add_shard(current_app.config, key, name, path)
+    except shards.ShardError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Created shard '{key}' at {path}.")
+    if not current_app.config.get('SHARDING_ENABLED'):
+        click.echo("Note: SHARDING_ENABLED is off, requests still use the main database.")
+
+@click.command('shard-list')
+def shard_list_command():
+    rows = shards.list_shards(current_app.config)
+    if not rows:
+        click.echo("No shards; everything is in the main database.")
+    for row in rows:
+        click.echo(f"{row['key']}\t{row['name']}\t{row['hunts']} vossenjacht(en)\t{row['users']} user(s)\t{row['path']}")
+
+@click.command('shard-assign')
+@click.argument('username')
+@click.argument('key')
+def shard_assign_command(username, key):
+    # KEY '-' moves the user back to the main database
+    try:
+        shards.assign_user(current_app.config, username, None if key == '-' else key)
+    except shards.ShardError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"{username} now works in {'the main database' if key == '-' else f'shard {key}'}.")
+
+@click.command('shard-move')
+@click.argument('key')
+@click.argument('new_path')
+def shard_move_command(key, new_path):
+    # Copy a shard to another file (e.g. a volume on another node); stop the app first
+    try:
+        path = shards.move_shard(current_app.config, key, new_path)
+    except shards.ShardError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Shard '{key}' now lives at {path}; the old file can be removed.")
+
 def init_app(flask_app):
     flask_app.teardown_appcontext(close_db)
+    flask_app.after_request(add_replica_headers)
+    flask_app.context_processor(inject_replica_status)
     flask_app.cli.add_command(init_db_command)
+    flask_app.cli.add_command(recalc_scores_command)
+    flask_app.cli.add_command(archive_hunts_command)
+    flask_app.cli.add_command(backup_command)
+    flask_app.cli.add_command(restore_command)
+    flask_app.cli.add_command(db_maintain_command)
+    flask_app.cli.add_command(shard_add_command)
+    flask_app.cli.add_command(shard_list_command)
+    flask_app.cli.add_command(shard_assign_command)
+    flask_app.cli.add_command(shard_move_command)
 
 init_app(app)
+# First, so shed requests skip the rest of the request hooks
+admission.init_app(app)
+profiling.init_app(app)
+backup.init_app(app)
+cache.init_app(app)
+repositories.init_app(app)
+purge.init_app(app)
+maintenance.init_app(app)
+participants.init_app(app)
+tracks.init_app(app)
+pings.init_app(app)
+replica.init_app(app)
+shards.init_app(app, migrate=init_shard_db)
 
 # Login required decorator
 def set_password(password):
@@ -103,6 +671,15 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def sqlite_backend_required(f):
+    # Tracks, split times, recalculations and purges work on the SQLite tables directly
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if memory_backend():
+            abort(501, description="Not available with REPOSITORY_BACKEND=memory.")
+        return f(*args, **kwargs)
+    return decorated_function
+
 # Moderator required decorator
 def moderator_required(f):
     @wraps(f)
@@ -120,16 +697,15 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        db = get_db()
-        user = db.execute(
-            'SELECT * FROM users WHERE username = ?', (username,)
-        ).fetchone()
+        user = get_repositories().users.by_username(username)
 
         if user and check_password_hash(user['password_hash'], password):
             session.clear() # Clear old session data
             session['user_id'] = user['id']
             session['username'] = user['username']
             session['role'] = user['role']
+            # The user's club shard (see shards.py); older databases have no such column
+            session['shard_key'] = user['shard_key'] if 'shard_key' in user.keys() else None
             next_url = request.args.get('next')
             # Basic protection against open redirect
             if next_url and ':' not in next_url and '@' not in next_url and '.' in next_url.split('/')[-1]: # very basic check
@@ -149,6 +725,7 @@ def logout():
     session.pop('user_id', None)
     session.pop('username', None)
     session.pop('role', None)
+    session.pop('shard_key', None)
     return redirect(url_for('results'))
 
 @app.route('/')
@@ -160,22 +737,45 @@ def index():
 def input_form():
     now = datetime.now()
     current_time_str = now.strftime('%H:%M')
-    db = get_db()
-    active_vossenjachten = db.execute(
-        "SELECT id, name FROM vossenjachten WHERE status = 'active' ORDER BY name"
-    ).fetchall()
+    active_vossenjachten = get_repositories().hunts.active()
     # return render_template('input.html', current_time_for_form=current_time_str, active_vossenjachten=active_vossenjachten)
     return f"Placeholder for input form. Active Vossenjachten: {[(vj['id'], vj['name']) for vj in active_vossenjachten]}"
 
+def track_from_upload(vj_id):
+    # The analysed GPS track uploaded with an entry form (see tracks.py) with its checkpoint visits, or None;
+    # raises TrackError (a ValueError)
+    upload = request.files.get('track')
+    if upload is None or not upload.filename:
+        return None
+    if memory_backend():
+        raise tracks.TrackError("GPS tracks are stored in SQLite; they can't be uploaded with REPOSITORY_BACKEND=memory")
+    config = current_app.config
+    track = tracks.parse(upload.stream, upload.filename, int(config['TRACK_MAX_POINTS']))
+    result = tracks.analyse(track, **tracks.options_from_config(config))
+    result['visits'] = []
+    if result['finished_at'] is not None and vj_id:
+        result['visits'] = checkpoints.match_track(get_db(), vj_id, *result['filtered'])
+    return result
+
+def entry_readings(track, vj_id):
+    # (start_km, end_km, arrival time) from the form, or from the track: stored as a reading from 0 to the
+    # driven distance, arriving at the last fox (or the track's last point; the form's time without times)
+    # Readings keep 0.1 km, as the form takes them (step 0.1); the score rounds to whole km (scoring.calculated_km)
+    if track is None:
+        return (round(float(request.form['start_km']), 1), round(float(request.form['end_km']), 1),
+                request.form['arrival_time_last_fox'])
+    last_fox = checkpoints.last_fox_visit(get_db(), vj_id, track['visits'])
+    arrival = tracks.hhmm(last_fox['visited_at']) if last_fox else tracks.arrival_hhmm(track)
+    return 0, tracks.km(track['distance_m']), arrival or request.form['arrival_time_last_fox']
+
 @app.route('/add_entry', methods=['POST'])
 @login_required # Protect this route
 def add_entry():
     try:
         name = request.form['name']
-        start_km = int(float(request.form['start_km']))
-        end_km = int(float(request.form['end_km']))
-        arrival_time_str = request.form['arrival_time_last_fox']
         vossenjacht_id = request.form.get('vossenjacht_id', type=int)
+        track = track_from_upload(vossenjacht_id)
+        start_km, end_km, arrival_time_str = entry_readings(track, vossenjacht_id)
 
         if not vossenjacht_id:
             # flash('Vossenjacht selection is required.', 'danger')
@@ -192,31 +792,32 @@ def add_entry():
             # return redirect(url_for('input_form'))
             return "Error: Selected Vossenjacht does not have a start time. <a href='/input'>Try again</a>"
 
-        max_odom_reading = int(current_app.config.get('MAX_ODOMETER_READING', 1000))
-        actual_end_km = end_km
-        if end_km < start_km: # Odometer rollover
-            actual_end_km += max_odom_reading
-        calculated_km = int(round(actual_end_km - start_km))
+        max_odom_reading = scoring.hunt_max_odometer(vossenjacht_for_entry, current_app.config.get('MAX_ODOMETER_READING', 1000))
+        calculated_km = scoring.calculated_km(start_km, end_km, max_odom_reading)
 
         if calculated_km < 0:
             # flash('Negative calculated kilometers. Check odometer readings.', 'danger')
-            print(f"Warning: Negative calculated_km for {name}. Start: {start_km}, End: {end_km}. Adjusted End: {actual_end_km}")
+            print(f"Warning: Negative calculated_km for {name}. Start: {start_km}, End: {end_km}. Rollover: {max_odom_reading}")
             return redirect(url_for('input_form'))
 
-        # Use Vossenjacht's specific start_time for duration calculation
-        arrival_dt = datetime.strptime(arrival_time_str, '%H:%M')
-        vj_start_time_dt = datetime.strptime(vossenjacht_for_entry['start_time'], '%H:%M')
-        duration_delta = arrival_dt - vj_start_time_dt
-        duration_minutes = int(duration_delta.total_seconds() / 60)
-
-        user_id = session['user_id']
-        db = get_db()
-        db.execute(
-            'INSERT INTO entries (name, start_km, end_km, arrival_time_last_fox, calculated_km, duration_minutes, vossenjacht_id, user_id)'
-            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-            (name, start_km, end_km, arrival_time_str, calculated_km, duration_minutes, vossenjacht_id, user_id)
-        )
-        db.commit()
+        # Use Vossenjacht's specific start time for duration calculation (arrivals after midnight wrap around)
+        arrival_minutes = scoring.parse_hhmm(arrival_time_str)
+        duration_minutes = scoring.duration_minutes(scoring.hunt_start_minutes(vossenjacht_for_entry), arrival_minutes)
+
+        entry_values = {
+            'name': name, 'start_km': start_km, 'end_km': end_km, 'arrival_time_last_fox': arrival_time_str,
+            'arrival_minutes': arrival_minutes, 'calculated_km': calculated_km, 'duration_minutes': duration_minutes,
+            'vossenjacht_id': vossenjacht_id, 'user_id': session['user_id'],
+        }
+        def add(conn):
+            repos = get_repositories(conn)
+            participant_id = repos.participants.get_or_create(name)
+            entry_id = repos.entries.add(dict(entry_values, participant_id=participant_id))
+            if track is not None:
+                tracks.save(conn, entry_id, track)
+                splits.replace_for_entry(conn, entry_id, splits.from_track(entry_id, vossenjacht_for_entry, track))
+            return participant_id
+        remember_participant(run_write(add, hunt_ids=[vossenjacht_id]), name)
         # flash('Entry added successfully!', 'success')
         return redirect(url_for('results'))
 
@@ -224,7 +825,7 @@ def add_entry():
         # flash('Invalid data submitted. Check kilometer fields and time format.', 'danger')
         print("Error: Non-numeric input for kilometer fields or invalid time format.")
         return redirect(url_for('input_form'))
-    except sqlite3.Error as e:
+    except (sqlite3.Error, TimeoutError) as e:
         # flash(f'Database error: {e}', 'danger')
         print(f"Database error in add_entry: {e}")
         return redirect(url_for('input_form'))
@@ -235,135 +836,146 @@ def add_entry():
 
 @app.route('/results')
 def results():
-    db = get_db()
     selected_vj_id = request.args.get('vj_id', type=int)
+    return render_template('results.html', title="Results", **results_context(selected_vj_id))
 
-    all_vossenjachten = db.execute("SELECT id, name FROM vossenjachten ORDER BY name").fetchall()
-
-    base_query = "SELECT e.*, vj.name as vossenjacht_name FROM entries e JOIN vossenjachten vj ON e.vossenjacht_id = vj.id"
-    params = []
-
-    if selected_vj_id:
-        base_query += " WHERE e.vossenjacht_id = ?"
-        params.append(selected_vj_id)
-
-    entries_rows = db.execute(base_query, params).fetchall()
-
-    sorted_entries = sorted(entries_rows, key=lambda x: (x['calculated_km'], x['duration_minutes']))
-
-    ranked_entries_with_dense_rank = []
-    last_score = None
-    current_dense_rank = 0
-    if sorted_entries:
-        for entry_row in sorted_entries: # Changed from 'entry' to 'entry_row' to avoid conflict
-            current_score = (entry_row['calculated_km'], entry_row['duration_minutes'])
-            if current_score != last_score:
-                current_dense_rank += 1
-                last_score = current_score
-
-            mutable_entry = dict(entry_row) # Use entry_row here
-            mutable_entry['rank'] = current_dense_rank
-            mutable_entry['start_km'] = int(mutable_entry['start_km'])
-            mutable_entry['end_km'] = int(mutable_entry['end_km'])
-            mutable_entry['calculated_km'] = int(mutable_entry['calculated_km'])
-            ranked_entries_with_dense_rank.append(mutable_entry)
-
-    total_kilometers_all = int(sum(entry['calculated_km'] for entry in ranked_entries_with_dense_rank))
-
-    current_vossenjacht_name = None
-    current_vossenjacht_type = None # Initialize type
-    if selected_vj_id:
-        # Fetch details for the selected vossenjacht to get its type
-        vj_details = db.execute("SELECT name, type FROM vossenjachten WHERE id = ?", (selected_vj_id,)).fetchone()
-        if vj_details:
-            current_vossenjacht_name = vj_details['name']
-            current_vossenjacht_type = vj_details['type']
-
-    # Conditional sorting logic
-    if selected_vj_id and current_vossenjacht_type:
-        if current_vossenjacht_type == 'time':
-            sorted_entries = sorted(entries_rows, key=lambda x: (x['duration_minutes'], x['calculated_km']))
-            def get_score(entry): return (entry['duration_minutes'], entry['calculated_km'])
-        else:  # 'kilometers' or 'both'
-            sorted_entries = sorted(entries_rows, key=lambda x: (x['calculated_km'], x['duration_minutes']))
-            def get_score(entry): return (entry['calculated_km'], entry['duration_minutes'])
-    else:  # Global view or if vj_id provided but type couldn't be fetched
-        sorted_entries = sorted(entries_rows, key=lambda x: (x['calculated_km'], x['duration_minutes']))
-        def get_score(entry): return (entry['calculated_km'], entry['duration_minutes'])
-
-    # Re-calculate ranked_entries_with_dense_rank based on the new sorting and scoring
-    ranked_entries_with_dense_rank = [] # Clear previous calculation if any
-    last_score = None
-    current_dense_rank = 0
-    if sorted_entries:
-        for entry_row in sorted_entries:
-            current_score = get_score(entry_row) # Use the dynamically defined get_score
-            if current_score != last_score:
-                current_dense_rank += 1
-                last_score = current_score
-
-            mutable_entry = dict(entry_row)
-            mutable_entry['rank'] = current_dense_rank
-            mutable_entry['start_km'] = int(mutable_entry['start_km'])
-            mutable_entry['end_km'] = int(mutable_entry['end_km'])
-            mutable_entry['calculated_km'] = int(mutable_entry['calculated_km'])
-            ranked_entries_with_dense_rank.append(mutable_entry)
-
-    total_kilometers_all = int(sum(entry['calculated_km'] for entry in ranked_entries_with_dense_rank))
-
-
-    return render_template('results.html',
-                           entries=ranked_entries_with_dense_rank,
-                           total_kilometers_all_participants=int(total_kilometers_all),
-                           all_vossenjachten=all_vossenjachten, # Already fetched
-                           selected_vj_id=selected_vj_id,
-                           current_vossenjacht_name=current_vossenjacht_name,
-                           current_vossenjacht_type=current_vossenjacht_type, # Pass type to template for info
-                           title="Results")
+@app.route('/api/leaderboard')
+def leaderboard_api():
+    # JSON variant of the results page; asgi.py serves the same document, plus long-polling and a stream
+    selected_vj_id = request.args.get('vj_id', type=int)
+    return jsonify(leaderboard.from_context(results_context(selected_vj_id), selected_vj_id))
+
+def results_context(vj_id):
+    # Shared with the async read path in asgi.py (see leaderboard.py); cached until the hunt changes
+    db = get_read_db()
+    context = cached(('results', vj_id), vj_id, lambda: leaderboard.results_context(
+        db, vj_id, current_app.config['ARCHIVE_DATABASE'], repos=get_repositories(db)))
+    # The hunt dropdown spans all hunts, so it is cached on its own: renaming or adding one hunt
+    # then only drops that hunt's results, not every hunt's
+    names = cached(('hunt_names',), None, lambda: get_repositories(db).hunts.names())
+    archived = [vj for vj in context['all_vossenjachten'] if vj['id'] == vj_id] if context['archived'] else []
+    return dict(context, all_vossenjachten=list(names) + archived)
 
 # Add this new route in app.py
 @app.route('/settings')
 @login_required
 def settings():
-    db = get_db()
-    entries_query_sql = "SELECT e.*, vj.name as vossenjacht_name FROM entries e JOIN vossenjachten vj ON e.vossenjacht_id = vj.id"
-    params = []
-
-    if session.get('role') == 'moderator':
-        entries_query_sql += " WHERE vj.creator_id = ?"
-        params.append(session['user_id'])
-
-    entries_query_sql += " ORDER BY e.calculated_km ASC, e.duration_minutes ASC"
-
-    entries_rows = db.execute(entries_query_sql, params).fetchall()
-    entries_list = [dict(row) for row in entries_rows]
-
+    repos = get_repositories()
+    search_query = request.args.get('q', '').strip()
+    creator_id = session['user_id'] if session.get('role') == 'moderator' else None
+
+    visible_vossenjachten = repos.hunts.names(creator_id)
+    # Admins manage every club; the listing shows one shard at a time, picked with ?club=KEY
+    clubs = []
+    if session.get('role') == 'admin' and shards.is_enabled(current_app.config):
+        clubs = shards.list_shards(current_app.config)
+
+    if search_query:
+        # Search results come back best match first; show each entry's place within its own hunt
+        ranked_entries = []
+        for row in repos.entries.search(search_query, creator_id=creator_id):
+            entry_data = dict(row)
+            entry_data['rank'] = entry_data['hunt_rank']
+            ranked_entries.append(entry_data)
+        return render_template('settings.html', entries=ranked_entries, search_query=search_query,
+                               vossenjachten=visible_vossenjachten, filters={}, page=None,
+                               clubs=clubs, current_club=g.shard_key)
+
+    filters = {
+        'creator_id': creator_id,
+        'vj_id': request.args.get('vj_id', type=int),
+        'status': request.args.get('status') if request.args.get('status') in ('active', 'completed') else None,
+        'participant': request.args.get('participant', '').strip(),
+    }
+    filter_error = None
+    try:
+        filters['date_from'] = listing.parse_date(request.args.get('date_from'))
+        filters['date_to'] = listing.parse_date(request.args.get('date_to'))
+    except ValueError:
+        filter_error = "Ongeldige datum, gebruik JJJJ-MM-DD."
+        filters['date_from'] = filters['date_to'] = None
+    if filters['participant']:
+        # The participant filter is an indexed lookup on the normalised name
+        participant = repos.participants.by_name(filters['participant'])
+        filters['participant_id'] = participant['id'] if participant else -1
+
+    # Within one hunt the natural order is its ranking; across hunts the newest entries first
+    default_sort = 'rank' if filters['vj_id'] else listing.DEFAULT_SORT
+    sort = request.args.get('sort', default_sort)
+    if sort not in listing.SORT_COLUMNS:
+        sort = default_sort
+    direction = request.args.get('dir', 'asc' if sort == 'rank' else 'desc')
+
+    page = repos.entries.page(filters, sort=sort, direction=direction,
+                              after=request.args.get('after'), before=request.args.get('before'),
+                              per_page=request.args.get('per_page', listing.DEFAULT_PER_PAGE, type=int))
     ranked_entries = []
-    last_score = None
-    current_dense_rank = 0
-    if entries_list:
-        for entry_data in entries_list:
-            entry_data['start_km'] = int(entry_data['start_km'])
-            entry_data['end_km'] = int(entry_data['end_km'])
-            entry_data['calculated_km'] = int(entry_data['calculated_km'])
-            entry_data['duration_minutes'] = int(entry_data['duration_minutes'])
-            current_score = (entry_data['calculated_km'], entry_data['duration_minutes'])
-            if current_score != last_score:
-                current_dense_rank += 1
-                last_score = current_score
-            mutable_entry = dict(entry_data)
-            mutable_entry['rank'] = current_dense_rank
-            ranked_entries.append(mutable_entry)
-
-    # return render_template('settings.html', entries=ranked_entries)
-    return f"Placeholder for settings page. Entries (count: {len(ranked_entries)}): {ranked_entries}"
+    for row in page['entries']:
+        entry_data = dict(row)
+        entry_data['rank'] = entry_data['hunt_rank']
+        ranked_entries.append(entry_data)
+
+    # Query string for links that keep the current filters and sorting
+    page_args = {key: value for key, value in request.args.items() if key not in ('after', 'before') and value}
+    return render_template('settings.html', entries=ranked_entries, search_query='', filter_error=filter_error,
+                           vossenjachten=visible_vossenjachten, filters=filters, sort=sort,
+                           direction='asc' if direction == 'asc' else 'desc',
+                           page=page, page_args=page_args, clubs=clubs, current_club=g.shard_key)
+
+@app.route('/api/entries/search')
+@login_required
+def search_entries_api():
+    # JSON variant of the settings search box, e.g. for type-ahead lookups
+    search_query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', search.DEFAULT_LIMIT, type=int)
+    creator_id = session['user_id'] if session.get('role') == 'moderator' else None
+    results = [{
+        'id': row['id'],
+        'name': row['name'],
+        'participant_id': row['participant_id'],
+        'vossenjacht_id': row['vossenjacht_id'],
+        'vossenjacht_name': row['vossenjacht_name'],
+        'calculated_km': int(row['calculated_km']),
+        'duration_minutes': row['duration_minutes'],
+        'hunt_rank': row['hunt_rank'],
+        'edit_url': url_for('edit_entry', entry_id=row['id'], vj_id=row['vossenjacht_id']),
+    } for row in get_repositories().entries.search(search_query, creator_id=creator_id, limit=limit)]
+    return jsonify({'query': search_query, 'results': results})
+
+def get_name_index():
+    # This process's participant name index for the request's database, caught up every SUGGEST_REFRESH_SECONDS;
+    # in-memory databases get a fresh one per request
+    db = get_db()
+    index = participants.get_index(shards.shard_path(current_app.config, g.shard_key))
+    if index is None:
+        return participants.NameIndex().load(db)
+    if index.is_stale(float(current_app.config['SUGGEST_REFRESH_SECONDS'])):
+        index.load(db)
+    return index
+
+def remember_participant(participant_id, name):
+    # Names entered here show up in suggestions right away, without waiting for the next catch-up
+    index = participants.get_index(shards.shard_path(current_app.config, g.shard_key))
+    if index is not None and index.loaded_at is not None:
+        index.add(participant_id, name)
+
+@app.route('/api/participants/suggest')
+@login_required
+def suggest_participants_api():
+    # Name suggestions for the entry form, answered from memory (see participants.NameIndex)
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    return jsonify({'query': query, 'results': get_name_index().suggest(query, limit)})
 
 
 def check_entry_permission(entry_id):
-    db = get_db()
-    entry = db.execute('SELECT * FROM entries WHERE id = ?', (entry_id,)).fetchone()
+    entry = get_repositories().entries.get(entry_id)
     if not entry:
         abort(404) # Entry not found
+    # Entry ids are per shard; ?vj_id= picked the shard (see shards.py), and the entry must belong to that hunt
+    requested_vj_id = request.args.get('vj_id', type=int)
+    if requested_vj_id is not None and entry['vossenjacht_id'] != requested_vj_id:
+        abort(404)
 
     vossenjacht = get_vossenjacht_or_abort(entry['vossenjacht_id'], check_owner=False) # Get VJ without owner check first
 
@@ -384,65 +996,71 @@ def check_entry_permission(entry_id):
 @app.route('/delete_entry/<int:entry_id>', methods=['POST'])
 @login_required
 def delete_entry(entry_id):
-    check_entry_permission(entry_id) # Will abort if no permission
+    entry, _ = check_entry_permission(entry_id) # Will abort if no permission
 
-    db = get_db()
-    db.execute('DELETE FROM entries WHERE id = ?', (entry_id,))
-    db.commit()
+    run_write(lambda conn: get_repositories(conn).entries.delete(entry_id),
+              hunt_ids=[entry['vossenjacht_id']])
     # flash('Entry deleted successfully.', 'success')
-    return redirect(url_for('settings'))
+    return redirect(url_for('settings', vj_id=entry['vossenjacht_id']))
 
 @app.route('/edit_entry/<int:entry_id>', methods=['GET', 'POST'])
 @login_required
 def edit_entry(entry_id):
-    entry_data, _ = check_entry_permission(entry_id) # Will abort if no permission
+    entry_data, entry_vossenjacht = check_entry_permission(entry_id) # Will abort if no permission
 
     entry_dict = dict(entry_data)
-    entry_dict['start_km'] = int(entry_dict['start_km'])
-    entry_dict['end_km'] = int(entry_dict['end_km'])
 
     if request.method == 'POST':
         try:
             name = request.form['name']
-            start_km = int(float(request.form['start_km']))
-            end_km = int(float(request.form['end_km']))
-            arrival_time_str = request.form['arrival_time_last_fox']
+            track = track_from_upload(entry_data['vossenjacht_id'])
+            start_km, end_km, arrival_time_str = entry_readings(track, entry_data['vossenjacht_id'])
 
-            max_odom_reading = int(current_app.config.get('MAX_ODOMETER_READING', 1000))
-            actual_end_km = end_km
-            if end_km < start_km:  # Odometer rollover
-                actual_end_km += max_odom_reading
-            calculated_km = int(round(actual_end_km - start_km))
+            max_odom_reading = scoring.hunt_max_odometer(entry_vossenjacht, current_app.config.get('MAX_ODOMETER_READING', 1000))
+            calculated_km = scoring.calculated_km(start_km, end_km, max_odom_reading)
 
             if calculated_km < 0:
                 # flash('Negative calculated kilometers. Check odometer readings.', 'danger')
                 # return render_template('edit_entry.html', entry=entry_dict, error='Negative calculated kilometers.')
-                return f"Error: Negative calculated km. <a href='{url_for('edit_entry', entry_id=entry_id)}'>Try again</a>"
-
-            arrival_dt = datetime.strptime(arrival_time_str, '%H:%M')
-            start_dt = datetime.strptime('12:00', '%H:%M') # Assuming fixed start time for duration
-            duration_delta = arrival_dt - start_dt
-            duration_minutes = int(duration_delta.total_seconds() / 60)
-
-            db = get_db()
-            db.execute(
-                'UPDATE entries SET name = ?, start_km = ?, end_km = ?, '
-                'arrival_time_last_fox = ?, calculated_km = ?, duration_minutes = ? '
-                'WHERE id = ?',
-                (name, start_km, end_km, arrival_time_str, calculated_km, duration_minutes, entry_id)
-            )
-            db.commit()
+                return f"Error: Negative calculated km. <a href='{url_for('edit_entry', entry_id=entry_id, vj_id=entry_data['vossenjacht_id'])}'>Try again</a>"
+
+            # Duration is measured from the entry's own Vossenjacht start time
+            start_minutes = scoring.hunt_start_minutes(entry_vossenjacht)
+            if start_minutes is None:
+                return f"Error: This entry's Vossenjacht does not have a start time. <a href='{url_for('edit_entry', entry_id=entry_id, vj_id=entry_data['vossenjacht_id'])}'>Try again</a>"
+            arrival_minutes = scoring.parse_hhmm(arrival_time_str)
+            duration_minutes = scoring.duration_minutes(start_minutes, arrival_minutes)
+
+            entry_values = {
+                'name': name, 'start_km': start_km, 'end_km': end_km, 'arrival_time_last_fox': arrival_time_str,
+                'arrival_minutes': arrival_minutes, 'calculated_km': calculated_km, 'duration_minutes': duration_minutes,
+            }
+            # The stored readings came from the track (if any); only changing them by hand replaces it
+            readings_changed = (start_km, end_km, arrival_time_str) != (
+                round(entry_data['start_km'], 1), round(entry_data['end_km'], 1), entry_data['arrival_time_last_fox'])
+            def update(conn):
+                repos = get_repositories(conn)
+                participant_id = repos.participants.get_or_create(name)
+                repos.entries.update(entry_id, dict(entry_values, participant_id=participant_id))
+                if track is not None:
+                    tracks.save(conn, entry_id, track)
+                    splits.replace_for_entry(conn, entry_id, splits.from_track(entry_id, entry_vossenjacht, track))
+                elif readings_changed and conn is not None and tracks.delete(conn, entry_id): # No tracks in memory
+                    # Km and time entered by hand replace the old track, and the split times read from it
+                    splits.replace_for_entry(conn, entry_id, [])
+                return participant_id
+            remember_participant(run_write(update, hunt_ids=[entry_data['vossenjacht_id']]), name)
             # flash('Entry updated successfully.', 'success')
-            return redirect(url_for('settings'))
+            return redirect(url_for('settings', vj_id=entry_data['vossenjacht_id']))
 
         except ValueError:
             # flash('Invalid data. Check fields.', 'danger')
             # return render_template('edit_entry.html', entry=entry_dict, error='Invalid data.')
-            return f"Error: Invalid data. <a href='{url_for('edit_entry', entry_id=entry_id)}'>Try again</a>"
+            return f"Error: Invalid data. <a href='{url_for('edit_entry', entry_id=entry_id, vj_id=entry_data['vossenjacht_id'])}'>Try again</a>"
         except Exception as e:
             # flash(f'Error updating entry: {e}', 'danger')
             print(f"Error updating entry {entry_id}: {e}")
-            return redirect(url_for('edit_entry', entry_id=entry_id))
+            return redirect(url_for('edit_entry', entry_id=entry_id, vj_id=entry_data['vossenjacht_id']))
 
     # GET request
     # return render_template('edit_entry.html', entry=entry_dict)
@@ -450,20 +1068,18 @@ def edit_entry(entry_id):
 
 @app.route('/clear_database', methods=['POST'])
 @login_required
+@sqlite_backend_required
 def clear_database():
     confirmation_text = request.form.get('confirm_text')
     # Server-side validation of the confirmation text
     if confirmation_text == "VERWIJDER ALLES":
-        db = get_db()
-        try:
-            db.execute('DELETE FROM entries')
-            db.commit()
-            # flash('Alle ritten zijn succesvol verwijderd uit de database.', 'success')
-            print("Database cleared successfully by user.") # Server log
-        except Exception as e:
-            # Log the exception e
-            print(f"Error clearing database: {e}")
-            # flash('Er is een fout opgetreden bij het wissen van de database.', 'error')
+        # Deleted in chunks in the background, so entries submitted meanwhile don't wait for the whole table
+        job = start_purge('clear_database', None, lambda db, job: purge.clear_entries(
+            db, refresh_hunts, progress=job.progress, total=job.set_total, **purge.options_from_config(current_app.config)))
+        if job.status == 'failed':
+            print(f"Error clearing database: {job.error}")
+        else:
+            print(f"Database clear started by user (purge job {job.id}).") # Server log
     else:
         # flash('Database niet gewist. Bevestigingstekst was incorrect.', 'warning')
         print(f"Database clear attempt failed due to incorrect confirmation text: '{confirmation_text}'") # Server log
@@ -475,8 +1091,7 @@ def clear_database():
 @login_required
 @admin_required
 def manage_users_page():
-    db = get_db()
-    users_data = db.execute("SELECT id, username, role FROM users ORDER BY username").fetchall()
+    users_data = get_repositories().users.list()
     return render_template('admin/manage_users.html', users=users_data, title="Manage Users")
 
 @app.route('/admin/users/add', methods=['GET', 'POST'])
@@ -498,15 +1113,15 @@ def add_user_page():
             return render_template('admin/add_user.html', error=error, username=username, role=role, title="Add New User")
 
         db = get_db()
-        existing_user = db.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
+        users = get_repositories(db).users
+        existing_user = users.by_username(username)
         if existing_user:
             error = "Username already exists."
             return render_template('admin/add_user.html', error=error, username=username, role=role, title="Add New User")
 
         hashed_password = generate_password_hash(password)
         try:
-            db.execute('INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)',
-                       (username, hashed_password, role))
+            users.add(username, hashed_password, role)
             db.commit()
             # flash('User added successfully.', 'success') # Optional: add flash messaging
             return redirect(url_for('manage_users_page'))
@@ -526,25 +1141,144 @@ def delete_user_page(user_id):
         return redirect(url_for('manage_users_page'))
 
     db = get_db()
+    users = get_repositories(db).users
     # Check if user exists before attempting delete
-    user_to_delete = db.execute('SELECT id FROM users WHERE id = ?', (user_id,)).fetchone()
+    user_to_delete = users.get(user_id)
     if user_to_delete:
-        db.execute('DELETE FROM users WHERE id = ?', (user_id,))
+        users.delete(user_id)
         db.commit()
         # flash('User deleted successfully.', 'success')
     # else:
         # flash('User not found.', 'warning')
     return redirect(url_for('manage_users_page'))
 
+# Profiling Routes
+@app.route('/admin/profiles')
+@login_required
+@admin_required
+def list_profiles_page():
+    profiles = profiling.list_profiles(current_app.config['PROFILE_DIR'])
+    return render_template('admin/profiles.html', profiles=profiles,
+                           sample_rate=current_app.config.get('PROFILE_SAMPLE_RATE'),
+                           sampled_endpoints=current_app.config.get('PROFILE_SAMPLED_ENDPOINTS'),
+                           title="Profiles")
+
+@app.route('/admin/profiles/<filename>')
+@login_required
+@admin_required
+def view_profile_page(filename):
+    if not profiling.is_valid_profile_name(filename):
+        abort(404)
+    profile_dir = current_app.config['PROFILE_DIR']
+    if request.args.get('download'):
+        return send_from_directory(os.path.abspath(profile_dir), filename, as_attachment=True)
+    path = os.path.join(profile_dir, filename)
+    if not os.path.isfile(path):
+        abort(404)
+    sort_by = request.args.get('sort', 'cumulative')
+    if sort_by not in ('cumulative', 'tottime', 'ncalls'):
+        sort_by = 'cumulative'
+    summary = profiling.summarize_profile(path, sort_by=sort_by)
+    return render_template('admin/profile_detail.html', filename=filename, summary=summary, title=filename)
+
+@app.route('/admin/memory')
+@login_required
+@admin_required
+def memory_report_page():
+    return render_template('admin/memory.html', endpoints=profiling.memory_report.rows(),
+                           enabled=current_app.config.get('TRACEMALLOC_ENABLED'),
+                           snapshot_rate=current_app.config.get('TRACEMALLOC_SNAPSHOT_RATE'),
+                           title="Memory Report")
+
+@app.route('/admin/memory/reset', methods=['POST'])
+@login_required
+@admin_required
+def reset_memory_report():
+    profiling.memory_report.reset()
+    return redirect(url_for('memory_report_page'))
+
+@app.route('/api/purges')
+@login_required
+def purges_api():
+    # Progress of recent clear/delete purges and recalculations, newest first; moderators see only the jobs they started
+    user_id = None if session.get('role') == 'admin' else session['user_id']
+    jobs = purge.get_purger(current_app._get_current_object()).recent_jobs(user_id)
+    return jsonify([job.to_dict() for job in jobs])
+
+def get_ping_store():
+    # This process's live positions for the request's database (see pings.py)
+    config = current_app.config
+    return pings.get_store(shards.shard_path(config, shards.current_key(config)), config)
+
+@app.route('/api/vossenjachten/<int:vj_id>/pings', methods=['POST'])
+def ingest_pings(vj_id):
+    # Batches of car positions; the hunt's ping token or one of its organisers. Kept in memory; the hunt
+    # itself comes from the hunt cache, so a busy hunt doesn't query per batch.
+    config = current_app.config
+    bearer = request.headers.get('Authorization', '')
+    has_token = bearer.startswith('Bearer ') and pings.check_token(config['SECRET_KEY'], vj_id, bearer[7:].strip())
+    if not has_token and not session.get('user_id'):
+        return jsonify({'error': 'Not authorised'}), 401
+    vossenjacht = cached(('hunt', vj_id), vj_id, lambda: get_repositories().hunts.get(vj_id))
+    if vossenjacht is None:
+        return jsonify({'error': 'No such vossenjacht'}), 404
+    if not has_token and session.get('role') != 'admin' and vossenjacht['creator_id'] != session.get('user_id'):
+        return jsonify({'error': 'Not an organiser of this vossenjacht'}), 403
+    if vossenjacht['status'] != 'active':
+        # Buffers this process still holds from before the hunt ended
+        pings.forget(shards.shard_path(config, shards.current_key(config)), vj_id, keep_pending=True)
+        return jsonify({'error': 'This vossenjacht is not active'}), 409
+    try:
+        rows = pings.parse_pings(request.get_json(silent=True), int(config['PINGS_MAX_BATCH']), tracks.parse_time)
+    except pings.PingError as e:
+        return jsonify({'error': str(e)}), 400
+    db_path = shards.shard_path(config, shards.current_key(config))
+    store = pings.get_store(db_path, config)
+    buffered = store.add(vj_id, rows)
+    if db_path == ':memory:':
+        # The flusher thread can't share an in-memory database; store right away on the request's connection
+        store.flush(get_db())
+    return jsonify({'received': len(rows), 'buffered': buffered}), 202
+
+@app.route('/api/vossenjachten/<int:vj_id>/live')
+@login_required
+def live_positions_api(vj_id):
+    # Live map feed from memory: each car's last position, ?trail=N earlier ones, ?max_age=S drops silent cars
+    vossenjacht = get_vossenjacht_or_abort(vj_id, check_owner=True)
+    if vossenjacht['status'] != 'active':
+        pings.forget(shards.shard_path(current_app.config, g.shard_key), vj_id, keep_pending=True)
+        return jsonify({'vossenjacht_id': vj_id, 'cars': []})
+    trail = max(0, min(request.args.get('trail', 0, type=int), int(current_app.config['PINGS_BUFFER_SIZE'])))
+    max_age = request.args.get('max_age', type=float)
+    return jsonify({'vossenjacht_id': vj_id, 'cars': get_ping_store().live(vj_id, trail, max_age)})
+
+@app.route('/api/vossenjachten/<int:vj_id>/ping-token')
+@login_required
+def ping_token_api(vj_id):
+    # For the hunt's organisers, to configure the cars' trackers
+    get_vossenjacht_or_abort(vj_id, check_owner=True)
+    return jsonify({'vossenjacht_id': vj_id, 'token': pings.token(current_app.config['SECRET_KEY'], vj_id),
+                    'url': url_for('ingest_pings', vj_id=vj_id, _external=True)})
+
+@app.route('/admin/pings')
+@login_required
+@admin_required
+def ping_stats_api():
+    # Received, buffered, queued and stored pings of this process, for monitoring
+    return jsonify(get_ping_store().snapshot_stats())
+
+@app.route('/admin/admission')
+@login_required
+@admin_required
+def admission_stats_api():
+    # Slots in use, queue depth and shed counts per request class, for monitoring
+    return jsonify(admission.stats())
+
 # Helper function for Vossenjacht access
 from flask import abort
 
 def get_vossenjacht_or_abort(vj_id, check_owner=True):
-    db = get_db()
-    vossenjacht = db.execute(
-        'SELECT vj.*, u.username as creator_username FROM vossenjachten vj JOIN users u ON vj.creator_id = u.id WHERE vj.id = ?',
-        (vj_id,)
-    ).fetchone()
+    vossenjacht = cached(('hunt', vj_id), vj_id, lambda: get_repositories().hunts.get(vj_id))
 
     if vossenjacht is None:
         abort(404)  # Not found
@@ -558,22 +1292,32 @@ def get_vossenjacht_or_abort(vj_id, check_owner=True):
 
     return vossenjacht
 
+def parse_max_odometer(value):
+    # Optional per-hunt odometer rollover; empty means "use MAX_ODOMETER_READING"
+    if value is None or not value.strip():
+        return None
+    max_odometer = int(value)
+    if max_odometer <= 0:
+        raise ValueError("Max odometer reading must be positive")
+    return max_odometer
+
 # Vossenjacht Management Routes
 @app.route('/vossenjachten')
 @login_required
 def list_vossenjachten_page():
-    db = get_db()
-    # Fetch all vossenjachten, joining with users to get creator's username
-    vossenjachten = db.execute(
-        'SELECT vj.id, vj.name, vj.creation_date, vj.status, vj.type, u.username as creator_username '
-        'FROM vossenjachten vj JOIN users u ON vj.creator_id = u.id ORDER BY vj.creation_date DESC'
-    ).fetchall()
-    # Fetch all vossenjachten, joining with users to get creator's username
-    vossenjachten_data = db.execute(
-        'SELECT vj.id, vj.name, vj.creation_date, vj.status, vj.type, u.username as creator_username, vj.creator_id '
-        'FROM vossenjachten vj JOIN users u ON vj.creator_id = u.id ORDER BY vj.creation_date DESC'
-    ).fetchall()
-    return render_template('vossenjacht/list_vossenjachten.html', vossenjachten=vossenjachten_data, title="Vossenjachten Overview")
+    # One page of vossenjachten, newest first, with entry counts and the winning score from one grouped query
+    filters = {
+        'status': request.args.get('status') if request.args.get('status') in ('active', 'completed') else None,
+        'creator_id': request.args.get('creator_id', type=int),
+    }
+    repos = get_repositories()
+    page = repos.hunts.page(filters, after=request.args.get('after'), before=request.args.get('before'),
+                            per_page=request.args.get('per_page', listing.DEFAULT_PER_PAGE, type=int))
+    # Query string for links that keep the current filters
+    page_args = {key: value for key, value in request.args.items() if key not in ('after', 'before') and value}
+    return render_template('vossenjacht/list_vossenjachten.html', vossenjachten=page['vossenjachten'], page=page,
+                           page_args=page_args, filters=filters, creators=repos.users.list(),
+                           title="Vossenjachten Overview")
 
 @app.route('/vossenjachten/new', methods=['GET', 'POST'])
 @login_required
@@ -583,6 +1327,7 @@ def create_vossenjacht_page():
         name = request.form.get('name')
         type = request.form.get('type')
         start_time_str = request.form.get('start_time')
+        max_odometer_str = request.form.get('max_odometer_reading')
         error = None
 
         if not name:
@@ -593,26 +1338,35 @@ def create_vossenjacht_page():
             error = "Start time is required."
         else:
             try:
-                datetime.strptime(start_time_str, '%H:%M')
+                start_minutes = scoring.parse_hhmm(start_time_str)
             except ValueError:
                 error = "Invalid start time format. Use HH:MM."
+        if not error:
+            try:
+                max_odometer_reading = parse_max_odometer(max_odometer_str)
+            except ValueError:
+                error = "Max odometer reading must be a positive whole number."
 
         if error:
-            return render_template('vossenjacht/create_vossenjacht.html', error=error, name=name, type=type, start_time=start_time_str, title="Create Vossenjacht")
+            return render_template('vossenjacht/create_vossenjacht.html', error=error, name=name, type=type, start_time=start_time_str, max_odometer_reading=max_odometer_str, title="Create Vossenjacht")
 
         creator_id = session['user_id']
         db = get_db()
         try:
-            db.execute(
-                'INSERT INTO vossenjachten (name, type, creator_id, start_time) VALUES (?, ?, ?, ?)',
-                (name, type, creator_id, start_time_str)
-            )
+            # With sharding the id comes from the catalog, unique over all shards; otherwise it's assigned here
+            vj_id = shards.allocate_hunt_id(current_app.config, g.shard_key)
+            vj_id = get_repositories(db).hunts.add({
+                'id': vj_id, 'name': name, 'type': type, 'creator_id': creator_id, 'start_time': start_time_str,
+                'start_minutes': start_minutes, 'max_odometer_reading': max_odometer_reading,
+            })
+            # The hunt dropdowns span all hunts and are dropped with any bump (see results_context)
+            cache.bump(db, [vj_id])
             db.commit()
             # flash('Vossenjacht created successfully!', 'success')
             return redirect(url_for('list_vossenjachten_page'))
         except sqlite3.Error as e:
             error = f"Database error: {e}"
-            return render_template('vossenjacht/create_vossenjacht.html', error=error, name=name, type=type, start_time=start_time_str, title="Create Vossenjacht")
+            return render_template('vossenjacht/create_vossenjacht.html', error=error, name=name, type=type, start_time=start_time_str, max_odometer_reading=max_odometer_str, title="Create Vossenjacht")
     # GET request
     return render_template('vossenjacht/create_vossenjacht.html', title="Create New Vossenjacht")
 
@@ -629,6 +1383,7 @@ def edit_vossenjacht_page(vj_id):
         type = request.form.get('type')
         status = request.form.get('status')
         start_time_str = request.form.get('start_time')
+        max_odometer_str = request.form.get('max_odometer_reading')
         error = None
 
         if not name:
@@ -641,9 +1396,14 @@ def edit_vossenjacht_page(vj_id):
             error = "Start time is required."
         else:
             try:
-                datetime.strptime(start_time_str, '%H:%M')
+                start_minutes = scoring.parse_hhmm(start_time_str)
             except ValueError:
                 error = "Invalid start time format. Use HH:MM."
+        if not error:
+            try:
+                max_odometer_reading = parse_max_odometer(max_odometer_str)
+            except ValueError:
+                error = "Max odometer reading must be a positive whole number."
 
         if error:
             # Pass current form values back to template, by updating vj_dict with form values before re-rendering
@@ -652,15 +1412,24 @@ def edit_vossenjacht_page(vj_id):
             vj_dict_for_form['type'] = type
             vj_dict_for_form['status'] = status
             vj_dict_for_form['start_time'] = start_time_str
+            vj_dict_for_form['max_odometer_reading'] = max_odometer_str
             return render_template('vossenjacht/edit_vossenjacht.html', error=error, vossenjacht=vj_dict_for_form, title=f"Edit {vj_dict_for_form['name']}")
 
         db = get_db()
         try:
-            db.execute(
-                'UPDATE vossenjachten SET name = ?, type = ?, status = ?, start_time = ? WHERE id = ?',
-                (name, type, status, start_time_str, vj_id)
-            )
+            ranking_changed = get_repositories(db).hunts.update(vj_id, {
+                'name': name, 'type': type, 'status': status, 'start_time': start_time_str,
+                'start_minutes': start_minutes, 'max_odometer_reading': max_odometer_reading,
+            }, current_app.config['MAX_ODOMETER_READING'])
+            if ranking_changed:
+                # Ranks depend on the start time, rollover and type; recompute them in the same transaction
+                refresh_hunts(db, [vj_id])
+            # The hunt's own pages; the dropdowns with its name span all hunts and go with any bump
+            cache.bump(db, [vj_id])
             db.commit()
+            if status != 'active':
+                # No more pings will come in; the positions already queued are still stored
+                pings.forget(shards.shard_path(current_app.config, g.shard_key), vj_id, keep_pending=True)
             # flash('Vossenjacht updated successfully!', 'success')
             return redirect(url_for('list_vossenjachten_page'))
         except sqlite3.Error as e:
@@ -671,16 +1440,158 @@ def edit_vossenjacht_page(vj_id):
             vj_dict_for_form['type'] = type
             vj_dict_for_form['status'] = status
             vj_dict_for_form['start_time'] = start_time_str
+            vj_dict_for_form['max_odometer_reading'] = max_odometer_str
             return render_template('vossenjacht/edit_vossenjacht.html', error=error, vossenjacht=vj_dict_for_form, title=f"Edit {vj_dict_for_form['name']}")
 
     # GET request
     return render_template('vossenjacht/edit_vossenjacht.html', vossenjacht=vj_dict, title=f"Edit {vj_dict['name']}")
 
+@app.route('/admin/recalc_scores', methods=['POST'])
+@login_required
+@admin_required
+@sqlite_backend_required
+def recalc_scores_page():
+    vj_id = request.form.get('vj_id', type=int)
+    if vj_id:
+        get_vossenjacht_or_abort(vj_id, check_owner=False)
+    # A recalculation walks every entry of the hunt(s); it runs in chunks on the purge thread (progress on /api/purges)
+    totals = {}
+    def recalc(db, job):
+        where, params = ('WHERE vossenjacht_id = ?', (vj_id,)) if vj_id else ('', ())
+        job.set_total(db.execute(f'SELECT COUNT(*) FROM entries {where}', params).fetchone()[0])
+        totals.update(scoring.recalc_scores(db, current_app.config['MAX_ODOMETER_READING'], vj_id=vj_id,
+                                            refresh=refresh_hunts, progress=lambda t: job.progress(t['rows']),
+                                            **purge.options_from_config(current_app.config)))
+        return totals['rows']
+    job = start_purge('recalc_scores', vj_id, recalc)
+    if job.status == 'failed':
+        flash(f"Database error: {job.error}", 'danger')
+    elif job.status == 'done':
+        flash(f"Scores herberekend: {totals['rows']} ritten in {totals['hunts']} vossenjacht(en), {totals['updated']} aangepast.", 'success')
+    else:
+        flash(f"Herberekening gestart (taak {job.id}); de voortgang staat op /api/purges.", 'info')
+    return redirect(url_for('list_vossenjachten_page'))
+
+# Participant Routes
+@app.route('/participants/<int:participant_id>')
+def participant_page(participant_id):
+    participant_repository = get_repositories(get_read_db()).participants
+    participant = participant_repository.get(participant_id)
+    if participant is None:
+        abort(404)
+    # The history spans all hunts, including archived ones
+    history = participant_repository.history(participant_id)
+    ranks = [entry['hunt_rank'] for entry in history if entry['hunt_rank']] # 0 (or NULL in the archive): not ranked
+    return render_template('participants/participant.html', participant=participant, history=history,
+                           total_km=int(sum(entry['calculated_km'] for entry in history)),
+                           best_rank=min(ranks) if ranks else None,
+                           title=f"Deelnemer {participant['name']}")
+
+# Season Routes
+def get_season_or_abort(season_id, check_owner=True, db=None):
+    season = get_repositories(db).seasons.get(season_id)
+    if season is None:
+        abort(404)
+    if check_owner and session.get('role') == 'moderator' and season['creator_id'] != session.get('user_id'):
+        abort(403)
+    return season
+
+def season_hunt_ids(season_repository, season_id):
+    return {hunt['id'] for hunt in season_repository.hunts(season_id)}
+
+@app.route('/seasons')
+def list_seasons_page():
+    seasons_data = get_repositories(get_read_db()).seasons.list()
+    return render_template('seasons/list_seasons.html', seasons=seasons_data, title="Seizoenen")
+
+@app.route('/seasons/<int:season_id>')
+def season_page(season_id):
+    db = get_read_db()
+    season = get_season_or_abort(season_id, check_owner=False, db=db)
+    season_repository = get_repositories(db).seasons
+    return render_template('seasons/season.html', season=season, hunts=season_repository.hunts(season_id),
+                           standings=season_repository.standings(season_id),
+                           points_scheme=current_app.config['SEASON_POINTS'],
+                           title=f"Seizoen {season['name']}")
+
+@app.route('/seasons/new', methods=['GET', 'POST'])
+@login_required
+@moderator_required
+def create_season_page():
+    db = get_db()
+    repos = get_repositories(db)
+    all_vossenjachten = repos.hunts.overview()
+    if request.method == 'POST':
+        name = (request.form.get('name') or '').strip()
+        selected = {int(vj_id) for vj_id in request.form.getlist('vossenjacht_ids') if vj_id.isdigit()}
+        if not name:
+            return render_template('seasons/edit_season.html', error="Name is required.", season={'name': name},
+                                   all_vossenjachten=all_vossenjachten, selected_ids=selected, title="Create Season")
+        try:
+            season_id = repos.seasons.add(name, session['user_id'])
+            for vj_id in sorted(selected):
+                repos.seasons.add_hunt(season_id, vj_id)
+            db.commit()
+            return redirect(url_for('season_page', season_id=season_id))
+        except sqlite3.Error as e:
+            db.rollback()
+            return render_template('seasons/edit_season.html', error=f"Database error: {e}", season={'name': name},
+                                   all_vossenjachten=all_vossenjachten, selected_ids=selected, title="Create Season")
+    return render_template('seasons/edit_season.html', season=None, all_vossenjachten=all_vossenjachten,
+                           selected_ids=set(), title="Create Season")
+
+@app.route('/seasons/edit/<int:season_id>', methods=['GET', 'POST'])
+@login_required
+@moderator_required
+def edit_season_page(season_id):
+    season = dict(get_season_or_abort(season_id, check_owner=True))
+    db = get_db()
+    repos = get_repositories(db)
+    all_vossenjachten = repos.hunts.overview()
+    current_ids = season_hunt_ids(repos.seasons, season_id)
+    if request.method == 'POST':
+        name = (request.form.get('name') or '').strip()
+        selected = {int(vj_id) for vj_id in request.form.getlist('vossenjacht_ids') if vj_id.isdigit()}
+        if not name:
+            season['name'] = name
+            return render_template('seasons/edit_season.html', error="Name is required.", season=season,
+                                   all_vossenjachten=all_vossenjachten, selected_ids=selected, title="Edit Season")
+        try:
+            repos.seasons.rename(season_id, name)
+            # Only the hunts that joined or left the season touch the standings
+            for vj_id in sorted(current_ids - selected):
+                repos.seasons.remove_hunt(season_id, vj_id)
+            for vj_id in sorted(selected - current_ids):
+                repos.seasons.add_hunt(season_id, vj_id)
+            db.commit()
+            return redirect(url_for('season_page', season_id=season_id))
+        except sqlite3.Error as e:
+            db.rollback()
+            season['name'] = name
+            return render_template('seasons/edit_season.html', error=f"Database error: {e}", season=season,
+                                   all_vossenjachten=all_vossenjachten, selected_ids=selected, title="Edit Season")
+    return render_template('seasons/edit_season.html', season=season, all_vossenjachten=all_vossenjachten,
+                           selected_ids=current_ids, title="Edit Season")
+
+@app.route('/seasons/delete/<int:season_id>', methods=['POST'])
+@login_required
+@moderator_required
+def delete_season_page(season_id):
+    get_season_or_abort(season_id, check_owner=True)
+    db = get_db()
+    try:
+        get_repositories(db).seasons.delete(season_id)
+        db.commit()
+    except sqlite3.Error as e:
+        db.rollback()
+        flash(f"Database error: {e}", 'danger')
+    return redirect(url_for('list_seasons_page'))
+
 def create_initial_admin_user():
     db = get_db()
+    users = get_repositories(db).users
     try:
-        admin_user = db.execute("SELECT id FROM users WHERE role = ?", ('admin',)).fetchone()
-        if admin_user:
+        if users.has_role('admin'):
             print("Admin user already exists.") # Or use app.logger if configured
             return
 
@@ -689,10 +1600,7 @@ def create_initial_admin_user():
 
         if initial_username and initial_password:
             hashed_password = generate_password_hash(initial_password)
-            db.execute(
-                "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-                (initial_username, hashed_password, 'admin')
-            )
+            users.add(initial_username, hashed_password, 'admin')
             db.commit()
             print(f"Initial admin user '{initial_username}' created successfully.") # Or use app.logger
         else:
@@ -702,23 +1610,132 @@ def create_initial_admin_user():
     # No explicit db.close() here as it's handled by teardown_appcontext
 
 
+@app.route('/vossenjachten/<int:vj_id>/checkpoints', methods=['GET', 'POST'])
+@login_required
+@moderator_required
+def checkpoints_page(vj_id):
+    vossenjacht = get_vossenjacht_or_abort(vj_id, check_owner=True)
+    db = get_db()
+    checkpoint_repository = get_repositories(db).checkpoints
+    error = None
+    if request.method == 'POST':
+        name = (request.form.get('name') or '').strip()
+        try:
+            lat, lon = float(request.form['lat']), float(request.form['lon'])
+            radius_m = float(request.form.get('radius_m') or 50)
+        except (KeyError, ValueError):
+            lat = lon = radius_m = None
+        if not name:
+            error = "Name is required."
+        elif lat is None:
+            error = "Latitude, longitude and radius must be numbers."
+        else:
+            try:
+                checkpoint_repository.add(vj_id, name, lat, lon, radius_m)
+                # Cached checkpoint standings of the hunt
+                cache.bump(db, [vj_id])
+                db.commit()
+                return redirect(url_for('checkpoints_page', vj_id=vj_id))
+            except ValueError as e:
+                error = str(e)
+            except sqlite3.Error as e:
+                db.rollback()
+                error = f"Database error: {e}"
+    return render_template('vossenjacht/checkpoints.html', vossenjacht=vossenjacht, error=error,
+                           checkpoints=checkpoint_repository.for_hunt(vj_id), title=f"Checkpoints of {vossenjacht['name']}")
+
+@app.route('/vossenjachten/<int:vj_id>/checkpoints/delete/<int:checkpoint_id>', methods=['POST'])
+@login_required
+@moderator_required
+def delete_checkpoint_page(vj_id, checkpoint_id):
+    get_vossenjacht_or_abort(vj_id, check_owner=True)
+    db = get_db()
+    get_repositories(db).checkpoints.delete(vj_id, checkpoint_id)
+    cache.bump(db, [vj_id])
+    db.commit()
+    return redirect(url_for('checkpoints_page', vj_id=vj_id))
+
+@app.route('/api/vossenjachten/<int:vj_id>/checkpoints/near')
+@login_required
+def near_checkpoints_api(vj_id):
+    # The checkpoints within reach of a reported position (?lat=&lon=), nearest first
+    lat, lon = request.args.get('lat', type=float), request.args.get('lon', type=float)
+    if lat is None or lon is None:
+        return jsonify({'error': 'lat and lon are required'}), 400
+    found = get_repositories().checkpoints.near(vj_id, lat, lon)
+    return jsonify({'vossenjacht_id': vj_id, 'checkpoints': [
+        {key: checkpoint[key] for key in ('id', 'seq', 'name', 'lat', 'lon', 'radius_m', 'distance_m')}
+        for checkpoint in found]})
+
+@app.route('/api/vossenjachten/<int:vj_id>/splits', methods=['POST'])
+@login_required
+@sqlite_backend_required
+def add_splits_api(vj_id):
+    # Bulk split times from the marshals at the checkpoints; a repeated entry and checkpoint replaces the earlier time
+    vossenjacht = get_vossenjacht_or_abort(vj_id, check_owner=False)
+    db = get_db()
+    entry_ids, checkpoint_ids = splits.valid_ids(db, vj_id)
+    try:
+        rows = splits.parse_splits(request.get_json(silent=True), vossenjacht, entry_ids, checkpoint_ids)
+    except splits.SplitError as e:
+        return jsonify({'error': str(e)}), 400
+    stored = run_write(lambda conn: splits.insert(conn, rows), hunt_ids=[vj_id])
+    return jsonify({'vossenjacht_id': vj_id, 'stored': stored}), 201
+
+def standings_context(vj_id, checkpoint_id, hunt_type):
+    # Intermediate leaderboard of one checkpoint; cached until the hunt changes, like the results
+    db = get_read_db()
+    def compute():
+        checkpoint = get_repositories(db).checkpoints.get(vj_id, checkpoint_id)
+        if checkpoint is None:
+            return None
+        return {'checkpoint': dict(checkpoint),
+                'standings': [dict(row) for row in splits.standings(db, checkpoint_id, hunt_type)]}
+    return cached(('splits', checkpoint_id), vj_id, compute)
+
+@app.route('/vossenjachten/<int:vj_id>/checkpoints/<int:checkpoint_id>/standings')
+@login_required
+@moderator_required
+@sqlite_backend_required
+def checkpoint_standings_page(vj_id, checkpoint_id):
+    vossenjacht = get_vossenjacht_or_abort(vj_id, check_owner=True)
+    context = standings_context(vj_id, checkpoint_id, vossenjacht['type'])
+    if context is None:
+        abort(404)
+    return render_template('vossenjacht/checkpoint_standings.html', vossenjacht=vossenjacht,
+                           format_hhmm=scoring.format_hhmm, title=f"Standings at {context['checkpoint']['name']}",
+                           **context)
+
+@app.route('/api/vossenjachten/<int:vj_id>/checkpoints/<int:checkpoint_id>/standings')
+@login_required
+@sqlite_backend_required
+def checkpoint_standings_api(vj_id, checkpoint_id):
+    vossenjacht = get_vossenjacht_or_abort(vj_id, check_owner=False)
+    context = standings_context(vj_id, checkpoint_id, vossenjacht['type'])
+    if context is None:
+        return jsonify({'error': 'Checkpoint not found'}), 404
+    return jsonify({'vossenjacht_id': vj_id, 'checkpoint': context['checkpoint'], 'standings': [
+        dict(row, arrival=scoring.format_hhmm(row['arrival_minutes'])) for row in context['standings']]})
+
 @app.route('/vossenjachten/delete/<int:vj_id>', methods=['POST'])
 @login_required
 @moderator_required # Ensures user is at least a moderator
 def delete_vossenjacht_page(vj_id):
     # get_vossenjacht_or_abort will handle 404 and basic permission for moderators
     get_vossenjacht_or_abort(vj_id, check_owner=True)
-
-    db = get_db()
-    try:
-        # For now, we accept orphaned entries. Future: check for entries or use CASCADE.
-        db.execute('DELETE FROM vossenjachten WHERE id = ?', (vj_id,))
-        db.commit()
-        # flash('Vossenjacht deleted successfully.', 'success')
-    except sqlite3.Error as e:
-        # Log error
-        # flash(f'Error deleting vossenjacht: {e}', 'danger')
-        pass # Fall through to redirect
+    pings.forget(shards.shard_path(current_app.config, g.shard_key), vj_id)
+    if memory_backend():
+        # The memory store drops the hunt with its entries, checkpoints and season places at once
+        get_repositories().hunts.delete(vj_id)
+        return redirect(url_for('list_vossenjachten_page'))
+
+    # Entries go first, in chunks in the background; the vossenjacht row goes in the last transaction
+    job = start_purge('delete_vossenjacht', vj_id, lambda db, job: purge.delete_hunt(
+        db, vj_id, progress=job.progress, total=job.set_total, **purge.options_from_config(current_app.config)))
+    if job.status == 'failed':
+        flash(f'Error deleting vossenjacht: {job.error}', 'danger')
+    elif job.status != 'done':
+        flash('The vossenjacht is being deleted in the background.', 'info')
     return redirect(url_for('list_vossenjachten_page'))
 
 if __name__ == '__main__':
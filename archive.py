@@ -0,0 +1,176 @@
+"""Archive of completed vossenjachten in a separate SQLite file.
+
+``flask archive-hunts --before DATE`` moves completed hunts (with their
+checkpoints and entries) from the hot database into ``ARCHIVE_DATABASE``,
+keeping their ids, so the tables that every request touches stay small.
+Entries are moved in chunks, one transaction per chunk, together with their
+GPS tracks and split times; the checkpoints are copied with the hunt row up
+front (without the R*Tree, which only serves live matching). The hunt row
+itself is removed from the hot database in the last transaction. Running the
+command again after an interruption finishes the hunts that were only partly
+moved.
+
+Read paths ``ATTACH`` the archive as schema ``archive`` only when they need
+it: the results page when an archived hunt is requested and the participant
+history. The archive tables have the same names and columns as the hot ones.
+"""
+import os
+
+SCHEMA = 'archive'
+
+HUNT_COLUMNS = ('id', 'name', 'creation_date', 'creator_id', 'status', 'type', 'start_time',
+                'start_minutes', 'max_odometer_reading')
+ENTRY_COLUMNS = ('id', 'name', 'start_km', 'end_km', 'arrival_time_last_fox', 'calculated_km',
+                 'duration_minutes', 'vossenjacht_id', 'user_id', 'arrival_minutes', 'hunt_rank',
+                 'participant_id', 'created_at')
+CHECKPOINT_COLUMNS = ('id', 'vossenjacht_id', 'seq', 'name', 'lat', 'lon', 'radius_m')
+TRACK_COLUMNS = ('entry_id', 'points', 'spikes', 'distance_m', 'started_at', 'finished_at', 'polyline')
+SPLIT_COLUMNS = ('entry_id', 'checkpoint_id', 'vossenjacht_id', 'arrival_minutes', 'duration_minutes', 'calculated_km')
+
+# Tables keyed by entry_id that cascade with their entry, moved along with each chunk of entries
+ENTRY_TABLES = (('entry_tracks', TRACK_COLUMNS), ('splits', SPLIT_COLUMNS))
+
+ARCHIVE_SCHEMA_SQL = f'''
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.vossenjachten (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        creation_date TIMESTAMP,
+        creator_id INTEGER,
+        status TEXT,
+        type TEXT,
+        start_time TEXT,
+        start_minutes INTEGER,
+        max_odometer_reading INTEGER,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.entries (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        start_km REAL NOT NULL,
+        end_km REAL NOT NULL,
+        arrival_time_last_fox TEXT NOT NULL,
+        calculated_km REAL NOT NULL,
+        duration_minutes INTEGER NOT NULL,
+        vossenjacht_id INTEGER,
+        user_id INTEGER,
+        arrival_minutes INTEGER,
+        hunt_rank INTEGER,
+        participant_id INTEGER,
+        created_at TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS {SCHEMA}.idx_entries_vossenjacht_rank ON entries (vossenjacht_id, hunt_rank);
+    CREATE INDEX IF NOT EXISTS {SCHEMA}.idx_entries_participant ON entries (participant_id);
+
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.checkpoints (
+        id INTEGER PRIMARY KEY,
+        vossenjacht_id INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        radius_m REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS {SCHEMA}.idx_checkpoints_vossenjacht ON checkpoints (vossenjacht_id, seq);
+
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.entry_tracks (
+        entry_id INTEGER PRIMARY KEY,
+        points INTEGER NOT NULL,
+        spikes INTEGER NOT NULL,
+        distance_m REAL NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        polyline TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.splits (
+        entry_id INTEGER NOT NULL,
+        checkpoint_id INTEGER NOT NULL,
+        vossenjacht_id INTEGER NOT NULL,
+        arrival_minutes INTEGER NOT NULL,
+        duration_minutes INTEGER NOT NULL,
+        calculated_km REAL NOT NULL,
+        PRIMARY KEY (entry_id, checkpoint_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS {SCHEMA}.idx_splits_checkpoint ON splits (checkpoint_id);
+'''
+
+
+def is_attached(db):
+    return any(row[1] == SCHEMA for row in db.execute('PRAGMA database_list'))
+
+
+def attach(db, archive_path, create=False):
+    """Attach the archive to this connection; returns False when there is no archive (yet)."""
+    if is_attached(db):
+        return True
+    if not archive_path or (not create and not os.path.exists(archive_path)):
+        return False
+    db.execute(f'ATTACH DATABASE ? AS {SCHEMA}', (archive_path,))
+    if create:
+        db.executescript(ARCHIVE_SCHEMA_SQL)
+    return True
+
+
+def find_hunt(db, archive_path, vj_id):
+    """The archived vossenjacht row with this id (attaching the archive), or None."""
+    if not attach(db, archive_path):
+        return None
+    return db.execute(f'SELECT * FROM {SCHEMA}.vossenjachten WHERE id = ?', (vj_id,)).fetchone()
+
+
+def hunts_to_archive(db, before):
+    # Completed hunts created before the given date; hunts in a season stay, their membership references them
+    return db.execute(
+        "SELECT id, name FROM main.vossenjachten WHERE status = 'completed' AND creation_date < ?"
+        " AND id NOT IN (SELECT vossenjacht_id FROM main.season_vossenjachten) ORDER BY id",
+        (before,)
+    ).fetchall()
+
+
+def archive_hunt(db, vj_id, chunk_size=1000, progress=None):
+    """Move one hunt, its checkpoints and its entries (with tracks and splits) into the attached archive; returns the number of entries moved."""
+    hunt_columns = ', '.join(HUNT_COLUMNS)
+    entry_columns = ', '.join(ENTRY_COLUMNS)
+    checkpoint_columns = ', '.join(CHECKPOINT_COLUMNS)
+    db.execute(f'INSERT OR REPLACE INTO {SCHEMA}.vossenjachten ({hunt_columns})'
+               f' SELECT {hunt_columns} FROM main.vossenjachten WHERE id = ?', (vj_id,))
+    # Copied before the hunt row goes: deleting it cascades to the hot checkpoints
+    db.execute(f'INSERT OR REPLACE INTO {SCHEMA}.checkpoints ({checkpoint_columns})'
+               f' SELECT {checkpoint_columns} FROM main.checkpoints WHERE vossenjacht_id = ?', (vj_id,))
+    db.commit()
+
+    moved = 0
+    while True:
+        ids = [row['id'] for row in db.execute(
+            'SELECT id FROM main.entries WHERE vossenjacht_id = ? ORDER BY id LIMIT ?', (vj_id, chunk_size)
+        ).fetchall()]
+        if not ids:
+            break
+        placeholders = ', '.join('?' * len(ids))
+        db.execute(f'INSERT OR REPLACE INTO {SCHEMA}.entries ({entry_columns})'
+                   f' SELECT {entry_columns} FROM main.entries WHERE id IN ({placeholders})', ids)
+        # Copied before the entries go: deleting them cascades to these tables
+        for table, columns in ENTRY_TABLES:
+            columns = ', '.join(columns)
+            db.execute(f'INSERT OR REPLACE INTO {SCHEMA}.{table} ({columns})'
+                       f' SELECT {columns} FROM main.{table} WHERE entry_id IN ({placeholders})', ids)
+        db.execute(f'DELETE FROM main.entries WHERE id IN ({placeholders})', ids)
+        db.commit()
+        moved += len(ids)
+        if progress:
+            progress(vj_id, moved)
+
+    db.execute('DELETE FROM main.vossenjachten WHERE id = ?', (vj_id,))
+    db.commit()
+    return moved
+
+
+def archive_hunts(db, archive_path, before, chunk_size=1000, progress=None):
+    """Archive every completed hunt created before `before`; returns {'hunts': n, 'entries': n}."""
+    attach(db, archive_path, create=True)
+    totals = {'hunts': 0, 'entries': 0}
+    for hunt in hunts_to_archive(db, before):
+        totals['entries'] += archive_hunt(db, hunt['id'], chunk_size=chunk_size, progress=progress)
+        totals['hunts'] += 1
+    return totals
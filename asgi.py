@@ -0,0 +1,306 @@
+"""Async read path: results page, JSON leaderboard and live streams over ASGI.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8081
+
+Spectators keep the leaderboard open for a whole hunt. Under Flask every
+open long-poll or stream holds a worker thread; here each one is a coroutine
+waiting on a single ``ChangeFeed``, which polls ``PRAGMA data_version`` once
+per ``ASYNC_POLL_INTERVAL_MS`` for the whole process. Queries run on a small
+pool of database threads (``AsyncDatabase``, the model aiosqlite uses, without
+the extra dependency), each thread with its own read-only connection. Pages
+are built by ``leaderboard.py`` and rendered from the Flask templates, so both
+servers rank and render the same way. When the data changes, the leaderboard
+of each hunt is built and serialised once for the new version and shared by
+every stream and long poll waiting on it.
+
+Routes:
+  GET /results                 same page as the Flask view
+  GET /api/leaderboard         JSON; with ``?since=VERSION`` it waits (up to
+                               ``ASYNC_LONG_POLL_SECONDS``) until the data changes
+  GET /stream/leaderboard      server-sent events, one ``leaderboard`` event per change
+  GET /static/...              the Flask static files
+
+Writes, logins and everything else stay on the Flask app; run both behind one
+proxy that sends the paths above here. Only the main database is served
+(no shards, no replica).
+"""
+import asyncio
+import json
+import mimetypes
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from flask import render_template
+from werkzeug.security import safe_join
+
+import leaderboard
+from app import app as flask_app
+
+
+class AsyncDatabase:
+    """Runs fn(conn, *args) on a pool of threads that each keep one read-only connection."""
+
+    def __init__(self, path, threads=4):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-db')
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, timeout=30,
+                                   detect_types=sqlite3.PARSE_DECLTYPES)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _call(self, fn, args):
+        return fn(self._connection(), *args)
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, fn, args)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def _data_version(conn):
+    return conn.execute('PRAGMA data_version').fetchone()[0]
+
+
+class ChangeFeed:
+    """A version number that goes up when another connection commits; waiters share one poller."""
+
+    def __init__(self, db, interval):
+        # db should have a single thread: data_version is only comparable on one connection
+        self.db = db
+        self.interval = interval
+        self.version = 0
+        self._changed = None
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._changed = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        last = await self.db.run(_data_version)
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                current = await self.db.run(_data_version)
+            except sqlite3.Error as e:
+                print(f"Change feed poll failed: {e}")
+                continue
+            if current != last:
+                last = current
+                self.version += 1
+                changed, self._changed = self._changed, asyncio.Event()
+                changed.set()
+
+    async def wait(self, since, timeout):
+        """Wait until the version differs from `since` (or timeout); returns the current version."""
+        self.start()
+        if self.version == since:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.version
+
+
+def _int_arg(query, name):
+    try:
+        return int(query[name][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+class AsyncReadApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        config.setdefault('ASYNC_DB_THREADS', int(os.environ.get('ASYNC_DB_THREADS', 4)))
+        config.setdefault('ASYNC_POLL_INTERVAL_MS', float(os.environ.get('ASYNC_POLL_INTERVAL_MS', 500)))
+        config.setdefault('ASYNC_LONG_POLL_SECONDS', float(os.environ.get('ASYNC_LONG_POLL_SECONDS', 25)))
+        config.setdefault('ASYNC_KEEPALIVE_SECONDS', float(os.environ.get('ASYNC_KEEPALIVE_SECONDS', 15)))
+        db_path = config.get('DATABASE', config['DATABASE_FILENAME'])
+        self.db = AsyncDatabase(db_path, int(config['ASYNC_DB_THREADS']))
+        self.feed = ChangeFeed(AsyncDatabase(db_path, 1), float(config['ASYNC_POLL_INTERVAL_MS']) / 1000.0)
+        self.streams = 0
+        # {(feed version, vj_id): task} of leaderboards being built or built, shared by every waiter
+        self._snapshots = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        if scope['method'] not in ('GET', 'HEAD'):
+            await self._send_text(send, 405, 'Method Not Allowed')
+            return
+        path = scope['path']
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        try:
+            if path == '/results':
+                await self.results(scope, query, send)
+            elif path == '/api/leaderboard':
+                await self.leaderboard_json(query, send)
+            elif path == '/stream/leaderboard':
+                await self.leaderboard_stream(query, receive, send)
+            elif path.startswith('/static/'):
+                await self.static_file(path[len('/static/'):], send)
+            else:
+                await self._send_text(send, 404, 'Not Found')
+        except sqlite3.Error as e:
+            print(f"Database error in async read path: {e}")
+            await self._send_text(send, 503, 'Database unavailable')
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.feed.stop()
+                self.db.close()
+                self.feed.db.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # --- responses ---
+
+    async def _send(self, send, status, body, content_type, headers=()):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', content_type.encode()),
+                                (b'content-length', str(len(body)).encode())] + list(headers)})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _send_text(self, send, status, text):
+        await self._send(send, status, text.encode(), 'text/plain; charset=utf-8')
+
+    async def _send_json(self, send, body):
+        # body is already serialised (see snapshot())
+        await self._send(send, 200, body, 'application/json', [(b'cache-control', b'no-cache')])
+
+    def _render_results(self, scope, context):
+        # url_for() and the template globals need a Flask request context; these pages have no session
+        with self.flask_app.test_request_context(scope['path'], query_string=scope.get('query_string', b'').decode('latin-1')):
+            return render_template('results.html', title="Results", **context)
+
+    async def snapshot(self, version, vj_id):
+        """(JSON data, JSON body with the version) of a leaderboard, built once per feed version and hunt.
+
+        A change wakes every open stream and long poll at once; they all await the
+        same task instead of each ranking the hunt and serialising it again.
+        """
+        key = (version, vj_id)
+        task = self._snapshots.get(key)
+        if task is None:
+            # Waiters only ask for the current version, so older snapshots are done with
+            for stale in [k for k in self._snapshots if k[0] < version]:
+                del self._snapshots[stale]
+            task = asyncio.ensure_future(self._build_snapshot(version, vj_id))
+
+            def forget_failed(done):
+                # A failed query (e.g. database locked) is retried by the next waiter
+                if done.cancelled() or done.exception() is not None:
+                    if self._snapshots.get(key) is done:
+                        del self._snapshots[key]
+            task.add_done_callback(forget_failed)
+            self._snapshots[key] = task
+        # A waiter that disconnects must not cancel the build for the others
+        return await asyncio.shield(task)
+
+    async def _build_snapshot(self, version, vj_id):
+        payload = await self.db.run(leaderboard.leaderboard, vj_id, self.flask_app.config['ARCHIVE_DATABASE'])
+        data = json.dumps(payload)
+        payload['version'] = version
+        return data, json.dumps(payload).encode()
+
+    # --- routes ---
+
+    async def results(self, scope, query, send):
+        context = await self.db.run(leaderboard.results_context, _int_arg(query, 'vj_id'),
+                                    self.flask_app.config['ARCHIVE_DATABASE'])
+        html = await asyncio.get_running_loop().run_in_executor(None, self._render_results, scope, context)
+        await self._send(send, 200, html.encode('utf-8'), 'text/html; charset=utf-8')
+
+    async def leaderboard_json(self, query, send):
+        since = _int_arg(query, 'since')
+        if since is None:
+            self.feed.start()
+            version = self.feed.version
+        else:
+            # Long poll: answer as soon as something changed, or with the same data after the timeout
+            version = await self.feed.wait(since, float(self.flask_app.config['ASYNC_LONG_POLL_SECONDS']))
+        data, body = await self.snapshot(version, _int_arg(query, 'vj_id'))
+        await self._send_json(send, body)
+
+    async def leaderboard_stream(self, query, receive, send):
+        vj_id = _int_arg(query, 'vj_id')
+        keepalive = float(self.flask_app.config['ASYNC_KEEPALIVE_SECONDS'])
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                                (b'x-accel-buffering', b'no')]})
+
+        async def wait_for_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+        disconnected = asyncio.ensure_future(wait_for_disconnect())
+        self.streams += 1
+        try:
+            self.feed.start()
+            version = self.feed.version
+            last_data = None
+            while not disconnected.done():
+                data, body = await self.snapshot(version, vj_id)
+                if data != last_data:
+                    last_data = data
+                    message = f"id: {version}\nevent: leaderboard\ndata: {data}\n\n"
+                    await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+                waiter = asyncio.ensure_future(self.feed.wait(version, keepalive))
+                await asyncio.wait({waiter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not waiter.done():
+                    waiter.cancel()
+                    break
+                if waiter.result() == version:
+                    # Comment lines keep proxies from closing an idle stream
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                version = waiter.result()
+        except OSError:
+            pass # Client went away mid-send
+        finally:
+            self.streams -= 1
+            disconnected.cancel()
+        try:
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        except OSError:
+            pass
+
+    async def static_file(self, filename, send):
+        path = safe_join(self.flask_app.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            await self._send_text(send, 404, 'Not Found')
+            return
+        with open(path, 'rb') as f:
+            body = f.read()
+        await self._send(send, 200, body, mimetypes.guess_type(path)[0] or 'application/octet-stream',
+                         [(b'cache-control', b'public, max-age=3600')])
+
+
+application = AsyncReadApp(flask_app)
@@ -0,0 +1,219 @@
+"""Online backups of the SQLite database.
+
+Copying ``foxhunt.db`` while the app writes can produce a torn file, so
+backups use SQLite's online backup API instead: ``BACKUP_PAGES`` pages are
+copied per step with a ``BACKUP_SLEEP_MS`` pause in between, so writers only
+wait for one short step at a time. The copy is checked with
+``PRAGMA integrity_check``, gzip-compressed and the oldest snapshots beyond
+``BACKUP_KEEP`` are removed.
+
+``flask backup`` makes a snapshot, ``flask restore FILE`` copies one back
+(again through the backup API, so it is safe while the app is running), and
+when ``BACKUP_INTERVAL_MINUTES`` is set a background thread makes a snapshot
+on that interval.
+"""
+import atexit
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+_SAFE_NAME = re.compile(r'^[A-Za-z0-9_.-]+\.db(\.gz)?$')
+
+# One backup at a time per process (scheduler and CLI runs)
+_backup_lock = threading.Lock()
+
+
+class BackupError(Exception):
+    pass
+
+
+def init_app(flask_app):
+    db_dir = os.path.dirname(os.path.abspath(flask_app.config['DATABASE_FILENAME']))
+    flask_app.config.setdefault('BACKUP_DIR', os.environ.get('BACKUP_DIR', os.path.join(db_dir, 'backups')))
+    flask_app.config.setdefault('BACKUP_KEEP', int(os.environ.get('BACKUP_KEEP', 14)))
+    flask_app.config.setdefault('BACKUP_PAGES', int(os.environ.get('BACKUP_PAGES', 256)))
+    flask_app.config.setdefault('BACKUP_SLEEP_MS', float(os.environ.get('BACKUP_SLEEP_MS', 50)))
+    flask_app.config.setdefault('BACKUP_COMPRESS', os.environ.get('BACKUP_COMPRESS', '1').lower() in ('1', 'true', 'yes'))
+    # 0 disables the background scheduler
+    flask_app.config.setdefault('BACKUP_INTERVAL_MINUTES', float(os.environ.get('BACKUP_INTERVAL_MINUTES', 0)))
+    # Started on the first request, so CLI commands like `flask init-db` don't spawn it
+    flask_app.before_request(_start_scheduler_once)
+
+
+def options_from_config(config):
+    return {
+        'backup_dir': config['BACKUP_DIR'],
+        'keep': int(config['BACKUP_KEEP']),
+        'pages': int(config['BACKUP_PAGES']),
+        'sleep': float(config['BACKUP_SLEEP_MS']) / 1000.0,
+        'compress': bool(config['BACKUP_COMPRESS']),
+    }
+
+
+def integrity_check(path):
+    conn = sqlite3.connect(path)
+    try:
+        result = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+    finally:
+        conn.close()
+    if result != ['ok']:
+        raise BackupError(f"Integrity check failed for {path}: {'; '.join(result[:5])}")
+
+
+def create_backup(db_path, backup_dir, keep=14, pages=256, sleep=0.05, compress=True, progress=None):
+    """Snapshot db_path into backup_dir; returns a dict with path, size and elapsed seconds."""
+    if db_path == ':memory:' or not os.path.exists(db_path):
+        raise BackupError(f"No database file to back up at {db_path}")
+    os.makedirs(backup_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db_path))[0]
+    filename = f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}.db"
+    final_path = os.path.join(backup_dir, filename + ('.gz' if compress else ''))
+    partial_path = os.path.join(backup_dir, filename + '.partial')
+
+    started = time.perf_counter()
+    with _backup_lock:
+        try:
+            source = sqlite3.connect(db_path, timeout=30)
+            target = sqlite3.connect(partial_path)
+            try:
+                # Step through the file so writers only wait for one step at a time
+                source.backup(target, pages=pages, sleep=sleep,
+                              progress=(lambda status, remaining, total: progress(total - remaining, total)) if progress else None)
+            finally:
+                target.close()
+                source.close()
+            integrity_check(partial_path)
+
+            if compress:
+                with open(partial_path, 'rb') as raw, gzip.open(final_path + '.partial', 'wb') as packed:
+                    shutil.copyfileobj(raw, packed, 1024 * 1024)
+                os.replace(final_path + '.partial', final_path)
+                os.remove(partial_path)
+            else:
+                os.replace(partial_path, final_path)
+        except Exception:
+            for leftover in (partial_path, final_path + '.partial'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        rotate_backups(backup_dir, keep)
+
+    return {
+        'path': final_path,
+        'size': os.path.getsize(final_path),
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+def list_backups(backup_dir):
+    """Return the stored backups, newest first."""
+    if not os.path.isdir(backup_dir):
+        return []
+    backups = []
+    for filename in os.listdir(backup_dir):
+        if not _SAFE_NAME.match(filename):
+            continue
+        stat = os.stat(os.path.join(backup_dir, filename))
+        backups.append({'filename': filename, 'size': stat.st_size, 'modified': stat.st_mtime})
+    backups.sort(key=lambda b: (b['modified'], b['filename']), reverse=True)
+    return backups
+
+
+def rotate_backups(backup_dir, keep):
+    for old in list_backups(backup_dir)[keep:]:
+        try:
+            os.remove(os.path.join(backup_dir, old['filename']))
+        except OSError:
+            pass
+
+
+def restore_backup(backup_path, db_path, pages=256, sleep=0.05):
+    """Replace the contents of db_path with a (gzipped) snapshot, after verifying the snapshot."""
+    if not os.path.exists(backup_path):
+        raise BackupError(f"Backup {backup_path} does not exist")
+    unpacked_path = db_path + '.restore'
+    try:
+        if backup_path.endswith('.gz'):
+            with gzip.open(backup_path, 'rb') as packed, open(unpacked_path, 'wb') as raw:
+                shutil.copyfileobj(packed, raw, 1024 * 1024)
+        else:
+            shutil.copyfile(backup_path, unpacked_path)
+        integrity_check(unpacked_path)
+
+        # Copy through the backup API so open connections see a consistent database afterwards
+        source = sqlite3.connect(unpacked_path)
+        target = sqlite3.connect(db_path, timeout=30)
+        try:
+            source.backup(target, pages=pages, sleep=sleep)
+        finally:
+            target.close()
+            source.close()
+    finally:
+        if os.path.exists(unpacked_path):
+            os.remove(unpacked_path)
+
+
+# --- background scheduler ---
+
+class BackupScheduler:
+    def __init__(self, db_path, interval_seconds, options):
+        self.db_path = db_path
+        self.interval_seconds = interval_seconds
+        self.options = options
+        self.last_result = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='backup-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.last_result = create_backup(self.db_path, **self.options)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Scheduled backup failed: {e}")
+
+
+scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _start_scheduler_once():
+    global scheduler
+    if scheduler is not None:
+        return
+    config = current_app.config
+    interval = float(config.get('BACKUP_INTERVAL_MINUTES') or 0)
+    db_path = config.get('DATABASE', config['DATABASE_FILENAME'])
+    if interval <= 0 or db_path == ':memory:' or config.get('TESTING'):
+        return
+    with _scheduler_lock:
+        if scheduler is None:
+            scheduler = BackupScheduler(db_path, interval * 60, options_from_config(config)).start()
+
+
+def stop_scheduler():
+    if scheduler is not None:
+        scheduler.stop()
+
+
+atexit.register(stop_scheduler)
@@ -0,0 +1,152 @@
+"""Per-process caches of hunt data that stay coherent across worker processes.
+
+Every write that changes a vossenjacht or its entries bumps that hunt's row in
+``hunt_versions`` inside the same transaction (``bump``). Versions come from
+one increasing sequence over the whole table, so "what changed since I last
+looked" is ``WHERE version > last_seen``.
+
+Each process keeps a ``HuntCache`` per database file with its own watch
+connection. ``check()`` runs once per request: it costs one
+``PRAGMA data_version``, which only changes when some other connection (in
+any process) committed. Only then is ``hunt_versions`` read, and only the
+cached values of the hunts that changed are dropped, plus the values that
+span all hunts (key hunt ``None``). Bumping ``ALL_HUNTS`` drops everything.
+No broker or shared memory is needed.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+# Bump this id for changes that touch every hunt (clearing all entries, bulk recalcs, archiving, ...);
+# values that merely list all hunts are cached under hunt None and go with any bump
+ALL_HUNTS = 0
+
+HUNT_VERSIONS_SQL = '''
+    CREATE TABLE IF NOT EXISTS hunt_versions (
+        vossenjacht_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_hunt_versions_version ON hunt_versions (version);
+'''
+
+
+def init_app(flask_app):
+    flask_app.config.setdefault('CACHE_ENABLED', os.environ.get('CACHE_ENABLED', '1').lower() in ('1', 'true', 'yes'))
+    flask_app.config.setdefault('CACHE_MAX_ENTRIES', int(os.environ.get('CACHE_MAX_ENTRIES', 256)))
+
+
+def install(db):
+    db.executescript(HUNT_VERSIONS_SQL)
+
+
+def bump(db, hunt_ids):
+    """Mark hunts as changed; call inside the write transaction."""
+    for vj_id in sorted(set(hunt_ids)):
+        db.execute(
+            'INSERT INTO hunt_versions (vossenjacht_id, version)'
+            ' VALUES (?, (SELECT COALESCE(MAX(version), 0) + 1 FROM hunt_versions))'
+            ' ON CONFLICT (vossenjacht_id) DO UPDATE SET version = excluded.version',
+            (vj_id,)
+        )
+
+
+class HuntCache:
+    def __init__(self, db_path, max_entries=256):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.stats = {'checks': 0, 'refreshes': 0, 'invalidated': 0, 'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._seen = None
+        # Bumped on every invalidation, so a value computed across one isn't stored
+        self._generation = 0
+        self._entries = OrderedDict() # key -> (hunt_id, value), least recently used first
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        return self._conn
+
+    def check(self):
+        """Drop the values of hunts that other connections changed since the last check."""
+        with self._lock:
+            self.stats['checks'] += 1
+            conn = self._connection()
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            self.stats['refreshes'] += 1
+            try:
+                latest = conn.execute('SELECT COALESCE(MAX(version), 0) FROM hunt_versions').fetchone()[0]
+                changed = conn.execute('SELECT vossenjacht_id FROM hunt_versions WHERE version > ?',
+                                       (self._seen or 0,)).fetchall()
+            except sqlite3.OperationalError:
+                # No hunt_versions yet (database not migrated): nothing can be trusted
+                self._clear()
+                self._seen = None
+                return
+            if self._seen is None or latest < self._seen:
+                # First look, or the sequence went back (a restored backup)
+                self._clear()
+            elif changed:
+                self._invalidate({row[0] for row in changed})
+            self._seen = latest
+
+    def _clear(self):
+        self.stats['invalidated'] += len(self._entries)
+        self._entries.clear()
+        self._generation += 1
+
+    def _invalidate(self, hunt_ids):
+        if ALL_HUNTS in hunt_ids:
+            self._clear()
+            return
+        stale = [key for key, (hunt_id, _) in self._entries.items() if hunt_id is None or hunt_id in hunt_ids]
+        for key in stale:
+            del self._entries[key]
+        self.stats['invalidated'] += len(stale)
+        self._generation += 1
+
+    def get_or_set(self, key, hunt_id, compute):
+        """The cached value for key, or compute() (stored under hunt_id; None means it spans all hunts)."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._entries[key][1]
+            self.stats['misses'] += 1
+            generation = self._generation
+        value = compute()
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (hunt_id, value)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(db_path, config=None):
+    """The process-wide cache for a database file; None when caching is off or impossible."""
+    config = config if config is not None else current_app.config
+    if not config.get('CACHE_ENABLED') or db_path == ':memory:':
+        return None
+    with _caches_lock:
+        hunt_cache = _caches.get(db_path)
+        if hunt_cache is None:
+            hunt_cache = _caches[db_path] = HuntCache(db_path, int(config.get('CACHE_MAX_ENTRIES', 256)))
+        return hunt_cache
@@ -0,0 +1,194 @@
+"""Fox and checkpoint locations of a hunt, and matching positions against them.
+
+Each checkpoint is a point with a radius (``radius_m``); ``seq`` orders them
+along the route, the highest being the last fox. Their bounding boxes live
+in an R*Tree virtual table (``checkpoint_rtree``), kept in sync by triggers,
+so finding the checkpoints near a position is a box query on the index
+instead of a distance check against every checkpoint of the hunt. Without
+the R*Tree module the same queries read the hunt's checkpoints instead.
+
+``match_track`` walks a GPS track in chunks of ``CHUNK_POINTS`` points: one
+box query per chunk (the chunk's bounding box against the checkpoint boxes,
+which include their radius) finds the candidate checkpoints, and only those
+are measured against the chunk's points. A checkpoint's visit is the first
+time the track comes within its radius; the visit of the last fox sets the
+entry's arrival time.
+"""
+import math
+import sqlite3
+
+# Points of a track per box query
+CHUNK_POINTS = 64
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi / 180 * EARTH_RADIUS_M
+
+CHECKPOINTS_SQL = '''
+    CREATE TABLE IF NOT EXISTS checkpoints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vossenjacht_id INTEGER NOT NULL REFERENCES vossenjachten (id) ON DELETE CASCADE,
+        seq INTEGER NOT NULL, -- Order along the route; the highest is the last fox
+        name TEXT NOT NULL,
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        radius_m REAL NOT NULL DEFAULT 50,
+        UNIQUE (vossenjacht_id, seq)
+    );
+'''
+
+RTREE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS checkpoint_rtree USING rtree(
+        id, min_lat, max_lat, min_lon, max_lon, +vossenjacht_id
+    );
+
+    CREATE TRIGGER IF NOT EXISTS checkpoint_rtree_insert AFTER INSERT ON checkpoints
+    BEGIN
+        INSERT INTO checkpoint_rtree (id, min_lat, max_lat, min_lon, max_lon, vossenjacht_id)
+        VALUES (NEW.id, {box}, NEW.vossenjacht_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS checkpoint_rtree_update AFTER UPDATE OF lat, lon, radius_m ON checkpoints
+    BEGIN
+        UPDATE checkpoint_rtree SET (min_lat, max_lat, min_lon, max_lon) = ({box}) WHERE id = NEW.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS checkpoint_rtree_delete AFTER DELETE ON checkpoints
+    BEGIN
+        DELETE FROM checkpoint_rtree WHERE id = OLD.id;
+    END;
+'''
+
+
+def _box_sql(prefix):
+    # The bounding box of a checkpoint's circle, as four SQL expressions (min_lat, max_lat, min_lon, max_lon)
+    dlat = f'({prefix}.radius_m / {METERS_PER_DEGREE!r})'
+    dlon = f'({dlat} / MAX(COS({prefix}.lat * {math.pi / 180!r}), 0.01))'
+    return (f'{prefix}.lat - {dlat}, {prefix}.lat + {dlat}, '
+            f'{prefix}.lon - {dlon}, {prefix}.lon + {dlon}')
+
+
+def install(db):
+    """Create the checkpoint tables; returns False if the R*Tree module is not available."""
+    db.executescript(CHECKPOINTS_SQL)
+    exists = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'checkpoint_rtree'").fetchone()
+    try:
+        db.executescript(RTREE_SQL.format(box=_box_sql('NEW')))
+    except sqlite3.OperationalError as e:
+        print(f"Checkpoint R*Tree disabled: {e}")
+        return False
+    if not exists:
+        db.execute(f'INSERT INTO checkpoint_rtree (id, min_lat, max_lat, min_lon, max_lon, vossenjacht_id)'
+                   f' SELECT c.id, {_box_sql("c")}, c.vossenjacht_id FROM checkpoints c')
+    return True
+
+
+def has_rtree(db):
+    return db.execute("SELECT 1 FROM sqlite_master WHERE name = 'checkpoint_rtree'").fetchone() is not None
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def validate(lat, lon, radius_m):
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"Invalid coordinate {lat}, {lon}")
+    if radius_m <= 0:
+        raise ValueError("Radius must be positive")
+
+
+def add(db, vj_id, name, lat, lon, radius_m=50):
+    """Add a checkpoint after the hunt's last one; returns its id."""
+    validate(lat, lon, radius_m)
+    return db.execute(
+        'INSERT INTO checkpoints (vossenjacht_id, seq, name, lat, lon, radius_m)'
+        ' VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM checkpoints WHERE vossenjacht_id = ?), ?, ?, ?, ?)',
+        (vj_id, vj_id, name, lat, lon, radius_m)
+    ).lastrowid
+
+
+def delete(db, vj_id, checkpoint_id):
+    db.execute('DELETE FROM checkpoints WHERE id = ? AND vossenjacht_id = ?', (checkpoint_id, vj_id))
+
+
+def get(db, vj_id, checkpoint_id):
+    return db.execute('SELECT * FROM checkpoints WHERE id = ? AND vossenjacht_id = ?', (checkpoint_id, vj_id)).fetchone()
+
+
+def for_hunt(db, vj_id):
+    return db.execute('SELECT * FROM checkpoints WHERE vossenjacht_id = ? ORDER BY seq', (vj_id,)).fetchall()
+
+
+def in_box(db, vj_id, min_lat, max_lat, min_lon, max_lon, rtree=None):
+    """The hunt's checkpoints whose bounding box overlaps the given box."""
+    if rtree is None:
+        rtree = has_rtree(db)
+    if rtree:
+        return db.execute(
+            'SELECT c.* FROM checkpoint_rtree r JOIN checkpoints c ON c.id = r.id'
+            ' WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?'
+            ' AND r.vossenjacht_id = ?',
+            (min_lat, max_lat, min_lon, max_lon, vj_id)
+        ).fetchall()
+    return [checkpoint for checkpoint in for_hunt(db, vj_id)
+            if _overlaps(_box(checkpoint['lat'], checkpoint['lon'], checkpoint['radius_m']),
+                         (min_lat, max_lat, min_lon, max_lon))]
+
+
+def _box(lat, lon, radius_m):
+    dlat = radius_m / METERS_PER_DEGREE
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def _overlaps(a, b):
+    return a[1] >= b[0] and a[0] <= b[1] and a[3] >= b[2] and a[2] <= b[3]
+
+
+def near(db, vj_id, lat, lon):
+    """The hunt's checkpoints whose radius contains the position, nearest first, with their distance_m."""
+    found = []
+    for checkpoint in in_box(db, vj_id, lat, lat, lon, lon):
+        distance = distance_m(lat, lon, checkpoint['lat'], checkpoint['lon'])
+        if distance <= checkpoint['radius_m']:
+            found.append(dict(checkpoint, distance_m=distance))
+    return sorted(found, key=lambda checkpoint: checkpoint['distance_m'])
+
+
+def match_track(db, vj_id, lat, lon, times, chunk_points=CHUNK_POINTS):
+    """The first visit of each checkpoint the track passes, in visit order.
+
+    lat, lon and times (Unix seconds) are sequences of equal length; returns
+    dicts with the checkpoint's columns plus the visiting point's index,
+    visited_at and distance_m.
+    """
+    if db.execute('SELECT 1 FROM checkpoints WHERE vossenjacht_id = ? LIMIT 1', (vj_id,)).fetchone() is None:
+        return []
+    rtree = has_rtree(db)
+    visits = {}
+    for start in range(0, len(lat), chunk_points):
+        chunk_lat = lat[start:start + chunk_points]
+        chunk_lon = lon[start:start + chunk_points]
+        candidates = in_box(db, vj_id, min(chunk_lat), max(chunk_lat), min(chunk_lon), max(chunk_lon), rtree=rtree)
+        for checkpoint in candidates:
+            if checkpoint['id'] in visits:
+                continue
+            for i in range(len(chunk_lat)):
+                distance = distance_m(chunk_lat[i], chunk_lon[i], checkpoint['lat'], checkpoint['lon'])
+                if distance <= checkpoint['radius_m']:
+                    visits[checkpoint['id']] = dict(checkpoint, index=start + i, visited_at=float(times[start + i]),
+                                                    distance_m=distance)
+                    break
+    return sorted(visits.values(), key=lambda visit: visit['visited_at'])
+
+
+def last_fox_visit(db, vj_id, visits):
+    """The visit of the hunt's last fox (highest seq), or None when the track didn't reach it."""
+    last = db.execute('SELECT MAX(seq) FROM checkpoints WHERE vossenjacht_id = ?', (vj_id,)).fetchone()[0]
+    for visit in visits:
+        if visit['seq'] == last:
+            return visit
+    return None
@@ -0,0 +1,81 @@
+"""Results and leaderboard data, shared by the Flask views and the ASGI read path.
+
+Both ``app.results`` and ``asgi.py`` build the results page from
+``results_context`` and the JSON leaderboard from ``leaderboard``, so the
+ranking (``scoring.dense_rank``) and the archive fallback are the same
+whichever server answers. Everything here takes a plain connection and no
+Flask globals, so it can run on the async path's database threads.
+"""
+import archive
+import repositories
+import scoring
+
+
+def results_context(db, vj_id, archive_path, repos=None):
+    """Template variables for results.html: one hunt (vj_id) or the overview of all hunts (None).
+
+    repos are the app's repositories (e.g. the memory backend); by default the SQLite ones on db.
+    """
+    if repos is None:
+        repos = repositories.sqlite(db)
+    all_vossenjachten = repos.hunts.names()
+
+    # Archived hunts live in a separate file that is only attached when one is requested
+    archived_vossenjacht = None
+    if vj_id and not any(vj['id'] == vj_id for vj in all_vossenjachten):
+        archived_vossenjacht = archive.find_hunt(db, archive_path, vj_id)
+        if archived_vossenjacht is not None:
+            repos = repositories.sqlite(db, schema=archive.SCHEMA)
+            all_vossenjachten = list(all_vossenjachten) + [archived_vossenjacht]
+
+    current_vossenjacht_name = None
+    current_vossenjacht_type = None
+    if vj_id:
+        vj_details = repos.hunts.get(vj_id)
+        if vj_details:
+            current_vossenjacht_name = vj_details['name']
+            current_vossenjacht_type = vj_details['type']
+
+    # Dense rank in the hunt's own order ('time' hunts by duration first); the overview ranks by kilometers
+    entries = scoring.dense_rank(repos.entries.results(vj_id), current_vossenjacht_type if vj_id else None)
+    for entry in entries:
+        entry['start_km'] = int(entry['start_km'])
+        entry['end_km'] = int(entry['end_km'])
+        entry['calculated_km'] = int(entry['calculated_km'])
+
+    return {
+        'entries': entries,
+        'total_kilometers_all_participants': int(sum(entry['calculated_km'] for entry in entries)),
+        'all_vossenjachten': all_vossenjachten,
+        'selected_vj_id': vj_id,
+        'current_vossenjacht_name': current_vossenjacht_name,
+        'current_vossenjacht_type': current_vossenjacht_type,
+        'archived': archived_vossenjacht is not None,
+    }
+
+
+def leaderboard(db, vj_id, archive_path):
+    """The ranked entries of a hunt (or all hunts) as a JSON-ready dict."""
+    return from_context(results_context(db, vj_id, archive_path), vj_id)
+
+
+def from_context(context, vj_id):
+    """The JSON leaderboard for a results_context() dict."""
+    vossenjacht = None
+    if context['current_vossenjacht_name'] is not None:
+        vossenjacht = {'id': vj_id, 'name': context['current_vossenjacht_name'],
+                       'type': context['current_vossenjacht_type'], 'archived': context['archived']}
+    return {
+        'vossenjacht': vossenjacht,
+        'total_km': context['total_kilometers_all_participants'],
+        'entries': [{
+            'rank': entry['rank'],
+            'name': entry['name'],
+            'participant_id': entry['participant_id'],
+            'vossenjacht_id': entry['vossenjacht_id'],
+            'vossenjacht_name': entry['vossenjacht_name'],
+            'calculated_km': entry['calculated_km'],
+            'duration_minutes': entry['duration_minutes'],
+            'arrival_time_last_fox': entry['arrival_time_last_fox'],
+        } for entry in context['entries']],
+    }
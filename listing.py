@@ -0,0 +1,207 @@
+"""Paginated, filtered listings: entries for the settings page, vossenjachten for their overview.
+
+Pages are fetched with keyset pagination: the cursor holds the sort value and
+id of the last (or first) row shown, and the next page is the rows after that
+``(sort value, id)`` pair. Only one page of rows is read, no matter how deep
+the user pages, and rows inserted meanwhile don't shift the page boundaries.
+Ranks are the stored per-hunt ``hunt_rank``, not a rank across unrelated hunts.
+"""
+import base64
+import heapq
+import json
+from datetime import datetime
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+# Sortable columns: name in the URL -> SQL column. All are NOT NULL, so row-value comparisons hold, and
+# each has a (column, id) index (see migrate_db in app.py) that the planner walks from the cursor instead
+# of sorting all entries. 'vossenjacht' groups by hunt in the order the hunts were created, on
+# idx_entries_vossenjacht (the rowid completes it); a hunt's name lives in another table and can't be walked.
+# With a hunt filter (or a moderator's own hunts) only those hunts' rows are read and sorted, except for
+# 'rank' and 'vossenjacht' within one hunt, which come straight from the index
+SORT_COLUMNS = {
+    'created': 'e.created_at',
+    'name': 'e.name',
+    'vossenjacht': 'e.vossenjacht_id',
+    'rank': 'e.hunt_rank',
+    'km': 'e.calculated_km',
+    'duration': 'e.duration_minutes',
+    'arrival': 'e.arrival_minutes',
+}
+DEFAULT_SORT = 'created'
+
+
+def encode_cursor(sort_value, entry_id):
+    raw = json.dumps([sort_value, entry_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (sort_value, entry_id), or None for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort_value, entry_id = json.loads(raw)
+        return sort_value, int(entry_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_date(value):
+    # 'YYYY-MM-DD' from an <input type="date">; None when empty, ValueError when malformed
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+
+def list_entries(db, filters=None, sort=DEFAULT_SORT, direction='desc', after=None, before=None,
+                 per_page=DEFAULT_PER_PAGE):
+    """One page of entries plus the cursors for the neighbouring pages.
+
+    filters may contain creator_id, vj_id, status, participant_id, date_from and date_to
+    (inclusive 'YYYY-MM-DD' dates on the entry's created_at). Returns a dict with
+    'entries', 'next_cursor' and 'prev_cursor' (None when there is no such page).
+    """
+    filters = filters or {}
+    if sort not in SORT_COLUMNS:
+        sort = DEFAULT_SORT
+    direction = 'asc' if direction == 'asc' else 'desc'
+    per_page = max(1, min(int(per_page), MAX_PER_PAGE))
+    sort_expr = SORT_COLUMNS[sort]
+
+    conditions = []
+    params = []
+    if filters.get('creator_id') is not None:
+        conditions.append('vj.creator_id = ?')
+        params.append(filters['creator_id'])
+    if filters.get('vj_id'):
+        conditions.append('e.vossenjacht_id = ?')
+        params.append(filters['vj_id'])
+    if filters.get('status'):
+        conditions.append('vj.status = ?')
+        params.append(filters['status'])
+    if filters.get('participant_id'):
+        conditions.append('e.participant_id = ?')
+        params.append(filters['participant_id'])
+    if filters.get('date_from'):
+        conditions.append('e.created_at >= ?')
+        params.append(filters['date_from'])
+    if filters.get('date_to'):
+        conditions.append("e.created_at < date(?, '+1 day')")
+        params.append(filters['date_to'])
+
+    # Paging backwards walks the index the other way and flips the rows afterwards
+    cursor = decode_cursor(before)
+    backwards = cursor is not None
+    if not backwards:
+        cursor = decode_cursor(after)
+    ascending = (direction == 'asc') != backwards
+    if cursor is not None:
+        conditions.append(f"({sort_expr}, e.id) {'>' if ascending else '<'} (?, ?)")
+        params.extend(cursor)
+
+    order = 'ASC' if ascending else 'DESC'
+    # The cursor holds the stored text, not the datetime the TIMESTAMP converter would make of created_at
+    sort_value = f'CAST({sort_expr} AS TEXT)' if sort == 'created' else sort_expr
+    sql = (f'SELECT e.*, vj.name as vossenjacht_name, vj.status as vossenjacht_status, {sort_value} as sort_value'
+           ' FROM entries e JOIN vossenjachten vj ON e.vossenjacht_id = vj.id')
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += f' ORDER BY {sort_expr} {order}, e.id {order} LIMIT ?'
+    rows = db.execute(sql, params + [per_page + 1]).fetchall()
+    rows, next_cursor, prev_cursor = _page(rows, per_page, backwards, cursor is not None)
+    return {'entries': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+
+def _page(rows, per_page, backwards, has_cursor):
+    """Trim the per_page + 1 rows fetched to one page in display order; returns (rows, next_cursor, prev_cursor)."""
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        first = encode_cursor(rows[0]['sort_value'], rows[0]['id'])
+        last = encode_cursor(rows[-1]['sort_value'], rows[-1]['id'])
+        if backwards:
+            next_cursor = last
+            prev_cursor = first if has_more else None
+        else:
+            next_cursor = last if has_more else None
+            prev_cursor = first if has_cursor else None
+    return rows, next_cursor, prev_cursor
+
+
+def paginate(rows, sort_value, direction='desc', after=None, before=None, per_page=DEFAULT_PER_PAGE):
+    """Keyset paging over rows already in memory (dicts with an 'id'), with the same cursors as the queries.
+
+    sort_value(row) is the value the cursor holds. Returns (rows, next_cursor, prev_cursor); each row
+    on the page gets its 'sort_value'.
+    """
+    per_page = max(1, min(int(per_page), MAX_PER_PAGE))
+    cursor = decode_cursor(before)
+    backwards = cursor is not None
+    if not backwards:
+        cursor = decode_cursor(after)
+    ascending = (direction == 'asc') != backwards
+    keyed = [((sort_value(row), row['id']), row) for row in rows]
+    if cursor is not None:
+        try:
+            keyed = [(key, row) for key, row in keyed if (key > cursor if ascending else key < cursor)]
+        except TypeError:
+            pass # A cursor from another sort column: start from the first page, as a malformed one does
+    # Only the page (and one row to tell whether there is a next one) is sorted
+    pick = heapq.nsmallest if ascending else heapq.nlargest
+    page = [dict(row, sort_value=key[0]) for key, row in pick(per_page + 1, keyed, key=lambda item: item[0])]
+    return _page(page, per_page, backwards, cursor is not None)
+
+
+def list_vossenjachten(db, filters=None, after=None, before=None, per_page=DEFAULT_PER_PAGE):
+    """One page of vossenjachten, newest first, with their entry statistics.
+
+    filters may contain status and creator_id. Each row has the hunt's columns, creator_username,
+    entry_count, total_km, best_km and best_duration (the scores of the rank 1 entry) and
+    last_entry_at. Returns a dict with 'vossenjachten', 'next_cursor' and 'prev_cursor'.
+    """
+    filters = filters or {}
+    per_page = max(1, min(int(per_page), MAX_PER_PAGE))
+
+    conditions = []
+    params = []
+    if filters.get('status'):
+        conditions.append('status = ?')
+        params.append(filters['status'])
+    if filters.get('creator_id') is not None:
+        conditions.append('creator_id = ?')
+        params.append(filters['creator_id'])
+
+    cursor = decode_cursor(before)
+    backwards = cursor is not None
+    if not backwards:
+        cursor = decode_cursor(after)
+    if cursor is not None:
+        conditions.append(f"(creation_date, id) {'>' if backwards else '<'} (?, ?)")
+        params.extend(cursor)
+    order = 'ASC' if backwards else 'DESC'
+
+    # The page of hunts is picked first (idx_vossenjachten_status_created / _creator_created), so only
+    # the entries of those hunts are aggregated, through idx_entries_vossenjacht_rank
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    rows = db.execute(
+        'SELECT vj.id, vj.name, vj.creation_date, vj.status, vj.type, vj.start_time, vj.creator_id,'
+        ' u.username as creator_username, CAST(vj.creation_date AS TEXT) as sort_value,'
+        ' COUNT(e.id) as entry_count, COALESCE(SUM(e.calculated_km), 0) as total_km,'
+        ' MAX(CASE WHEN e.hunt_rank = 1 THEN e.calculated_km END) as best_km,'
+        ' MIN(CASE WHEN e.hunt_rank = 1 THEN e.duration_minutes END) as best_duration,'
+        ' MAX(e.created_at) as last_entry_at'
+        f' FROM (SELECT * FROM vossenjachten{where} ORDER BY creation_date {order}, id {order} LIMIT ?) vj'
+        ' LEFT JOIN users u ON u.id = vj.creator_id'
+        ' LEFT JOIN entries e ON e.vossenjacht_id = vj.id'
+        f' GROUP BY vj.id ORDER BY vj.creation_date {order}, vj.id {order}',
+        params + [per_page + 1]
+    ).fetchall()
+    rows, next_cursor, prev_cursor = _page(rows, per_page, backwards, cursor is not None)
+    return {'vossenjachten': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
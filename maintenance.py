@@ -0,0 +1,231 @@
+"""Routine database maintenance: statistics, free space, WAL and integrity.
+
+``flask db-maintain`` runs these steps on the main database and on every club
+shard, timing each one and logging the space it freed:
+
+  optimize    ``PRAGMA optimize``; a full ``ANALYZE`` while there are no
+              statistics yet (or with ``--analyze``)
+  convert     only with ``--convert-vacuum``: a one-time full ``VACUUM`` that
+              switches a database created before incremental vacuum to
+              ``auto_vacuum = INCREMENTAL``
+  vacuum      ``PRAGMA incremental_vacuum`` in steps of
+              ``MAINTENANCE_VACUUM_PAGES``, at most ``MAINTENANCE_VACUUM_MAX_PAGES``
+              per run (see purge.py for the auto_vacuum mode it needs)
+  checkpoint  ``PRAGMA wal_checkpoint(TRUNCATE)`` for databases in WAL mode
+  integrity   ``PRAGMA integrity_check`` of the whole file on the first run of
+              a process and every ``MAINTENANCE_INTEGRITY_EVERY`` runs after
+              that; in between of one table per run, in turn (SQLite 3.33+)
+
+A run is skipped while a hunt is taking entries: an active vossenjacht with
+an entry in the last ``MAINTENANCE_IDLE_MINUTES``. With
+``MAINTENANCE_INTERVAL_MINUTES`` set, a background thread tries a run on that
+interval, so maintenance happens in the quiet hours between hunts.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+import purge
+import shards
+
+# SQLite 3.33 added integrity_check(TABLE); older versions can only check the whole file
+_TABLE_INTEGRITY_CHECK = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+# Per database file: how many runs this process made, to pick the next table to check
+_run_counts = {}
+
+
+def init_app(flask_app):
+    config = flask_app.config
+    # 0 disables the background scheduler
+    config.setdefault('MAINTENANCE_INTERVAL_MINUTES', float(os.environ.get('MAINTENANCE_INTERVAL_MINUTES', 0)))
+    config.setdefault('MAINTENANCE_IDLE_MINUTES', float(os.environ.get('MAINTENANCE_IDLE_MINUTES', 30)))
+    config.setdefault('MAINTENANCE_VACUUM_PAGES', int(os.environ.get('MAINTENANCE_VACUUM_PAGES', 1000)))
+    config.setdefault('MAINTENANCE_VACUUM_MAX_PAGES', int(os.environ.get('MAINTENANCE_VACUUM_MAX_PAGES', 100000)))
+    config.setdefault('MAINTENANCE_PAUSE_MS', float(os.environ.get('MAINTENANCE_PAUSE_MS', 20)))
+    config.setdefault('MAINTENANCE_INTEGRITY_EVERY', int(os.environ.get('MAINTENANCE_INTEGRITY_EVERY', 7)))
+    flask_app.before_request(_start_scheduler_once)
+
+
+def options_from_config(config):
+    return {
+        'idle_minutes': float(config['MAINTENANCE_IDLE_MINUTES']),
+        'vacuum_pages': int(config['MAINTENANCE_VACUUM_PAGES']),
+        'vacuum_max_pages': int(config['MAINTENANCE_VACUUM_MAX_PAGES']),
+        'pause': float(config['MAINTENANCE_PAUSE_MS']) / 1000.0,
+        'integrity_every': int(config['MAINTENANCE_INTEGRITY_EVERY']),
+    }
+
+
+def database_paths(config):
+    """The main database and, with sharding, every club shard."""
+    paths = [shards.catalog_path(config)]
+    if shards.is_enabled(config):
+        paths += [shard['path'] for shard in shards.list_shards(config)]
+    return paths
+
+
+def busy_hunt(db, idle_minutes):
+    """The name of an active vossenjacht that received an entry in the last idle_minutes, or None."""
+    row = db.execute(
+        "SELECT v.name FROM entries e JOIN vossenjachten v ON v.id = e.vossenjacht_id"
+        " WHERE v.status = 'active' AND e.created_at >= datetime('now', ?) LIMIT 1",
+        (f'-{float(idle_minutes)} minutes',)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _file_size(db_path):
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+
+def optimize(db, analyze=False):
+    has_stats = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None
+    if analyze or not has_stats:
+        db.execute('ANALYZE')
+        return 'ANALYZE (full)'
+    db.execute('PRAGMA optimize')
+    return 'PRAGMA optimize'
+
+
+def checkpoint(db):
+    if db.execute('PRAGMA journal_mode').fetchone()[0].lower() != 'wal':
+        return 'skipped, not in WAL mode'
+    busy, log_pages, checkpointed = db.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    return f"{checkpointed}/{log_pages} WAL pages checkpointed" + (', busy' if busy else '')
+
+
+def integrity(db, run_number, every):
+    """Check the whole file or, on runs in between, one table; returns (ok, detail)."""
+    tables = [row[0] for row in db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    ).fetchall()]
+    if every <= 1 or run_number % every == 0:
+        target, results = 'whole file', db.execute('PRAGMA integrity_check').fetchall()
+    elif _TABLE_INTEGRITY_CHECK and tables:
+        target = tables[run_number % len(tables)]
+        results = db.execute(f'PRAGMA integrity_check("{target}")').fetchall()
+    else:
+        return True, 'skipped until the next full check'
+    problems = [row[0] for row in results if row[0] != 'ok']
+    if problems:
+        return False, f"{target}: {'; '.join(problems[:5])}"
+    return True, f"{target}: ok"
+
+
+def run(db_path, options, force=False, analyze=False, convert_vacuum=False, log=print):
+    """One maintenance run on db_path; returns {'skipped': reason or None, 'ok': bool, 'steps': [...]}."""
+    result = {'path': db_path, 'skipped': None, 'ok': True, 'steps': [], 'freed_bytes': 0}
+    db = sqlite3.connect(db_path, timeout=30)
+    try:
+        if not force:
+            hunt = busy_hunt(db, options['idle_minutes'])
+            if hunt is not None:
+                result['skipped'] = f"vossenjacht '{hunt}' is taking entries"
+                log(f"Maintenance of {db_path} skipped: {result['skipped']}")
+                return result
+        run_number = _run_counts.get(db_path, 0)
+        _run_counts[db_path] = run_number + 1
+        size_before = _file_size(db_path)
+        page_size = db.execute('PRAGMA page_size').fetchone()[0]
+
+        def step(name, fn):
+            started = time.perf_counter()
+            before = _file_size(db_path)
+            detail = fn()
+            seconds = time.perf_counter() - started
+            freed = max(before - _file_size(db_path), 0)
+            result['steps'].append({'step': name, 'seconds': seconds, 'freed_bytes': freed, 'detail': detail})
+            log(f"Maintenance of {db_path}: {name} took {seconds:.2f}s, freed {freed} bytes ({detail})")
+
+        step('optimize', lambda: optimize(db, analyze))
+        if convert_vacuum:
+            step('convert', lambda: 'auto_vacuum switched to INCREMENTAL' if purge.enable_incremental_vacuum(db)
+                 else 'skipped, auto_vacuum is already INCREMENTAL')
+
+        def vacuum():
+            pages = purge.incremental_vacuum(db, options['vacuum_pages'], options['pause'],
+                                             max_pages=options['vacuum_max_pages'])
+            remaining = db.execute('PRAGMA freelist_count').fetchone()[0]
+            if not purge.incremental_vacuum_enabled(db):
+                return f"skipped, auto_vacuum is not INCREMENTAL ({remaining} free pages; see --convert-vacuum)"
+            return f"{pages} pages ({pages * page_size} bytes) released, {remaining} free pages left"
+        step('vacuum', vacuum)
+        step('checkpoint', lambda: checkpoint(db))
+
+        def check():
+            result['ok'], detail = integrity(db, run_number, options['integrity_every'])
+            return detail
+        step('integrity', check)
+        result['freed_bytes'] = max(size_before - _file_size(db_path), 0)
+        if not result['ok']:
+            log(f"Integrity problem in {db_path}: {result['steps'][-1]['detail']}")
+        return result
+    finally:
+        db.close()
+
+
+# --- background scheduler ---
+
+class MaintenanceScheduler:
+    def __init__(self, targets, interval_seconds, options):
+        # targets() returns the database files to maintain; the shard list can change while the app runs
+        self.targets = targets
+        self.interval_seconds = interval_seconds
+        self.options = options
+        self.last_results = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='maintenance-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            results = []
+            for db_path in self.targets():
+                try:
+                    results.append(run(db_path, self.options))
+                except sqlite3.Error as e:
+                    print(f"Scheduled maintenance of {db_path} failed: {e}")
+            self.last_results = results
+
+
+scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _start_scheduler_once():
+    global scheduler
+    if scheduler is not None:
+        return
+    config = current_app.config
+    interval = float(config.get('MAINTENANCE_INTERVAL_MINUTES') or 0)
+    db_path = config.get('DATABASE', config['DATABASE_FILENAME'])
+    if interval <= 0 or db_path == ':memory:' or config.get('TESTING'):
+        return
+    with _scheduler_lock:
+        if scheduler is None:
+            scheduler = MaintenanceScheduler(lambda: database_paths(config), interval * 60,
+                                             options_from_config(config)).start()
+
+
+def stop_scheduler():
+    if scheduler is not None:
+        scheduler.stop()
+
+
+atexit.register(stop_scheduler)
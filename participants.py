@@ -0,0 +1,175 @@
+"""Participants recognised across vossenjachten.
+
+``entries.name`` is typed in by hand on every submission. Each entry is
+linked to a row in ``participants`` through ``entries.participant_id``; the
+participant is found by ``name_key``, a case-folded and whitespace-normalised
+form of the name, so "Jan  de Vries" and "jan de vries" end up as the same
+person and a participant's history is an index range scan on
+``idx_entries_participant``.
+
+``NameIndex`` answers the name suggestions of the entry form from memory:
+sorted arrays of normalised names (and of every word-start within them)
+searched with ``bisect``, so a keystroke costs a binary search instead of
+a query. It is filled from ``participants`` on first use, extended by the
+entry routes as they create participants, and catches up on participants
+added by other workers with an ``id > last seen`` query at most once per
+``SUGGEST_REFRESH_SECONDS``.
+"""
+import bisect
+import os
+import threading
+import time
+import unicodedata
+
+
+def init_app(flask_app):
+    flask_app.config.setdefault('SUGGEST_REFRESH_SECONDS', float(os.environ.get('SUGGEST_REFRESH_SECONDS', 15)))
+
+
+def participant_key(name):
+    # Case-folded, whitespace-normalised name used to recognise the same participant across hunts
+    return ' '.join(unicodedata.normalize('NFKC', name or '').casefold().split())
+
+
+def display_name(name):
+    return ' '.join((name or '').split())
+
+
+def get_or_create(db, name):
+    """Return the participant id for this name, creating the participant on first use."""
+    key = participant_key(name)
+    if not key:
+        return None
+    db.execute('INSERT INTO participants (name, name_key) VALUES (?, ?) ON CONFLICT (name_key) DO NOTHING',
+               (display_name(name), key))
+    return db.execute('SELECT id FROM participants WHERE name_key = ?', (key,)).fetchone()['id']
+
+
+def backfill(db, batch_size=1000, commit=True):
+    """Link entries without a participant_id, batch_size entries per transaction.
+
+    Names that normalise to the same key are merged into one participant.
+    Returns the number of entries that were linked.
+    """
+    linked = 0
+    last_id = 0
+    known = {}
+    while True:
+        rows = db.execute(
+            'SELECT id, name FROM entries WHERE participant_id IS NULL AND id > ? ORDER BY id LIMIT ?',
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            key = participant_key(row['name'])
+            if not key:
+                continue
+            if key not in known:
+                known[key] = get_or_create(db, row['name'])
+            updates.append((known[key], row['id']))
+        db.executemany('UPDATE entries SET participant_id = ? WHERE id = ?', updates)
+        if commit:
+            db.commit()
+        linked += len(updates)
+        last_id = rows[-1]['id']
+    return linked
+
+
+def history(db, participant_id, schemas=('main',)):
+    # Newest first; served from idx_entries_participant in every schema (e.g. also the attached archive)
+    selects = [
+        'SELECT e.id as id, e.name, e.calculated_km, e.duration_minutes, e.arrival_time_last_fox, e.hunt_rank, e.vossenjacht_id,'
+        ' vj.name as vossenjacht_name, vj.type as vossenjacht_type, vj.creation_date as vossenjacht_date,'
+        f" {int(schema != 'main')} as archived"
+        f' FROM {schema}.entries e JOIN {schema}.vossenjachten vj ON e.vossenjacht_id = vj.id'
+        ' WHERE e.participant_id = ?'
+        for schema in schemas
+    ]
+    return db.execute(' UNION ALL '.join(selects) + ' ORDER BY id DESC', (participant_id,) * len(selects)).fetchall()
+
+
+class NameIndex:
+    def __init__(self):
+        self.last_id = 0
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self._names = {} # participant id -> display name
+        # Sorted (key, id): whole normalised names, and the rest of the name from each later word on
+        self._full = []
+        self._words = []
+
+    def _entries(self, participant_id, name):
+        words = participant_key(name).split(' ')
+        return ((' '.join(words), participant_id),
+                [(' '.join(words[i:]), participant_id) for i in range(1, len(words))])
+
+    def add(self, participant_id, name):
+        if participant_id is None or not participant_key(name):
+            return
+        with self._lock:
+            if participant_id in self._names:
+                return
+            full, words = self._entries(participant_id, name)
+            bisect.insort(self._full, full)
+            for word in words:
+                bisect.insort(self._words, word)
+            # last_id is left to load(): participants other workers created before this one are still to come
+            self._names[participant_id] = display_name(name)
+
+    def load(self, db):
+        """Add the participants created since the last load (all of them the first time)."""
+        if db.execute('SELECT COALESCE(MAX(id), 0) FROM participants').fetchone()[0] < self.last_id:
+            # Ids went back (a restored backup): start over
+            with self._lock:
+                self.last_id = 0
+                self._names, self._full, self._words = {}, [], []
+        rows = db.execute('SELECT id, name FROM participants WHERE id > ? ORDER BY id', (self.last_id,)).fetchall()
+        with self._lock:
+            for row in rows:
+                self.last_id = max(self.last_id, row['id'])
+                if row['id'] in self._names or not participant_key(row['name']):
+                    continue
+                full, words = self._entries(row['id'], row['name'])
+                self._full.append(full)
+                self._words.extend(words)
+                self._names[row['id']] = display_name(row['name'])
+            if rows:
+                self._full.sort()
+                self._words.sort()
+            self.loaded_at = time.monotonic()
+        return self
+
+    def is_stale(self, max_age):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at >= max_age
+
+    def suggest(self, query, limit=10):
+        """Up to limit {'id', 'name'} whose name starts with query, then those with a later word that does."""
+        prefix = participant_key(query)
+        if not prefix or limit <= 0:
+            return []
+        found = []
+        with self._lock:
+            for keys in (self._full, self._words):
+                i = bisect.bisect_left(keys, (prefix,))
+                while i < len(keys) and len(found) < limit and keys[i][0].startswith(prefix):
+                    participant_id = keys[i][1]
+                    if participant_id not in found:
+                        found.append(participant_id)
+                    i += 1
+            return [{'id': participant_id, 'name': self._names[participant_id]} for participant_id in found]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(db_path):
+    """The process-wide name index of a database file; None for in-memory databases."""
+    if db_path == ':memory:':
+        return None
+    with _indexes_lock:
+        if db_path not in _indexes:
+            _indexes[db_path] = NameIndex()
+        return _indexes[db_path]
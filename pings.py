@@ -0,0 +1,303 @@
+"""Live car positions: pings kept in memory, stored in batches.
+
+Cars (a phone in each car) post batches of positions to
+``/api/vossenjachten/<id>/pings``. The request never touches SQLite: each
+ping goes into the ring buffer of its car (the last ``PINGS_BUFFER_SIZE``
+positions, at most one per ``PINGS_BUFFER_INTERVAL_S``), and at most one
+ping per car per ``PINGS_STORE_INTERVAL_S`` is queued for storage.
+A flusher thread writes the queue to ``car_pings`` every ``PINGS_FLUSH_MS``
+in one transaction on its own connection; when the database is busy the
+rows stay queued for the next round (at most ``PINGS_MAX_PENDING``; the
+oldest are dropped beyond that). The live feed (``/api/vossenjachten/<id>/live``)
+is read from the ring buffers. A hunt keeps buffers for at most
+``PINGS_MAX_CARS`` cars; pings of further cars are rejected, so a device
+inventing car names can't grow the process without bound. Only active hunts
+take pings, and a hunt's buffers are dropped when it stops being active (its
+queued pings are still stored) or is deleted. Other worker processes drop
+theirs on the hunt's next ping or live feed request.
+
+Buffers live in the process that received the pings; with several worker
+processes send a hunt's pings and its live feed to the same one.
+
+Devices authenticate with a per-hunt token (``Authorization: Bearer ...``),
+an HMAC of the hunt id under the app's secret key, so checking it needs no
+query either. Organisers get it from ``/api/vossenjachten/<id>/ping-token``.
+"""
+import atexit
+import hashlib
+import hmac
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+PINGS_SQL = '''
+    -- Stored (downsampled) live positions; no foreign keys, so a batch never fails on a deleted hunt
+    CREATE TABLE IF NOT EXISTS car_pings (
+        id INTEGER PRIMARY KEY,
+        vossenjacht_id INTEGER NOT NULL,
+        car TEXT NOT NULL,
+        entry_id INTEGER,
+        recorded_at REAL NOT NULL, -- Unix seconds of the position fix
+        lat REAL NOT NULL,
+        lon REAL NOT NULL,
+        speed_kmh REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_car_pings_hunt_car ON car_pings (vossenjacht_id, car, recorded_at);
+'''
+
+INSERT_SQL = ('INSERT INTO car_pings (vossenjacht_id, car, entry_id, recorded_at, lat, lon, speed_kmh)'
+              ' VALUES (?, ?, ?, ?, ?, ?, ?)')
+
+
+class PingError(ValueError):
+    pass
+
+
+def init_app(flask_app):
+    config = flask_app.config
+    config.setdefault('PINGS_BUFFER_SIZE', int(os.environ.get('PINGS_BUFFER_SIZE', 120)))
+    config.setdefault('PINGS_BUFFER_INTERVAL_S', float(os.environ.get('PINGS_BUFFER_INTERVAL_S', 1)))
+    config.setdefault('PINGS_STORE_INTERVAL_S', float(os.environ.get('PINGS_STORE_INTERVAL_S', 5)))
+    config.setdefault('PINGS_FLUSH_MS', float(os.environ.get('PINGS_FLUSH_MS', 1000)))
+    config.setdefault('PINGS_MAX_PENDING', int(os.environ.get('PINGS_MAX_PENDING', 100000)))
+    config.setdefault('PINGS_MAX_BATCH', int(os.environ.get('PINGS_MAX_BATCH', 1000)))
+    config.setdefault('PINGS_MAX_CARS', int(os.environ.get('PINGS_MAX_CARS', 500)))
+
+
+def install(db):
+    db.executescript(PINGS_SQL)
+
+
+def token(secret_key, vj_id):
+    """The ping token of a hunt; changes only with the secret key."""
+    key = secret_key.encode() if isinstance(secret_key, str) else secret_key
+    return hmac.new(key, f'pings:{int(vj_id)}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def check_token(secret_key, vj_id, value):
+    return bool(value) and hmac.compare_digest(token(secret_key, vj_id), value)
+
+
+def parse_pings(payload, max_batch, parse_time, now=None):
+    """Rows (car, entry_id, t, lat, lon, speed_kmh) from a JSON body; raises PingError."""
+    if not isinstance(payload, dict) or not isinstance(payload.get('pings'), list):
+        raise PingError("Expected a JSON object with a 'pings' list")
+    items = payload['pings']
+    if len(items) > max_batch:
+        raise PingError(f"At most {max_batch} pings per request")
+    now = time.time() if now is None else now
+    rows = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise PingError('Every ping must be an object')
+        entry_id = item.get('entry_id', payload.get('entry_id'))
+        car = item.get('car', payload.get('car'))
+        if car is None and entry_id is not None:
+            car = f'entry-{entry_id}'
+        if not car or len(str(car)) > 64:
+            raise PingError('Every ping needs a car (at most 64 characters) or an entry_id')
+        try:
+            lat, lon = float(item['lat']), float(item['lon'])
+            entry_id = None if entry_id is None else int(entry_id)
+            speed = item.get('speed_kmh')
+            speed = None if speed is None else float(speed)
+            t = item.get('t')
+            t = parse_time(t) if isinstance(t, str) else (None if t is None else float(t))
+            t = now if t is None else t
+        except (KeyError, TypeError, ValueError):
+            raise PingError('Every ping needs numeric lat and lon, and t as Unix seconds or ISO 8601') from None
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not math.isfinite(t):
+            raise PingError(f"Invalid position {lat}, {lon}")
+        rows.append((str(car), entry_id, t, lat, lon, speed))
+    return rows
+
+
+class CarBuffer:
+    __slots__ = ('positions', 'entry_id', 'last_stored')
+
+    def __init__(self, size):
+        self.positions = deque(maxlen=size) # (t, lat, lon, speed_kmh), oldest first
+        self.entry_id = None
+        self.last_stored = -math.inf
+
+
+class PingStore:
+    """Ring buffers per (hunt, car) and the queue of pings waiting to be stored."""
+
+    def __init__(self, buffer_size=120, buffer_interval=1.0, store_interval=5.0, max_pending=100000, max_cars=500):
+        self.buffer_size = buffer_size
+        self.buffer_interval = buffer_interval
+        self.store_interval = store_interval
+        self.max_pending = max_pending
+        self.max_cars = max_cars
+        self.stats = {'received': 0, 'buffered': 0, 'queued': 0, 'stored': 0, 'dropped': 0, 'flushes': 0, 'errors': 0,
+                      'rejected': 0}
+        self._lock = threading.Lock()
+        self._cars = {} # vossenjacht_id -> {car: CarBuffer}
+        self._pending = []
+
+    def add(self, vj_id, rows):
+        """Take parsed pings of one hunt; returns how many were kept for the live feed."""
+        buffered = rejected = 0
+        with self._lock:
+            cars = self._cars.setdefault(vj_id, {})
+            for car, entry_id, t, lat, lon, speed in rows:
+                buffer = cars.get(car)
+                if buffer is None:
+                    if len(cars) >= self.max_cars:
+                        # The hunt already has all the cars it can have; an unknown one is noise
+                        rejected += 1
+                        continue
+                    buffer = cars[car] = CarBuffer(self.buffer_size)
+                if entry_id is not None:
+                    buffer.entry_id = entry_id
+                positions = buffer.positions
+                # Older than the last kept position (late or repeated): only the feed's history would change
+                if not positions or t >= positions[-1][0] + self.buffer_interval:
+                    positions.append((t, lat, lon, speed))
+                    buffered += 1
+                if t >= buffer.last_stored + self.store_interval:
+                    buffer.last_stored = t
+                    self._pending.append((vj_id, car, buffer.entry_id, t, lat, lon, speed))
+                    self.stats['queued'] += 1
+            self.stats['received'] += len(rows)
+            self.stats['buffered'] += buffered
+            self.stats['rejected'] += rejected
+            self._trim_pending()
+        return buffered
+
+    def _trim_pending(self):
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self.stats['dropped'] += overflow
+
+    def take_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def requeue(self, rows):
+        # A failed flush: put its rows back in front, in their original order
+        with self._lock:
+            self._pending[:0] = rows
+            self._trim_pending()
+
+    def flush(self, db):
+        """Store the queued pings in one transaction; returns the number stored."""
+        rows = self.take_pending()
+        if not rows:
+            return 0
+        try:
+            db.executemany(INSERT_SQL, rows)
+            db.commit()
+        except sqlite3.Error as e:
+            db.rollback()
+            self.requeue(rows)
+            with self._lock:
+                self.stats['errors'] += 1
+            print(f"Storing {len(rows)} pings failed, retrying next round: {e}")
+            return 0
+        with self._lock:
+            self.stats['stored'] += len(rows)
+            self.stats['flushes'] += 1
+        return len(rows)
+
+    def live(self, vj_id, trail=0, max_age=None, now=None):
+        """The last position of every car of a hunt (with up to `trail` earlier ones), newest first."""
+        now = time.time() if now is None else now
+        cars = []
+        with self._lock:
+            for car, buffer in self._cars.get(vj_id, {}).items():
+                if not buffer.positions:
+                    continue
+                t, lat, lon, speed = buffer.positions[-1]
+                if max_age is not None and now - t > max_age:
+                    continue
+                position = {'car': car, 'entry_id': buffer.entry_id, 't': t, 'lat': lat, 'lon': lon, 'speed_kmh': speed}
+                if trail:
+                    history = list(buffer.positions)[-trail - 1:-1]
+                    position['trail'] = [[t, lat, lon] for t, lat, lon, _ in history]
+                cars.append(position)
+        cars.sort(key=lambda position: position['t'], reverse=True)
+        return cars
+
+    def forget(self, vj_id, keep_pending=False):
+        """Drop a hunt's buffers; its queued pings too, unless keep_pending."""
+        with self._lock:
+            self._cars.pop(vj_id, None)
+            if not keep_pending:
+                self._pending = [row for row in self._pending if row[0] != vj_id]
+
+    def snapshot_stats(self):
+        with self._lock:
+            return dict(self.stats, pending=len(self._pending), cars=sum(len(cars) for cars in self._cars.values()))
+
+
+class PingFlusher:
+    """Writes a store's queue to its database file on a daemon thread, every interval seconds."""
+
+    def __init__(self, store, db_path, interval):
+        self.store = store
+        self.db_path = db_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='ping-flusher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        db = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            while not self._stop.wait(self.interval):
+                self.store.flush(db)
+            # Whatever came in since the last round
+            self.store.flush(db)
+        finally:
+            db.close()
+
+
+_stores = {}
+_flushers = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path, config):
+    """The process-wide ping store of a database file, with its flusher running (not for :memory:)."""
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = _stores[db_path] = PingStore(
+                int(config['PINGS_BUFFER_SIZE']), float(config['PINGS_BUFFER_INTERVAL_S']),
+                float(config['PINGS_STORE_INTERVAL_S']), int(config['PINGS_MAX_PENDING']), int(config['PINGS_MAX_CARS']))
+            if db_path != ':memory:':
+                _flushers[db_path] = PingFlusher(store, db_path, float(config['PINGS_FLUSH_MS']) / 1000.0).start()
+        return store
+
+
+def forget(db_path, vj_id, keep_pending=False):
+    # Drop a hunt's buffers (and queued pings, for a deleted hunt) without creating a store
+    store = _stores.get(db_path)
+    if store is not None:
+        store.forget(vj_id, keep_pending)
+
+
+def stop_flushers():
+    for flusher in list(_flushers.values()):
+        flusher.stop()
+
+
+atexit.register(stop_flushers)
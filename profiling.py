@@ -0,0 +1,247 @@
+"""Request profiling for the Vreetvos app.
+
+Admins can profile a single request by adding ``?_profile=1`` (or the
+``X-Profile: 1`` header). A percentage of real traffic on selected endpoints
+can be sampled as well. Profiles are written as pstats files into a rotating
+directory and listed on ``/admin/profiles``.
+
+When ``TRACEMALLOC_ENABLED`` is set, the peak Python allocation of every
+request is recorded per endpoint, and a sample of requests also records the
+top allocation sites. The report is shown on ``/admin/memory``.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+
+from flask import current_app, g, request, session
+
+PROFILE_QUERY_PARAM = '_profile'
+MEMORY_QUERY_PARAM = '_memory'
+PROFILE_HEADER = 'X-Profile'
+PROFILE_SUFFIX = '.prof'
+
+# Only plain file names we wrote ourselves may be served or summarised
+_SAFE_NAME = re.compile(r'^[A-Za-z0-9_.-]+\.prof$')
+
+
+def init_app(flask_app):
+    db_dir = os.path.dirname(os.path.abspath(flask_app.config['DATABASE_FILENAME']))
+    flask_app.config.setdefault('PROFILE_DIR', os.environ.get('PROFILE_DIR', os.path.join(db_dir, 'profiles')))
+    flask_app.config.setdefault('PROFILE_KEEP', int(os.environ.get('PROFILE_KEEP', 50)))
+    # Percentage (0-100) of requests on PROFILE_SAMPLED_ENDPOINTS to profile
+    flask_app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', 0)))
+    flask_app.config.setdefault('PROFILE_SAMPLED_ENDPOINTS', ('results', 'add_entry'))
+    flask_app.config.setdefault('TRACEMALLOC_ENABLED', os.environ.get('TRACEMALLOC_ENABLED', '').lower() in ('1', 'true', 'yes'))
+    flask_app.config.setdefault('TRACEMALLOC_FRAMES', int(os.environ.get('TRACEMALLOC_FRAMES', 10)))
+    # Percentage (0-100) of traced requests that also take a snapshot for the top allocation sites
+    flask_app.config.setdefault('TRACEMALLOC_SNAPSHOT_RATE', float(os.environ.get('TRACEMALLOC_SNAPSHOT_RATE', 5)))
+    flask_app.config.setdefault('TRACEMALLOC_TOP_SITES', 10)
+    flask_app.before_request(start_request_profile)
+    flask_app.before_request(start_memory_trace)
+    flask_app.after_request(finish_memory_trace)
+    flask_app.after_request(finish_request_profile)
+    flask_app.teardown_request(_discard_request_profile)
+
+
+def _requested_by_admin():
+    flag = request.args.get(PROFILE_QUERY_PARAM) or request.headers.get(PROFILE_HEADER)
+    return flag in ('1', 'true', 'yes') and session.get('role') == 'admin'
+
+
+def _sampled():
+    rate = float(current_app.config.get('PROFILE_SAMPLE_RATE') or 0)
+    if rate <= 0 or request.endpoint not in current_app.config.get('PROFILE_SAMPLED_ENDPOINTS', ()):
+        return False
+    return random.random() * 100 < rate
+
+
+def start_request_profile():
+    if request.endpoint == 'static':
+        return
+    if _requested_by_admin():
+        reason = 'admin'
+    elif _sampled():
+        reason = 'sample'
+    else:
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active in this thread; skip this request
+        return
+    g.profiler = profiler
+    g.profile_reason = reason
+    g.profile_started = time.perf_counter()
+
+
+def finish_request_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    elapsed_ms = int((time.perf_counter() - g.pop('profile_started')) * 1000)
+    reason = g.pop('profile_reason', 'admin')
+    try:
+        filename = save_profile(profiler, request.endpoint or 'unknown', reason, elapsed_ms)
+        response.headers['X-Profile-File'] = filename
+    except OSError as e:
+        print(f"Could not write profile for {request.path}: {e}")
+    return response
+
+
+def _discard_request_profile(exc=None):
+    # after_request is skipped on unhandled errors; make sure the profiler is switched off
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def save_profile(profiler, endpoint, reason, elapsed_ms):
+    profile_dir = current_app.config['PROFILE_DIR']
+    os.makedirs(profile_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    filename = f"{stamp}-{int(time.time() * 1000) % 1000:03d}_{endpoint}_{reason}_{elapsed_ms}ms{PROFILE_SUFFIX}"
+    profiler.dump_stats(os.path.join(profile_dir, filename))
+    rotate_profiles(profile_dir, int(current_app.config.get('PROFILE_KEEP', 50)))
+    return filename
+
+
+def rotate_profiles(profile_dir, keep):
+    profiles = list_profiles(profile_dir)
+    for old in profiles[keep:]:
+        try:
+            os.remove(os.path.join(profile_dir, old['filename']))
+        except OSError:
+            pass
+
+
+def list_profiles(profile_dir):
+    """Return the stored profiles, newest first."""
+    if not os.path.isdir(profile_dir):
+        return []
+    profiles = []
+    for filename in os.listdir(profile_dir):
+        if not _SAFE_NAME.match(filename):
+            continue
+        path = os.path.join(profile_dir, filename)
+        stat = os.stat(path)
+        parts = filename[:-len(PROFILE_SUFFIX)].split('_')
+        profiles.append({
+            'filename': filename,
+            'endpoint': '_'.join(parts[1:-2]) if len(parts) >= 4 else '',
+            'reason': parts[-2] if len(parts) >= 4 else '',
+            'elapsed': parts[-1] if len(parts) >= 4 else '',
+            'size': stat.st_size,
+            'modified': stat.st_mtime,
+        })
+    profiles.sort(key=lambda p: (p['modified'], p['filename']), reverse=True)
+    return profiles
+
+
+def is_valid_profile_name(filename):
+    return bool(_SAFE_NAME.match(filename))
+
+
+def summarize_profile(path, sort_by='cumulative', limit=30):
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.strip_dirs().sort_stats(sort_by).print_stats(limit)
+    return out.getvalue()
+
+
+# --- tracemalloc instrumentation ---
+
+class MemoryReport:
+    """Per-endpoint aggregate of traced request allocations (process local)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, endpoint, peak_bytes, top_sites=None):
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {
+                'endpoint': endpoint, 'requests': 0, 'total_peak': 0,
+                'max_peak': 0, 'last_peak': 0, 'top_sites': [], 'top_sites_peak': 0,
+            })
+            stats['requests'] += 1
+            stats['total_peak'] += peak_bytes
+            stats['last_peak'] = peak_bytes
+            stats['max_peak'] = max(stats['max_peak'], peak_bytes)
+            # Keep the allocation sites of the heaviest sampled request
+            if top_sites is not None and peak_bytes >= stats['top_sites_peak']:
+                stats['top_sites'] = top_sites
+                stats['top_sites_peak'] = peak_bytes
+
+    def rows(self):
+        with self._lock:
+            rows = [dict(stats, avg_peak=stats['total_peak'] // stats['requests'])
+                    for stats in self._endpoints.values()]
+        rows.sort(key=lambda r: r['max_peak'], reverse=True)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+memory_report = MemoryReport()
+
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def _memory_snapshot_requested():
+    if request.args.get(MEMORY_QUERY_PARAM) in ('1', 'true', 'yes') and session.get('role') == 'admin':
+        return True
+    rate = float(current_app.config.get('TRACEMALLOC_SNAPSHOT_RATE') or 0)
+    return rate > 0 and random.random() * 100 < rate
+
+
+def start_memory_trace():
+    if not current_app.config.get('TRACEMALLOC_ENABLED') or request.endpoint == 'static':
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(int(current_app.config.get('TRACEMALLOC_FRAMES', 10)))
+    # The peak is process wide, so concurrent requests make these numbers an upper bound
+    tracemalloc.reset_peak()
+    g.memory_baseline = tracemalloc.get_traced_memory()[0]
+    if _memory_snapshot_requested():
+        g.memory_snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+def finish_memory_trace(response):
+    baseline = g.pop('memory_baseline', None)
+    if baseline is None or not tracemalloc.is_tracing():
+        return response
+    # Make sure the body has been rendered before measuring
+    if not response.direct_passthrough:
+        response.get_data()
+    peak_bytes = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+
+    top_sites = None
+    before = g.pop('memory_snapshot', None)
+    if before is not None:
+        after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        limit = int(current_app.config.get('TRACEMALLOC_TOP_SITES', 10))
+        top_sites = [{
+            'site': str(stat.traceback[0]) if stat.traceback else '?',
+            'size_diff': stat.size_diff,
+            'count_diff': stat.count_diff,
+        } for stat in after.compare_to(before, 'lineno')[:limit]]
+
+    memory_report.record(request.endpoint or 'unknown', peak_bytes, top_sites)
+    response.headers['X-Memory-Peak'] = str(peak_bytes)
+    return response
@@ -0,0 +1,288 @@
+"""Chunked purges of entries on a background thread.
+
+Clearing all entries or deleting a vossenjacht with one ``DELETE`` holds the
+write lock until every row is gone, and marshals' submissions wait behind it.
+Purges delete ``PURGE_CHUNK_SIZE`` entries per transaction and pause
+``PURGE_PAUSE_MS`` between chunks, so other writers get the lock in between.
+A vossenjacht row is removed in the last transaction, after its entries,
+together with any entries that older versions left without a hunt; its
+stored car positions follow in chunks of their own.
+
+Purges run one at a time on a background thread per process, each with its
+own connection; ``/api/purges`` shows their progress. Score recalculations
+from ``/admin/recalc_scores`` run as jobs on the same thread, with the rows
+processed as their progress. In-memory databases
+can't be shared with another thread, so there the purge runs right away on
+the request's connection. Afterwards freed pages are handed back with
+``PRAGMA incremental_vacuum`` in steps of ``PURGE_VACUUM_PAGES``, for
+databases created with ``auto_vacuum = INCREMENTAL`` (new databases are).
+Older databases are converted once with ``flask db-maintain
+--convert-vacuum``; until then a job reports ``vacuum_skipped``.
+"""
+import atexit
+import itertools
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import cache
+import repositories
+import seasons
+
+# A full VACUUM would lock the database for as long as it takes; incremental needs this mode
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def init_app(flask_app):
+    flask_app.config.setdefault('PURGE_CHUNK_SIZE', int(os.environ.get('PURGE_CHUNK_SIZE', 500)))
+    flask_app.config.setdefault('PURGE_PAUSE_MS', float(os.environ.get('PURGE_PAUSE_MS', 20)))
+    flask_app.config.setdefault('PURGE_VACUUM_PAGES', int(os.environ.get('PURGE_VACUUM_PAGES', 1000)))
+
+
+def options_from_config(config):
+    return {
+        'chunk_size': int(config['PURGE_CHUNK_SIZE']),
+        'pause': float(config['PURGE_PAUSE_MS']) / 1000.0,
+    }
+
+
+def delete_entries(db, where, params=(), chunk_size=500, pause=0.0, bump_ids=(), progress=None):
+    """Delete the entries matching `where`, chunk_size rows per transaction; returns the number deleted."""
+    return delete_rows(db, 'entries', where, params, chunk_size, pause, bump_ids, progress)
+
+
+def delete_rows(db, table, where, params=(), chunk_size=500, pause=0.0, bump_ids=(), progress=None):
+    deleted = 0
+    while True:
+        ids = [row[0] for row in db.execute(
+            f'SELECT id FROM {table} WHERE {where} ORDER BY id LIMIT ?', tuple(params) + (chunk_size,)
+        ).fetchall()]
+        if not ids:
+            break
+        placeholders = ', '.join('?' * len(ids))
+        db.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', ids)
+        cache.bump(db, bump_ids)
+        db.commit()
+        deleted += len(ids)
+        if progress:
+            progress(deleted)
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+
+def clear_entries(db, refresh, chunk_size=500, pause=0.0, progress=None, total=None):
+    """Delete every entry that exists now; entries submitted meanwhile are kept (and re-ranked)."""
+    max_id = db.execute('SELECT MAX(id) FROM entries').fetchone()[0]
+    if max_id is None:
+        return 0
+    if total:
+        total(db.execute('SELECT COUNT(*) FROM entries WHERE id <= ?', (max_id,)).fetchone()[0])
+    deleted = delete_entries(db, 'id <= ?', (max_id,), chunk_size=chunk_size, pause=pause,
+                             bump_ids=[cache.ALL_HUNTS], progress=progress)
+    seasons.reset_points(db)
+    remaining = [row[0] for row in db.execute(
+        'SELECT DISTINCT vossenjacht_id FROM entries WHERE vossenjacht_id IS NOT NULL'
+    ).fetchall()]
+    refresh(db, remaining)
+    cache.bump(db, [cache.ALL_HUNTS])
+    db.commit()
+    return deleted
+
+
+def delete_hunt(db, vj_id, chunk_size=500, pause=0.0, progress=None, total=None):
+    """Delete a vossenjacht with its entries and season results; returns the number of entries deleted."""
+    if total:
+        total(db.execute('SELECT COUNT(*) FROM entries WHERE vossenjacht_id = ?', (vj_id,)).fetchone()[0])
+    deleted = delete_entries(db, 'vossenjacht_id = ?', (vj_id,), chunk_size=chunk_size, pause=pause,
+                             bump_ids=[vj_id], progress=progress)
+    # The last transaction also takes entries submitted during the purge, so the foreign key holds
+    deleted += db.execute('DELETE FROM entries WHERE vossenjacht_id = ?', (vj_id,)).rowcount
+    seasons.remove_hunt_from_all(db, vj_id)
+    repositories.sqlite(db).hunts.delete(vj_id)
+    cache.bump(db, [vj_id])
+    db.commit()
+    # Entries orphaned by versions that deleted hunts without their entries
+    hunt_deleted = deleted
+    deleted += delete_entries(db, 'vossenjacht_id IS NOT NULL AND vossenjacht_id NOT IN (SELECT id FROM vossenjachten)',
+                              chunk_size=chunk_size, pause=pause,
+                              progress=(lambda n: progress(hunt_deleted + n)) if progress else None)
+    # Stored live positions of this hunt, and any the ping flusher wrote for it meanwhile (see pings.py)
+    delete_rows(db, 'car_pings', 'vossenjacht_id NOT IN (SELECT id FROM vossenjachten)',
+                chunk_size=chunk_size, pause=pause)
+    return deleted
+
+
+def incremental_vacuum_enabled(db):
+    return db.execute('PRAGMA auto_vacuum').fetchone()[0] == AUTO_VACUUM_INCREMENTAL
+
+
+def enable_incremental_vacuum(db):
+    """Switch a database created before incremental vacuum; returns whether it had to.
+
+    The mode only changes with a full VACUUM, which locks and rewrites the whole file once.
+    """
+    if incremental_vacuum_enabled(db):
+        return False
+    db.commit()
+    db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    db.execute('VACUUM')
+    return True
+
+
+def incremental_vacuum(db, pages=1000, pause=0.0, max_pages=None):
+    """Hand free pages back to the file system a step at a time (at most max_pages); returns the number freed."""
+    if not incremental_vacuum_enabled(db):
+        return 0
+    freed = 0
+    while max_pages is None or freed < max_pages:
+        free_pages = db.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free_pages:
+            break
+        step = min(pages, free_pages, max_pages - freed if max_pages is not None else free_pages)
+        # executescript steps the pragma to completion; execute() would free a single page
+        db.executescript(f'PRAGMA incremental_vacuum({int(step)});')
+        freed += step
+        if pause:
+            time.sleep(pause)
+    return freed
+
+
+# --- jobs ---
+
+_job_ids = itertools.count(1)
+
+
+class PurgeJob:
+    def __init__(self, kind, target, fn, db_path, vacuum_pages=1000, pause=0.0, user_id=None):
+        # fn(db, job) does the purge and returns the number of entries deleted
+        self.id = next(_job_ids)
+        self.kind = kind
+        self.target = target
+        # Who started it; non-admins only see their own jobs on /api/purges
+        self.user_id = user_id
+        self.fn = fn
+        self.db_path = db_path
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause
+        self.status = 'queued'
+        self.total = None
+        self.deleted = 0
+        self.freed_pages = 0
+        # Why no pages could be freed, for databases that are not in incremental mode yet
+        self.vacuum_skipped = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def progress(self, deleted):
+        self.deleted = deleted
+
+    def set_total(self, total):
+        self.total = total
+
+    def run(self, db):
+        self.status = 'running'
+        try:
+            self.deleted = self.fn(db, self)
+            if incremental_vacuum_enabled(db):
+                self.freed_pages = incremental_vacuum(db, self.vacuum_pages, self.pause)
+            else:
+                self.vacuum_skipped = 'auto_vacuum is not INCREMENTAL; run flask db-maintain --convert-vacuum once'
+            self.status = 'done'
+        except Exception as e:
+            # Any error (also from a recalculation job) fails this job only; the purger thread goes on with the next
+            db.rollback()
+            self.status = 'failed'
+            self.error = str(e)
+            print(f"Purge {self.kind} {self.target} failed: {e}")
+        finally:
+            self.finished_at = time.time()
+
+    def to_dict(self):
+        return {'id': self.id, 'kind': self.kind, 'target': self.target, 'status': self.status,
+                'total': self.total, 'deleted': self.deleted, 'freed_pages': self.freed_pages,
+                'vacuum_skipped': self.vacuum_skipped, 'error': self.error, 'created_at': self.created_at, 'finished_at': self.finished_at}
+
+
+class Purger:
+    """Runs purge jobs one after another on a daemon thread, in the Flask app's context."""
+
+    def __init__(self, flask_app, keep=50):
+        self.flask_app = flask_app
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, job):
+        with self._lock:
+            # Deleting the same thing twice only needs one purge
+            for other in self.jobs.values():
+                if (other.kind, other.target, other.db_path) == (job.kind, job.target, job.db_path) \
+                        and other.status in ('queued', 'running'):
+                    return other
+            self._remember(job)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='purger', daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        return job
+
+    def run_now(self, job, db):
+        with self._lock:
+            self._remember(job)
+        job.run(db)
+        return job
+
+    def _remember(self, job):
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.keep:
+            self.jobs.popitem(last=False)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            db = sqlite3.connect(job.db_path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA foreign_keys = ON;')
+            try:
+                with self.flask_app.app_context():
+                    job.run(db)
+            finally:
+                db.close()
+
+    def recent_jobs(self, user_id=None):
+        """Newest first; with user_id only the jobs that user started."""
+        with self._lock:
+            return [job for job in reversed(self.jobs.values()) if user_id is None or job.user_id == user_id]
+
+    def stop(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+
+
+purger = None
+_purger_lock = threading.Lock()
+
+
+def get_purger(flask_app):
+    global purger
+    with _purger_lock:
+        if purger is None:
+            purger = Purger(flask_app)
+        return purger
+
+
+def stop_purger():
+    if purger is not None:
+        purger.stop()
+
+
+atexit.register(stop_purger)
@@ -0,0 +1,237 @@
+"""Read-only replica of the database for public pages.
+
+Spectators reloading ``/results`` during a hunt shouldn't compete with the
+marshals' writes for the same file. When ``REPLICA_ENABLED`` is set, a
+background thread copies the primary database into ``REPLICA_PATH`` with the
+SQLite backup API and public pages read from that copy.
+
+The copy is written to a temporary file and renamed over the replica, so a
+replica file is never modified after it is in place. That makes it safe to
+open with ``mode=ro&immutable=1``: SQLite then skips all locking on it, and
+connections that still have the previous file open keep reading that one.
+
+The copy must not hold up the writers it is meant to relieve, so the
+primary has to be in WAL mode (``init_db`` sets it; the refresher also tries
+when it finds the database in another mode), where a read transaction doesn't
+block commits. The copy runs inside one read transaction, a fixed snapshot,
+so it never restarts, in steps of ``REPLICA_PAGES`` pages with
+``REPLICA_SLEEP_MS`` pauses, like backup.py. Without WAL there is no replica:
+public pages keep reading the primary and ``status()`` says why.
+
+The thread refreshes the replica after committed writes (``mark_dirty``),
+and also notices other writes by polling ``PRAGMA data_version`` on its own
+primary connection. Writes are coalesced: however many arrive, refreshes are
+at least ``REPLICA_MIN_INTERVAL_MS`` apart. ``lag_seconds()`` is how long
+the oldest write not yet in the replica has been waiting.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+
+
+class Replica:
+    def __init__(self, primary_path, replica_path, min_interval=5.0, poll_interval=0.5, pages=256, sleep=0.01):
+        self.primary_path = primary_path
+        self.replica_path = replica_path
+        self.min_interval = min_interval
+        self.poll_interval = poll_interval
+        self.pages = pages
+        self.sleep = sleep
+        self.refreshed_at = None
+        self.pending_since = None
+        self.last_change_at = None
+        self.last_error = None
+        self.stats = {'refreshes': 0, 'last_duration': 0.0}
+        self._state_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_ready(self):
+        return self.refreshed_at is not None and os.path.exists(self.replica_path)
+
+    def connect(self):
+        # The file is replaced, never changed in place, so immutable is safe here
+        uri = f"file:{self.replica_path}?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def mark_dirty(self):
+        now = time.time()
+        with self._state_lock:
+            self.last_change_at = now
+            if self.pending_since is None:
+                self.pending_since = now
+        self._wake.set()
+
+    def lag_seconds(self):
+        pending_since = self.pending_since
+        return 0.0 if pending_since is None else max(time.time() - pending_since, 0.0)
+
+    def status(self):
+        return {
+            'refreshed_at': self.refreshed_at,
+            'lag_seconds': self.lag_seconds(),
+            'refreshes': self.stats['refreshes'],
+            'last_error': self.last_error,
+        }
+
+    def refresh(self, source=None):
+        """Copy the primary into the replica file now; writes committed before this call are included."""
+        with self._refresh_lock:
+            started = time.time()
+            temp_path = f"{self.replica_path}.{os.getpid()}.tmp"
+            own_source = source is None
+            if own_source:
+                source = sqlite3.connect(self.primary_path, timeout=30)
+            try:
+                if not enable_wal(source):
+                    # Copying in rollback-journal mode would block the writers' commits, or never finish
+                    raise sqlite3.OperationalError('the primary database is not in WAL mode')
+                target = sqlite3.connect(temp_path)
+                try:
+                    # Pin one snapshot for all steps; in WAL mode writers keep committing meanwhile
+                    source.execute('BEGIN')
+                    source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                    try:
+                        # backup() only sleeps on busy steps; the progress callback paces every step
+                        source.backup(target, pages=self.pages, progress=self._pause)
+                    finally:
+                        source.rollback()
+                finally:
+                    target.close()
+                os.replace(temp_path, self.replica_path)
+            finally:
+                if own_source:
+                    source.close()
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            with self._state_lock:
+                self.refreshed_at = started
+                # Writes that arrived while copying are still pending
+                if self.last_change_at is not None and self.last_change_at > started:
+                    self.pending_since = self.last_change_at
+                else:
+                    self.pending_since = None
+            self.stats['refreshes'] += 1
+            self.stats['last_duration'] = time.time() - started
+
+    def _pause(self, status, remaining, total):
+        if remaining and self.sleep > 0:
+            time.sleep(self.sleep)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='replica-refresher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        conn = sqlite3.connect(self.primary_path, timeout=30, check_same_thread=False)
+        last_version = None
+        try:
+            while not self._stop.is_set():
+                version = conn.execute('PRAGMA data_version').fetchone()[0]
+                if last_version is not None and version != last_version:
+                    self.mark_dirty()
+                if self.refreshed_at is None or self.pending_since is not None:
+                    wait = 0 if self.refreshed_at is None else self.min_interval - (time.time() - self.refreshed_at)
+                    if wait > 0:
+                        self._stop.wait(wait)
+                    # Read the version first: a write during the copy shows up as a change next round
+                    last_version = conn.execute('PRAGMA data_version').fetchone()[0]
+                    try:
+                        self.refresh(conn)
+                        self.last_error = None
+                    except (sqlite3.Error, OSError) as e:
+                        self.last_error = str(e)
+                        print(f"Replica refresh failed: {e}")
+                else:
+                    last_version = version
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+        finally:
+            conn.close()
+
+
+def enable_wal(conn, busy_timeout_ms=100):
+    """Switch the database to WAL mode (a persistent setting); returns whether it is in WAL mode.
+
+    Switching needs a moment without other connections in a transaction; this waits
+    at most busy_timeout_ms for one and otherwise leaves it to the next call.
+    """
+    mode = conn.execute('PRAGMA journal_mode').fetchone()[0].lower()
+    if mode == 'wal':
+        return True
+    previous_timeout = conn.execute('PRAGMA busy_timeout').fetchone()[0]
+    conn.execute(f'PRAGMA busy_timeout = {int(busy_timeout_ms)}')
+    try:
+        mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()[0].lower()
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.execute(f'PRAGMA busy_timeout = {int(previous_timeout)}')
+    return mode == 'wal'
+
+
+replica = None
+_replica_lock = threading.Lock()
+
+
+def init_app(flask_app):
+    db_dir = os.path.dirname(os.path.abspath(flask_app.config['DATABASE_FILENAME']))
+    flask_app.config.setdefault('REPLICA_ENABLED', os.environ.get('REPLICA_ENABLED', '').lower() in ('1', 'true', 'yes'))
+    flask_app.config.setdefault('REPLICA_PATH', os.environ.get('REPLICA_PATH', os.path.join(db_dir, 'foxhunt-replica.db')))
+    flask_app.config.setdefault('REPLICA_MIN_INTERVAL_MS', float(os.environ.get('REPLICA_MIN_INTERVAL_MS', 5000)))
+    flask_app.config.setdefault('REPLICA_POLL_INTERVAL_MS', float(os.environ.get('REPLICA_POLL_INTERVAL_MS', 500)))
+    flask_app.config.setdefault('REPLICA_PAGES', int(os.environ.get('REPLICA_PAGES', 256)))
+    flask_app.config.setdefault('REPLICA_SLEEP_MS', float(os.environ.get('REPLICA_SLEEP_MS', 10)))
+    flask_app.before_request(_start_once)
+
+
+def get_replica(config):
+    """The process-wide replica for this configuration, or None when disabled or not possible."""
+    global replica
+    primary_path = config.get('DATABASE', config['DATABASE_FILENAME'])
+    if not config.get('REPLICA_ENABLED') or primary_path == ':memory:':
+        return None
+    with _replica_lock:
+        if replica is None or replica.primary_path != primary_path or replica.replica_path != config['REPLICA_PATH']:
+            if replica is not None:
+                replica.stop()
+            replica = Replica(primary_path, config['REPLICA_PATH'],
+                              min_interval=float(config['REPLICA_MIN_INTERVAL_MS']) / 1000.0,
+                              poll_interval=float(config['REPLICA_POLL_INTERVAL_MS']) / 1000.0,
+                              pages=int(config['REPLICA_PAGES']), sleep=float(config['REPLICA_SLEEP_MS']) / 1000.0)
+        return replica
+
+
+def _start_once():
+    # Tests refresh the replica by hand
+    if current_app.config.get('TESTING'):
+        return
+    current = get_replica(current_app.config)
+    if current is not None:
+        current.start()
+
+
+def stop_replica():
+    if replica is not None:
+        replica.stop()
+
+
+atexit.register(stop_replica)
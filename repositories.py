@@ -0,0 +1,1004 @@
+"""Storage behind the views: entries, vossenjachten, users, participants, seasons and checkpoints.
+
+Routes go through ``EntryRepository``, ``HuntRepository``,
+``UserRepository``, ``ParticipantRepository``, ``SeasonRepository`` and
+``CheckpointRepository`` instead of writing SQL themselves. They are abstract
+base classes; ``sqlite(db)`` returns the implementations the app uses, on a
+connection from ``get_db()`` or a writer job, and ``sqlite(db, schema)`` the
+same on an attached database such as the archive. The SQLite implementations
+hand the work to the modules that own the tables (listing.py, search.py,
+seasons.py, checkpoints.py, ...).
+
+``memory(store)`` serves the same interfaces from a ``MemoryStore``: every
+row of one database in dicts, loaded from SQLite once, with each hunt's
+entries kept sorted in rank order. With ``REPOSITORY_BACKEND = 'memory'`` the
+app serves a single small event from RAM that way; changes stay in the
+process and are not written back to SQLite, so it suits one worker process
+and events whose results are copied out before a restart. ``python
+repositories.py`` benchmarks both backends on the same data.
+
+Rows come back as ``sqlite3.Row`` (dicts from the memory store), which support
+``row['col']``, ``row.keys()`` and attribute access in templates.
+"""
+import bisect
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import archive
+import checkpoints
+import listing
+import participants
+import scoring
+import search
+import seasons
+import splits
+
+ENTRY_COLUMNS = ('name', 'start_km', 'end_km', 'arrival_time_last_fox', 'arrival_minutes', 'calculated_km',
+                 'duration_minutes', 'vossenjacht_id', 'user_id', 'participant_id')
+HUNT_COLUMNS = ('id', 'name', 'type', 'creator_id', 'start_time', 'start_minutes', 'max_odometer_reading', 'status')
+
+
+def init_app(flask_app):
+    # 'sqlite', or 'memory' to serve the database from a MemoryStore (see get_store)
+    flask_app.config.setdefault('REPOSITORY_BACKEND', os.environ.get('REPOSITORY_BACKEND', 'sqlite').lower())
+
+
+class Repositories:
+    def __init__(self, entries, hunts, users, participants, seasons, checkpoints):
+        self.entries = entries
+        self.hunts = hunts
+        self.users = users
+        self.participants = participants
+        self.seasons = seasons
+        self.checkpoints = checkpoints
+
+
+class EntryRepository(ABC):
+    @abstractmethod
+    def get(self, entry_id):
+        pass
+
+    @abstractmethod
+    def add(self, values):
+        """Insert an entry from a dict with ENTRY_COLUMNS; returns its id."""
+
+    @abstractmethod
+    def update(self, entry_id, values):
+        pass
+
+    @abstractmethod
+    def delete(self, entry_id):
+        pass
+
+    @abstractmethod
+    def results(self, vj_id=None):
+        """Entries with their vossenjacht_name, of one hunt (in rank order) or of all hunts."""
+
+    @abstractmethod
+    def page(self, filters=None, sort=listing.DEFAULT_SORT, direction='desc', after=None, before=None,
+             per_page=listing.DEFAULT_PER_PAGE):
+        """One page of the settings listing; see listing.list_entries for the arguments and the result."""
+
+    @abstractmethod
+    def search(self, query, creator_id=None, limit=search.DEFAULT_LIMIT):
+        """Entries whose participant or vossenjacht name matches every word of query, best match first."""
+
+
+class HuntRepository(ABC):
+    @abstractmethod
+    def get(self, vj_id):
+        """The vossenjacht with its creator_username, or None."""
+
+    @abstractmethod
+    def names(self, creator_id=None):
+        """(id, name) of every vossenjacht (or those of one creator), by name, for the filter dropdowns."""
+
+    @abstractmethod
+    def active(self):
+        pass
+
+    @abstractmethod
+    def overview(self):
+        """Every vossenjacht with its creator_username, newest first."""
+
+    @abstractmethod
+    def page(self, filters=None, after=None, before=None, per_page=listing.DEFAULT_PER_PAGE):
+        """One page of the vossenjachten overview; see listing.list_vossenjachten."""
+
+    @abstractmethod
+    def add(self, values):
+        """Insert a vossenjacht from a dict with HUNT_COLUMNS (id may be None); returns its id."""
+
+    @abstractmethod
+    def update(self, vj_id, values, default_max_odometer):
+        """Change a vossenjacht from a dict with HUNT_COLUMNS; returns whether its ranking may have changed.
+
+        Durations (and split times) follow a new start time, kilometers a new odometer rollover.
+        """
+
+    @abstractmethod
+    def delete(self, vj_id):
+        """Delete the vossenjacht; SQLite expects its entries gone already (purge.delete_hunt), memory drops them."""
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    def get(self, user_id):
+        pass
+
+    @abstractmethod
+    def by_username(self, username):
+        pass
+
+    @abstractmethod
+    def list(self):
+        pass
+
+    @abstractmethod
+    def has_role(self, role):
+        pass
+
+    @abstractmethod
+    def add(self, username, password_hash, role):
+        pass
+
+    @abstractmethod
+    def delete(self, user_id):
+        pass
+
+
+class ParticipantRepository(ABC):
+    @abstractmethod
+    def get(self, participant_id):
+        pass
+
+    @abstractmethod
+    def by_name(self, name):
+        """The participant this name belongs to (see participants.participant_key), or None."""
+
+    @abstractmethod
+    def get_or_create(self, name):
+        """The participant id for this name, creating the participant on first use; None for a blank name."""
+
+    @abstractmethod
+    def history(self, participant_id):
+        """The participant's entries over all hunts (archived ones too), newest first."""
+
+
+class SeasonRepository(ABC):
+    @abstractmethod
+    def get(self, season_id):
+        """The season with its creator_username, or None."""
+
+    @abstractmethod
+    def list(self):
+        """Every season with its creator_username and hunt_count, newest first."""
+
+    @abstractmethod
+    def hunts(self, season_id):
+        """(id, name) of the season's vossenjachten, oldest first."""
+
+    @abstractmethod
+    def add(self, name, creator_id):
+        pass
+
+    @abstractmethod
+    def rename(self, season_id, name):
+        pass
+
+    @abstractmethod
+    def delete(self, season_id):
+        pass
+
+    @abstractmethod
+    def add_hunt(self, season_id, vj_id):
+        pass
+
+    @abstractmethod
+    def remove_hunt(self, season_id, vj_id):
+        pass
+
+    @abstractmethod
+    def standings(self, season_id):
+        """The season table by points, with a dense 'rank' (see seasons.standings)."""
+
+
+class CheckpointRepository(ABC):
+    @abstractmethod
+    def for_hunt(self, vj_id):
+        """The hunt's checkpoints in route order."""
+
+    @abstractmethod
+    def get(self, vj_id, checkpoint_id):
+        pass
+
+    @abstractmethod
+    def add(self, vj_id, name, lat, lon, radius_m=50):
+        """Add a checkpoint after the hunt's last one; returns its id, raises ValueError for a bad position."""
+
+    @abstractmethod
+    def delete(self, vj_id, checkpoint_id):
+        pass
+
+    @abstractmethod
+    def near(self, vj_id, lat, lon):
+        """The hunt's checkpoints whose radius contains the position, nearest first, with their distance_m."""
+
+
+class SqliteEntryRepository(EntryRepository):
+    def __init__(self, db, schema='main'):
+        # schema: 'main', or e.g. the attached archive (see archive.py)
+        self.db = db
+        self.schema = schema
+
+    def get(self, entry_id):
+        return self.db.execute(f'SELECT * FROM {self.schema}.entries WHERE id = ?', (entry_id,)).fetchone()
+
+    def add(self, values):
+        columns = ', '.join(ENTRY_COLUMNS)
+        placeholders = ', '.join('?' * len(ENTRY_COLUMNS))
+        return self.db.execute(f'INSERT INTO {self.schema}.entries ({columns}) VALUES ({placeholders})',
+                               [values.get(column) for column in ENTRY_COLUMNS]).lastrowid
+
+    def update(self, entry_id, values):
+        assignments = ', '.join(f'{column} = ?' for column in values)
+        self.db.execute(f'UPDATE {self.schema}.entries SET {assignments} WHERE id = ?',
+                        list(values.values()) + [entry_id])
+
+    def delete(self, entry_id):
+        self.db.execute(f'DELETE FROM {self.schema}.entries WHERE id = ?', (entry_id,))
+
+    def results(self, vj_id=None):
+        sql = (f'SELECT e.*, vj.name as vossenjacht_name FROM {self.schema}.entries e'
+               f' JOIN {self.schema}.vossenjachten vj ON e.vossenjacht_id = vj.id')
+        if vj_id is None:
+            return self.db.execute(sql + ' ORDER BY e.calculated_km, e.duration_minutes').fetchall()
+        # Stored hunt_rank follows the hunt's own order (idx_entries_vossenjacht_rank)
+        return self.db.execute(sql + ' WHERE e.vossenjacht_id = ? ORDER BY e.hunt_rank, e.id', (vj_id,)).fetchall()
+
+    def page(self, filters=None, sort=listing.DEFAULT_SORT, direction='desc', after=None, before=None,
+             per_page=listing.DEFAULT_PER_PAGE):
+        return listing.list_entries(self.db, filters, sort, direction, after, before, per_page)
+
+    def search(self, query, creator_id=None, limit=search.DEFAULT_LIMIT):
+        return search.search_entries(self.db, query, creator_id, limit)
+
+
+class SqliteHuntRepository(HuntRepository):
+    def __init__(self, db, schema='main'):
+        self.db = db
+        self.schema = schema
+
+    def get(self, vj_id):
+        return self.db.execute(
+            f'SELECT vj.*, u.username as creator_username FROM {self.schema}.vossenjachten vj'
+            ' LEFT JOIN users u ON vj.creator_id = u.id WHERE vj.id = ?',
+            (vj_id,)
+        ).fetchone()
+
+    def names(self, creator_id=None):
+        if creator_id is not None:
+            return self.db.execute(f'SELECT id, name FROM {self.schema}.vossenjachten WHERE creator_id = ? ORDER BY name',
+                                   (creator_id,)).fetchall()
+        return self.db.execute(f'SELECT id, name FROM {self.schema}.vossenjachten ORDER BY name').fetchall()
+
+    def active(self):
+        return self.db.execute(
+            f"SELECT id, name FROM {self.schema}.vossenjachten WHERE status = 'active' ORDER BY name"
+        ).fetchall()
+
+    def overview(self):
+        return self.db.execute(
+            'SELECT vj.id, vj.name, vj.creation_date, vj.status, vj.type, u.username as creator_username, vj.creator_id'
+            f' FROM {self.schema}.vossenjachten vj LEFT JOIN users u ON vj.creator_id = u.id'
+            ' ORDER BY vj.creation_date DESC, vj.id DESC'
+        ).fetchall()
+
+    def page(self, filters=None, after=None, before=None, per_page=listing.DEFAULT_PER_PAGE):
+        return listing.list_vossenjachten(self.db, filters, after, before, per_page)
+
+    def add(self, values):
+        columns = ', '.join(column for column in HUNT_COLUMNS if column in values)
+        params = [values[column] for column in HUNT_COLUMNS if column in values]
+        return self.db.execute(
+            f"INSERT INTO {self.schema}.vossenjachten ({columns}) VALUES ({', '.join('?' * len(params))})", params
+        ).lastrowid
+
+    def update(self, vj_id, values, default_max_odometer):
+        old = self.get(vj_id)
+        assignments = ', '.join(f'{column} = ?' for column in values)
+        self.db.execute(f'UPDATE {self.schema}.vossenjachten SET {assignments} WHERE id = ?',
+                        list(values.values()) + [vj_id])
+        new = self.get(vj_id)
+        if new['start_minutes'] != old['start_minutes']:
+            # Split durations count from the start time too
+            splits.recompute_durations(self.db, vj_id)
+        if new['max_odometer_reading'] != old['max_odometer_reading']:
+            # The rollover changed: recompute kilometers as well as durations
+            scoring.recompute_hunt_scores(self.db, vj_id, default_max_odometer)
+        elif new['start_minutes'] != old['start_minutes']:
+            scoring.recompute_hunt_scores(self.db, vj_id)
+        return any(new[column] != old[column] for column in ('start_minutes', 'max_odometer_reading', 'type'))
+
+    def delete(self, vj_id):
+        self.db.execute(f'DELETE FROM {self.schema}.vossenjachten WHERE id = ?', (vj_id,))
+
+
+class SqliteUserRepository(UserRepository):
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, user_id):
+        return self.db.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+
+    def by_username(self, username):
+        return self.db.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+
+    def list(self):
+        return self.db.execute('SELECT id, username, role FROM users ORDER BY username').fetchall()
+
+    def has_role(self, role):
+        return self.db.execute('SELECT 1 FROM users WHERE role = ? LIMIT 1', (role,)).fetchone() is not None
+
+    def add(self, username, password_hash, role):
+        return self.db.execute('INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)',
+                               (username, password_hash, role)).lastrowid
+
+    def delete(self, user_id):
+        self.db.execute('DELETE FROM users WHERE id = ?', (user_id,))
+
+
+class SqliteParticipantRepository(ParticipantRepository):
+    def __init__(self, db, archive_path=None):
+        # With archive_path the history also covers the hunts moved to the archive
+        self.db = db
+        self.archive_path = archive_path
+
+    def get(self, participant_id):
+        return self.db.execute('SELECT * FROM participants WHERE id = ?', (participant_id,)).fetchone()
+
+    def by_name(self, name):
+        return self.db.execute('SELECT * FROM participants WHERE name_key = ?',
+                               (participants.participant_key(name),)).fetchone()
+
+    def get_or_create(self, name):
+        return participants.get_or_create(self.db, name)
+
+    def history(self, participant_id):
+        schemas = ('main', archive.SCHEMA) if archive.attach(self.db, self.archive_path) else ('main',)
+        return participants.history(self.db, participant_id, schemas)
+
+
+class SqliteSeasonRepository(SeasonRepository):
+    def __init__(self, db, points_scheme=seasons.DEFAULT_POINTS):
+        self.db = db
+        self.points_scheme = points_scheme
+
+    def get(self, season_id):
+        return self.db.execute(
+            'SELECT s.*, u.username as creator_username FROM seasons s JOIN users u ON s.creator_id = u.id WHERE s.id = ?',
+            (season_id,)
+        ).fetchone()
+
+    def list(self):
+        return self.db.execute(
+            'SELECT s.id, s.name, s.creation_date, s.creator_id, u.username as creator_username, '
+            '(SELECT COUNT(*) FROM season_vossenjachten sv WHERE sv.season_id = s.id) as hunt_count '
+            'FROM seasons s JOIN users u ON s.creator_id = u.id ORDER BY s.creation_date DESC, s.id DESC'
+        ).fetchall()
+
+    def hunts(self, season_id):
+        return self.db.execute(
+            'SELECT vj.id, vj.name FROM season_vossenjachten sv JOIN vossenjachten vj ON sv.vossenjacht_id = vj.id '
+            'WHERE sv.season_id = ? ORDER BY vj.creation_date, vj.id',
+            (season_id,)
+        ).fetchall()
+
+    def add(self, name, creator_id):
+        return self.db.execute('INSERT INTO seasons (name, creator_id) VALUES (?, ?)', (name, creator_id)).lastrowid
+
+    def rename(self, season_id, name):
+        self.db.execute('UPDATE seasons SET name = ? WHERE id = ?', (name, season_id))
+
+    def delete(self, season_id):
+        for hunt in self.hunts(season_id):
+            seasons.remove_hunt(self.db, season_id, hunt['id'])
+        self.db.execute('DELETE FROM seasons WHERE id = ?', (season_id,))
+
+    def add_hunt(self, season_id, vj_id):
+        seasons.add_hunt(self.db, season_id, vj_id, self.points_scheme)
+
+    def remove_hunt(self, season_id, vj_id):
+        seasons.remove_hunt(self.db, season_id, vj_id)
+
+    def standings(self, season_id):
+        return seasons.standings(self.db, season_id)
+
+
+class SqliteCheckpointRepository(CheckpointRepository):
+    def __init__(self, db):
+        self.db = db
+
+    def for_hunt(self, vj_id):
+        return checkpoints.for_hunt(self.db, vj_id)
+
+    def get(self, vj_id, checkpoint_id):
+        return checkpoints.get(self.db, vj_id, checkpoint_id)
+
+    def add(self, vj_id, name, lat, lon, radius_m=50):
+        return checkpoints.add(self.db, vj_id, name, lat, lon, radius_m)
+
+    def delete(self, vj_id, checkpoint_id):
+        checkpoints.delete(self.db, vj_id, checkpoint_id)
+
+    def near(self, vj_id, lat, lon):
+        return checkpoints.near(self.db, vj_id, lat, lon)
+
+
+def sqlite(db, schema='main', points_scheme=seasons.DEFAULT_POINTS, archive_path=None):
+    return Repositories(SqliteEntryRepository(db, schema), SqliteHuntRepository(db, schema), SqliteUserRepository(db),
+                        SqliteParticipantRepository(db, archive_path), SqliteSeasonRepository(db, points_scheme),
+                        SqliteCheckpointRepository(db))
+
+
+
+class MemoryStore:
+    """All rows of one database in dicts, with each hunt's entry ids kept sorted by (rank key, id).
+
+    Every change to an entry or a hunt updates that hunt's sorted index and reads the dense
+    hunt_rank off it, so results, listings and season standings never sort a whole hunt.
+    """
+
+    TABLES = ('users', 'hunts', 'entries', 'participants', 'checkpoints', 'seasons')
+
+    def __init__(self):
+        self.users = {}
+        self.hunts = {}
+        self.entries = {}
+        self.participants = {}
+        self.checkpoints = {}
+        self.seasons = {}
+        self.season_hunts = {} # season id -> set of vossenjacht ids
+        self.participant_keys = {} # participants.participant_key -> participant id
+        self.hunt_index = {} # vossenjacht id -> sorted [(rank key + (id,), id)]
+        self.lock = threading.RLock()
+        self._last_ids = dict.fromkeys(self.TABLES, 0)
+
+    @classmethod
+    def load(cls, db):
+        """A store with every row of the database behind db (a connection like get_db()'s)."""
+        store = cls()
+        for table, sql_table in (('users', 'users'), ('hunts', 'vossenjachten'), ('entries', 'entries'),
+                                 ('participants', 'participants'), ('checkpoints', 'checkpoints'),
+                                 ('seasons', 'seasons')):
+            for row in db.execute(f'SELECT * FROM {sql_table}').fetchall():
+                store.put(table, dict(row))
+        for row in db.execute('SELECT season_id, vossenjacht_id FROM season_vossenjachten').fetchall():
+            store.season_hunts.setdefault(row['season_id'], set()).add(row['vossenjacht_id'])
+        for entry in store.entries.values():
+            store.hunt_index.setdefault(entry['vossenjacht_id'], []).append((store._sort_key(entry), entry['id']))
+        for vj_id, index in store.hunt_index.items():
+            index.sort()
+            store.rerank(vj_id)
+        return store
+
+    def put(self, table, row):
+        # Timestamps as datetimes, like the TIMESTAMP columns read through PARSE_DECLTYPES
+        for column in ('created_at', 'creation_date'):
+            if isinstance(row.get(column), str):
+                row[column] = datetime.fromisoformat(row[column])
+        getattr(self, table)[row['id']] = row
+        self._last_ids[table] = max(self._last_ids[table], row['id'])
+        if table == 'participants':
+            self.participant_keys[row['name_key']] = row['id']
+        return row['id']
+
+    def next_id(self, table, requested=None):
+        # Like AUTOINCREMENT: ids are never reused; explicit ids (e.g. from the shard catalog) are kept
+        if requested is not None:
+            if requested in getattr(self, table):
+                raise sqlite3.IntegrityError(f'UNIQUE constraint failed: {table}.id')
+            return requested
+        return self._last_ids[table] + 1
+
+    @staticmethod
+    def now():
+        # CURRENT_TIMESTAMP: UTC, whole seconds
+        return datetime.utcnow().replace(microsecond=0)
+
+    def _sort_key(self, entry):
+        hunt = self.hunts.get(entry['vossenjacht_id'])
+        return scoring.rank_key(hunt['type'] if hunt else None)(entry) + (entry['id'],)
+
+    def index_entry(self, entry):
+        index = self.hunt_index.setdefault(entry['vossenjacht_id'], [])
+        bisect.insort(index, (self._sort_key(entry), entry['id']))
+
+    def unindex_entry(self, entry):
+        index = self.hunt_index.get(entry['vossenjacht_id'], [])
+        position = bisect.bisect_left(index, (self._sort_key(entry), entry['id']))
+        if position < len(index) and index[position][1] == entry['id']:
+            del index[position]
+
+    def reindex_hunt(self, vj_id):
+        index = [(self._sort_key(entry), entry['id']) for entry in self.entries.values() if entry['vossenjacht_id'] == vj_id]
+        index.sort()
+        self.hunt_index[vj_id] = index
+        self.rerank(vj_id)
+
+    def rerank(self, vj_id):
+        # The dense rank, read off the sorted index: equal scores share a rank
+        rank, last_score = 0, None
+        for key, entry_id in self.hunt_index.get(vj_id, ()):
+            if key[:-1] != last_score:
+                rank += 1
+                last_score = key[:-1]
+            self.entries[entry_id]['hunt_rank'] = rank
+
+    def ranked(self, vj_id):
+        return [self.entries[entry_id] for _, entry_id in self.hunt_index.get(vj_id, ())]
+
+    def entry_row(self, entry):
+        # The entry with the columns the queries join in from its vossenjacht
+        hunt = self.hunts[entry['vossenjacht_id']]
+        return dict(entry, vossenjacht_name=hunt['name'], vossenjacht_status=hunt['status'],
+                    vossenjacht_creator_id=hunt['creator_id'])
+
+    def username(self, user_id):
+        user = self.users.get(user_id)
+        return user['username'] if user else None
+
+
+class MemoryEntryRepository(EntryRepository):
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, entry_id):
+        entry = self.store.entries.get(entry_id)
+        return dict(entry) if entry else None
+
+    def add(self, values):
+        with self.store.lock:
+            entry = {column: values.get(column) for column in ENTRY_COLUMNS}
+            entry.update(id=self.store.next_id('entries'), hunt_rank=0, created_at=self.store.now())
+            self.store.put('entries', entry)
+            self.store.index_entry(entry)
+            self.store.rerank(entry['vossenjacht_id'])
+            return entry['id']
+
+    def update(self, entry_id, values):
+        with self.store.lock:
+            entry = self.store.entries.get(entry_id)
+            if entry is None:
+                return
+            old_hunt = entry['vossenjacht_id']
+            self.store.unindex_entry(entry)
+            entry.update(values)
+            self.store.index_entry(entry)
+            for vj_id in {old_hunt, entry['vossenjacht_id']}:
+                self.store.rerank(vj_id)
+
+    def delete(self, entry_id):
+        with self.store.lock:
+            entry = self.store.entries.pop(entry_id, None)
+            if entry is not None:
+                self.store.unindex_entry(entry)
+                self.store.rerank(entry['vossenjacht_id'])
+
+    def results(self, vj_id=None):
+        with self.store.lock:
+            if vj_id is not None:
+                if vj_id not in self.store.hunts:
+                    return []
+                return [self.store.entry_row(entry) for entry in self.store.ranked(vj_id)]
+            rows = [self.store.entry_row(entry) for entry in self.store.entries.values()
+                    if entry['vossenjacht_id'] in self.store.hunts]
+        return sorted(rows, key=lambda row: (row['calculated_km'], row['duration_minutes']))
+
+    def page(self, filters=None, sort=listing.DEFAULT_SORT, direction='desc', after=None, before=None,
+             per_page=listing.DEFAULT_PER_PAGE):
+        filters = filters or {}
+        if sort not in listing.SORT_COLUMNS:
+            sort = listing.DEFAULT_SORT
+        column = 'created_at' if sort == 'created' else listing.SORT_COLUMNS[sort][len('e.'):]
+        with self.store.lock:
+            # A hunt filter reads that hunt's index only
+            if filters.get('vj_id'):
+                candidates = self.store.ranked(filters['vj_id']) if filters['vj_id'] in self.store.hunts else []
+            else:
+                candidates = [entry for entry in self.store.entries.values() if entry['vossenjacht_id'] in self.store.hunts]
+            rows = [entry for entry in candidates if _matches_entry_filters(entry, self.store.hunts[entry['vossenjacht_id']], filters)]
+            # The cursor holds created_at as the stored text, like CAST(created_at AS TEXT)
+            sort_value = (lambda row: str(row[column])) if sort == 'created' else (lambda row: row[column])
+            rows, next_cursor, prev_cursor = listing.paginate(rows, sort_value, direction, after, before, per_page)
+            rows = [dict(self.store.entry_row(row), sort_value=row['sort_value']) for row in rows]
+        return {'entries': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+    def search(self, query, creator_id=None, limit=search.DEFAULT_LIMIT):
+        # Substring matches, newest first: the LIKE fallback of search.search_entries
+        query_terms = [term.casefold() for term in search.terms(query)]
+        if not query_terms:
+            return []
+        limit = max(1, min(int(limit), search.MAX_LIMIT))
+        found = []
+        with self.store.lock:
+            for entry_id in sorted(self.store.entries, reverse=True):
+                entry = self.store.entries[entry_id]
+                hunt = self.store.hunts.get(entry['vossenjacht_id'])
+                if hunt is None or (creator_id is not None and hunt['creator_id'] != creator_id):
+                    continue
+                text = (entry['name'] or '').casefold(), hunt['name'].casefold()
+                if all(term in text[0] or term in text[1] for term in query_terms):
+                    found.append(self.store.entry_row(entry))
+                    if len(found) == limit:
+                        break
+        return found
+
+
+def _matches_entry_filters(entry, hunt, filters):
+    # The WHERE clause of listing.list_entries
+    return ((filters.get('creator_id') is None or hunt['creator_id'] == filters['creator_id'])
+            and (not filters.get('status') or hunt['status'] == filters['status'])
+            and (not filters.get('participant_id') or entry['participant_id'] == filters['participant_id'])
+            and (not filters.get('date_from') or str(entry['created_at'])[:10] >= filters['date_from'])
+            and (not filters.get('date_to') or str(entry['created_at'])[:10] <= filters['date_to']))
+
+
+class MemoryHuntRepository(HuntRepository):
+    def __init__(self, store):
+        self.store = store
+
+    def _with_creator(self, hunt):
+        return dict(hunt, creator_username=self.store.username(hunt['creator_id']))
+
+    def _newest_first(self, hunts):
+        return sorted(hunts, key=lambda hunt: (hunt['creation_date'], hunt['id']), reverse=True)
+
+    def get(self, vj_id):
+        hunt = self.store.hunts.get(vj_id)
+        return self._with_creator(hunt) if hunt else None
+
+    def names(self, creator_id=None):
+        with self.store.lock:
+            hunts = [hunt for hunt in self.store.hunts.values() if creator_id is None or hunt['creator_id'] == creator_id]
+        return [{'id': hunt['id'], 'name': hunt['name']} for hunt in sorted(hunts, key=lambda hunt: (hunt['name'], hunt['id']))]
+
+    def active(self):
+        with self.store.lock:
+            return [{'id': hunt['id'], 'name': hunt['name']} for hunt in self.names()
+                    if self.store.hunts[hunt['id']]['status'] == 'active']
+
+    def overview(self):
+        with self.store.lock:
+            return [self._with_creator(hunt) for hunt in self._newest_first(self.store.hunts.values())]
+
+    def page(self, filters=None, after=None, before=None, per_page=listing.DEFAULT_PER_PAGE):
+        filters = filters or {}
+        rows = []
+        with self.store.lock:
+            for hunt in self.store.hunts.values():
+                if filters.get('status') and hunt['status'] != filters['status']:
+                    continue
+                if filters.get('creator_id') is not None and hunt['creator_id'] != filters['creator_id']:
+                    continue
+                entries = self.store.ranked(hunt['id'])
+                winners = [entry for entry in entries if entry['hunt_rank'] == 1]
+                rows.append(dict(
+                    self._with_creator(hunt), entry_count=len(entries),
+                    total_km=sum(entry['calculated_km'] for entry in entries),
+                    best_km=max((entry['calculated_km'] for entry in winners), default=None),
+                    best_duration=min((entry['duration_minutes'] for entry in winners), default=None),
+                    last_entry_at=str(max(entry['created_at'] for entry in entries)) if entries else None))
+        rows, next_cursor, prev_cursor = listing.paginate(rows, lambda row: str(row['creation_date']), 'desc',
+                                                          after, before, per_page)
+        return {'vossenjachten': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+    def add(self, values):
+        with self.store.lock:
+            hunt = {column: values.get(column) for column in HUNT_COLUMNS}
+            hunt['id'] = self.store.next_id('hunts', hunt['id'])
+            hunt['status'] = hunt['status'] or 'active'
+            hunt['creation_date'] = self.store.now()
+            self.store.put('hunts', hunt)
+            self.store.reindex_hunt(hunt['id'])
+            return hunt['id']
+
+    def update(self, vj_id, values, default_max_odometer):
+        with self.store.lock:
+            hunt = self.store.hunts[vj_id]
+            old = dict(hunt)
+            hunt.update(values)
+            start_minutes = scoring.hunt_start_minutes(hunt)
+            for entry in self.store.ranked(vj_id):
+                if hunt['start_minutes'] != old['start_minutes'] and start_minutes is not None and entry['arrival_minutes'] >= 0:
+                    entry['duration_minutes'] = scoring.duration_minutes(start_minutes, entry['arrival_minutes'])
+                if hunt['max_odometer_reading'] != old['max_odometer_reading']:
+                    entry['calculated_km'] = scoring.calculated_km(
+                        entry['start_km'], entry['end_km'], scoring.hunt_max_odometer(hunt, default_max_odometer))
+            changed = any(hunt[column] != old[column] for column in ('start_minutes', 'max_odometer_reading', 'type'))
+            if changed:
+                self.store.reindex_hunt(vj_id)
+            return changed
+
+    def delete(self, vj_id):
+        # With its entries, checkpoints and places in seasons
+        with self.store.lock:
+            self.store.hunts.pop(vj_id, None)
+            for entry in self.store.ranked(vj_id):
+                del self.store.entries[entry['id']]
+            self.store.hunt_index.pop(vj_id, None)
+            for checkpoint_id in [c['id'] for c in self.store.checkpoints.values() if c['vossenjacht_id'] == vj_id]:
+                del self.store.checkpoints[checkpoint_id]
+            for hunt_ids in self.store.season_hunts.values():
+                hunt_ids.discard(vj_id)
+
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, user_id):
+        user = self.store.users.get(user_id)
+        return dict(user) if user else None
+
+    def by_username(self, username):
+        with self.store.lock:
+            for user in self.store.users.values():
+                if user['username'] == username:
+                    return dict(user)
+        return None
+
+    def list(self):
+        with self.store.lock:
+            users = sorted(self.store.users.values(), key=lambda user: user['username'])
+        return [{'id': user['id'], 'username': user['username'], 'role': user['role']} for user in users]
+
+    def has_role(self, role):
+        with self.store.lock:
+            return any(user['role'] == role for user in self.store.users.values())
+
+    def add(self, username, password_hash, role):
+        # Raises what the users table's constraints would
+        with self.store.lock:
+            if self.by_username(username) is not None:
+                raise sqlite3.IntegrityError('UNIQUE constraint failed: users.username')
+            return self.store.put('users', {'id': self.store.next_id('users'), 'username': username,
+                                            'password_hash': password_hash, 'role': role})
+
+    def delete(self, user_id):
+        with self.store.lock:
+            if any(row['creator_id'] == user_id for table in (self.store.hunts, self.store.seasons) for row in table.values()):
+                raise sqlite3.IntegrityError('FOREIGN KEY constraint failed')
+            self.store.users.pop(user_id, None)
+
+
+class MemoryParticipantRepository(ParticipantRepository):
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, participant_id):
+        participant = self.store.participants.get(participant_id)
+        return dict(participant) if participant else None
+
+    def by_name(self, name):
+        return self.get(self.store.participant_keys.get(participants.participant_key(name)))
+
+    def get_or_create(self, name):
+        key = participants.participant_key(name)
+        if not key:
+            return None
+        with self.store.lock:
+            if key not in self.store.participant_keys:
+                self.store.put('participants', {'id': self.store.next_id('participants'), 'name': participants.display_name(name),
+                                                'name_key': key, 'creation_date': self.store.now()})
+            return self.store.participant_keys[key]
+
+    def history(self, participant_id):
+        # The hunts in this store; archived hunts stay in the SQLite archive
+        with self.store.lock:
+            rows = []
+            for entry_id in sorted(self.store.entries, reverse=True):
+                entry = self.store.entries[entry_id]
+                hunt = self.store.hunts.get(entry['vossenjacht_id'])
+                if entry['participant_id'] == participant_id and hunt is not None:
+                    rows.append({column: entry[column] for column in (
+                        'id', 'name', 'calculated_km', 'duration_minutes', 'arrival_time_last_fox', 'hunt_rank', 'vossenjacht_id')})
+                    rows[-1].update(vossenjacht_name=hunt['name'], vossenjacht_type=hunt['type'],
+                                    vossenjacht_date=hunt['creation_date'], archived=0)
+            return rows
+
+
+class MemorySeasonRepository(SeasonRepository):
+    def __init__(self, store, points_scheme=seasons.DEFAULT_POINTS):
+        self.store = store
+        self.points_scheme = points_scheme
+
+    def get(self, season_id):
+        season = self.store.seasons.get(season_id)
+        return dict(season, creator_username=self.store.username(season['creator_id'])) if season else None
+
+    def list(self):
+        with self.store.lock:
+            rows = [dict(season, creator_username=self.store.username(season['creator_id']),
+                         hunt_count=len(self.store.season_hunts.get(season['id'], ())))
+                    for season in self.store.seasons.values()]
+        return sorted(rows, key=lambda season: (season['creation_date'], season['id']), reverse=True)
+
+    def hunts(self, season_id):
+        with self.store.lock:
+            hunts = [self.store.hunts[vj_id] for vj_id in self.store.season_hunts.get(season_id, ())]
+        return [{'id': hunt['id'], 'name': hunt['name']}
+                for hunt in sorted(hunts, key=lambda hunt: (hunt['creation_date'], hunt['id']))]
+
+    def add(self, name, creator_id):
+        with self.store.lock:
+            if creator_id not in self.store.users:
+                raise sqlite3.IntegrityError('FOREIGN KEY constraint failed')
+            return self.store.put('seasons', {'id': self.store.next_id('seasons'), 'name': name,
+                                              'creation_date': self.store.now(), 'creator_id': creator_id})
+
+    def rename(self, season_id, name):
+        with self.store.lock:
+            if season_id in self.store.seasons:
+                self.store.seasons[season_id]['name'] = name
+
+    def delete(self, season_id):
+        with self.store.lock:
+            self.store.seasons.pop(season_id, None)
+            self.store.season_hunts.pop(season_id, None)
+
+    def add_hunt(self, season_id, vj_id):
+        with self.store.lock:
+            if season_id not in self.store.seasons or vj_id not in self.store.hunts:
+                raise sqlite3.IntegrityError('FOREIGN KEY constraint failed')
+            self.store.season_hunts.setdefault(season_id, set()).add(vj_id)
+
+    def remove_hunt(self, season_id, vj_id):
+        with self.store.lock:
+            self.store.season_hunts.get(season_id, set()).discard(vj_id)
+
+    def standings(self, season_id):
+        # Computed from the hunts' current ranks on every read, the same way seasons.py fills season_standings
+        totals = {}
+        with self.store.lock:
+            for hunt in self.hunts(season_id):
+                best = {}
+                for entry in self.store.ranked(hunt['id']):
+                    key = participants.participant_key(entry['name'])
+                    if entry['hunt_rank'] > 0 and key and key not in best:
+                        best[key] = (seasons.points_for_rank(entry['hunt_rank'], self.points_scheme), entry['name'])
+                for key, (points, name) in best.items():
+                    total = totals.setdefault(key, {'participant_key': key, 'points': 0, 'hunts': 0,
+                                                    'participant_id': self.store.participant_keys.get(key)})
+                    total['participant_name'] = name
+                    total['points'] += points
+                    total['hunts'] += 1
+        ranked = []
+        last_points = None
+        current_dense_rank = 0
+        for standing in sorted(totals.values(), key=lambda row: (-row['points'], row['participant_name'])):
+            if standing['points'] != last_points:
+                current_dense_rank += 1
+                last_points = standing['points']
+            standing['rank'] = current_dense_rank
+            ranked.append(standing)
+        return ranked
+
+
+class MemoryCheckpointRepository(CheckpointRepository):
+    def __init__(self, store):
+        self.store = store
+
+    def for_hunt(self, vj_id):
+        with self.store.lock:
+            found = [dict(c) for c in self.store.checkpoints.values() if c['vossenjacht_id'] == vj_id]
+        return sorted(found, key=lambda checkpoint: checkpoint['seq'])
+
+    def get(self, vj_id, checkpoint_id):
+        checkpoint = self.store.checkpoints.get(checkpoint_id)
+        return dict(checkpoint) if checkpoint and checkpoint['vossenjacht_id'] == vj_id else None
+
+    def add(self, vj_id, name, lat, lon, radius_m=50):
+        checkpoints.validate(lat, lon, radius_m)
+        with self.store.lock:
+            seq = max((checkpoint['seq'] for checkpoint in self.for_hunt(vj_id)), default=0) + 1
+            return self.store.put('checkpoints', {'id': self.store.next_id('checkpoints'), 'vossenjacht_id': vj_id,
+                                                  'seq': seq, 'name': name, 'lat': lat, 'lon': lon, 'radius_m': radius_m})
+
+    def delete(self, vj_id, checkpoint_id):
+        with self.store.lock:
+            if self.get(vj_id, checkpoint_id) is not None:
+                del self.store.checkpoints[checkpoint_id]
+
+    def near(self, vj_id, lat, lon):
+        # A small event has a handful of checkpoints per hunt: measured one by one, no bounding boxes
+        found = []
+        for checkpoint in self.for_hunt(vj_id):
+            distance = checkpoints.distance_m(lat, lon, checkpoint['lat'], checkpoint['lon'])
+            if distance <= checkpoint['radius_m']:
+                found.append(dict(checkpoint, distance_m=distance))
+        return sorted(found, key=lambda checkpoint: checkpoint['distance_m'])
+
+
+def memory(store, points_scheme=seasons.DEFAULT_POINTS):
+    return Repositories(MemoryEntryRepository(store), MemoryHuntRepository(store), MemoryUserRepository(store),
+                        MemoryParticipantRepository(store), MemorySeasonRepository(store, points_scheme),
+                        MemoryCheckpointRepository(store))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path, db):
+    """The process-wide memory store of a database file, loaded through db on first use."""
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = _stores[db_path] = MemoryStore.load(db)
+        return store
+
+
+# --- benchmark ---
+
+def benchmark(hunts=10, entries_per_hunt=500, repeat=5):
+    """Time the same reads and writes on both backends, on one synthetic event in an in-memory SQLite database."""
+    import app as app_module # The schema and migrations live with the app
+    db = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+    db.row_factory = sqlite3.Row
+    db.executescript(app_module.USERS_SCHEMA_SQL + app_module.HUNT_SCHEMA_SQL)
+    app_module.migrate_db(db)
+    repos = sqlite(db)
+    creator_id = repos.users.add('bench', 'x', 'admin')
+    hunt_ids = [repos.hunts.add({'name': f'Vossenjacht {h}', 'type': ('kilometers', 'time')[h % 2], 'creator_id': creator_id,
+                                 'start_time': '12:00', 'start_minutes': 720}) for h in range(hunts)]
+    for vj_id in hunt_ids:
+        for i in range(entries_per_hunt):
+            arrival = 780 + (i * 37) % 240
+            repos.entries.add({'name': f'Team {i}', 'start_km': 0, 'end_km': (i * 53) % 300, 'arrival_time_last_fox': scoring.format_hhmm(arrival),
+                               'arrival_minutes': arrival, 'calculated_km': (i * 53) % 300, 'duration_minutes': arrival - 720,
+                               'vossenjacht_id': vj_id, 'participant_id': repos.participants.get_or_create(f'Team {i}')})
+        scoring.recompute_hunt_ranks(db, vj_id)
+    db.commit()
+    started = time.perf_counter()
+    store = MemoryStore.load(db)
+    print(f"{hunts} hunts x {entries_per_hunt} entries: loaded into memory in {time.perf_counter() - started:.3f}s")
+
+    def add_and_delete(repos, refresh):
+        entry_id = repos.entries.add({'name': 'Bench', 'start_km': 0, 'end_km': 42, 'arrival_time_last_fox': '13:30',
+                                      'arrival_minutes': 810, 'calculated_km': 42, 'duration_minutes': 90,
+                                      'vossenjacht_id': hunt_ids[0]})
+        refresh()
+        repos.entries.delete(entry_id)
+        refresh()
+
+    cases = [
+        ('results of one hunt', lambda repos, refresh: repos.entries.results(hunt_ids[0])),
+        ('settings page by km', lambda repos, refresh: repos.entries.page({}, sort='km')),
+        ('settings page of one hunt', lambda repos, refresh: repos.entries.page({'vj_id': hunt_ids[0]}, sort='rank', direction='asc')),
+        ('search', lambda repos, refresh: repos.entries.search('team 12')),
+        ('vossenjachten overview', lambda repos, refresh: repos.hunts.page()),
+        ('add + delete an entry (ranked)', add_and_delete),
+    ]
+    backends = [('sqlite', sqlite(db), lambda: scoring.recompute_hunt_ranks(db, hunt_ids[0])),
+                ('memory', memory(store), lambda: None)]
+    for name, case in cases:
+        timings = []
+        for backend, backend_repos, refresh in backends:
+            best = float('inf')
+            for _ in range(repeat):
+                started = time.perf_counter()
+                case(backend_repos, refresh)
+                best = min(best, time.perf_counter() - started)
+            timings.append(f"{backend} {best * 1000:8.2f} ms")
+        print(f"  {name:32} {'  '.join(timings)}")
+    db.rollback()
+
+
+if __name__ == '__main__':
+    import sys
+    benchmark(*(int(arg) for arg in sys.argv[1:3]))
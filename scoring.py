@@ -0,0 +1,207 @@
+"""Score calculations shared by the entry routes and the batch recalculations.
+
+Times of day are stored as integer minutes since midnight next to the
+original ``HH:MM`` text (``vossenjachten.start_minutes`` and
+``entries.arrival_minutes``), so durations can be recomputed for a whole
+hunt with one set-based ``UPDATE`` instead of parsing strings per row.
+Driven kilometers are recomputed the same way, with the odometer rollover
+expressed as a SQL ``CASE``.
+"""
+import sqlite3
+import time
+
+# SQLite 3.33 added UPDATE ... FROM; older versions write the changed ranks row by row
+_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+MINUTES_PER_DAY = 24 * 60
+
+# Sort order (and therefore dense-rank order) per vossenjacht type, lowest first
+RANK_ORDER_SQL = {
+    'time': 'duration_minutes ASC, calculated_km ASC',
+    'kilometers': 'calculated_km ASC, duration_minutes ASC',
+    'both': 'calculated_km ASC, duration_minutes ASC',
+}
+
+
+def rank_key(hunt_type):
+    """Python equivalent of RANK_ORDER_SQL: the sort key of an entry in a hunt of this type."""
+    if hunt_type == 'time':
+        return lambda entry: (entry['duration_minutes'], entry['calculated_km'])
+    return lambda entry: (entry['calculated_km'], entry['duration_minutes'])
+
+
+def dense_rank(entries, hunt_type=None):
+    """Entries as dicts in rank order, each with its dense 'rank' (equal scores share a rank)."""
+    key = rank_key(hunt_type)
+    ranked = []
+    last_score = None
+    rank = 0
+    for entry in sorted(entries, key=key):
+        score = key(entry)
+        if score != last_score:
+            rank += 1
+            last_score = score
+        ranked_entry = dict(entry)
+        ranked_entry['rank'] = rank
+        ranked.append(ranked_entry)
+    return ranked
+
+
+def parse_hhmm(value):
+    """Parse an ``HH:MM`` string into minutes since midnight; raises ValueError."""
+    hours, sep, minutes = (value or '').strip().partition(':')
+    if not sep or not (1 <= len(hours) <= 2 and hours.isdigit()) or not (1 <= len(minutes) <= 2 and minutes.isdigit()):
+        raise ValueError(f"Invalid time '{value}', expected HH:MM")
+    hours, minutes = int(hours), int(minutes)
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"Invalid time '{value}', expected HH:MM")
+    return hours * 60 + minutes
+
+
+def format_hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def hhmm_to_minutes_sql(column):
+    # SQL expression equivalent of parse_hhmm for well-formed values (used by triggers and backfills)
+    return (f"(CAST(substr({column}, 1, instr({column}, ':') - 1) AS INTEGER) * 60"
+            f" + CAST(substr({column}, instr({column}, ':') + 1) AS INTEGER))")
+
+
+def hunt_start_minutes(vossenjacht):
+    """A hunt's start as minutes since midnight, or None when it has no start time to measure durations from."""
+    if vossenjacht['start_minutes'] is not None:
+        return int(vossenjacht['start_minutes'])
+    if vossenjacht['start_time']:
+        return parse_hhmm(vossenjacht['start_time'])
+    return None
+
+
+def duration_minutes(start_minutes, arrival_minutes):
+    # An arrival "before" the start time means the hunt ran past midnight
+    return (arrival_minutes - start_minutes) % MINUTES_PER_DAY
+
+
+def duration_sql(arrival, start):
+    # SQLite's % keeps the sign of the dividend, hence the extra + day
+    return f"((({arrival}) - ({start})) % {MINUTES_PER_DAY} + {MINUTES_PER_DAY}) % {MINUTES_PER_DAY}"
+
+
+def calculated_km(start_km, end_km, max_odometer_reading):
+    actual_end_km = end_km
+    if end_km < start_km: # Odometer rollover
+        actual_end_km += max_odometer_reading
+    return int(round(actual_end_km - start_km))
+
+
+def calculated_km_sql(max_odometer_reading):
+    # SQL equivalent of calculated_km() over the start_km/end_km columns
+    return (f"CAST(ROUND(CASE WHEN end_km < start_km THEN end_km + {int(max_odometer_reading)} ELSE end_km END"
+            f" - start_km) AS INTEGER)")
+
+
+def hunt_max_odometer(vossenjacht, default_max_odometer):
+    # A vossenjacht can override the app-wide MAX_ODOMETER_READING (e.g. a different car fleet)
+    if vossenjacht['max_odometer_reading']:
+        return int(vossenjacht['max_odometer_reading'])
+    return int(default_max_odometer)
+
+
+def recompute_hunt_scores(db, vj_id, default_max_odometer=None, after_id=None, upto_id=None):
+    """Recompute duration_minutes, and calculated_km when a default rollover is given, for one hunt.
+
+    Runs as one UPDATE, optionally limited to the id range (after_id, upto_id]. Only rows
+    whose values actually change are written; returns the number of updated rows.
+    """
+    vj = db.execute('SELECT start_minutes, max_odometer_reading FROM vossenjachten WHERE id = ?', (vj_id,)).fetchone()
+    if vj is None:
+        return 0
+    new_values = {}
+    if vj['start_minutes'] is not None:
+        new_values['duration_minutes'] = f"COALESCE({duration_sql('arrival_minutes', int(vj['start_minutes']))}, duration_minutes)"
+    if default_max_odometer is not None:
+        new_values['calculated_km'] = calculated_km_sql(hunt_max_odometer(vj, default_max_odometer))
+    if not new_values:
+        return 0
+
+    set_clause = ', '.join(f"{column} = {expression}" for column, expression in new_values.items())
+    changed_clause = ' OR '.join(f"{column} IS NOT {expression}" for column, expression in new_values.items())
+    sql = f"UPDATE entries SET {set_clause} WHERE vossenjacht_id = ? AND ({changed_clause})"
+    params = [vj_id]
+    if after_id is not None:
+        sql += " AND id > ?"
+        params.append(after_id)
+    if upto_id is not None:
+        sql += " AND id <= ?"
+        params.append(upto_id)
+    return db.execute(sql, params).rowcount
+
+
+def recompute_hunt_ranks(db, vj_id):
+    """Store the dense rank of every entry within its hunt; returns the number of entries whose rank changed."""
+    vj = db.execute('SELECT type FROM vossenjachten WHERE id = ?', (vj_id,)).fetchone()
+    if vj is None:
+        return 0
+    order = RANK_ORDER_SQL.get(vj['type'], RANK_ORDER_SQL['kilometers'])
+    ranked_sql = (f"SELECT id, hunt_rank, DENSE_RANK() OVER (ORDER BY {order}) AS new_rank"
+                  " FROM entries WHERE vossenjacht_id = ?")
+    if _UPDATE_FROM:
+        # One set-based statement; only the rows whose rank actually moved are written
+        return db.execute(
+            f"UPDATE entries SET hunt_rank = ranked.new_rank FROM ({ranked_sql}) AS ranked"
+            " WHERE entries.id = ranked.id AND ranked.hunt_rank IS NOT ranked.new_rank",
+            (vj_id,)
+        ).rowcount
+    changed = [(row['new_rank'], row['id']) for row in db.execute(ranked_sql, (vj_id,)).fetchall()
+               if row['hunt_rank'] != row['new_rank']]
+    if changed:
+        db.executemany('UPDATE entries SET hunt_rank = ? WHERE id = ?', changed)
+    return len(changed)
+
+
+def recompute_hunt(db, vj_id, default_max_odometer=None):
+    recompute_hunt_scores(db, vj_id, default_max_odometer)
+    return recompute_hunt_ranks(db, vj_id)
+
+
+def recalc_scores(db, default_max_odometer, vj_id=None, chunk_size=1000, pause=0.01,
+                  refresh=None, progress=None):
+    """Recompute calculated_km and duration_minutes for one hunt or all hunts.
+
+    Entries are walked in id order, chunk_size rows per transaction, sleeping `pause`
+    seconds between chunks so other writers get the lock. Afterwards
+    refresh(db, [vj_id]) (default: recompute_hunt_ranks) runs once per hunt.
+    """
+    if vj_id is None:
+        hunt_ids = [row['id'] for row in db.execute('SELECT id FROM vossenjachten ORDER BY id').fetchall()]
+    else:
+        hunt_ids = [vj_id]
+    totals = {'hunts': 0, 'rows': 0, 'updated': 0}
+
+    for hunt_id in hunt_ids:
+        last_id = 0
+        while True:
+            chunk = db.execute(
+                'SELECT id FROM entries WHERE vossenjacht_id = ? AND id > ? ORDER BY id LIMIT ?',
+                (hunt_id, last_id, chunk_size)
+            ).fetchall()
+            if not chunk:
+                break
+            upto_id = chunk[-1]['id']
+            totals['updated'] += recompute_hunt_scores(db, hunt_id, default_max_odometer, after_id=last_id, upto_id=upto_id)
+            db.commit()
+            totals['rows'] += len(chunk)
+            last_id = upto_id
+            if progress:
+                progress(totals)
+            if pause:
+                time.sleep(pause)
+
+        if refresh is None:
+            recompute_hunt_ranks(db, hunt_id)
+        else:
+            refresh(db, [hunt_id])
+        db.commit()
+        totals['hunts'] += 1
+    return totals
+
@@ -0,0 +1,120 @@
+"""Full-text search over entries for the settings/moderation view.
+
+``entry_search`` is an FTS5 table with one row per entry (rowid = entries.id)
+holding the participant name and the vossenjacht name. Triggers on
+``entries`` and ``vossenjachten`` keep it in sync, so a lookup is an index
+query ranked with bm25 instead of a scan over every entry. Every search
+term is matched as a prefix ("jan vri" finds "Jan de Vries").
+
+SQLite builds without FTS5 fall back to a ``LIKE`` scan (substring
+matches, newest first) so the search box keeps working there, just slower.
+"""
+import re
+import sqlite3
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# bm25 column weights: a hit on the participant name counts more than one on the hunt name
+NAME_WEIGHT = 10.0
+VOSSENJACHT_WEIGHT = 1.0
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def install(db):
+    """Create the search table and its triggers; returns False if FTS5 is not available."""
+    exists = db.execute("SELECT 1 FROM sqlite_master WHERE name = 'entry_search'").fetchone()
+    try:
+        db.executescript('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS entry_search USING fts5(
+                name, vossenjacht_name,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            );
+
+            CREATE TRIGGER IF NOT EXISTS entry_search_insert AFTER INSERT ON entries
+            BEGIN
+                INSERT INTO entry_search (rowid, name, vossenjacht_name)
+                VALUES (NEW.id, NEW.name, (SELECT name FROM vossenjachten WHERE id = NEW.vossenjacht_id));
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS entry_search_update AFTER UPDATE OF name, vossenjacht_id ON entries
+            BEGIN
+                UPDATE entry_search SET name = NEW.name,
+                    vossenjacht_name = (SELECT name FROM vossenjachten WHERE id = NEW.vossenjacht_id)
+                WHERE rowid = NEW.id;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS entry_search_delete AFTER DELETE ON entries
+            BEGIN
+                DELETE FROM entry_search WHERE rowid = OLD.id;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS entry_search_vossenjacht_rename AFTER UPDATE OF name ON vossenjachten
+            BEGIN
+                UPDATE entry_search SET vossenjacht_name = NEW.name
+                WHERE rowid IN (SELECT id FROM entries WHERE vossenjacht_id = NEW.id);
+            END;
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search disabled: {e}")
+        return False
+    if not exists:
+        rebuild(db)
+    return True
+
+
+def rebuild(db):
+    # Re-index every entry, e.g. after the table was first created on an existing database
+    db.execute('DELETE FROM entry_search')
+    db.execute(
+        'INSERT INTO entry_search (rowid, name, vossenjacht_name)'
+        ' SELECT e.id, e.name, vj.name FROM entries e LEFT JOIN vossenjachten vj ON e.vossenjacht_id = vj.id'
+    )
+
+
+def terms(query):
+    return _TERM.findall(query or '')
+
+
+def match_expression(query):
+    # Every word becomes a quoted prefix term, so user input can't inject FTS5 syntax
+    return ' '.join(f'"{term}"*' for term in terms(query))
+
+
+def _available(db):
+    return db.execute("SELECT 1 FROM sqlite_master WHERE name = 'entry_search'").fetchone() is not None
+
+
+def search_entries(db, query, creator_id=None, limit=DEFAULT_LIMIT):
+    """Entries whose participant or vossenjacht name matches every word of query, best match first.
+
+    creator_id restricts the results to vossenjachten created by that user (moderators).
+    """
+    query_terms = terms(query)
+    if not query_terms:
+        return []
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    select = ('SELECT e.*, vj.name as vossenjacht_name, vj.creator_id as vossenjacht_creator_id'
+              ' FROM entries e JOIN vossenjachten vj ON e.vossenjacht_id = vj.id')
+
+    if _available(db):
+        sql = (f'{select} JOIN (SELECT rowid, bm25(entry_search, {NAME_WEIGHT}, {VOSSENJACHT_WEIGHT}) as score'
+               ' FROM entry_search WHERE entry_search MATCH ?) hits ON hits.rowid = e.id')
+        params = [match_expression(query)]
+        conditions = []
+        order = ' ORDER BY hits.score, e.id DESC'
+    else:
+        sql = select
+        params = []
+        conditions = ['(e.name LIKE ? OR vj.name LIKE ?)'] * len(query_terms)
+        params.extend(value for term in query_terms for value in (f'%{term}%', f'%{term}%'))
+        order = ' ORDER BY e.id DESC'
+
+    if creator_id is not None:
+        conditions.append('vj.creator_id = ?')
+        params.append(creator_id)
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    return db.execute(sql + order + ' LIMIT ?', params + [limit]).fetchall()
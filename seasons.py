@@ -0,0 +1,130 @@
+"""Season standings across multiple vossenjachten.
+
+A season groups vossenjachten. Every participant earns points per hunt from
+their dense rank in that hunt (``SEASON_POINTS``: points for rank 1, 2, ...).
+The points per hunt are kept in ``season_points`` and the totals in
+``season_standings``. When the entries of a hunt change, only that hunt's
+points are recomputed and the difference is applied to the totals, so the
+season page is a single indexed read no matter how many hunts it contains.
+"""
+
+from participants import participant_key
+
+DEFAULT_POINTS = (25, 18, 15, 12, 10, 8, 6, 4, 2, 1)
+
+
+def parse_points_scheme(value):
+    if not value:
+        return DEFAULT_POINTS
+    return tuple(int(points) for points in value.split(',') if points.strip())
+
+
+def points_for_rank(rank, scheme):
+    if rank is None or rank < 1 or rank > len(scheme):
+        return 0
+    return scheme[rank - 1]
+
+
+def hunt_points(db, vj_id, scheme):
+    """Return {participant_key: (points, display_name)} for one hunt, best entry per participant."""
+    best = {}
+    rows = db.execute(
+        'SELECT name, hunt_rank FROM entries WHERE vossenjacht_id = ? AND hunt_rank > 0 ORDER BY hunt_rank, id',
+        (vj_id,)
+    ).fetchall()
+    for row in rows:
+        key = participant_key(row['name'])
+        if key and key not in best:
+            best[key] = (points_for_rank(row['hunt_rank'], scheme), row['name'])
+    return best
+
+
+def _apply_hunt_points(db, season_id, vj_id, new_points):
+    old_points = {
+        row['participant_key']: row['points'] for row in db.execute(
+            'SELECT participant_key, points FROM season_points WHERE season_id = ? AND vossenjacht_id = ?',
+            (season_id, vj_id)
+        ).fetchall()
+    }
+    for key in set(old_points) | set(new_points):
+        old = old_points.get(key)
+        new = new_points.get(key)
+        if new is None:
+            db.execute('DELETE FROM season_points WHERE season_id = ? AND vossenjacht_id = ? AND participant_key = ?',
+                       (season_id, vj_id, key))
+            db.execute('UPDATE season_standings SET points = points - ?, hunts = hunts - 1'
+                       ' WHERE season_id = ? AND participant_key = ?', (old, season_id, key))
+        elif old is None:
+            points, name = new
+            db.execute('INSERT INTO season_points (season_id, vossenjacht_id, participant_key, points) VALUES (?, ?, ?, ?)',
+                       (season_id, vj_id, key, points))
+            db.execute('INSERT INTO season_standings (season_id, participant_key, participant_name, points, hunts)'
+                       ' VALUES (?, ?, ?, ?, 1)'
+                       ' ON CONFLICT (season_id, participant_key) DO UPDATE SET'
+                       ' points = points + excluded.points, hunts = hunts + 1, participant_name = excluded.participant_name',
+                       (season_id, key, name, points))
+        elif old != new[0]:
+            db.execute('UPDATE season_points SET points = ? WHERE season_id = ? AND vossenjacht_id = ? AND participant_key = ?',
+                       (new[0], season_id, vj_id, key))
+            db.execute('UPDATE season_standings SET points = points + ? WHERE season_id = ? AND participant_key = ?',
+                       (new[0] - old, season_id, key))
+    db.execute('DELETE FROM season_standings WHERE season_id = ? AND hunts <= 0', (season_id,))
+
+
+def update_hunt_points(db, vj_id, scheme, season_ids=None):
+    """Bring the standings of every season containing this hunt up to date with its current ranks."""
+    if season_ids is None:
+        season_ids = [row['season_id'] for row in db.execute(
+            'SELECT season_id FROM season_vossenjachten WHERE vossenjacht_id = ?', (vj_id,)
+        ).fetchall()]
+    if not season_ids:
+        return
+    new_points = hunt_points(db, vj_id, scheme)
+    for season_id in season_ids:
+        _apply_hunt_points(db, season_id, vj_id, new_points)
+
+
+def add_hunt(db, season_id, vj_id, scheme):
+    db.execute('INSERT OR IGNORE INTO season_vossenjachten (season_id, vossenjacht_id) VALUES (?, ?)', (season_id, vj_id))
+    update_hunt_points(db, vj_id, scheme, season_ids=[season_id])
+
+
+def remove_hunt(db, season_id, vj_id):
+    _apply_hunt_points(db, season_id, vj_id, {})
+    db.execute('DELETE FROM season_vossenjachten WHERE season_id = ? AND vossenjacht_id = ?', (season_id, vj_id))
+
+
+def remove_hunt_from_all(db, vj_id):
+    # Used when a vossenjacht is deleted
+    season_ids = [row['season_id'] for row in db.execute(
+        'SELECT season_id FROM season_vossenjachten WHERE vossenjacht_id = ?', (vj_id,)
+    ).fetchall()]
+    for season_id in season_ids:
+        remove_hunt(db, season_id, vj_id)
+
+
+def reset_points(db):
+    # Used when all entries are cleared; the season/hunt grouping itself is kept
+    db.execute('DELETE FROM season_points')
+    db.execute('DELETE FROM season_standings')
+
+
+def standings(db, season_id):
+    """Season table sorted by points, with a dense 'rank' attached."""
+    rows = db.execute(
+        'SELECT s.participant_key, s.participant_name, s.points, s.hunts, p.id as participant_id'
+        ' FROM season_standings s LEFT JOIN participants p ON p.name_key = s.participant_key'
+        ' WHERE s.season_id = ? ORDER BY s.points DESC, s.participant_name',
+        (season_id,)
+    ).fetchall()
+    ranked = []
+    last_points = None
+    current_dense_rank = 0
+    for row in rows:
+        if row['points'] != last_points:
+            current_dense_rank += 1
+            last_points = row['points']
+        standing = dict(row)
+        standing['rank'] = current_dense_rank
+        ranked.append(standing)
+    return ranked
@@ -0,0 +1,283 @@
+"""Per-club database shards with a shared catalog.
+
+With ``SHARDING_ENABLED`` every club gets its own SQLite file, so a busy hunt
+of one club only locks (and grows) that club's file. The main database
+(``DATABASE_PATH``) becomes the catalog: it keeps ``users``, the ``shards``
+registry (club key -> file) and ``hunt_shards``, the directory that says which
+shard a vossenjacht lives in. It also remains the default shard for users and
+hunts that don't belong to a club, so enabling sharding changes nothing for
+existing data.
+
+``get_db()`` picks the shard for the request: the shard of the requested
+vossenjacht when the request names one, else the logged-in user's club, else
+the club chosen with ``?club=KEY`` (remembered in the session), else the
+default shard. Admins are not tied to their own club and switch with
+``?club=KEY`` as well. Entry ids are only unique within a shard, so links to
+an entry carry its hunt as ``?vj_id=``. A shard connection has the catalog attached as ``catalog``;
+SQLite resolves unqualified table names in ``main`` first, so ``users`` is
+read from the catalog while all hunt tables come from the shard file.
+
+Each shard file gets the hunt schema and migrations the first time this
+process opens it, and its own group-commit writer. Vossenjacht ids are
+allocated in the catalog so they are unique over all shards.
+"""
+import os
+import re
+import sqlite3
+import threading
+
+from flask import has_request_context, request, session
+
+CATALOG_SCHEMA = 'catalog'
+
+_KEY_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]{0,39}$')
+# SQLite can't enforce a foreign key into another file; user ids in a shard refer to catalog.users
+_USER_FOREIGN_KEY = re.compile(r',(\s*--[^\n]*)?\s*FOREIGN KEY \(\w+\) REFERENCES users \(id\)')
+
+CATALOG_SQL = '''
+    CREATE TABLE IF NOT EXISTS shards (
+        key TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        path TEXT NOT NULL,
+        creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Which shard each vossenjacht lives in; NULL is the default shard (the catalog file itself)
+    CREATE TABLE IF NOT EXISTS hunt_shards (
+        vossenjacht_id INTEGER PRIMARY KEY,
+        shard_key TEXT REFERENCES shards (key)
+    );
+'''
+
+_migrate_shard = None
+_migrated = set()
+# Per catalog: {catalog path: {key: shard path}} and {(catalog path, vj_id): key}
+_registry = {}
+_hunt_shards = {}
+_lock = threading.Lock()
+
+
+class ShardError(Exception):
+    pass
+
+
+def init_app(flask_app, migrate):
+    """migrate(db) creates the hunt schema in a shard file and runs the migrations."""
+    global _migrate_shard
+    _migrate_shard = migrate
+    flask_app.config.setdefault('SHARDING_ENABLED', os.environ.get('SHARDING_ENABLED', '').lower() in ('1', 'true', 'yes'))
+    db_dir = os.path.dirname(os.path.abspath(flask_app.config['DATABASE_FILENAME']))
+    flask_app.config.setdefault('SHARD_DIR', os.environ.get('SHARD_DIR', os.path.join(db_dir, 'shards')))
+
+
+def catalog_path(config):
+    return config.get('DATABASE', config['DATABASE_FILENAME'])
+
+
+def is_enabled(config):
+    # An in-memory database can't be shared between connections, let alone files
+    return bool(config.get('SHARDING_ENABLED')) and catalog_path(config) != ':memory:'
+
+
+def shard_schema(sql):
+    """The hunt schema as created in a shard file: without the foreign keys into users."""
+    return _USER_FOREIGN_KEY.sub(r'\1', sql)
+
+
+def install_catalog(db):
+    db.executescript(CATALOG_SQL)
+    if 'shard_key' not in {row['name'] for row in db.execute('PRAGMA table_info(users)')}:
+        db.execute('ALTER TABLE users ADD COLUMN shard_key TEXT REFERENCES shards (key)')
+    # Hunts created before sharding stay in the default shard
+    db.execute('INSERT OR IGNORE INTO hunt_shards (vossenjacht_id, shard_key) SELECT id, NULL FROM vossenjachten')
+
+
+def _connect_catalog(config):
+    conn = sqlite3.connect(catalog_path(config), timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _load_registry(config):
+    conn = _connect_catalog(config)
+    try:
+        rows = conn.execute('SELECT key, path FROM shards').fetchall()
+    finally:
+        conn.close()
+    with _lock:
+        _registry[catalog_path(config)] = {row['key']: row['path'] for row in rows}
+
+
+def shard_exists(config, key):
+    if key not in _registry.get(catalog_path(config), {}):
+        _load_registry(config)
+    return key in _registry[catalog_path(config)]
+
+
+def shard_path(config, key):
+    """The database file for a shard key; None is the default shard."""
+    if key is None or not is_enabled(config):
+        return catalog_path(config)
+    if not shard_exists(config, key):
+        raise ShardError(f"Unknown shard '{key}'")
+    return _registry[catalog_path(config)][key]
+
+
+def hunt_shard(config, vj_id):
+    """The shard key of a vossenjacht (None for the default shard or unknown hunts)."""
+    cache_key = (catalog_path(config), vj_id)
+    if cache_key in _hunt_shards:
+        return _hunt_shards[cache_key]
+    conn = _connect_catalog(config)
+    try:
+        row = conn.execute('SELECT shard_key FROM hunt_shards WHERE vossenjacht_id = ?', (vj_id,)).fetchone()
+    finally:
+        conn.close()
+    key = row['shard_key'] if row else None
+    if row:
+        with _lock:
+            if len(_hunt_shards) > 10000:
+                _hunt_shards.clear()
+            _hunt_shards[cache_key] = key
+    return key
+
+
+def _requested_hunt_id():
+    vj_id = (request.view_args or {}).get('vj_id')
+    if vj_id is None:
+        vj_id = request.args.get('vj_id', type=int)
+    if vj_id is None and request.method == 'POST':
+        vj_id = request.form.get('vossenjacht_id', type=int)
+    return vj_id
+
+
+def current_key(config):
+    """The shard key for the current request (None: the default shard)."""
+    if not is_enabled(config) or not has_request_context():
+        return None
+    vj_id = _requested_hunt_id()
+    if vj_id is not None:
+        return hunt_shard(config, vj_id)
+    if session.get('user_id') and session.get('role') != 'admin':
+        return session.get('shard_key')
+    # Spectators and admins (who manage every club) pick a club with ?club=KEY
+    club = request.args.get('club')
+    if club is not None:
+        if club and shard_exists(config, club):
+            session['club'] = club
+        else:
+            session.pop('club', None)
+    if session.get('user_id') and 'club' not in session:
+        return session.get('shard_key')
+    return session.get('club')
+
+
+def prepare(db, config, path):
+    """Bring the shard schema up to date (once per process) and attach the catalog to a shard connection."""
+    # Migrate before attaching, so the catalog's own hunt tables can't be mistaken for the shard's
+    if path not in _migrated:
+        _migrate_shard(db)
+        with _lock:
+            _migrated.add(path)
+    db.execute(f'ATTACH DATABASE ? AS {CATALOG_SCHEMA}', (catalog_path(config),))
+
+
+def allocate_hunt_id(config, key):
+    """Reserve a vossenjacht id for a new hunt in shard `key`; None when sharding is off."""
+    if not is_enabled(config):
+        return None
+    conn = _connect_catalog(config)
+    try:
+        # Also past the default shard's own ids, which may have been created with sharding off
+        cursor = conn.execute(
+            'INSERT INTO hunt_shards (vossenjacht_id, shard_key) SELECT MAX('
+            ' COALESCE((SELECT MAX(vossenjacht_id) FROM hunt_shards), 0),'
+            ' COALESCE((SELECT MAX(id) FROM vossenjachten), 0)) + 1, ?',
+            (key,)
+        )
+        conn.commit()
+        vj_id = cursor.lastrowid
+    finally:
+        conn.close()
+    with _lock:
+        _hunt_shards[(catalog_path(config), vj_id)] = key
+    return vj_id
+
+
+def add_shard(config, key, name, path=None):
+    """Register a shard and create its database file; returns the path."""
+    if not _KEY_PATTERN.match(key or ''):
+        raise ShardError('Shard keys use lowercase letters, digits, - and _ (max 40).')
+    path = os.path.abspath(path or os.path.join(config['SHARD_DIR'], f'{key}.db'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = _connect_catalog(config)
+    try:
+        try:
+            conn.execute('INSERT INTO shards (key, name, path) VALUES (?, ?, ?)', (key, name, path))
+        except sqlite3.IntegrityError:
+            raise ShardError(f"Shard '{key}' already exists")
+        shard = sqlite3.connect(path)
+        shard.row_factory = sqlite3.Row
+        try:
+            prepare(shard, config, path)
+        finally:
+            shard.close()
+        conn.commit()
+    finally:
+        conn.close()
+    _load_registry(config)
+    return path
+
+
+def list_shards(config):
+    conn = _connect_catalog(config)
+    try:
+        return conn.execute(
+            'SELECT s.key, s.name, s.path,'
+            ' (SELECT COUNT(*) FROM hunt_shards h WHERE h.shard_key = s.key) as hunts,'
+            ' (SELECT COUNT(*) FROM users u WHERE u.shard_key = s.key) as users'
+            ' FROM shards s ORDER BY s.key'
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def assign_user(config, username, key):
+    if key is not None and not shard_exists(config, key):
+        raise ShardError(f"Unknown shard '{key}'")
+    conn = _connect_catalog(config)
+    try:
+        cursor = conn.execute('UPDATE users SET shard_key = ? WHERE username = ?', (key, username))
+        conn.commit()
+    finally:
+        conn.close()
+    if cursor.rowcount == 0:
+        raise ShardError(f"Unknown user '{username}'")
+
+
+def move_shard(config, key, new_path, pages=256, sleep=0.05):
+    """Copy a shard to new_path through the backup API and point the registry at it.
+
+    Stop the app (or at least the traffic for this club) first: writes to the
+    old file after the copy would be lost.
+    """
+    old_path = shard_path(config, key)
+    new_path = os.path.abspath(new_path)
+    if new_path == old_path:
+        return new_path
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    source = sqlite3.connect(old_path, timeout=30)
+    target = sqlite3.connect(new_path)
+    try:
+        source.backup(target, pages=pages, sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+    conn = _connect_catalog(config)
+    try:
+        conn.execute('UPDATE shards SET path = ? WHERE key = ?', (new_path, key))
+        conn.commit()
+    finally:
+        conn.close()
+    _load_registry(config)
+    return new_path
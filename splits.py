@@ -0,0 +1,130 @@
+"""Split times: when (and after how many km) each entry reached each checkpoint.
+
+``splits`` has one row per entry and checkpoint, with the same score columns
+as ``entries`` (``duration_minutes`` since the hunt's start and
+``calculated_km``), so a checkpoint's intermediate standings rank exactly
+like the final results (``scoring.RANK_ORDER_SQL``). They are computed with
+``DENSE_RANK()`` over one checkpoint's rows; the covering indexes on
+``(checkpoint_id, duration_minutes, calculated_km, ...)`` and
+``(checkpoint_id, calculated_km, duration_minutes, ...)`` hand the window its
+rows already in order, so a standings page is one index range scan without a
+sort, and is cached per hunt version like the results page.
+
+Rows come from the checkpoint visits of uploaded GPS tracks (see
+checkpoints.py), or in bulk from marshals at the checkpoints through
+``/api/vossenjachten/<id>/splits``.
+"""
+import scoring
+import tracks
+
+# Splits per request of the bulk API
+MAX_BATCH = 5000
+
+SPLITS_SQL = '''
+    CREATE TABLE IF NOT EXISTS splits (
+        entry_id INTEGER NOT NULL REFERENCES entries (id) ON DELETE CASCADE,
+        checkpoint_id INTEGER NOT NULL REFERENCES checkpoints (id) ON DELETE CASCADE,
+        vossenjacht_id INTEGER NOT NULL,
+        arrival_minutes INTEGER NOT NULL, -- Time of day at the checkpoint, minutes since midnight
+        duration_minutes INTEGER NOT NULL, -- Since the hunt's start
+        calculated_km REAL NOT NULL, -- Driven up to the checkpoint
+        PRIMARY KEY (entry_id, checkpoint_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_splits_checkpoint_time ON splits (checkpoint_id, duration_minutes, calculated_km, arrival_minutes);
+    CREATE INDEX IF NOT EXISTS idx_splits_checkpoint_km ON splits (checkpoint_id, calculated_km, duration_minutes, arrival_minutes);
+    CREATE INDEX IF NOT EXISTS idx_splits_vossenjacht ON splits (vossenjacht_id);
+'''
+
+INSERT_SQL = ('INSERT OR REPLACE INTO splits'
+              ' (entry_id, checkpoint_id, vossenjacht_id, arrival_minutes, duration_minutes, calculated_km)'
+              ' VALUES (?, ?, ?, ?, ?, ?)')
+
+
+class SplitError(ValueError):
+    pass
+
+
+def install(db):
+    db.executescript(SPLITS_SQL)
+
+
+def row(entry_id, checkpoint_id, vossenjacht, arrival_minutes, calculated_km):
+    """A splits row; the duration follows from the hunt's start time like an entry's."""
+    start_minutes = scoring.hunt_start_minutes(vossenjacht)
+    if start_minutes is None:
+        raise SplitError('This vossenjacht has no start time to measure split times from')
+    return (entry_id, checkpoint_id, vossenjacht['id'], arrival_minutes,
+            scoring.duration_minutes(start_minutes, arrival_minutes), calculated_km)
+
+
+def from_track(entry_id, vossenjacht, track):
+    """Rows for the checkpoint visits of an analysed track (see tracks.analyse and checkpoints.match_track)."""
+    return [row(entry_id, visit['id'], vossenjacht, scoring.parse_hhmm(tracks.hhmm(visit['visited_at'])),
+                tracks.km(tracks.distance_at(track, visit['index'])))
+            for visit in track.get('visits', ())]
+
+
+def insert(db, rows):
+    """Bulk insert (or replace) splits rows built by row(); returns the number written."""
+    db.executemany(INSERT_SQL, rows)
+    return len(rows)
+
+
+def replace_for_entry(db, entry_id, rows):
+    # An entry's track was (re)uploaded: its visits replace whatever was recorded before
+    db.execute('DELETE FROM splits WHERE entry_id = ?', (entry_id,))
+    return insert(db, rows)
+
+
+def valid_ids(db, vj_id):
+    """(entry ids, checkpoint ids) of a hunt, to check bulk splits against."""
+    entry_ids = {r[0] for r in db.execute('SELECT id FROM entries WHERE vossenjacht_id = ?', (vj_id,))}
+    checkpoint_ids = {r[0] for r in db.execute('SELECT id FROM checkpoints WHERE vossenjacht_id = ?', (vj_id,))}
+    return entry_ids, checkpoint_ids
+
+
+def parse_splits(payload, vossenjacht, entry_ids, checkpoint_ids, max_batch=MAX_BATCH):
+    """Rows from a bulk JSON body ({'splits': [{entry_id, checkpoint_id, arrival, calculated_km}]}); raises SplitError."""
+    if not isinstance(payload, dict) or not isinstance(payload.get('splits'), list):
+        raise SplitError("Expected a JSON object with a 'splits' list")
+    items = payload['splits']
+    if len(items) > max_batch:
+        raise SplitError(f"At most {max_batch} splits per request")
+    rows = []
+    for item in items:
+        if not isinstance(item, dict):
+            raise SplitError('Every split must be an object')
+        try:
+            entry_id, checkpoint_id = int(item['entry_id']), int(item['checkpoint_id'])
+            arrival_minutes = scoring.parse_hhmm(item['arrival'])
+            calculated_km = float(item['calculated_km'])
+        except (KeyError, TypeError, ValueError):
+            raise SplitError('Every split needs entry_id, checkpoint_id, arrival (HH:MM) and calculated_km') from None
+        if entry_id not in entry_ids or checkpoint_id not in checkpoint_ids:
+            raise SplitError(f"Entry {entry_id} or checkpoint {checkpoint_id} is not part of this vossenjacht")
+        if calculated_km < 0:
+            raise SplitError('calculated_km must not be negative')
+        rows.append(row(entry_id, checkpoint_id, vossenjacht, arrival_minutes, calculated_km))
+    return rows
+
+
+def recompute_durations(db, vj_id):
+    """Follow a changed start time of the hunt; returns the number of updated rows."""
+    vj = db.execute('SELECT start_minutes FROM vossenjachten WHERE id = ?', (vj_id,)).fetchone()
+    if vj is None or vj['start_minutes'] is None:
+        return 0
+    duration = scoring.duration_sql('arrival_minutes', int(vj['start_minutes']))
+    return db.execute(f'UPDATE splits SET duration_minutes = {duration}'
+                      f' WHERE vossenjacht_id = ? AND duration_minutes IS NOT {duration}', (vj_id,)).rowcount
+
+
+def standings(db, checkpoint_id, hunt_type):
+    """Entries that reached a checkpoint in rank order, with their dense 'rank' there."""
+    order = scoring.RANK_ORDER_SQL.get(hunt_type, scoring.RANK_ORDER_SQL['kilometers'])
+    return db.execute(
+        'SELECT r.*, e.name, e.participant_id FROM ('
+        f' SELECT entry_id, arrival_minutes, duration_minutes, calculated_km, DENSE_RANK() OVER (ORDER BY {order}) AS rank'
+        ' FROM splits WHERE checkpoint_id = ?'
+        ') r JOIN entries e ON e.id = r.entry_id ORDER BY r.rank, e.name',
+        (checkpoint_id,)
+    ).fetchall()
@@ -1,8 +1,15 @@
+import asyncio
+import json
 import unittest
 import sys
 import os
 
 import re # Added re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 from datetime import datetime # Ensure datetime is imported
 
 # Add the parent directory to the Python path to allow module imports
@@ -975,6 +982,2026 @@ class FoxHuntTrackerDBTests(unittest.TestCase):
         admin_users = db.execute("SELECT * FROM users WHERE role = ?", ('admin',)).fetchall()
         self.assertEqual(len(admin_users), 0, "No admin user should be created if environment variables are missing.")
 
+    # --- Profiling ---
+    def _use_temp_profile_dir(self):
+        profile_dir = tempfile.mkdtemp()
+        original = {key: app.config.get(key) for key in ('PROFILE_DIR', 'PROFILE_SAMPLE_RATE', 'PROFILE_KEEP')}
+        app.config['PROFILE_DIR'] = profile_dir
+        self.addCleanup(app.config.update, original)
+        self.addCleanup(shutil.rmtree, profile_dir, True)
+        return profile_dir
+
+    def test_25_admin_profile_request_writes_pstats(self):
+        profile_dir = self._use_temp_profile_dir()
+        self.login(username=self.admin_user['username'], password=self.admin_user['password'])
+
+        response = self.client.get('/results?_profile=1')
+        self.assertEqual(response.status_code, 200)
+        filename = response.headers.get('X-Profile-File')
+        self.assertIsNotNone(filename)
+        self.assertTrue(os.path.isfile(os.path.join(profile_dir, filename)))
+        self.assertIn('_results_admin_', filename)
+
+        listing = self.client.get('/admin/profiles')
+        self.assertEqual(listing.status_code, 200)
+        self.assertIn(filename.encode(), listing.data)
+
+        detail = self.client.get(f'/admin/profiles/{filename}')
+        self.assertEqual(detail.status_code, 200)
+        self.assertIn(b'function calls', detail.data)
+
+        download = self.client.get(f'/admin/profiles/{filename}?download=1')
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('attachment', download.headers.get('Content-Disposition', ''))
+
+        self.assertEqual(self.client.get('/admin/profiles/..%2Fapp.py').status_code, 404)
+
+    def test_26_profile_switch_ignored_for_moderator(self):
+        profile_dir = self._use_temp_profile_dir()
+        self.login(username=self.mod_user['username'], password=self.mod_user['password'])
+
+        response = self.client.get('/results', headers={'X-Profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-File', response.headers)
+        self.assertEqual(os.listdir(profile_dir) if os.path.isdir(profile_dir) else [], [])
+
+    def test_27_sampled_profiling_rotates_directory(self):
+        profile_dir = self._use_temp_profile_dir()
+        app.config['PROFILE_SAMPLE_RATE'] = 100
+        app.config['PROFILE_KEEP'] = 2
+
+        for _ in range(4):
+            response = self.client.get('/results')
+            self.assertIn('_results_sample_', response.headers.get('X-Profile-File', ''))
+        self.client.get('/login') # Not a sampled endpoint
+
+        self.assertEqual(len(os.listdir(profile_dir)), 2)
+
+    # --- Memory instrumentation ---
+    def test_28_tracemalloc_report_per_endpoint(self):
+        import tracemalloc
+        from profiling import memory_report
+        original = {key: app.config.get(key) for key in ('TRACEMALLOC_ENABLED', 'TRACEMALLOC_SNAPSHOT_RATE')}
+        app.config.update({'TRACEMALLOC_ENABLED': True, 'TRACEMALLOC_SNAPSHOT_RATE': 0})
+        self.addCleanup(app.config.update, original)
+        self.addCleanup(tracemalloc.stop)
+        memory_report.reset()
+
+        self.login(username=self.admin_user['username'], password=self.admin_user['password'])
+        response = self.client.get('/results')
+        self.assertGreater(int(response.headers['X-Memory-Peak']), 0)
+        self.client.get('/results?_memory=1') # Admin-requested snapshot
+
+        rows = {row['endpoint']: row for row in memory_report.rows()}
+        self.assertEqual(rows['results']['requests'], 2)
+        self.assertTrue(rows['results']['top_sites'])
+
+        report = self.client.get('/admin/memory')
+        self.assertEqual(report.status_code, 200)
+        self.assertIn(b'Top allocation sites: results', report.data)
+
+        self.client.post('/admin/memory/reset')
+        self.assertNotIn('results', {row['endpoint'] for row in memory_report.rows()})
+
+    def test_29_tracemalloc_disabled_by_default(self):
+        response = self.client.get('/results')
+        self.assertNotIn('X-Memory-Peak', response.headers)
+
+    # --- Group commit ---
+    def test_30_add_entry_through_group_commit_writer(self):
+        import writer
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'writer.db')
+        self.addCleanup(writer.shutdown_writers)
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:', 'GROUP_COMMIT_ENABLED': app.config['GROUP_COMMIT_ENABLED']})
+
+        self.app_context.pop()
+        app.config.update({'DATABASE': db_path, 'GROUP_COMMIT_ENABLED': True})
+        self.app_context = app.app_context()
+        self.app_context.push()
+        init_db()
+        db = get_db()
+        admin_id = db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                              ('writeradmin', generate_password_hash('pw'), 'admin')).lastrowid
+        db.commit()
+        vj_id = self._create_vossenjacht("Writer VJ", "kilometers", admin_id)
+
+        self.login(username='writeradmin', password='pw')
+        response = self.client.post('/add_entry', data={
+            'vossenjacht_id': vj_id, 'name': 'Team Writer', 'start_km': '10', 'end_km': '25', 'arrival_time_last_fox': '12:45'
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/results', response.location)
+
+        entry = db.execute("SELECT * FROM entries WHERE name = 'Team Writer'").fetchone()
+        self.assertIsNotNone(entry)
+        self.assertEqual(entry['calculated_km'], 15)
+        self.assertEqual(writer.get_writer(db_path).stats['jobs'], 1)
+
+    # --- Integer time model ---
+    def _admin_id(self):
+        return get_db().execute("SELECT id FROM users WHERE username = 'testadmin'").fetchone()['id']
+
+    def test_31_duration_wraps_past_midnight(self):
+        vj_id = self._create_vossenjacht("Night VJ", "time", self._admin_id(), start_time='23:00')
+        self.login()
+        self.client.post('/add_entry', data={
+            'vossenjacht_id': vj_id, 'name': 'Night Owl', 'start_km': '0', 'end_km': '5', 'arrival_time_last_fox': '00:30'
+        })
+        entry = get_db().execute("SELECT * FROM entries WHERE name = 'Night Owl'").fetchone()
+        self.assertEqual(entry['duration_minutes'], 90)
+        self.assertEqual(entry['arrival_minutes'], 30)
+        self.assertEqual(entry['hunt_rank'], 1)
+
+    def test_32_editing_hunt_start_and_type_recomputes_durations_and_ranks(self):
+        db = get_db()
+        vj_id = self._create_vossenjacht("Recalc VJ", "kilometers", self._admin_id(), start_time='12:00')
+        self.assertEqual(db.execute("SELECT start_minutes FROM vossenjachten WHERE id = ?", (vj_id,)).fetchone()[0], 720)
+        self.login()
+        self.client.post('/add_entry', data={'vossenjacht_id': vj_id, 'name': 'Short Slow', 'start_km': '0', 'end_km': '10', 'arrival_time_last_fox': '14:00'})
+        self.client.post('/add_entry', data={'vossenjacht_id': vj_id, 'name': 'Long Fast', 'start_km': '0', 'end_km': '20', 'arrival_time_last_fox': '13:00'})
+
+        ranks = dict(db.execute("SELECT name, hunt_rank FROM entries WHERE vossenjacht_id = ?", (vj_id,)).fetchall())
+        self.assertEqual(ranks, {'Short Slow': 1, 'Long Fast': 2})
+
+        response = self.client.post(f'/vossenjachten/edit/{vj_id}', data={
+            'name': 'Recalc VJ', 'type': 'time', 'status': 'active', 'start_time': '11:30'
+        })
+        self.assertEqual(response.status_code, 302)
+
+        rows = {row['name']: row for row in db.execute("SELECT * FROM entries WHERE vossenjacht_id = ?", (vj_id,)).fetchall()}
+        self.assertEqual(rows['Short Slow']['duration_minutes'], 150)
+        self.assertEqual(rows['Long Fast']['duration_minutes'], 90)
+        self.assertEqual(rows['Long Fast']['hunt_rank'], 1)
+        self.assertEqual(rows['Short Slow']['hunt_rank'], 2)
+
+    def test_33_edit_entry_uses_hunt_start_time(self):
+        vj_id = self._create_vossenjacht("Edit Start VJ", "kilometers", self._admin_id(), start_time='10:00')
+        entry_id = self._create_entry("Edit Me", 0, 5, "11:00", vj_id, self._admin_id())
+        self.login()
+        self.client.post(f'/edit_entry/{entry_id}', data={'name': 'Edit Me', 'start_km': '0', 'end_km': '5', 'arrival_time_last_fox': '10:45'})
+        entry = get_db().execute("SELECT * FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        self.assertEqual(entry['duration_minutes'], 45)
+        self.assertEqual(entry['hunt_rank'], 1)
+
+    def test_34_migrate_db_backfills_integer_times(self):
+        from app import migrate_db
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = sqlite3.Row
+        conn.executescript('''
+            CREATE TABLE vossenjachten (id INTEGER PRIMARY KEY, name TEXT, creator_id INTEGER, status TEXT, type TEXT, start_time TEXT);
+            CREATE TABLE entries (id INTEGER PRIMARY KEY, name TEXT, start_km REAL, end_km REAL, arrival_time_last_fox TEXT,
+                                  calculated_km REAL, duration_minutes INTEGER, vossenjacht_id INTEGER, user_id INTEGER);
+            INSERT INTO vossenjachten VALUES (1, 'Old VJ', 1, 'completed', 'time', '13:15');
+            INSERT INTO entries VALUES (1, 'Old Team', 0, 4, '12:45', 4, -30, 1, 1);
+        ''')
+        migrate_db(conn)
+        self.assertEqual(conn.execute("SELECT start_minutes FROM vossenjachten").fetchone()[0], 795)
+        entry = conn.execute("SELECT * FROM entries").fetchone()
+        self.assertEqual(entry['arrival_minutes'], 765)
+        self.assertEqual(entry['duration_minutes'], 1410) # Arrival before the start counts as after midnight
+        self.assertEqual(entry['hunt_rank'], 1)
+        conn.close()
+
+    # --- Score recalculation ---
+    def test_35_recalc_scores_command_applies_new_rollover(self):
+        db = get_db()
+        vj_id = self._create_vossenjacht("Rollover VJ", "kilometers", self._admin_id())
+        other_vj = self._create_vossenjacht("Other VJ", "kilometers", self._admin_id())
+        rolled = self._create_entry("Rolled Over", 990, 10, "13:00", vj_id, self._admin_id()) # 20 km with a 1000 rollover
+        plain = self._create_entry("No Rollover", 100, 130, "13:30", vj_id, self._admin_id())
+        untouched = self._create_entry("Other Hunt", 995, 5, "13:00", other_vj, self._admin_id())
+
+        app.config['MAX_ODOMETER_READING'] = 10000
+        self.addCleanup(app.config.update, {'MAX_ODOMETER_READING': 1000})
+        result = app.test_cli_runner().invoke(args=['recalc-scores', '--vj-id', str(vj_id), '--chunk-size', '1'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Recalculated 2 entries in 1 vossenjacht(en), 1 changed.', result.output)
+
+        km = lambda entry_id: db.execute("SELECT calculated_km FROM entries WHERE id = ?", (entry_id,)).fetchone()[0]
+        self.assertEqual(km(rolled), 9020)
+        self.assertEqual(km(plain), 30)
+        self.assertEqual(km(untouched), 10)
+        ranks = dict(db.execute("SELECT name, hunt_rank FROM entries WHERE vossenjacht_id = ?", (vj_id,)).fetchall())
+        self.assertEqual(ranks, {'No Rollover': 1, 'Rolled Over': 2})
+
+    def test_36_per_hunt_rollover_used_by_entries_and_admin_recalc(self):
+        db = get_db()
+        self.login()
+        self.client.post('/vossenjachten/new', data={'name': 'Fleet VJ', 'type': 'kilometers', 'start_time': '12:00', 'max_odometer_reading': '100000'})
+        vj = db.execute("SELECT * FROM vossenjachten WHERE name = 'Fleet VJ'").fetchone()
+        self.assertEqual(vj['max_odometer_reading'], 100000)
+
+        self.client.post('/add_entry', data={'vossenjacht_id': vj['id'], 'name': 'Fleet Car', 'start_km': '99990', 'end_km': '15', 'arrival_time_last_fox': '13:00'})
+        entry = db.execute("SELECT * FROM entries WHERE name = 'Fleet Car'").fetchone()
+        self.assertEqual(entry['calculated_km'], 25)
+
+        # Simulate a row stored with the wrong rollover, then fix it via the admin action
+        db.execute("UPDATE entries SET calculated_km = 925 WHERE id = ?", (entry['id'],))
+        db.commit()
+        response = self.client.post('/admin/recalc_scores', data={'vj_id': vj['id']}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Scores herberekend: 1 ritten in 1 vossenjacht(en), 1 aangepast.', response.data)
+        self.assertEqual(db.execute("SELECT calculated_km FROM entries WHERE id = ?", (entry['id'],)).fetchone()[0], 25)
+
+        # Changing the hunt's rollover recomputes its entries right away
+        self.client.post(f"/vossenjachten/edit/{vj['id']}", data={'name': 'Fleet VJ', 'type': 'kilometers', 'status': 'active', 'start_time': '12:00', 'max_odometer_reading': '200000'})
+        self.assertEqual(db.execute("SELECT calculated_km FROM entries WHERE id = ?", (entry['id'],)).fetchone()[0], 100025)
+
+    def test_37_recalc_scores_requires_admin(self):
+        vj_id = self._create_vossenjacht("Mod Recalc VJ", "kilometers", self._admin_id())
+        self.login(username=self.mod_user['username'], password=self.mod_user['password'])
+        response = self.client.post('/admin/recalc_scores', data={'vj_id': vj_id})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/results', response.location)
+
+
+    # --- Seasons ---
+    def _add_entry(self, vj_id, name, end_km, arrival='13:00'):
+        self.client.post('/add_entry', data={'vossenjacht_id': vj_id, 'name': name, 'start_km': '0', 'end_km': str(end_km), 'arrival_time_last_fox': arrival})
+
+    def test_38_season_standings_follow_entry_changes(self):
+        import seasons
+        db = get_db()
+        vj1 = self._create_vossenjacht("Season VJ 1", "kilometers", self._admin_id())
+        vj2 = self._create_vossenjacht("Season VJ 2", "kilometers", self._admin_id())
+        self.login()
+        response = self.client.post('/seasons/new', data={'name': 'Seizoen 2026', 'vossenjacht_ids': [str(vj1), str(vj2)]})
+        self.assertEqual(response.status_code, 302)
+        season_id = db.execute("SELECT id FROM seasons WHERE name = 'Seizoen 2026'").fetchone()['id']
+
+        self._add_entry(vj1, 'Alice', 10)
+        self._add_entry(vj1, 'Bob', 20)
+        self._add_entry(vj2, 'bob ', 5) # Same participant, different spelling
+        self._add_entry(vj2, 'Alice', 15)
+        points = {row['participant_name'].strip().lower(): (row['points'], row['hunts'])
+                  for row in db.execute("SELECT * FROM season_standings WHERE season_id = ?", (season_id,)).fetchall()}
+        self.assertEqual(points, {'alice': (25 + 18, 2), 'bob': (18 + 25, 2)})
+
+        # Editing an entry only moves the points of the hunt it belongs to
+        bob_vj1 = db.execute("SELECT id FROM entries WHERE name = 'Bob'").fetchone()['id']
+        self.client.post(f'/edit_entry/{bob_vj1}', data={'name': 'Bob', 'start_km': '0', 'end_km': '5', 'arrival_time_last_fox': '13:00'})
+        standings = seasons.standings(db, season_id)
+        self.assertEqual([(s['participant_key'], s['points'], s['rank']) for s in standings], [('bob', 50, 1), ('alice', 36, 2)])
+
+        # Deleting an entry takes its points away again
+        self.client.post(f'/delete_entry/{bob_vj1}')
+        standings = {s['participant_key']: s['points'] for s in seasons.standings(db, season_id)}
+        self.assertEqual(standings, {'alice': 43, 'bob': 25})
+
+    def test_39_season_membership_changes_and_public_page(self):
+        import seasons
+        db = get_db()
+        vj1 = self._create_vossenjacht("Member VJ 1", "kilometers", self._admin_id())
+        vj2 = self._create_vossenjacht("Member VJ 2", "kilometers", self._admin_id())
+        self.login()
+        self._add_entry(vj1, 'Carol', 10)
+        self._add_entry(vj2, 'Carol', 10)
+        self.client.post('/seasons/new', data={'name': 'Membership', 'vossenjacht_ids': [str(vj1)]})
+        season_id = db.execute("SELECT id FROM seasons WHERE name = 'Membership'").fetchone()['id']
+        self.assertEqual(seasons.standings(db, season_id)[0]['points'], 25)
+
+        self.client.post(f'/seasons/edit/{season_id}', data={'name': 'Membership', 'vossenjacht_ids': [str(vj1), str(vj2)]})
+        self.assertEqual(seasons.standings(db, season_id)[0]['points'], 50)
+        self.client.post(f'/seasons/edit/{season_id}', data={'name': 'Membership', 'vossenjacht_ids': [str(vj2)]})
+        self.assertEqual(seasons.standings(db, season_id)[0]['points'], 25)
+
+        self.logout()
+        response = self.client.get(f'/seasons/{season_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Seizoensklassement', response.data)
+        self.assertIn(b'Carol', response.data)
+        self.assertEqual(self.client.get('/seasons/9999').status_code, 404)
+
+    def test_40_season_edit_requires_owner_for_moderators(self):
+        db = get_db()
+        db.execute("INSERT INTO seasons (name, creator_id) VALUES (?, ?)", ('Admin Season', self._admin_id()))
+        db.commit()
+        season_id = db.execute("SELECT id FROM seasons WHERE name = 'Admin Season'").fetchone()['id']
+        self.login(username=self.mod_user['username'], password=self.mod_user['password'])
+        self.assertEqual(self.client.get(f'/seasons/edit/{season_id}').status_code, 403)
+        self.assertEqual(self.client.post(f'/seasons/delete/{season_id}').status_code, 403)
+
+    # --- Participants ---
+    def test_41_entries_are_linked_to_normalised_participants(self):
+        db = get_db()
+        vj1 = self._create_vossenjacht("History VJ 1", "kilometers", self._admin_id())
+        vj2 = self._create_vossenjacht("History VJ 2", "kilometers", self._admin_id())
+        self.login()
+        self._add_entry(vj1, 'Jan de Vries', 10)
+        self._add_entry(vj2, '  JAN  de vries ', 12)
+        self._add_entry(vj2, 'Piet', 8)
+        linked = db.execute("SELECT name, participant_id FROM entries ORDER BY id").fetchall()
+        self.assertEqual(linked[0]['participant_id'], linked[1]['participant_id'])
+        self.assertNotEqual(linked[0]['participant_id'], linked[2]['participant_id'])
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM participants").fetchone()[0], 2)
+
+        self.logout()
+        response = self.client.get(f"/participants/{linked[0]['participant_id']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'History VJ 1', response.data)
+        self.assertIn(b'History VJ 2', response.data)
+        self.assertIn(b'2 rit(ten), totaal 22 km', response.data)
+        self.assertEqual(self.client.get('/participants/9999').status_code, 404)
+
+        plan = ' '.join(row[3] for row in db.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM entries WHERE participant_id = ?", (linked[0]['participant_id'],)
+        ).fetchall())
+        self.assertIn('idx_entries_participant', plan)
+
+    def test_42_participant_backfill_deduplicates_in_batches(self):
+        import participants
+        db = get_db()
+        vj_id = self._create_vossenjacht("Backfill VJ", "kilometers", self._admin_id())
+        for name in ['Anna', 'anna', 'ANNA ', 'Bert', 'bert', 'Cees']:
+            self._create_entry(name, 0, 10, "13:00", vj_id, self._admin_id())
+        self.assertEqual(participants.backfill(db, batch_size=2), 6)
+        counts = db.execute(
+            "SELECT p.name_key, COUNT(e.id) FROM participants p JOIN entries e ON e.participant_id = p.id GROUP BY p.id ORDER BY p.name_key"
+        ).fetchall()
+        self.assertEqual([tuple(row) for row in counts], [('anna', 3), ('bert', 2), ('cees', 1)])
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM entries WHERE participant_id IS NULL").fetchone()[0], 0)
+
+    # --- Entry search ---
+    def test_43_entry_search_index_follows_writes(self):
+        import search
+        db = get_db()
+        vj_id = self._create_vossenjacht("Zomerjacht", "kilometers", self._admin_id())
+        self.login()
+        self._add_entry(vj_id, 'Jan de Vries', 10)
+        self._add_entry(vj_id, 'Janneke Bos', 12)
+        self._add_entry(vj_id, 'Piet Jansen', 14)
+
+        names = lambda query: [row['name'] for row in search.search_entries(db, query)]
+        self.assertEqual(names('vri'), ['Jan de Vries'])
+        self.assertEqual(set(names('jan')), {'Jan de Vries', 'Janneke Bos', 'Piet Jansen'})
+        self.assertEqual(set(names('zomer bos')), {'Janneke Bos'})
+        self.assertEqual(names('") OR *'), []) # FTS syntax in user input is neutralised
+
+        piet = db.execute("SELECT id FROM entries WHERE name = 'Piet Jansen'").fetchone()['id']
+        self.client.post(f'/edit_entry/{piet}', data={'name': 'Piet Klaassen', 'start_km': '0', 'end_km': '14', 'arrival_time_last_fox': '13:00'})
+        self.assertEqual(names('klaas'), ['Piet Klaassen'])
+        self.assertEqual(set(names('jan')), {'Jan de Vries', 'Janneke Bos'})
+
+        db.execute("UPDATE vossenjachten SET name = 'Winterjacht' WHERE id = ?", (vj_id,))
+        db.commit()
+        self.assertEqual(len(names('winter')), 3)
+        self.assertEqual(names('zomer'), [])
+
+        self.client.post(f'/delete_entry/{piet}')
+        self.assertEqual(names('klaas'), [])
+
+    def test_44_entry_search_api_and_settings_box_respect_moderator_scope(self):
+        mod_id = get_db().execute("SELECT id FROM users WHERE username = 'testmod'").fetchone()['id']
+        own_vj = self._create_vossenjacht("Mod Jacht", "kilometers", mod_id)
+        other_vj = self._create_vossenjacht("Admin Jacht", "kilometers", self._admin_id())
+        self._create_entry("Zoeker Een", 0, 10, "13:00", own_vj, mod_id)
+        self._create_entry("Zoeker Twee", 0, 10, "13:00", other_vj, self._admin_id())
+
+        self.login(username=self.mod_user['username'], password=self.mod_user['password'])
+        response = self.client.get('/api/entries/search?q=zoek')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['name'] for r in response.get_json()['results']], ['Zoeker Een'])
+
+        response = self.client.get('/settings?q=zoeker')
+        self.assertIn(b'Zoeker Een', response.data)
+        self.assertNotIn(b'Zoeker Twee', response.data)
+        self.assertIn(b'name="q"', response.data)
+
+        self.logout()
+        self.login()
+        results = self.client.get('/api/entries/search?q=zoeker').get_json()['results']
+        self.assertEqual({r['name'] for r in results}, {'Zoeker Een', 'Zoeker Twee'})
+
+    # --- Settings listing ---
+    def test_45_settings_keyset_pagination_and_sorting(self):
+        vj_id = self._create_vossenjacht("Page VJ", "kilometers", self._admin_id())
+        self.login()
+        for i, km in enumerate([30, 10, 50, 20, 40]):
+            self._add_entry(vj_id, f'Pager {i}', km)
+
+        def names(response):
+            return re.findall(r'<td>(?:<a [^>]*>)?(Pager \d)', response.get_data(as_text=True))
+
+        def link(response, label):
+            match = re.search(r'href="([^"]+)">' + label, response.get_data(as_text=True))
+            return match.group(1).replace('&amp;', '&') if match else None
+
+        first = self.client.get(f'/settings?vj_id={vj_id}&per_page=2')
+        self.assertEqual(names(first), ['Pager 1', 'Pager 3']) # Rank order within the hunt
+        self.assertIsNone(link(first, '&laquo; Vorige'))
+        second = self.client.get(link(first, 'Volgende'))
+        self.assertEqual(names(second), ['Pager 0', 'Pager 4'])
+        third = self.client.get(link(second, 'Volgende'))
+        self.assertEqual(names(third), ['Pager 2'])
+        self.assertIsNone(link(third, 'Volgende'))
+        back = self.client.get(link(third, '&laquo; Vorige'))
+        self.assertEqual(names(back), ['Pager 0', 'Pager 4'])
+        self.assertEqual(names(self.client.get(link(back, '&laquo; Vorige'))), ['Pager 1', 'Pager 3'])
+
+        by_km_desc = self.client.get(f'/settings?vj_id={vj_id}&sort=km&dir=desc&per_page=3')
+        self.assertEqual(names(by_km_desc), ['Pager 2', 'Pager 4', 'Pager 0'])
+
+    def test_46_settings_filters_and_per_hunt_ranks(self):
+        import listing
+        db = get_db()
+        km_vj = self._create_vossenjacht("Filter KM", "kilometers", self._admin_id())
+        time_vj = self._create_vossenjacht("Filter Time", "time", self._admin_id())
+        db.execute("UPDATE vossenjachten SET status = 'completed' WHERE id = ?", (time_vj,))
+        db.commit()
+        self.login()
+        self._add_entry(km_vj, 'Filter Anna', 10, '15:00')
+        self._add_entry(km_vj, 'Filter Bert', 20, '13:00')
+        db.execute("UPDATE vossenjachten SET status = 'active' WHERE id = ?", (time_vj,))
+        db.commit()
+        self._add_entry(time_vj, 'Filter Bert', 90, '12:30')
+        db.execute("UPDATE vossenjachten SET status = 'completed' WHERE id = ?", (time_vj,))
+        db.execute("UPDATE entries SET created_at = '2026-01-15 10:00:00' WHERE vossenjacht_id = ?", (time_vj,))
+        db.commit()
+
+        rows = listing.list_entries(db, {'status': 'completed'})['entries']
+        self.assertEqual([(r['name'], r['hunt_rank']) for r in rows], [('Filter Bert', 1)])
+        rows = listing.list_entries(db, {'vj_id': km_vj}, sort='rank', direction='asc')['entries']
+        self.assertEqual([(r['name'], r['hunt_rank']) for r in rows], [('Filter Anna', 1), ('Filter Bert', 2)])
+
+        response = self.client.get('/settings?participant=filter+bert')
+        self.assertIn(b'Filter Bert', response.data)
+        self.assertNotIn(b'Filter Anna', response.data)
+        response = self.client.get('/settings?date_from=2026-01-01&date_to=2026-01-31')
+        self.assertIn(b'Filter Bert', response.data)
+        self.assertNotIn(b'Filter Anna', response.data)
+        response = self.client.get('/settings?date_from=not-a-date')
+        self.assertIn(b'Ongeldige datum', response.data)
+
+    # --- Archive ---
+    def test_47_archive_hunts_moves_old_completed_hunts(self):
+        db = get_db()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        self.addCleanup(app.config.update, {'ARCHIVE_DATABASE': app.config['ARCHIVE_DATABASE']})
+        app.config['ARCHIVE_DATABASE'] = os.path.join(tmp_dir, 'archive.db')
+
+        old_vj = self._create_vossenjacht("Oude Jacht", "kilometers", self._admin_id())
+        recent_vj = self._create_vossenjacht("Nieuwe Jacht", "kilometers", self._admin_id())
+        active_vj = self._create_vossenjacht("Oude Actieve Jacht", "kilometers", self._admin_id())
+        self.login()
+        for i in range(5):
+            self._add_entry(old_vj, f'Archief {i}', 10 + i)
+        self._add_entry(recent_vj, 'Archief 0', 30)
+        db.execute("UPDATE vossenjachten SET status = 'completed', creation_date = '2024-03-01 10:00:00' WHERE id = ?", (old_vj,))
+        db.execute("UPDATE vossenjachten SET status = 'completed' WHERE id = ?", (recent_vj,))
+        db.execute("UPDATE vossenjachten SET creation_date = '2024-03-01 10:00:00' WHERE id = ?", (active_vj,))
+        db.commit()
+
+        result = app.test_cli_runner().invoke(args=['archive-hunts', '--before', '2025-01-01', '--chunk-size', '2'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Archived 1 vossenjacht(en) with 5 entries', result.output)
+
+        self.assertIsNone(db.execute("SELECT 1 FROM main.vossenjachten WHERE id = ?", (old_vj,)).fetchone())
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM main.entries WHERE vossenjacht_id = ?", (old_vj,)).fetchone()[0], 0)
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM main.entries").fetchone()[0], 1)
+        archived = sqlite3.connect(app.config['ARCHIVE_DATABASE'])
+        self.addCleanup(archived.close)
+        self.assertEqual(archived.execute("SELECT COUNT(*) FROM entries WHERE vossenjacht_id = ?", (old_vj,)).fetchone()[0], 5)
+        self.assertEqual(archived.execute("SELECT name FROM vossenjachten").fetchall(), [('Oude Jacht',)])
+
+        # Read paths attach the archive transparently
+        response = self.client.get(f'/results?vj_id={old_vj}')
+        self.assertIn(b'Oude Jacht (gearchiveerd)', response.data)
+        self.assertIn(b'Archief 4', response.data)
+        participant_id = db.execute("SELECT participant_id FROM main.entries WHERE name = 'Archief 0'").fetchone()[0]
+        response = self.client.get(f'/participants/{participant_id}')
+        self.assertIn(b'Oude Jacht</a> (archief)', response.data)
+        self.assertIn(b'Nieuwe Jacht', response.data)
+
+    def test_48_archive_hunts_rejects_bad_date(self):
+        result = app.test_cli_runner().invoke(args=['archive-hunts', '--before', 'yesterday'])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('YYYY-MM-DD', result.output)
+    # --- Read replica ---
+    def test_49_public_results_read_from_replica(self):
+        import replica
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'primary.db')
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:', 'REPLICA_ENABLED': False})
+
+        self.app_context.pop()
+        app.config.update({'DATABASE': db_path, 'REPLICA_ENABLED': True,
+                           'REPLICA_PATH': os.path.join(tmp_dir, 'replica.db')})
+        self.app_context = app.app_context()
+        self.app_context.push()
+        init_db()
+        db = get_db()
+        admin_id = db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                              ('replicaadmin', generate_password_hash('pw'), 'admin')).lastrowid
+        db.commit()
+        vj_id = self._create_vossenjacht("Replica VJ", "kilometers", admin_id)
+        self.login(username='replicaadmin', password='pw')
+        self._add_entry(vj_id, 'Team Copied', 20)
+
+        self.assertEqual(db.execute('PRAGMA journal_mode').fetchone()[0], 'wal') # Set by init_db for the replica
+        current = replica.get_replica(app.config)
+        current.refresh()
+        self._add_entry(vj_id, 'Team Pending', 30) # Marks the replica dirty
+        self.client.get('/logout')
+        # Requests get their own app context from here on, like in production
+        self.app_context.pop()
+
+        response = self.client.get(f'/results?vj_id={vj_id}')
+        self.assertIn(b'Team Copied', response.data)
+        self.assertNotIn(b'Team Pending', response.data) # Not in the replica yet
+        self.assertIn('X-Replica-Lag', response.headers)
+        self.assertIn(b'Stand van', response.data)
+
+        current.refresh()
+        response = self.client.get(f'/results?vj_id={vj_id}')
+        self.assertIn(b'Team Pending', response.data)
+        self.assertEqual(response.headers['X-Replica-Lag'], '0.0')
+
+        # Logged-in users read the primary
+        self.login(username='replicaadmin', password='pw')
+        self._add_entry(vj_id, 'Team Own Write', 40)
+        response = self.client.get(f'/results?vj_id={vj_id}')
+        self.assertIn(b'Team Own Write', response.data)
+        self.assertNotIn('X-Replica-Lag', response.headers)
+        self.app_context = app.app_context()
+        self.app_context.push()
+    # --- Shards ---
+    def test_50_club_hunts_live_in_their_own_shard(self):
+        import shards
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'catalog.db')
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:', 'SHARDING_ENABLED': False,
+                                            'SHARD_DIR': app.config['SHARD_DIR']})
+
+        self.app_context.pop()
+        app.config.update({'DATABASE': db_path, 'SHARDING_ENABLED': True, 'SHARD_DIR': os.path.join(tmp_dir, 'shards')})
+        self.app_context = app.app_context()
+        self.app_context.push()
+        init_db()
+        db = get_db()
+        mod_id = db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                            ('noordmod', generate_password_hash('pw'), 'moderator')).lastrowid
+        db.commit()
+        main_vj = self._create_vossenjacht("Main VJ", "kilometers", mod_id)
+        shard_path = shards.add_shard(app.config, 'noord', 'Club Noord')
+        shards.assign_user(app.config, 'noordmod', 'noord')
+        self.app_context.pop() # Each request routes its own connection from here on
+
+        self.login(username='noordmod', password='pw')
+        self.client.post('/vossenjachten/new', data={'name': 'Noord VJ', 'type': 'kilometers', 'start_time': '12:00'})
+        shard = sqlite3.connect(shard_path)
+        vj_id = shard.execute("SELECT id FROM vossenjachten WHERE name = 'Noord VJ'").fetchone()[0]
+        self.assertGreater(vj_id, main_vj) # Ids are unique over all shards
+        self._add_entry(vj_id, 'Team Noord', 25)
+        shard.close()
+        self.logout()
+
+        # Public pages find the shard from the hunt id
+        response = self.client.get(f'/results?vj_id={vj_id}')
+        self.assertIn(b'Team Noord', response.data)
+        self.assertNotIn(b'Team Noord', self.client.get('/results').data)
+        self.assertIn(b'Team Noord', self.client.get('/results?club=noord').data)
+
+        catalog = sqlite3.connect(db_path)
+        self.assertEqual(catalog.execute("SELECT COUNT(*) FROM entries").fetchone()[0], 0)
+        self.assertEqual(catalog.execute("SELECT shard_key FROM hunt_shards WHERE vossenjacht_id = ?", (vj_id,)).fetchone()[0], 'noord')
+        catalog.close()
+        self.assertEqual(sqlite3.connect(shard_path).execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = 'users'").fetchone()[0], 0) # Users stay in the catalog
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    # --- Worker caches ---
+    def test_51_cache_drops_only_hunts_changed_elsewhere(self):
+        import cache
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'cached.db')
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:'})
+
+        self.app_context.pop()
+        app.config.update({'DATABASE': db_path, 'CACHE_ENABLED': True})
+        self.app_context = app.app_context()
+        self.app_context.push()
+        init_db()
+        db = get_db()
+        admin_id = db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                              ('cacheadmin', generate_password_hash('pw'), 'admin')).lastrowid
+        db.commit()
+        vj1 = self._create_vossenjacht("Cache VJ 1", "kilometers", admin_id)
+        vj2 = self._create_vossenjacht("Cache VJ 2", "kilometers", admin_id)
+        self.login(username='cacheadmin', password='pw')
+        self._add_entry(vj1, 'Team Een', 20)
+        self._add_entry(vj2, 'Team Twee', 30)
+        self.logout()
+        self.app_context.pop()
+        hunt_cache = cache.get_cache(db_path, app.config)
+        self.addCleanup(hunt_cache.close)
+
+        self.assertIn(b'Team Een', self.client.get(f'/results?vj_id={vj1}').data)
+        self.assertIn(b'Team Twee', self.client.get(f'/results?vj_id={vj2}').data)
+
+        # Another worker renames both teams but only bumps hunt 1
+        other = sqlite3.connect(db_path)
+        other.execute("UPDATE entries SET name = 'Team Een B' WHERE name = 'Team Een'")
+        other.execute("UPDATE entries SET name = 'Team Twee B' WHERE name = 'Team Twee'")
+        cache.bump(other, [vj1])
+        other.commit()
+        other.close()
+        hits = hunt_cache.stats['hits']
+        self.assertIn(b'Team Een B', self.client.get(f'/results?vj_id={vj1}').data)
+        self.assertNotIn(b'Team Twee B', self.client.get(f'/results?vj_id={vj2}').data) # Still served from the cache
+        self.assertEqual(hunt_cache.stats['hits'], hits + 2) # Hunt 2's results and the hunt dropdown
+
+        # Writes through the app bump their hunt, so every worker sees them on its next request
+        self.login(username='cacheadmin', password='pw')
+        self._add_entry(vj2, 'Team Drie', 40)
+        self.logout()
+        response = self.client.get(f'/results?vj_id={vj2}')
+        self.assertIn(b'Team Drie', response.data)
+        self.assertIn(b'Team Twee B', response.data)
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    # --- Admission control ---
+    def test_52_public_reads_are_shed_before_writes(self):
+        import admission
+        vj_id = self._create_vossenjacht("Rush VJ", "kilometers", self._admin_id())
+        self.addCleanup(app.config.update, {'ADMISSION_ENABLED': False})
+        app.config.update({'ADMISSION_ENABLED': True, 'ADMISSION_READ_LIMIT': 1, 'ADMISSION_READ_QUEUE': 0})
+        response = self.client.get(f'/results?vj_id={vj_id}')
+        self.assertEqual(response.status_code, 200)
+
+        # Every read slot is taken
+        read_gate = admission.gates[admission.READ]
+        self.assertTrue(read_gate.acquire(0))
+        self.addCleanup(read_gate.release)
+        response = self.client.get(f'/results?vj_id={vj_id}')
+        self.assertEqual(response.status_code, 200) # The copy served before
+        self.assertEqual(response.headers['X-Stale'], '1')
+        self.assertIn(b'Rush VJ', response.data)
+        response = self.client.get('/seasons')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '5')
+
+        # Marshals still get through
+        self.login()
+        self._add_entry(vj_id, 'Team Rush', 15)
+        self.assertEqual(get_db().execute("SELECT COUNT(*) FROM entries WHERE name = 'Team Rush'").fetchone()[0], 1)
+        stats = self.client.get('/admin/admission').get_json()
+        self.assertEqual(stats['read']['active'], 1)
+        self.assertGreaterEqual(stats['read']['shed'], 2)
+        self.assertGreaterEqual(stats['write']['admitted'], 2)
+        self.assertGreaterEqual(stats['stale_served'], 1)
+
+    # --- Purges ---
+    def test_53_delete_vossenjacht_purges_its_entries_in_chunks(self):
+        db = get_db()
+        self.addCleanup(app.config.update, {'PURGE_CHUNK_SIZE': app.config['PURGE_CHUNK_SIZE']})
+        app.config.update({'PURGE_CHUNK_SIZE': 2})
+        vj1 = self._create_vossenjacht("Purge VJ", "kilometers", self._admin_id())
+        vj2 = self._create_vossenjacht("Keep VJ", "kilometers", self._admin_id())
+        self.login()
+        self.client.post('/seasons/new', data={'name': 'Purge Seizoen', 'vossenjacht_ids': [str(vj1), str(vj2)]})
+        for i in range(5):
+            self._add_entry(vj1, f'Purge Team {i}', 10 + i)
+        self._add_entry(vj2, 'Keep Team', 10)
+        # An entry left behind by a hunt deleted before purges existed
+        db.execute("PRAGMA foreign_keys = OFF")
+        db.execute("INSERT INTO entries (name, start_km, end_km, arrival_time_last_fox, calculated_km, duration_minutes, vossenjacht_id)"
+                   " VALUES ('Orphan', 0, 1, '13:00', 1, 60, 999)")
+        db.commit()
+        db.execute("PRAGMA foreign_keys = ON")
+
+        response = self.client.post(f'/vossenjachten/delete/{vj1}')
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNone(db.execute("SELECT id FROM vossenjachten WHERE id = ?", (vj1,)).fetchone())
+        self.assertEqual([row['name'] for row in db.execute("SELECT name FROM entries")], ['Keep Team'])
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM season_vossenjachten WHERE vossenjacht_id = ?", (vj1,)).fetchone()[0], 0)
+        self.assertEqual([row['participant_name'] for row in db.execute("SELECT participant_name FROM season_standings")], ['Keep Team'])
+
+        job = self.client.get('/api/purges').get_json()[0]
+        self.assertEqual((job['kind'], job['target'], job['status']), ('delete_vossenjacht', vj1, 'done'))
+        self.assertEqual((job['total'], job['deleted']), (5, 6))
+
+    # --- Maintenance ---
+    def test_54_db_maintain_waits_for_idle_hunts(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'maintained.db')
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:'})
+
+        self.app_context.pop()
+        app.config.update({'DATABASE': db_path})
+        self.app_context = app.app_context()
+        self.app_context.push()
+        init_db()
+        db = get_db()
+        admin_id = db.execute("INSERT INTO users (username, password_hash, role) VALUES ('maint', 'x', 'admin')").lastrowid
+        vj_id = self._create_vossenjacht("Busy VJ", "kilometers", admin_id)
+        db.executemany("INSERT INTO entries (name, start_km, end_km, arrival_time_last_fox, calculated_km, duration_minutes, vossenjacht_id)"
+                       " VALUES (?, 0, 1, '13:00', 1, 60, ?)", [(f'Team {i:04d} ' + 'x' * 200, vj_id) for i in range(2000)])
+        db.commit()
+        db.execute("DELETE FROM entries WHERE id > 1")
+        db.commit()
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['db-maintain'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("skipped: vossenjacht 'Busy VJ' is taking entries", result.output)
+        free_pages = db.execute('PRAGMA freelist_count').fetchone()[0]
+        self.assertGreater(free_pages, 0)
+
+        db.execute("UPDATE vossenjachten SET status = 'completed' WHERE id = ?", (vj_id,))
+        db.commit()
+        size_before = os.path.getsize(db_path)
+        result = runner.invoke(args=['db-maintain'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        for step in ('optimize', 'vacuum', 'checkpoint', 'integrity'):
+            self.assertIn(f': {step} took', result.output)
+        self.assertIn('whole file: ok', result.output)
+        self.assertEqual(db.execute('PRAGMA freelist_count').fetchone()[0], 0)
+        self.assertLess(os.path.getsize(db_path), size_before)
+        self.assertIsNotNone(db.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone())
+
+    # --- Vossenjachten overview ---
+    def test_55_vossenjachten_overview_pages_with_entry_stats(self):
+        import listing
+        db = get_db()
+        mod_id = self._create_user('overviewmod', 'pw', 'moderator')
+        vj1 = self._create_vossenjacht("Overview VJ 1", "kilometers", self._admin_id())
+        vj2 = self._create_vossenjacht("Overview VJ 2", "time", mod_id)
+        vj3 = self._create_vossenjacht("Overview VJ 3", "kilometers", self._admin_id())
+        self.login()
+        self._add_entry(vj1, 'Team A', 30)
+        self._add_entry(vj1, 'Team B', 20)
+        self._add_entry(vj2, 'Team C', 10, arrival='12:45')
+        db.execute("UPDATE vossenjachten SET status = 'completed' WHERE id = ?", (vj1,))
+        db.commit()
+
+        page = listing.list_vossenjachten(db, per_page=2)
+        self.assertEqual([row['id'] for row in page['vossenjachten']], [vj3, vj2]) # Newest first
+        self.assertIsNone(page['prev_cursor'])
+        stats = listing.list_vossenjachten(db, after=page['next_cursor'], per_page=2)
+        self.assertEqual([row['id'] for row in stats['vossenjachten']], [vj1])
+        self.assertIsNone(stats['next_cursor'])
+        row = stats['vossenjachten'][0]
+        self.assertEqual((row['entry_count'], row['total_km'], row['best_km']), (2, 50, 20)) # Fewest km wins
+        self.assertIsNotNone(row['last_entry_at'])
+        back = listing.list_vossenjachten(db, before=stats['prev_cursor'], per_page=2)
+        self.assertEqual([row['id'] for row in back['vossenjachten']], [vj3, vj2])
+
+        self.assertEqual([row['id'] for row in listing.list_vossenjachten(db, {'status': 'completed'})['vossenjachten']], [vj1])
+        self.assertEqual([row['id'] for row in listing.list_vossenjachten(db, {'creator_id': mod_id})['vossenjachten']], [vj2])
+
+        response = self.client.get(f'/vossenjachten?creator_id={mod_id}')
+        self.assertIn(b'Overview VJ 2', response.data)
+        self.assertNotIn(b'Overview VJ 1', response.data)
+        self.assertIn(b'45 min', response.data) # Best time of a 'time' hunt
+        response = self.client.get('/vossenjachten?per_page=2')
+        self.assertIn(b'Next &raquo;', response.data)
+
+    # --- Participant suggestions ---
+    def test_56_participant_names_are_suggested_from_memory(self):
+        import participants
+        db = get_db()
+        vj_id = self._create_vossenjacht("Suggest VJ", "kilometers", self._admin_id())
+        self.login()
+        self._add_entry(vj_id, 'Jan de Vries', 30)
+        self._add_entry(vj_id, 'Janneke Smit', 25)
+        self._add_entry(vj_id, 'Piet Jansen', 20)
+        self._add_entry(vj_id, 'jan  de vries', 28) # Same participant
+
+        response = self.client.get('/api/participants/suggest?q=JAN')
+        names = [result['name'] for result in response.get_json()['results']]
+        self.assertEqual(names, ['Jan de Vries', 'Janneke Smit', 'Piet Jansen']) # Name prefixes before word prefixes
+        response = self.client.get('/api/participants/suggest?q=de v')
+        self.assertEqual([result['name'] for result in response.get_json()['results']], ['Jan de Vries'])
+        self.assertEqual(self.client.get('/api/participants/suggest?q=').get_json()['results'], [])
+
+        # Loads catch up on participants created since, and adds are visible right away
+        index = participants.NameIndex().load(db)
+        participants.get_or_create(db, 'Jansen-Bakker')
+        db.commit()
+        new_id = participants.get_or_create(db, 'Klaas Vaak')
+        index.add(new_id, 'Klaas Vaak')
+        self.assertEqual([r['name'] for r in index.suggest('vaak')], ['Klaas Vaak'])
+        self.assertNotIn('Jansen-Bakker', [r['name'] for r in index.suggest('jansen')])
+        index.load(db)
+        self.assertIn('Jansen-Bakker', [r['name'] for r in index.suggest('jansen')])
+        self.assertEqual(len(index.suggest('j', limit=2)), 2)
+
+        self.logout()
+        self.assertNotEqual(self.client.get('/api/participants/suggest?q=jan').status_code, 200)
+
+    # --- GPS tracks ---
+    def test_57_entry_distance_and_arrival_from_gpx_track(self):
+        import io
+        import tracks
+        db = get_db()
+        vj_id = self._create_vossenjacht("Track VJ", "both", self._admin_id())
+        # 12 km due north, one point per minute from 12:10, with a spike and a few minutes parked with jitter
+        points = [(52.0 + i * 0.008993, 5.0, f'2026-05-01T12:{10 + i:02d}:00') for i in range(13)]
+        points.insert(6, (52.5, 5.0, '2026-05-01T12:15:30'))
+        points[-1:-1] = [(52.0 + 12 * 0.008993 + 0.00003 * (-1) ** i, 5.0 + 0.00003 * (i % 2),
+                          f'2026-05-01T12:21:{10 * i:02d}') for i in range(5)]
+        gpx = ('<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>'
+               + ''.join(f'<trkpt lat="{lat}" lon="{lon}"><time>{stamp}</time></trkpt>' for lat, lon, stamp in points)
+               + '</trkseg></trk></gpx>').encode()
+
+        self.login()
+        response = self.client.post('/add_entry', data={
+            'vossenjacht_id': vj_id, 'name': 'Track Team', 'arrival_time_last_fox': '14:00',
+            'track': (io.BytesIO(gpx), 'rit.gpx'),
+        }, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 302)
+        entry = db.execute("SELECT * FROM entries WHERE name = 'Track Team'").fetchone()
+        self.assertEqual((entry['calculated_km'], entry['arrival_time_last_fox'], entry['duration_minutes']),
+                         (12, '12:22', 22))
+        track = db.execute('SELECT * FROM entry_tracks WHERE entry_id = ?', (entry['id'],)).fetchone()
+        self.assertEqual((track['points'], track['spikes']), (len(points), 1))
+        self.assertAlmostEqual(track['distance_m'], 12000, delta=20)
+        self.assertLess(len(track['polyline']), 40) # Simplified to the two ends of the straight line
+
+        # CSV without times: no spike filter, arrival time from the form
+        csv_track = tracks.parse(io.BytesIO(b'latitude,longitude\n52.0,5.0\n52.008993,5.0\n'), 'rit.csv')
+        result = tracks.analyse(csv_track, vectorized=False)
+        self.assertAlmostEqual(result['distance_m'], 1000, delta=2)
+        self.assertIsNone(tracks.arrival_hhmm(result))
+        with self.assertRaises(tracks.TrackError):
+            tracks.parse(io.BytesIO(b'<gpx><trk><trkseg><trkpt lat="52"'), 'kapot.gpx')
+
+        db.execute('DELETE FROM entries WHERE id = ?', (entry['id'],))
+        self.assertIsNone(db.execute('SELECT 1 FROM entry_tracks WHERE entry_id = ?', (entry['id'],)).fetchone())
+
+    # --- Live positions ---
+    def test_58_pings_are_buffered_in_memory_and_stored_in_batches(self):
+        import pings
+        self.addCleanup(pings._stores.pop, ':memory:', None)
+        db = get_db()
+        vj_id = self._create_vossenjacht("Live VJ", "kilometers", self._admin_id())
+        url = f'/api/vossenjachten/{vj_id}/pings'
+        body = {'car': 'auto-7', 'pings': [{'lat': 52.0 + i / 1000, 'lon': 5.0, 't': 1780000000 + i} for i in range(12)]}
+
+        self.assertEqual(self.client.post(url, json=body).status_code, 401)
+        self.assertEqual(self.client.post(url, json=body, headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        self.login()
+        token = self.client.get(f'/api/vossenjachten/{vj_id}/ping-token').get_json()['token']
+        self.logout()
+        headers = {'Authorization': f'Bearer {token}'}
+        other_token = pings.token(app.config['SECRET_KEY'], vj_id + 1)
+        self.assertEqual(self.client.post(url, json=body, headers={'Authorization': f'Bearer {other_token}'}).status_code, 401)
+
+        response = self.client.post(url, json=body, headers=headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json(), {'received': 12, 'buffered': 12})
+        late = {'pings': [{'entry_id': 99, 'lat': 52.3, 'lon': 5.1, 't': '2026-06-01T10:00:00Z'},
+                          {'car': 'auto-7', 'lat': 52.0, 'lon': 5.0, 't': 1780000005.5}]} # Older than the last kept one
+        self.assertEqual(self.client.post(url, json=late, headers=headers).get_json()['buffered'], 1)
+        self.assertEqual(self.client.post(url, json={'pings': [{'car': 'x', 'lat': 95, 'lon': 5}]},
+                                          headers=headers).status_code, 400)
+        # One stored row per car per PINGS_STORE_INTERVAL_S (5 s)
+        stored = db.execute('SELECT car, recorded_at FROM car_pings WHERE vossenjacht_id = ? ORDER BY id', (vj_id,)).fetchall()
+        self.assertEqual([(row['car'], row['recorded_at']) for row in stored],
+                         [('auto-7', 1780000000), ('auto-7', 1780000005), ('auto-7', 1780000010), ('entry-99', 1780308000)])
+
+        self.assertNotEqual(self.client.get(f'/api/vossenjachten/{vj_id}/live').status_code, 200)
+        self.login()
+        cars = self.client.get(f'/api/vossenjachten/{vj_id}/live?trail=2').get_json()['cars']
+        self.assertEqual([(car['car'], car['entry_id']) for car in cars], [('entry-99', 99), ('auto-7', None)])
+        self.assertEqual(cars[1]['lat'], 52.011)
+        self.assertEqual([point[0] for point in cars[1]['trail']], [1780000009, 1780000010])
+
+        # A failed flush keeps its rows for the next round
+        store = pings.PingStore(store_interval=0, max_pending=3)
+        store.add(vj_id, [('a', None, float(t), 52.0, 5.0, None) for t in range(5)])
+        self.assertEqual(store.snapshot_stats()['dropped'], 2)
+        broken = sqlite3.connect(':memory:')
+        with patch('builtins.print'):
+            self.assertEqual(store.flush(broken), 0)
+        self.assertEqual(store.snapshot_stats()['pending'], 3)
+        pings.install(broken)
+        self.assertEqual(store.flush(broken), 3)
+
+        self.client.post(f'/vossenjachten/delete/{vj_id}')
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM car_pings').fetchone()[0], 0)
+        self.assertEqual(pings._stores[':memory:'].live(vj_id), [])
+
+    # --- Checkpoints ---
+    def test_59_track_arrival_is_the_visit_of_the_last_fox(self):
+        import io
+        import checkpoints
+        db = get_db()
+        vj_id = self._create_vossenjacht("Checkpoint VJ", "time", self._admin_id())
+        step = 0.008993 # About 1 km of latitude
+        self.login()
+        for name, lat, lon in (('Vos 1', 52.0 + 3 * step, 5.0), ('Vos 2 (off route)', 52.05, 5.2),
+                               ('Laatste vos', 52.0 + 9 * step, 5.0003)):
+            response = self.client.post(f'/vossenjachten/{vj_id}/checkpoints',
+                                        data={'name': name, 'lat': str(lat), 'lon': str(lon), 'radius_m': '100'})
+            self.assertEqual(response.status_code, 302)
+        self.assertIn(b'must be numbers', self.client.post(f'/vossenjachten/{vj_id}/checkpoints',
+                                                           data={'name': 'x', 'lat': 'north', 'lon': '5'}).data)
+        page = self.client.get(f'/vossenjachten/{vj_id}/checkpoints')
+        self.assertIn(b'Laatste vos (last fox)', page.data)
+        self.assertTrue(checkpoints.has_rtree(db))
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM checkpoint_rtree').fetchone()[0], 3)
+
+        near = self.client.get(f'/api/vossenjachten/{vj_id}/checkpoints/near?lat={52.0 + 9 * step}&lon=5.0').get_json()
+        self.assertEqual([checkpoint['name'] for checkpoint in near['checkpoints']], ['Laatste vos'])
+        self.assertAlmostEqual(near['checkpoints'][0]['distance_m'], 20.5, delta=1)
+        self.assertEqual(self.client.get(f'/api/vossenjachten/{vj_id}/checkpoints/near?lat=52.5&lon=5').get_json()['checkpoints'], [])
+
+        # 12 km north from 12:10, one point per minute: the last fox is reached at 12:19, the track ends at 12:22
+        gpx = ('<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>' + ''.join(
+            f'<trkpt lat="{52.0 + i * step}" lon="5.0"><time>2026-05-01T12:{10 + i:02d}:00</time></trkpt>'
+            for i in range(13)) + '</trkseg></trk></gpx>').encode()
+        self.client.post('/add_entry', data={'vossenjacht_id': vj_id, 'name': 'Vossenjagers', 'arrival_time_last_fox': '14:00',
+                                             'track': (io.BytesIO(gpx), 'rit.gpx')}, content_type='multipart/form-data')
+        entry = db.execute("SELECT * FROM entries WHERE name = 'Vossenjagers'").fetchone()
+        self.assertEqual((entry['arrival_time_last_fox'], entry['duration_minutes']), ('12:19', 19))
+        track = [52.0 + i * step for i in range(13)]
+        visits = checkpoints.match_track(db, vj_id, track, [5.0] * 13, [60.0 * i for i in range(13)], chunk_points=4)
+        self.assertEqual([(visit['name'], visit['visited_at']) for visit in visits], [('Vos 1', 180.0), ('Laatste vos', 540.0)])
+        # Same answer without the R*Tree
+        self.assertEqual(len(checkpoints.in_box(db, vj_id, 52.0, 52.1, 4.9, 5.1, rtree=False)), 2)
+
+        last_id = checkpoints.for_hunt(db, vj_id)[-1]['id']
+        self.client.post(f'/vossenjachten/{vj_id}/checkpoints/delete/{last_id}')
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM checkpoint_rtree').fetchone()[0], 2)
+        self.client.post(f'/vossenjachten/delete/{vj_id}')
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM checkpoints').fetchone()[0], 0)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM checkpoint_rtree').fetchone()[0], 0)
+
+    # --- Split times ---
+
+    def test_60_checkpoint_standings_from_tracks_and_bulk_splits(self):
+        import io
+        import splits
+        db = get_db()
+        vj_id = self._create_vossenjacht("Splits VJ", "kilometers", self._admin_id())
+        step = 0.008993 # About 1 km of latitude
+        self.login()
+        for name, lat in (('Vos 1', 52.0 + 3 * step), ('Laatste vos', 52.0 + 9 * step)):
+            self.client.post(f'/vossenjachten/{vj_id}/checkpoints', data={'name': name, 'lat': str(lat), 'lon': '5.0', 'radius_m': '100'})
+        first_id, last_id = [checkpoint['id'] for checkpoint in db.execute(
+            'SELECT id FROM checkpoints WHERE vossenjacht_id = ? ORDER BY seq', (vj_id,))]
+
+        # A track stores a split per visited checkpoint: Vos 1 after 3 km at 12:13
+        gpx = ('<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>' + ''.join(
+            f'<trkpt lat="{52.0 + i * step}" lon="5.0"><time>2026-05-01T12:{10 + i:02d}:00</time></trkpt>'
+            for i in range(13)) + '</trkseg></trk></gpx>').encode()
+        self.client.post('/add_entry', data={'vossenjacht_id': vj_id, 'name': 'Spoorzoekers', 'arrival_time_last_fox': '14:00',
+                                             'track': (io.BytesIO(gpx), 'rit.gpx')}, content_type='multipart/form-data')
+        tracked_id = db.execute("SELECT id FROM entries WHERE name = 'Spoorzoekers'").fetchone()['id']
+        self.assertEqual([tuple(row) for row in db.execute(
+            'SELECT checkpoint_id, arrival_minutes, duration_minutes, calculated_km FROM splits WHERE entry_id = ? ORDER BY arrival_minutes',
+            (tracked_id,))], [(first_id, 733, 13, 3), (last_id, 739, 19, 9)])
+
+        # Marshals post the others in bulk; fewest km ranks first, equal scores share a rank
+        self._add_entry(vj_id, 'Snelle Jelle', 20)
+        self._add_entry(vj_id, 'Omweg', 25)
+        ids = {row['name']: row['id'] for row in db.execute('SELECT id, name FROM entries WHERE vossenjacht_id = ?', (vj_id,))}
+        response = self.client.post(f'/api/vossenjachten/{vj_id}/splits', json={'splits': [
+            {'entry_id': ids['Snelle Jelle'], 'checkpoint_id': first_id, 'arrival': '12:20', 'calculated_km': 2},
+            {'entry_id': ids['Omweg'], 'checkpoint_id': first_id, 'arrival': '12:13', 'calculated_km': 3}]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json()['stored'], 2)
+        self.assertEqual(self.client.post(f'/api/vossenjachten/{vj_id}/splits', json={'splits': [
+            {'entry_id': ids['Omweg'], 'checkpoint_id': 999, 'arrival': '12:13', 'calculated_km': 3}]}).status_code, 400)
+        self.assertEqual(self.client.post(f'/api/vossenjachten/{vj_id}/splits', json={'splits': [
+            {'entry_id': ids['Omweg'], 'checkpoint_id': first_id, 'arrival': 'soon', 'calculated_km': 3}]}).status_code, 400)
+
+        standings = self.client.get(f'/api/vossenjachten/{vj_id}/checkpoints/{first_id}/standings').get_json()['standings']
+        self.assertEqual([(row['name'], row['rank'], row['arrival']) for row in standings],
+                         [('Snelle Jelle', 1, '12:20'), ('Omweg', 2, '12:13'), ('Spoorzoekers', 2, '12:13')])
+        page = self.client.get(f'/vossenjachten/{vj_id}/checkpoints/{first_id}/standings')
+        self.assertIn(b'Standings at Vos 1', page.data)
+        self.assertIn(b'Snelle Jelle', page.data)
+        self.assertEqual(self.client.get(f'/vossenjachten/{vj_id}/checkpoints/999/standings').status_code, 404)
+
+        # A later start shortens every split's duration; the cached standings follow
+        self.client.post(f'/vossenjachten/edit/{vj_id}', data={'name': 'Splits VJ', 'type': 'kilometers',
+                                                               'status': 'active', 'start_time': '12:05'})
+        self.assertEqual([row['duration_minutes'] for row in self.client.get(
+            f'/api/vossenjachten/{vj_id}/checkpoints/{first_id}/standings').get_json()['standings']], [15, 8, 8])
+        self.assertEqual(splits.recompute_durations(db, vj_id), 0)
+
+        self.client.post(f'/vossenjachten/{vj_id}/checkpoints/delete/{first_id}')
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM splits WHERE checkpoint_id = ?', (first_id,)).fetchone()[0], 0)
+        self.client.post(f'/delete_entry/{tracked_id}')
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM splits').fetchone()[0], 0)
+
+    # --- Archive with checkpoints ---
+
+    def test_61_archive_keeps_checkpoints_tracks_and_splits(self):
+        import checkpoints
+        db = get_db()
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        self.addCleanup(app.config.update, {'ARCHIVE_DATABASE': app.config['ARCHIVE_DATABASE']})
+        app.config['ARCHIVE_DATABASE'] = os.path.join(tmp_dir, 'archive.db')
+
+        vj_id = self._create_vossenjacht("Oude Vossen", "kilometers", self._admin_id())
+        checkpoint_id = checkpoints.add(db, vj_id, 'Laatste vos', 52.1, 5.1, 75)
+        self.login()
+        self._add_entry(vj_id, 'Archiefjagers', 12)
+        entry_id = db.execute("SELECT id FROM entries WHERE name = 'Archiefjagers'").fetchone()['id']
+        self.client.post(f'/api/vossenjachten/{vj_id}/splits', json={'splits': [
+            {'entry_id': entry_id, 'checkpoint_id': checkpoint_id, 'arrival': '12:40', 'calculated_km': 11.5}]})
+        db.execute("INSERT INTO entry_tracks (entry_id, points, spikes, distance_m, polyline) VALUES (?, 3, 0, 12000, '_p~iF~ps|U')",
+                   (entry_id,))
+        db.execute("UPDATE vossenjachten SET status = 'completed', creation_date = '2024-03-01 10:00:00' WHERE id = ?", (vj_id,))
+        db.commit()
+
+        result = app.test_cli_runner().invoke(args=['archive-hunts', '--before', '2025-01-01'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM main.checkpoints').fetchone()[0], 0)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM checkpoint_rtree').fetchone()[0], 0)
+        archived = sqlite3.connect(app.config['ARCHIVE_DATABASE'])
+        self.addCleanup(archived.close)
+        self.assertEqual(archived.execute('SELECT id, vossenjacht_id, seq, name, radius_m FROM checkpoints').fetchall(),
+                         [(checkpoint_id, vj_id, 1, 'Laatste vos', 75.0)])
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM main.splits').fetchone()[0], 0)
+        self.assertEqual(archived.execute('SELECT entry_id, checkpoint_id, duration_minutes, calculated_km FROM splits').fetchall(),
+                         [(entry_id, checkpoint_id, 40, 11.5)])
+        self.assertEqual(archived.execute('SELECT entry_id, distance_m FROM entry_tracks').fetchall(), [(entry_id, 12000.0)])
+
+    def test_62_checkpoint_changes_invalidate_the_hunt_cache(self):
+        db = get_db()
+        vj_id = self._create_vossenjacht("Cache Vossen", "kilometers", self._admin_id())
+        version = lambda: db.execute('SELECT version FROM hunt_versions WHERE vossenjacht_id = ?', (vj_id,)).fetchone()
+        self.login()
+        self.client.post(f'/vossenjachten/{vj_id}/checkpoints', data={'name': 'Vos', 'lat': '52.1', 'lon': '5.1'})
+        added = version()['version']
+        checkpoint_id = db.execute('SELECT id FROM checkpoints WHERE vossenjacht_id = ?', (vj_id,)).fetchone()['id']
+        self.client.post(f'/vossenjachten/{vj_id}/checkpoints/delete/{checkpoint_id}')
+        self.assertGreater(version()['version'], added)
+
+    # --- Settings listing indexes ---
+
+    def test_63_settings_pages_walk_an_index(self):
+        import listing
+        db = get_db()
+        notnull = {row['name']: row['notnull'] for row in db.execute('PRAGMA table_info(entries)')}
+        self.assertEqual([notnull[column] for column in ('arrival_minutes', 'hunt_rank', 'created_at')], [1, 1, 1])
+        captured = []
+
+        class Capture:
+            def execute(self, sql, params=()):
+                captured.append((sql, params))
+                return db.execute(sql, params)
+
+        for filters, sort, cursor in (({}, 'created', None), ({}, 'created', listing.encode_cursor('2026-01-01 10:00:00', 9)),
+                                      ({'vj_id': 1}, 'rank', None), ({'vj_id': 1}, 'rank', listing.encode_cursor(2, 9))):
+            captured.clear()
+            listing.list_entries(Capture(), filters, sort=sort, direction='asc', after=cursor)
+            plan = ' | '.join(row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + captured[0][0], captured[0][1]))
+            self.assertNotIn('TEMP B-TREE', plan)
+            self.assertIn('idx_entries_created' if sort == 'created' else 'idx_entries_vossenjacht_rank', plan)
+
+    def test_64_migrate_db_makes_listing_columns_not_null(self):
+        from app import migrate_db
+        import checkpoints
+        import splits
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.executescript('''
+            CREATE TABLE vossenjachten (id INTEGER PRIMARY KEY, name TEXT, creation_date TIMESTAMP, creator_id INTEGER,
+                                        status TEXT, type TEXT, start_time TEXT);
+            CREATE TABLE entries (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, start_km REAL NOT NULL,
+                                  end_km REAL NOT NULL, arrival_time_last_fox TEXT NOT NULL, calculated_km REAL NOT NULL,
+                                  duration_minutes INTEGER NOT NULL, vossenjacht_id INTEGER, user_id INTEGER,
+                                  arrival_minutes INTEGER, hunt_rank INTEGER, participant_id INTEGER, created_at TIMESTAMP,
+                                  FOREIGN KEY (vossenjacht_id) REFERENCES vossenjachten (id));
+            INSERT INTO vossenjachten VALUES (1, 'Oud', '2025-05-01 10:00:00', 1, 'completed', 'kilometers', '12:00');
+            INSERT INTO entries (name, start_km, end_km, arrival_time_last_fox, calculated_km, duration_minutes, vossenjacht_id)
+            VALUES ('Team A', 0, 9, '13:00', 9, 60, 1), ('Team B', 0, 5, '13:30', 5, 90, 1), ('Weg', 0, 1, '13:00', 1, 60, 1);
+            DELETE FROM entries WHERE name = 'Weg';
+        ''')
+        checkpoints.install(conn)
+        checkpoints.add(conn, 1, 'Vos', 52.0, 5.0)
+        splits.install(conn)
+        conn.execute('INSERT INTO splits VALUES (1, 1, 1, 760, 40, 4)')
+        conn.commit()
+        migrate_db(conn)
+        conn.commit()
+        rows = conn.execute('SELECT name, arrival_minutes, hunt_rank, created_at FROM entries ORDER BY id').fetchall()
+        self.assertEqual([tuple(row) for row in rows], [('Team A', 780, 2, '2025-05-01 10:00:00'), ('Team B', 810, 1, '2025-05-01 10:00:00')])
+        self.assertTrue(all(row['notnull'] for row in conn.execute('PRAGMA table_info(entries)')
+                            if row['name'] in ('arrival_minutes', 'hunt_rank', 'created_at')))
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM splits').fetchone()[0], 1)
+        self.assertEqual(conn.execute('PRAGMA foreign_keys').fetchone()[0], 1)
+        # Triggers and the id sequence survive the rebuild
+        conn.execute("INSERT INTO entries (name, start_km, end_km, arrival_time_last_fox, calculated_km, duration_minutes, vossenjacht_id)"
+                     " VALUES ('Team C', 0, 3, '14:15', 3, 135, 1)")
+        self.assertEqual(tuple(conn.execute("SELECT id, arrival_minutes FROM entries WHERE name = 'Team C'").fetchone()), (4, 855))
+        conn.close()
+
+    # --- Replica copies ---
+
+    def test_65_replica_copies_a_snapshot_only_in_wal_mode(self):
+        import replica
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        primary_path = os.path.join(tmp_dir, 'primary.db')
+        conn = sqlite3.connect(primary_path)
+        self.addCleanup(conn.close)
+        conn.execute('CREATE TABLE items (value TEXT)')
+        conn.executemany('INSERT INTO items VALUES (?)', [('x' * 200,) for _ in range(2000)])
+        conn.commit()
+        copy = replica.Replica(primary_path, os.path.join(tmp_dir, 'replica.db'), pages=8, sleep=0)
+
+        # A reader mid-transaction keeps the database out of WAL mode: no copy that would block writers
+        conn.execute('BEGIN')
+        conn.execute('SELECT COUNT(*) FROM items').fetchone()
+        with self.assertRaises(sqlite3.OperationalError):
+            copy.refresh()
+        self.assertFalse(copy.is_ready())
+        conn.rollback()
+
+        # Writers keep committing while the copy runs step by step on its snapshot
+        steps = []
+        def write_during_copy(status, remaining, total):
+            steps.append(remaining)
+            if len(steps) == 2:
+                conn.execute("INSERT INTO items VALUES ('during')")
+                conn.commit()
+        copy._pause = write_during_copy
+        copy.refresh()
+        self.assertGreater(len(steps), 2)
+        self.assertTrue(copy.is_ready())
+        replica_conn = copy.connect()
+        self.addCleanup(replica_conn.close)
+        self.assertEqual(replica_conn.execute('SELECT COUNT(*) FROM items').fetchone()[0], 2000)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM items').fetchone()[0], 2001)
+
+    # --- Entries across shards ---
+
+    def test_66_admin_reaches_club_entries_by_hunt_id(self):
+        import shards
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'catalog.db')
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:', 'SHARDING_ENABLED': False,
+                                            'SHARD_DIR': app.config['SHARD_DIR']})
+
+        self.app_context.pop()
+        app.config.update({'DATABASE': db_path, 'SHARDING_ENABLED': True, 'SHARD_DIR': os.path.join(tmp_dir, 'shards')})
+        self.app_context = app.app_context()
+        self.app_context.push()
+        init_db()
+        db = get_db()
+        admin_id = db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                              ('shardadmin', generate_password_hash('pw'), 'admin')).lastrowid
+        db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                   ('zuidmod', generate_password_hash('pw'), 'moderator'))
+        db.commit()
+        main_vj = self._create_vossenjacht("Main VJ", "kilometers", admin_id)
+        shard_path = shards.add_shard(app.config, 'zuid', 'Club Zuid')
+        shards.assign_user(app.config, 'zuidmod', 'zuid')
+        self.app_context.pop()
+
+        self.login(username='zuidmod', password='pw')
+        self.client.post('/vossenjachten/new', data={'name': 'Zuid VJ', 'type': 'kilometers', 'start_time': '12:00'})
+        club_vj = sqlite3.connect(shard_path).execute("SELECT id FROM vossenjachten WHERE name = 'Zuid VJ'").fetchone()[0]
+        self._add_entry(club_vj, 'Team Zuid', 25)
+        self.logout()
+        self.login(username='shardadmin', password='pw')
+        self._add_entry(main_vj, 'Team Main', 30)
+
+        shard = sqlite3.connect(shard_path)
+        catalog = sqlite3.connect(db_path)
+        club_entry = shard.execute("SELECT id FROM entries WHERE name = 'Team Zuid'").fetchone()[0]
+        main_entry = catalog.execute("SELECT id FROM entries WHERE name = 'Team Main'").fetchone()[0]
+        self.assertEqual(club_entry, main_entry) # Entry ids are per shard
+
+        # The admin switches to the club and gets links that name the hunt
+        response = self.client.get('/settings?club=zuid')
+        self.assertIn(b'Team Zuid', response.data)
+        self.assertIn(f'/edit_entry/{club_entry}?vj_id={club_vj}'.encode(), response.data)
+        self.assertIn(b'Team Main', self.client.get('/settings?club=').data)
+
+        # The hunt id routes to the right shard, and must match the entry
+        self.assertEqual(self.client.post(f'/delete_entry/{club_entry}?vj_id={main_vj + 1000}').status_code, 404)
+        self.client.post(f'/edit_entry/{club_entry}?vj_id={club_vj}',
+                         data={'name': 'Team Zuid Edited', 'start_km': '0', 'end_km': '30', 'arrival_time_last_fox': '13:00'})
+        self.assertEqual(shard.execute("SELECT name FROM entries WHERE id = ?", (club_entry,)).fetchone()[0], 'Team Zuid Edited')
+        self.client.post(f'/delete_entry/{club_entry}?vj_id={club_vj}')
+        self.assertEqual(shard.execute("SELECT COUNT(*) FROM entries").fetchone()[0], 0)
+        self.assertEqual(catalog.execute("SELECT name FROM entries WHERE id = ?", (main_entry,)).fetchone()[0], 'Team Main')
+        shard.close()
+        catalog.close()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    # --- Ping ingest checks ---
+
+    def test_67_pings_only_for_active_hunts_of_the_sender(self):
+        import pings
+        self.addCleanup(pings._stores.pop, ':memory:', None)
+        db = get_db()
+        vj_id = self._create_vossenjacht("Ping VJ", "kilometers", self._admin_id())
+        body = {'car': 'auto-1', 'pings': [{'lat': 52.0, 'lon': 5.0, 't': 1780000000}]}
+
+        self.login(username='testmod', password='modpass')
+        self.assertEqual(self.client.post(f'/api/vossenjachten/{vj_id}/pings', json=body).status_code, 403)
+        self.logout()
+        missing = pings.token(app.config['SECRET_KEY'], vj_id + 100)
+        self.assertEqual(self.client.post(f'/api/vossenjachten/{vj_id + 100}/pings', json=body,
+                                          headers={'Authorization': f'Bearer {missing}'}).status_code, 404)
+        headers = {'Authorization': f"Bearer {pings.token(app.config['SECRET_KEY'], vj_id)}"}
+        self.assertEqual(self.client.post(f'/api/vossenjachten/{vj_id}/pings', json=body, headers=headers).status_code, 202)
+
+        db.execute("UPDATE vossenjachten SET status = 'completed' WHERE id = ?", (vj_id,))
+        db.commit()
+        self.assertEqual(self.client.post(f'/api/vossenjachten/{vj_id}/pings', json=body, headers=headers).status_code, 409)
+        self.assertEqual(pings._stores[':memory:'].live(vj_id), []) # Ended elsewhere: dropped on the next ping
+
+        # Cars beyond PINGS_MAX_CARS get no buffer
+        store = pings.PingStore(max_cars=2)
+        store.add(vj_id, [(f'car-{i}', None, 1780000000.0, 52.0, 5.0, None) for i in range(5)])
+        self.assertEqual(sorted(car['car'] for car in store.live(vj_id)), ['car-0', 'car-1'])
+        self.assertEqual(store.snapshot_stats()['rejected'], 3)
+
+    # --- Rank updates and start times ---
+
+    def test_68_ranks_are_stored_in_one_statement_or_row_by_row(self):
+        import scoring
+        db = get_db()
+        vj_id = self._create_vossenjacht("Rank VJ", "time", self._admin_id())
+        for name, km, duration in (('Slow', 10, 90), ('Fast', 30, 40), ('Tie', 30, 40), ('Mid', 5, 60)):
+            db.execute("INSERT INTO entries (name, start_km, end_km, arrival_time_last_fox, calculated_km, duration_minutes,"
+                       " vossenjacht_id) VALUES (?, 0, ?, '13:00', ?, ?, ?)", (name, km, km, duration, vj_id))
+        for update_from in (True, False):
+            with self.subTest(update_from=update_from), patch('scoring._UPDATE_FROM', update_from):
+                db.execute("UPDATE entries SET hunt_rank = 0 WHERE vossenjacht_id = ?", (vj_id,))
+                self.assertEqual(scoring.recompute_hunt_ranks(db, vj_id), 4)
+                ranks = db.execute("SELECT name, hunt_rank FROM entries WHERE vossenjacht_id = ? ORDER BY hunt_rank, name",
+                                   (vj_id,)).fetchall()
+                self.assertEqual([tuple(row) for row in ranks], [('Fast', 1), ('Tie', 1), ('Mid', 2), ('Slow', 3)])
+                self.assertEqual(scoring.recompute_hunt_ranks(db, vj_id), 0) # Nothing moved
+
+    def test_69_no_start_time_is_rejected_instead_of_assumed(self):
+        import splits
+        db = get_db()
+        vj_id = self._create_vossenjacht("No Start VJ", "time", self._admin_id(), start_time=None)
+        entry_id = db.execute("INSERT INTO entries (name, start_km, end_km, arrival_time_last_fox, calculated_km, duration_minutes,"
+                              " vossenjacht_id) VALUES ('Team', 0, 10, '13:00', 10, 60, ?)", (vj_id,)).lastrowid
+        db.commit()
+        self.login()
+        response = self.client.post(f'/edit_entry/{entry_id}?vj_id={vj_id}',
+                                    data={'name': 'Team', 'start_km': '0', 'end_km': '20', 'arrival_time_last_fox': '14:00'})
+        self.assertIn(b'does not have a start time', response.data)
+        self.assertEqual(db.execute("SELECT duration_minutes FROM entries WHERE id = ?", (entry_id,)).fetchone()[0], 60)
+        with self.assertRaises(splits.SplitError):
+            splits.row(entry_id, 1, get_db().execute("SELECT * FROM vossenjachten WHERE id = ?", (vj_id,)).fetchone(), 800, 5)
+
+    # --- Hunt edits and the cache ---
+
+    def test_70_editing_a_hunt_keeps_other_hunts_cached(self):
+        import cache
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'cached.db')
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:'})
+
+        self.app_context.pop()
+        app.config.update({'DATABASE': db_path, 'CACHE_ENABLED': True})
+        self.app_context = app.app_context()
+        self.app_context.push()
+        init_db()
+        db = get_db()
+        admin_id = db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                              ('editadmin', generate_password_hash('pw'), 'admin')).lastrowid
+        db.commit()
+        vj1 = self._create_vossenjacht("Edit VJ 1", "kilometers", admin_id)
+        vj2 = self._create_vossenjacht("Edit VJ 2", "kilometers", admin_id)
+        self.app_context.pop()
+        hunt_cache = cache.get_cache(db_path, app.config)
+        self.addCleanup(hunt_cache.close)
+
+        self.login(username='editadmin', password='pw')
+        self.client.get(f'/results?vj_id={vj1}')
+        self.client.post(f'/vossenjachten/edit/{vj2}', data={'name': 'Edit VJ 2 Renamed', 'type': 'kilometers',
+                                                            'status': 'active', 'start_time': '12:00'})
+        self.assertEqual(sqlite3.connect(db_path).execute("SELECT vossenjacht_id FROM hunt_versions").fetchall(), [(vj2,)])
+        misses = hunt_cache.stats['misses']
+        response = self.client.get(f'/results?vj_id={vj1}')
+        self.assertIn(b'Edit VJ 2 Renamed', response.data) # The dropdown follows the rename
+        self.assertEqual(hunt_cache.stats['misses'], misses + 1) # Only the dropdown was rebuilt, not hunt 1's results
+
+        self.client.post('/vossenjachten/new', data={'name': 'Edit VJ 3', 'type': 'kilometers', 'start_time': '12:00'})
+        self.assertNotIn((cache.ALL_HUNTS,), sqlite3.connect(db_path).execute("SELECT vossenjacht_id FROM hunt_versions").fetchall())
+        self.assertIn(b'Edit VJ 3', self.client.get(f'/results?vj_id={vj1}').data)
+        self.logout()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    # --- Background recalculation ---
+
+    def test_71_recalc_scores_runs_as_a_background_job(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'recalc.db')
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:', 'MAX_ODOMETER_READING': 1000})
+
+        self.app_context.pop()
+        app.config.update({'DATABASE': db_path})
+        self.app_context = app.app_context()
+        self.app_context.push()
+        init_db()
+        db = get_db()
+        admin_id = db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                              ('recalcadmin', generate_password_hash('pw'), 'admin')).lastrowid
+        db.commit()
+        vj_id = self._create_vossenjacht("Recalc VJ", "kilometers", admin_id)
+        db.executemany("INSERT INTO entries (name, start_km, end_km, arrival_time_last_fox, calculated_km, duration_minutes,"
+                       " vossenjacht_id) VALUES (?, 990, 10, '13:00', 20, 60, ?)", [(f'Team {i}', vj_id) for i in range(30)])
+        db.commit()
+        self.app_context.pop()
+
+        app.config.update({'MAX_ODOMETER_READING': 2000})
+        self.login(username='recalcadmin', password='pw')
+        response = self.client.post('/admin/recalc_scores', data={'vj_id': vj_id})
+        self.assertEqual(response.status_code, 302)
+        deadline = time.time() + 10
+        job = self.client.get('/api/purges').get_json()[0]
+        while job['status'] in ('queued', 'running') and time.time() < deadline:
+            time.sleep(0.05)
+            job = self.client.get('/api/purges').get_json()[0]
+        self.assertEqual((job['kind'], job['target'], job['status']), ('recalc_scores', vj_id, 'done'))
+        self.assertEqual((job['total'], job['deleted']), (30, 30)) # Rows processed
+        conn = sqlite3.connect(db_path)
+        self.assertEqual(conn.execute("SELECT DISTINCT calculated_km FROM entries").fetchall(), [(1020,)])
+        conn.close()
+        self.logout()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+    # --- Track precision and hand edits ---
+
+    def test_72_track_km_keeps_tenths_and_hand_edits_drop_the_track(self):
+        import io
+        db = get_db()
+        vj_id = self._create_vossenjacht("Tenths VJ", "time", self._admin_id())
+        step = 0.008993 # About 1 km of latitude
+        self.login()
+        self.client.post(f'/vossenjachten/{vj_id}/checkpoints',
+                         data={'name': 'Vos 1', 'lat': str(52.0 + 2.7 * step), 'lon': '5.0', 'radius_m': '100'})
+        # 5.4 km north from 12:10
+        gpx = ('<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>' + ''.join(
+            f'<trkpt lat="{52.0 + i * step * 0.9}" lon="5.0"><time>2026-05-01T12:{10 + i:02d}:00</time></trkpt>'
+            for i in range(7)) + '</trkseg></trk></gpx>').encode()
+        self.client.post('/add_entry', data={'vossenjacht_id': vj_id, 'name': 'Tienden', 'arrival_time_last_fox': '14:00',
+                                             'track': (io.BytesIO(gpx), 'rit.gpx')}, content_type='multipart/form-data')
+        entry = db.execute("SELECT * FROM entries WHERE name = 'Tienden'").fetchone()
+        self.assertAlmostEqual(entry['end_km'], 5.4, places=1)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM splits WHERE entry_id = ?', (entry['id'],)).fetchone()[0], 1)
+
+        # Renaming keeps the readings, so the track and its split times stay
+        self.client.post(f"/edit_entry/{entry['id']}?vj_id={vj_id}",
+                         data={'name': 'Tienden B', 'start_km': str(entry['start_km']), 'end_km': str(entry['end_km']),
+                               'arrival_time_last_fox': entry['arrival_time_last_fox']})
+        renamed = db.execute("SELECT * FROM entries WHERE id = ?", (entry['id'],)).fetchone()
+        self.assertEqual((renamed['name'], renamed['end_km']), ('Tienden B', entry['end_km']))
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM entry_tracks WHERE entry_id = ?', (entry['id'],)).fetchone()[0], 1)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM splits WHERE entry_id = ?', (entry['id'],)).fetchone()[0], 1)
+
+        self.client.post(f"/edit_entry/{entry['id']}?vj_id={vj_id}",
+                         data={'name': 'Tienden', 'start_km': '100.2', 'end_km': '112.7', 'arrival_time_last_fox': '13:05'})
+        entry = db.execute("SELECT * FROM entries WHERE id = ?", (entry['id'],)).fetchone()
+        self.assertEqual((entry['start_km'], entry['end_km'], entry['duration_minutes']), (100.2, 112.7, 65))
+        self.assertIn("'end_km': 112.7", self.client.get(f"/edit_entry/{entry['id']}?vj_id={vj_id}").get_data(as_text=True))
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM entry_tracks WHERE entry_id = ?', (entry['id'],)).fetchone()[0], 0)
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM splits WHERE entry_id = ?', (entry['id'],)).fetchone()[0], 0)
+
+    # --- Purge progress per user ---
+
+    def test_73_moderators_only_see_their_own_purges(self):
+        mod_id = get_db().execute("SELECT id FROM users WHERE username = 'testmod'").fetchone()['id']
+        mod_vj = self._create_vossenjacht("Mod Purge VJ", "kilometers", mod_id)
+        admin_vj = self._create_vossenjacht("Admin Purge VJ", "kilometers", self._admin_id())
+        self.login()
+        self.client.post(f'/vossenjachten/delete/{admin_vj}')
+        self.logout()
+        self.login(username='testmod', password='modpass')
+        self.client.post(f'/vossenjachten/delete/{mod_vj}')
+        self.assertEqual([job['target'] for job in self.client.get('/api/purges').get_json()], [mod_vj])
+        self.logout()
+        self.login()
+        targets = [job['target'] for job in self.client.get('/api/purges').get_json()]
+        self.assertEqual(targets[:2], [mod_vj, admin_vj])
+
+    def test_74_failing_purge_job_can_be_retried(self):
+        import purge
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'jobs.db')
+        sqlite3.connect(db_path).close()
+        purger = purge.Purger(app)
+        self.addCleanup(purger.stop)
+
+        def broken(db, job):
+            raise ValueError('bad score')
+        failed = purger.submit(purge.PurgeJob('recalc_scores', 1, broken, db_path))
+        for _ in range(100):
+            if failed.finished_at is not None:
+                break
+            time.sleep(0.02)
+        self.assertEqual((failed.status, failed.error), ('failed', 'bad score'))
+
+        retried = purger.submit(purge.PurgeJob('recalc_scores', 1, lambda db, job: 3, db_path))
+        self.assertIsNot(retried, failed)
+        for _ in range(100):
+            if retried.finished_at is not None:
+                break
+            time.sleep(0.02)
+        self.assertEqual((retried.status, retried.deleted), ('done', 3))
+
+    def test_75_convert_vacuum_switches_older_databases(self):
+        import purge
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'old.db')
+        db = sqlite3.connect(db_path)
+        self.addCleanup(db.close)
+        db.execute("CREATE TABLE filler (data TEXT)")
+        db.executemany("INSERT INTO filler VALUES (?)", [('x' * 500,) for _ in range(500)])
+        db.commit()
+        db.execute("DELETE FROM filler")
+        db.commit()
+
+        job = purge.PurgeJob('clear_database', None, lambda db, job: 0, db_path)
+        job.run(db)
+        self.assertEqual((job.status, job.freed_pages), ('done', 0))
+        self.assertIn('--convert-vacuum', job.to_dict()['vacuum_skipped'])
+
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:'})
+        app.config.update({'DATABASE': db_path})
+        result = app.test_cli_runner().invoke(args=['db-maintain', '--force', '--convert-vacuum'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('auto_vacuum switched to INCREMENTAL', result.output)
+        converted = sqlite3.connect(db_path) # Connections read the mode when they open, like the purger's
+        self.addCleanup(converted.close)
+        self.assertTrue(purge.incremental_vacuum_enabled(converted))
+        self.assertEqual(converted.execute('PRAGMA freelist_count').fetchone()[0], 0)
+        job = purge.PurgeJob('clear_database', None, lambda db, job: 0, db_path)
+        job.run(converted)
+        self.assertIsNone(job.vacuum_skipped)
+
+    # --- Settings listing indexes ---
+
+    def test_76_settings_sorts_walk_an_index(self):
+        import listing
+        db = get_db()
+        vj_id = self._create_vossenjacht("Index VJ", "kilometers", self._admin_id())
+        self.login()
+        for i in range(3):
+            self._add_entry(vj_id, f'Index Team {i}', 10 + i)
+
+        class Explained:
+            plans = []
+
+            def execute(self, sql, params=()):
+                self.plans.append(' '.join(row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params)))
+                return db.execute(sql, params)
+        for sort in listing.SORT_COLUMNS:
+            page = listing.list_entries(Explained(), sort=sort, per_page=2)
+            self.assertEqual(len(page['entries']), 2)
+            self.assertEqual(len(listing.list_entries(Explained(), sort=sort, after=page['next_cursor'])['entries']), 1)
+        for plan in Explained.plans:
+            self.assertNotIn('TEMP B-TREE', plan)
+            self.assertIn('USING INDEX idx_entries_', plan)
+
+    def test_77_live_feed_for_organisers_and_dropped_when_a_hunt_ends(self):
+        import pings
+        self.addCleanup(pings._stores.pop, ':memory:', None)
+        vj_id = self._create_vossenjacht("Live End VJ", "kilometers", self._admin_id())
+        headers = {'Authorization': f"Bearer {pings.token(app.config['SECRET_KEY'], vj_id)}"}
+        body = {'car': 'auto-1', 'pings': [{'lat': 52.0, 'lon': 5.0, 't': 1780000000}]}
+        self.assertEqual(self.client.post(f'/api/vossenjachten/{vj_id}/pings', json=body, headers=headers).status_code, 202)
+
+        self.login(username='testmod', password='modpass')
+        self.assertEqual(self.client.get(f'/api/vossenjachten/{vj_id}/live').status_code, 403)
+        self.logout()
+        self.login()
+        self.assertEqual(len(self.client.get(f'/api/vossenjachten/{vj_id}/live').get_json()['cars']), 1)
+
+        store = pings._stores[':memory:']
+        store.add(vj_id, [('auto-2', None, 1780000100.0, 52.1, 5.0, None)]) # Queued, not flushed yet
+        self.client.post(f'/vossenjachten/edit/{vj_id}', data={'name': 'Live End VJ', 'type': 'kilometers',
+                                                              'status': 'completed', 'start_time': '12:00'})
+        self.assertEqual(store.snapshot_stats()['cars'], 0)
+        self.assertEqual(store.snapshot_stats()['pending'], 1) # Still stored on the next flush
+        self.assertEqual(self.client.get(f'/api/vossenjachten/{vj_id}/live').get_json()['cars'], [])
+
+    # --- Memory repository backend ---
+    def test_78_memory_backend_serves_an_event_from_ram(self):
+        import repositories
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, True)
+        db_path = os.path.join(tmp_dir, 'event.db')
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:', 'REPOSITORY_BACKEND': 'sqlite'})
+        self.addCleanup(repositories._stores.pop, db_path, None)
+
+        self.app_context.pop()
+        app.config.update({'DATABASE': db_path})
+        self.app_context = app.app_context()
+        self.app_context.push()
+        init_db()
+        db = get_db()
+        db.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                   ('eventadmin', generate_password_hash('pw'), 'admin'))
+        db.commit()
+        vj_id = self._create_vossenjacht("RAM VJ", "kilometers", db.execute("SELECT id FROM users").fetchone()['id'])
+        self.login(username='eventadmin', password='pw')
+        self._add_entry(vj_id, 'Team Oud', 40) # Stored in SQLite before the switch
+        self.logout()
+        self.app_context.pop()
+
+        app.config['REPOSITORY_BACKEND'] = 'memory'
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.login(username='eventadmin', password='pw')
+        self._add_entry(vj_id, 'Team Snel', 15)
+        self._add_entry(vj_id, 'Team Ook Snel', 15)
+        board = self.client.get(f'/api/leaderboard?vj_id={vj_id}').get_json()
+        self.assertEqual([(e['name'], e['rank']) for e in board['entries']],
+                         [('Team Snel', 1), ('Team Ook Snel', 1), ('Team Oud', 2)])
+        self.assertIn(b'Team Ook Snel', self.client.get(f'/settings?vj_id={vj_id}&sort=km&dir=asc').data)
+
+        # Seasons and hunt edits go through the same store
+        self.client.post('/seasons/new', data={'name': 'RAM Seizoen', 'vossenjacht_ids': [str(vj_id)]})
+        self.assertIn(b'Team Snel', self.client.get('/seasons/1').data)
+        self.client.post(f'/vossenjachten/edit/{vj_id}', data={'name': 'RAM VJ 2', 'type': 'kilometers',
+                                                              'status': 'active', 'start_time': '11:00'})
+        board = self.client.get(f'/api/leaderboard?vj_id={vj_id}').get_json()
+        self.assertEqual(board['vossenjacht']['name'], 'RAM VJ 2')
+        self.assertEqual({e['duration_minutes'] for e in board['entries']}, {120}) # From the new start time
+
+        # Nothing reached the database file; SQLite-only features say so
+        on_disk = sqlite3.connect(db_path)
+        self.addCleanup(on_disk.close)
+        self.assertEqual(on_disk.execute("SELECT name FROM entries").fetchall(), [('Team Oud',)])
+        self.assertEqual(on_disk.execute("SELECT name FROM vossenjachten").fetchall(), [('RAM VJ',)])
+        self.assertEqual(self.client.post(f'/api/vossenjachten/{vj_id}/splits', json={'splits': []}).status_code, 501)
+
+        self.client.post(f'/vossenjachten/delete/{vj_id}')
+        self.assertEqual(self.client.get('/api/leaderboard').get_json()['entries'], [])
+        self.assertEqual(on_disk.execute("SELECT COUNT(*) FROM entries").fetchone()[0], 1)
+
+
+class GroupCommitWriterTests(unittest.TestCase):
+
+    def setUp(self):
+        import writer
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'burst.db')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value INTEGER NOT NULL CHECK (value >= 0))")
+        conn.commit()
+        conn.close()
+        self.writer = writer.GroupCommitWriter(self.db_path, max_batch=50, max_delay=0.01)
+
+    def tearDown(self):
+        self.writer.stop()
+        shutil.rmtree(self.tmp_dir, True)
+
+    def test_burst_is_committed_in_few_batches(self):
+        barrier = threading.Barrier(200)
+        tickets = []
+
+        def submit(value):
+            barrier.wait()
+            tickets.append(self.writer.submit(
+                lambda conn: conn.execute("INSERT INTO items (value) VALUES (?)", (value,)).lastrowid))
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(200)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ids = [ticket.result(timeout=10) for ticket in tickets]
+
+        self.assertEqual(len(set(ids)), 200)
+        self.assertEqual(self.writer.stats['jobs'], 200)
+        self.assertLessEqual(self.writer.stats['batches'], 20)
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM items").fetchone()[0], 200)
+        conn.close()
+
+    def test_failing_job_does_not_abort_its_batch(self):
+        good = self.writer.submit(lambda conn: conn.execute("INSERT INTO items (value) VALUES (1)").lastrowid)
+        bad = self.writer.submit(lambda conn: conn.execute("INSERT INTO items (value) VALUES (-1)").lastrowid)
+        self.assertIsNotNone(good.result(timeout=5))
+        with self.assertRaises(sqlite3.IntegrityError):
+            bad.result(timeout=5)
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM items").fetchone()[0], 1)
+        conn.close()
+
+    def test_timed_out_job_is_never_committed(self):
+        started, release = threading.Event(), threading.Event()
+
+        def slow(conn):
+            started.set()
+            release.wait(5)
+            return conn.execute("INSERT INTO items (value) VALUES (1)").lastrowid
+
+        blocking = self.writer.submit(slow)
+        self.assertTrue(started.wait(5))
+        # Queued behind the running batch; the submitter gives up and resubmits
+        queued = self.writer.submit(lambda conn: conn.execute("INSERT INTO items (value) VALUES (2)").lastrowid)
+        with self.assertRaises(TimeoutError):
+            queued.result(timeout=0.05)
+        release.set()
+        self.assertIsNotNone(blocking.result(timeout=5))
+        retry = self.writer.submit(lambda conn: conn.execute("INSERT INTO items (value) VALUES (2)").lastrowid)
+        self.assertIsNotNone(retry.result(timeout=5))
+
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT value FROM items ORDER BY id").fetchall(), [(1,), (2,)])
+        conn.close()
+        self.assertEqual(self.writer.stats['cancelled_jobs'], 1)
+
+    def test_running_job_is_waited_for_past_the_timeout(self):
+        started = threading.Event()
+
+        def slow(conn):
+            started.set()
+            time.sleep(0.2)
+            return conn.execute("INSERT INTO items (value) VALUES (1)").lastrowid
+
+        ticket = self.writer.submit(slow)
+        self.assertTrue(started.wait(5))
+        # Already part of the transaction: reported as stored rather than failed
+        self.assertIsNotNone(ticket.result(timeout=0.01))
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM items").fetchone()[0], 1)
+        conn.close()
+
+
+class BackupTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'live.db')
+        self.backup_dir = os.path.join(self.tmp_dir, 'backups')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT)")
+        conn.executemany("INSERT INTO items (value) VALUES (?)", [(f'item {i}' * 20,) for i in range(2000)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, True)
+
+    def _count(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_backup_is_stepped_compressed_and_rotated(self):
+        import gzip
+        import backup
+        steps = []
+        for _ in range(3):
+            result = backup.create_backup(self.db_path, self.backup_dir, keep=2, pages=5, sleep=0,
+                                          progress=lambda done, total: steps.append((done, total)))
+        self.assertTrue(result['path'].endswith('.db.gz'))
+        self.assertGreater(len(steps), 3) # Copied in several steps, not all at once
+        self.assertEqual(len(backup.list_backups(self.backup_dir)), 2)
+
+        unpacked = os.path.join(self.tmp_dir, 'unpacked.db')
+        with gzip.open(result['path'], 'rb') as packed, open(unpacked, 'wb') as raw:
+            shutil.copyfileobj(packed, raw)
+        self.assertEqual(self._count(unpacked), 2000)
+
+    def test_backup_and_restore_commands(self):
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:', 'BACKUP_DIR': app.config['BACKUP_DIR']})
+        app.config.update({'DATABASE': self.db_path, 'BACKUP_DIR': self.backup_dir})
+        app_context = app.app_context()
+        app_context.push()
+        self.addCleanup(app_context.pop)
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['backup'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Backup written to', result.output)
+        filename = runner.invoke(args=['backup', '--list']).output.split()[0]
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DELETE FROM items WHERE id > 10")
+        conn.commit()
+        conn.close()
+        self.assertEqual(self._count(self.db_path), 10)
+
+        result = runner.invoke(args=['restore', filename, '--yes'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(self._count(self.db_path), 2000)
+
+    def test_restore_rejects_corrupt_backup(self):
+        import backup
+        corrupt = os.path.join(self.tmp_dir, 'corrupt.db')
+        with open(corrupt, 'wb') as f:
+            f.write(b'not a database' * 100)
+        with self.assertRaises((backup.BackupError, sqlite3.DatabaseError)):
+            backup.restore_backup(corrupt, self.db_path)
+        self.assertEqual(self._count(self.db_path), 2000)
+
+
+
+class RepositoryTests(unittest.TestCase):
+    """The repository scenario the routes rely on, against the SQLite implementation."""
+
+    def _sqlite_repos(self):
+        import app as app_module
+        import repositories
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = sqlite3.Row
+        self.addCleanup(conn.close)
+        conn.executescript(app_module.USERS_SCHEMA_SQL + app_module.HUNT_SCHEMA_SQL)
+        app_module.migrate_db(conn)
+        return repositories.sqlite(conn)
+
+    def _entry(self, vj_id, name, km, duration):
+        return {'name': name, 'start_km': 0, 'end_km': km, 'arrival_time_last_fox': '13:00', 'arrival_minutes': 780,
+                'calculated_km': km, 'duration_minutes': duration, 'vossenjacht_id': vj_id, 'user_id': None,
+                'participant_id': None}
+
+    def test_base_classes_are_abstract(self):
+        import repositories
+        for base in (repositories.EntryRepository, repositories.HuntRepository, repositories.UserRepository,
+                     repositories.ParticipantRepository, repositories.SeasonRepository,
+                     repositories.CheckpointRepository):
+            with self.assertRaises(TypeError):
+                base()
+
+    def _memory_repos(self):
+        import repositories
+        # Loaded from the same schema, like the app does from its database
+        return repositories.memory(repositories.MemoryStore.load(self._sqlite_repos().entries.db))
+
+    def test_sqlite_repositories(self):
+        import scoring
+        repos = self._sqlite_repos()
+        self._repository_scenario(repos, lambda vj_id: scoring.recompute_hunt_ranks(repos.entries.db, vj_id))
+
+    def test_memory_repositories(self):
+        # The memory store ranks on every change
+        self._repository_scenario(self._memory_repos(), lambda vj_id: None)
+
+    def _repository_scenario(self, repos, recompute_ranks):
+        import scoring
+        admin_id = repos.users.add('admin', 'hash', 'admin')
+        self.assertEqual(repos.users.by_username('admin')['role'], 'admin')
+        km_id = repos.hunts.add({'id': None, 'name': 'Km VJ', 'type': 'kilometers', 'creator_id': admin_id,
+                                 'start_time': '12:00', 'start_minutes': 720, 'max_odometer_reading': None})
+        time_id = repos.hunts.add({'id': 50, 'name': 'Tijd VJ', 'type': 'time', 'creator_id': admin_id,
+                                   'start_time': '12:00', 'start_minutes': 720, 'max_odometer_reading': None})
+        self.assertEqual(time_id, 50)
+        self.assertEqual(repos.hunts.get(km_id)['creator_username'], 'admin')
+        self.assertEqual([hunt['name'] for hunt in repos.hunts.names()], ['Km VJ', 'Tijd VJ'])
+
+        slow = repos.entries.add(self._entry(time_id, 'Slow', 10, 90))
+        repos.entries.add(self._entry(time_id, 'Fast', 30, 40))
+        repos.entries.add(self._entry(km_id, 'Short', 5, 60))
+        recompute_ranks(time_id)
+        ranked = scoring.dense_rank(repos.entries.results(time_id), 'time')
+        self.assertEqual([(e['name'], e['rank']) for e in ranked], [('Fast', 1), ('Slow', 2)])
+
+        repos.entries.update(slow, {'duration_minutes': 20})
+        recompute_ranks(time_id)
+        self.assertEqual([e['name'] for e in repos.entries.results(time_id)], ['Slow', 'Fast'])
+        self.assertEqual([e['name'] for e in repos.entries.results()], ['Short', 'Slow', 'Fast'])
+        self.assertEqual(repos.entries.results(km_id)[0]['vossenjacht_name'], 'Km VJ')
+
+        repos.entries.delete(slow)
+        self.assertIsNone(repos.entries.get(slow))
+        repos.hunts.delete(km_id)
+        self.assertIsNone(repos.hunts.get(km_id))
+        self.assertEqual([e['name'] for e in repos.entries.results()], ['Fast'])
+
+    def _event_scenario(self, repos, recompute_ranks):
+        # Hunt edits, participants, seasons and checkpoints as the views use them
+        admin_id = repos.users.add('admin', 'hash', 'admin')
+        self.assertTrue(repos.users.has_role('admin'))
+        self.assertFalse(repos.users.has_role('moderator'))
+        vj_id = repos.hunts.add({'id': None, 'name': 'Tijd VJ', 'type': 'time', 'creator_id': admin_id,
+                                 'start_time': '12:00', 'start_minutes': 720, 'max_odometer_reading': None})
+        participant_id = repos.participants.get_or_create('  Team  Fast ')
+        self.assertEqual(repos.participants.get_or_create('team fast'), participant_id)
+        self.assertIsNone(repos.participants.get_or_create(' '))
+        self.assertEqual(repos.participants.by_name('TEAM FAST')['name'], 'Team Fast')
+        self.assertEqual(repos.participants.get(participant_id)['name'], 'Team Fast')
+        repos.entries.add(dict(self._entry(vj_id, 'Team Fast', 30, 40), participant_id=participant_id))
+        repos.entries.add(dict(self._entry(vj_id, 'Team Slow', 10, 120), arrival_time_last_fox='14:00', arrival_minutes=840))
+        recompute_ranks(vj_id)
+        self.assertEqual([e['hunt_rank'] for e in repos.participants.history(participant_id)], [1])
+
+        # An earlier start makes both durations 60 minutes longer
+        self.assertFalse(repos.hunts.update(vj_id, {'name': 'Tijd VJ 2'}, 999999))
+        self.assertTrue(repos.hunts.update(vj_id, {'start_time': '11:00', 'start_minutes': 660}, 999999))
+        recompute_ranks(vj_id)
+        self.assertEqual([(e['name'], e['duration_minutes']) for e in repos.entries.results(vj_id)],
+                         [('Team Fast', 120), ('Team Slow', 180)])
+        self.assertEqual(repos.hunts.get(vj_id)['name'], 'Tijd VJ 2')
+        self.assertEqual([hunt['name'] for hunt in repos.hunts.overview()], ['Tijd VJ 2'])
+        self.assertEqual([hunt['id'] for hunt in repos.hunts.names(admin_id)], [vj_id])
+        self.assertEqual(list(repos.hunts.names(admin_id + 1)), [])
+
+        season_id = repos.seasons.add('2026', admin_id)
+        repos.seasons.add_hunt(season_id, vj_id)
+        self.assertEqual([hunt['id'] for hunt in repos.seasons.hunts(season_id)], [vj_id])
+        self.assertEqual(repos.seasons.list()[0]['hunt_count'], 1)
+        self.assertEqual([(row['participant_name'], row['points'], row['rank']) for row in repos.seasons.standings(season_id)],
+                         [('Team Fast', 25, 1), ('Team Slow', 18, 2)])
+        repos.seasons.rename(season_id, 'Seizoen 2026')
+        self.assertEqual(repos.seasons.get(season_id)['creator_username'], 'admin')
+        repos.seasons.remove_hunt(season_id, vj_id)
+        self.assertEqual(list(repos.seasons.standings(season_id)), [])
+        repos.seasons.delete(season_id)
+        self.assertIsNone(repos.seasons.get(season_id))
+
+        far = repos.checkpoints.add(vj_id, 'Ver', 52.1, 5.1, 50)
+        near = repos.checkpoints.add(vj_id, 'Dichtbij', 52.0, 5.0, 100)
+        with self.assertRaises(ValueError):
+            repos.checkpoints.add(vj_id, 'Fout', 91, 5.0)
+        self.assertEqual([(c['name'], c['seq']) for c in repos.checkpoints.for_hunt(vj_id)], [('Ver', 1), ('Dichtbij', 2)])
+        self.assertEqual([c['id'] for c in repos.checkpoints.near(vj_id, 52.0003, 5.0)], [near])
+        repos.checkpoints.delete(vj_id, far)
+        self.assertIsNone(repos.checkpoints.get(vj_id, far))
+        self.assertEqual(repos.checkpoints.get(vj_id, near)['name'], 'Dichtbij')
+
+    def test_sqlite_event_repositories(self):
+        import scoring
+        import seasons
+        repos = self._sqlite_repos()
+        def recompute_ranks(vj_id):
+            scoring.recompute_hunt_ranks(repos.entries.db, vj_id)
+            seasons.update_hunt_points(repos.entries.db, vj_id, seasons.DEFAULT_POINTS)
+        self._event_scenario(repos, recompute_ranks)
+
+    def test_memory_event_repositories(self):
+        self._event_scenario(self._memory_repos(), lambda vj_id: None)
+
+    def test_memory_pages_match_sqlite(self):
+        import repositories
+        import scoring
+        sqlite_repos = self._sqlite_repos()
+        admin_id = sqlite_repos.users.add('admin', 'hash', 'admin')
+        hunt_ids = [sqlite_repos.hunts.add({'id': None, 'name': f'VJ {h}', 'type': ('time', 'kilometers')[h % 2],
+                                            'creator_id': admin_id, 'start_time': '12:00', 'start_minutes': 720})
+                    for h in range(3)]
+        for i in range(40):
+            sqlite_repos.entries.add(self._entry(hunt_ids[i % 3], f'Team {i % 7}', (i * 13) % 50, (i * 29) % 90))
+        for vj_id in hunt_ids:
+            scoring.recompute_hunt_ranks(sqlite_repos.entries.db, vj_id)
+        memory_repos = repositories.memory(repositories.MemoryStore.load(sqlite_repos.entries.db))
+
+        def walk(repos, filters, sort, direction):
+            ids, page = [], repos.entries.page(filters, sort=sort, direction=direction, per_page=6)
+            while True:
+                ids.extend((row['id'], row['hunt_rank'], row['vossenjacht_name']) for row in page['entries'])
+                if page['next_cursor'] is None:
+                    return ids, repos.entries.page(filters, sort=sort, direction=direction, per_page=6,
+                                                   before=page['prev_cursor'])['entries'][0]['id']
+                page = repos.entries.page(filters, sort=sort, direction=direction, per_page=6, after=page['next_cursor'])
+
+        for filters, sort, direction in [({}, 'km', 'asc'), ({}, 'duration', 'desc'), ({}, 'created', 'desc'),
+                                         ({'vj_id': hunt_ids[0]}, 'rank', 'asc'), ({}, 'name', 'asc')]:
+            with self.subTest(sort=sort, direction=direction):
+                self.assertEqual(walk(memory_repos, filters, sort, direction), walk(sqlite_repos, filters, sort, direction))
+        self.assertEqual([row['id'] for row in memory_repos.entries.search('team 3')],
+                         [row['id'] for row in sqlite_repos.entries.search('team 3')])
+        self.assertEqual([(row['id'], row['entry_count'], row['best_km']) for row in memory_repos.hunts.page()['vossenjachten']],
+                         [(row['id'], row['entry_count'], row['best_km']) for row in sqlite_repos.hunts.page()['vossenjachten']])
+
+
+class AsyncReadPathTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, True)
+        self.db_path = os.path.join(self.tmp_dir, 'async.db')
+        self.addCleanup(app.config.update, {'DATABASE': ':memory:'})
+        app.config.update({'DATABASE': self.db_path, 'ASYNC_POLL_INTERVAL_MS': 20, 'ASYNC_KEEPALIVE_SECONDS': 5})
+        with app.app_context():
+            init_db()
+            db = get_db()
+            admin_id = db.execute("INSERT INTO users (username, password_hash, role) VALUES ('asyncadmin', 'x', 'admin')").lastrowid
+            self.vj_id = db.execute("INSERT INTO vossenjachten (name, type, creator_id, start_time) VALUES ('Async VJ', 'time', ?, '12:00')",
+                                    (admin_id,)).lastrowid
+            db.commit()
+        self._insert_entry('Team Slow', 90)
+        self._insert_entry('Team Fast', 40)
+
+    def _insert_entry(self, name, duration):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO entries (name, start_km, end_km, arrival_time_last_fox, calculated_km, duration_minutes, vossenjacht_id)"
+                     " VALUES (?, 0, 10, '13:00', 10, ?, ?)", (name, duration, self.vj_id))
+        conn.commit()
+        conn.close()
+
+    async def _get(self, application, path, query=b'', disconnect_after=None):
+        """Run one request through the ASGI app; returns (status, headers, body chunks)."""
+        messages = []
+        disconnect = asyncio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+            chunks = [m for m in messages if m['type'] == 'http.response.body' and m.get('body')]
+            if disconnect_after is not None and len(chunks) >= disconnect_after:
+                disconnect.set()
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'headers': []}
+        await application(scope, receive, send)
+        start = messages[0]
+        return start['status'], dict(start['headers']), [m['body'] for m in messages[1:] if m.get('body')]
+
+    def test_results_and_leaderboard(self):
+        import asgi
+        application = asgi.AsyncReadApp(app)
+        self.addCleanup(application.db.close)
+
+        async def scenario():
+            status, headers, body = await self._get(application, '/results', f'vj_id={self.vj_id}'.encode())
+            self.assertEqual(status, 200)
+            html = b''.join(body)
+            self.assertIn(b'Async VJ', html)
+            self.assertLess(html.index(b'Team Fast'), html.index(b'Team Slow')) # Same ranking as the Flask view
+
+            status, headers, body = await self._get(application, '/api/leaderboard', f'vj_id={self.vj_id}'.encode())
+            board = json.loads(b''.join(body))
+            self.assertEqual([(e['name'], e['rank']) for e in board['entries']], [('Team Fast', 1), ('Team Slow', 2)])
+
+            # A long poll returns once another connection commits
+            poll = asyncio.ensure_future(self._get(application, '/api/leaderboard',
+                                                   f"vj_id={self.vj_id}&since={board['version']}".encode()))
+            await asyncio.sleep(0.1)
+            self.assertFalse(poll.done())
+            await asyncio.get_running_loop().run_in_executor(None, self._insert_entry, 'Team Fastest', 10)
+            status, headers, body = await asyncio.wait_for(poll, 5)
+            board = json.loads(b''.join(body))
+            self.assertEqual(board['entries'][0]['name'], 'Team Fastest')
+
+            status, headers, body = await self._get(application, '/stream/leaderboard',
+                                                    f'vj_id={self.vj_id}'.encode(), disconnect_after=1)
+            self.assertEqual(headers[b'content-type'], b'text/event-stream')
+            self.assertTrue(body[0].startswith(b'id: '))
+            self.assertIn(b'Team Fastest', body[0])
+            self.assertEqual(application.streams, 0)
+            await application.feed.stop()
+
+        asyncio.run(scenario())
+
+    def test_waiters_share_one_leaderboard_per_version(self):
+        import asgi
+        import leaderboard
+        application = asgi.AsyncReadApp(app)
+        self.addCleanup(application.db.close)
+        calls = []
+        build = leaderboard.leaderboard
+
+        def counting(db, vj_id, archive_path):
+            calls.append(vj_id)
+            return build(db, vj_id, archive_path)
+
+        async def scenario():
+            application.feed.start()
+            query = f'vj_id={self.vj_id}&since={application.feed.version}'.encode()
+            polls = [asyncio.ensure_future(self._get(application, '/api/leaderboard', query)) for _ in range(20)]
+            await asyncio.sleep(0.1)
+            await asyncio.get_running_loop().run_in_executor(None, self._insert_entry, 'Team Fastest', 10)
+            bodies = [b''.join(body) for status, headers, body in await asyncio.wait_for(asyncio.gather(*polls), 5)]
+            self.assertEqual(len(set(bodies)), 1)
+            self.assertEqual(json.loads(bodies[0])['entries'][0]['name'], 'Team Fastest')
+            await application.feed.stop()
+
+        with patch('asgi.leaderboard.leaderboard', counting):
+            asyncio.run(scenario())
+        self.assertEqual(calls, [self.vj_id])
 
 if __name__ == '__main__':
     unittest.main()
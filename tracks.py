@@ -0,0 +1,426 @@
+"""Driven distance and arrival time from an uploaded GPS track.
+
+Instead of odometer readings a marshal can upload the team's track as GPX
+(``<trkpt lat lon><time>``) or CSV (columns ``lat``/``latitude``,
+``lon``/``lng``/``longitude`` and optionally ``time``/``timestamp``, ISO 8601
+or Unix seconds). Files are parsed as a stream into flat ``array('d')``
+columns, so a 100k-point track costs a few MB, not a list of objects per
+point. Tracks over ``TRACK_MAX_POINTS`` are refused.
+
+``analyse`` then:
+
+  1. drops GPS spikes: points reached and left faster than
+     ``TRACK_MAX_SPEED_KMH`` (needs timestamps; repeated until none are left)
+  2. simplifies the track (Ramer-Douglas-Peucker, ``TRACK_SIMPLIFY_METERS``),
+     which also removes the jitter of a car standing still
+  3. measures the simplified track with the haversine formula; the arrival
+     time is the time of the last point
+
+With NumPy installed steps 1-3 work on whole coordinate arrays at once;
+without it the same steps run point by point (about ten times slower, see
+``python tracks.py`` for a benchmark). The simplified track is kept as an
+encoded polyline in ``entry_tracks``.
+"""
+import bisect
+import csv
+import io
+import itertools
+import math
+import os
+import time
+import xml.etree.ElementTree as ET
+from array import array
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+except ImportError: # The pure Python path below gives the same results
+    np = None
+
+EARTH_RADIUS_M = 6371008.8
+
+TRACKS_SQL = '''
+    -- Uploaded GPS track of an entry, simplified (see tracks.py)
+    CREATE TABLE IF NOT EXISTS entry_tracks (
+        entry_id INTEGER PRIMARY KEY REFERENCES entries (id) ON DELETE CASCADE,
+        points INTEGER NOT NULL, -- points in the uploaded file
+        spikes INTEGER NOT NULL, -- points dropped as GPS spikes
+        distance_m REAL NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        polyline TEXT NOT NULL -- encoded polyline (precision 1e-5) of the simplified track
+    );
+'''
+
+
+class TrackError(ValueError):
+    pass
+
+
+def init_app(flask_app):
+    config = flask_app.config
+    config.setdefault('TRACK_MAX_POINTS', int(os.environ.get('TRACK_MAX_POINTS', 500000)))
+    config.setdefault('TRACK_MAX_SPEED_KMH', float(os.environ.get('TRACK_MAX_SPEED_KMH', 200)))
+    config.setdefault('TRACK_SIMPLIFY_METERS', float(os.environ.get('TRACK_SIMPLIFY_METERS', 10)))
+
+
+def options_from_config(config):
+    return {
+        'max_speed_kmh': float(config['TRACK_MAX_SPEED_KMH']),
+        'tolerance_m': float(config['TRACK_SIMPLIFY_METERS']),
+    }
+
+
+def install(db):
+    db.executescript(TRACKS_SQL)
+
+
+# --- parsing ---
+
+class Track:
+    """Coordinates in degrees and times in Unix seconds (NaN when the point has none), as flat arrays."""
+
+    def __init__(self):
+        self.lat = array('d')
+        self.lon = array('d')
+        self.times = array('d')
+
+    def __len__(self):
+        return len(self.lat)
+
+    def append(self, lat, lon, timestamp):
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise TrackError(f"Invalid coordinate {lat}, {lon}")
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.times.append(math.nan if timestamp is None else timestamp)
+
+
+def parse_time(value):
+    """ISO 8601 (naive means local time) or Unix seconds; None for an empty value."""
+    value = (value or '').strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    # fromisoformat before Python 3.11 only takes 3 or 6 fractional digits
+    main, dot, rest = value.partition('.')
+    if dot:
+        digits = len(rest) - len(rest.lstrip('0123456789'))
+        value = main + ('.' + rest[:digits].ljust(6, '0')[:6] if digits else '') + rest[digits:]
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise TrackError(f"Invalid time '{value}'") from None
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_gpx(stream, max_points):
+    track = Track()
+    try:
+        for event, element in ET.iterparse(stream, events=('end',)):
+            name = _local_name(element.tag)
+            if name in ('trkpt', 'rtept'):
+                timestamp = None
+                for child in element:
+                    if _local_name(child.tag) == 'time':
+                        timestamp = parse_time(child.text)
+                try:
+                    track.append(float(element.get('lat')), float(element.get('lon')), timestamp)
+                except (TypeError, ValueError):
+                    raise TrackError('Track point without valid lat/lon') from None
+                if len(track) > max_points:
+                    raise TrackError(f"Track has more than {max_points} points")
+                element.clear()
+            elif name in ('trkseg', 'trk', 'rte'):
+                element.clear()
+    except ET.ParseError as e:
+        raise TrackError(f"Invalid GPX: {e}") from None
+    return track
+
+
+def _column(fieldnames, *names):
+    for field in fieldnames:
+        if field.strip().lower() in names:
+            return field
+    return None
+
+
+def parse_csv(stream, max_points):
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    fieldnames = reader.fieldnames or []
+    lat_column = _column(fieldnames, 'lat', 'latitude')
+    lon_column = _column(fieldnames, 'lon', 'lng', 'long', 'longitude')
+    time_column = _column(fieldnames, 'time', 'timestamp', 'datetime')
+    if lat_column is None or lon_column is None:
+        raise TrackError('CSV track needs lat and lon columns')
+    track = Track()
+    for row in reader:
+        try:
+            lat, lon = float(row[lat_column]), float(row[lon_column])
+        except (TypeError, ValueError):
+            raise TrackError(f"Invalid coordinate on line {reader.line_num}") from None
+        track.append(lat, lon, parse_time(row[time_column]) if time_column else None)
+        if len(track) > max_points:
+            raise TrackError(f"Track has more than {max_points} points")
+    return track
+
+
+def parse(stream, filename, max_points=500000):
+    """Parse a GPX or CSV track from a binary stream; the format follows the file extension."""
+    if (filename or '').lower().endswith('.csv'):
+        track = parse_csv(stream, max_points)
+    else:
+        track = parse_gpx(stream, max_points)
+    if len(track) < 2:
+        raise TrackError('Track needs at least two points')
+    return track
+
+
+# --- distance, spikes and simplification ---
+
+def _vectorized(vectorized):
+    # None: use NumPy when it is installed
+    return np is not None if vectorized is None else vectorized
+
+
+def segment_meters(lat, lon, vectorized=None):
+    """Haversine length of each segment between consecutive points."""
+    if _vectorized(vectorized):
+        lat, lon = np.radians(np.asarray(lat)), np.radians(np.asarray(lon))
+        a = (np.sin(np.diff(lat) / 2) ** 2
+             + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2)
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    lengths = array('d')
+    radians, sin, cos = math.radians, math.sin, math.cos
+    previous_lat, previous_lon = radians(lat[0]), radians(lon[0])
+    for i in range(1, len(lat)):
+        phi, lam = radians(lat[i]), radians(lon[i])
+        a = sin((phi - previous_lat) / 2) ** 2 + cos(previous_lat) * cos(phi) * sin((lam - previous_lon) / 2) ** 2
+        lengths.append(2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0))))
+        previous_lat, previous_lon = phi, lam
+    return lengths
+
+
+def spike_mask(lat, lon, times, max_speed_ms, vectorized=None):
+    """True for every inner point that was reached and left faster than max_speed_ms."""
+    lengths = segment_meters(lat, lon, vectorized)
+    if _vectorized(vectorized):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            speeds = lengths / np.diff(np.asarray(times))
+        # Same timestamp twice: any movement counts as too fast
+        speeds = np.where(np.isfinite(speeds), speeds, np.where(lengths > 0, np.inf, 0.0))
+        too_fast = speeds > max_speed_ms
+        mask = np.zeros(len(lat), dtype=bool)
+        mask[1:-1] = too_fast[:-1] & too_fast[1:]
+        return mask
+    too_fast = []
+    for i, length in enumerate(lengths):
+        seconds = times[i + 1] - times[i]
+        too_fast.append(length > max_speed_ms * seconds if seconds > 0 else length > 0)
+    return [False] + [too_fast[i - 1] and too_fast[i] for i in range(1, len(lat) - 1)] + [False]
+
+
+def _select(values, keep, vectorized):
+    if vectorized:
+        return np.asarray(values)[keep]
+    return array('d', (value for value, kept in zip(values, keep) if kept))
+
+
+def drop_spikes(lat, lon, times, max_speed_ms, vectorized=None, max_passes=5):
+    """(lat, lon, times, number dropped) without spikes; a spike of a few points takes a pass per point."""
+    vectorized = _vectorized(vectorized)
+    dropped = 0
+    for _ in range(max_passes):
+        mask = spike_mask(lat, lon, times, max_speed_ms, vectorized)
+        spikes = int(np.count_nonzero(mask)) if vectorized else sum(mask)
+        if not spikes:
+            break
+        keep = ~mask if vectorized else [not spike for spike in mask]
+        lat, lon, times = (_select(values, keep, vectorized) for values in (lat, lon, times))
+        dropped += spikes
+    return lat, lon, times, dropped
+
+
+def _project(lat, lon, vectorized):
+    # Local equirectangular projection in meters, accurate enough over the extent of one hunt
+    lat0 = lat[0]
+    scale = math.pi / 180 * EARTH_RADIUS_M
+    x_scale = scale * math.cos(math.radians(lat0))
+    if vectorized:
+        return (np.asarray(lon) - lon[0]) * x_scale, (np.asarray(lat) - lat0) * scale
+    return ([(value - lon[0]) * x_scale for value in lon], [(value - lat0) * scale for value in lat])
+
+
+def simplify(lat, lon, tolerance_m, vectorized=None):
+    """Indices of the points Ramer-Douglas-Peucker keeps at tolerance_m (first and last always)."""
+    vectorized = _vectorized(vectorized)
+    n = len(lat)
+    if n < 3 or tolerance_m <= 0:
+        return list(range(n))
+    x, y = _project(lat, lon, vectorized)
+    keep = [0, n - 1]
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        chord = math.hypot(dx, dy)
+        if vectorized:
+            px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+            # Distance to the chord, or to its start when the chord has no length (a closed loop)
+            distances = np.abs(dx * py - dy * px) / chord if chord else np.hypot(px, py)
+            offset = int(np.argmax(distances))
+            farthest, distance = first + 1 + offset, float(distances[offset])
+        else:
+            farthest, distance = first, -1.0
+            x0, y0 = x[first], y[first]
+            for i in range(first + 1, last):
+                px, py = x[i] - x0, y[i] - y0
+                d = abs(dx * py - dy * px) / chord if chord else math.hypot(px, py)
+                if d > distance:
+                    farthest, distance = i, d
+        if distance > tolerance_m:
+            keep.append(farthest)
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return sorted(keep)
+
+
+def encode_polyline(lat, lon):
+    """The encoded polyline format (precision 1e-5), a few bytes per point."""
+    chunks = []
+    previous = (0, 0)
+    for point in zip(lat, lon):
+        current = (int(round(point[0] * 1e5)), int(round(point[1] * 1e5)))
+        for value in (current[0] - previous[0], current[1] - previous[1]):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous = current
+    return ''.join(chunks)
+
+
+def analyse(track, max_speed_kmh=200, tolerance_m=10, vectorized=None):
+    """Distance, times and simplified polyline of a parsed track."""
+    vectorized = _vectorized(vectorized)
+    lat, lon, times = track.lat, track.lon, track.times
+    timed = not (np.isnan(np.asarray(times)).any() if vectorized else any(math.isnan(value) for value in times))
+    spikes = 0
+    if timed:
+        lat, lon, times, spikes = drop_spikes(lat, lon, times, max_speed_kmh / 3.6, vectorized)
+    kept = simplify(lat, lon, tolerance_m, vectorized)
+    kept_lat = [float(lat[i]) for i in kept]
+    kept_lon = [float(lon[i]) for i in kept]
+    kept_meters = list(itertools.accumulate(segment_meters(kept_lat, kept_lon, vectorized=False), initial=0.0))
+    return {
+        'points': len(track),
+        'spikes': spikes,
+        'kept_points': len(kept),
+        'distance_m': kept_meters[-1],
+        'started_at': float(times[0]) if timed else None,
+        'finished_at': float(times[-1]) if timed else None,
+        'polyline': encode_polyline(kept_lat, kept_lon),
+        # The spike-free points, for matching against checkpoints (see checkpoints.py); not stored
+        'filtered': (lat, lon, times),
+        'kept': kept,
+        'kept_meters': kept_meters,
+    }
+
+
+def distance_at(result, index):
+    """Meters along the simplified track up to filtered point `index` (e.g. a checkpoint visit)."""
+    lat, lon, _ = result['filtered']
+    j = bisect.bisect_right(result['kept'], index) - 1
+    previous = result['kept'][j]
+    return result['kept_meters'][j] + float(segment_meters([lat[previous], lat[index]], [lon[previous], lon[index]],
+                                                           vectorized=False)[0])
+
+
+def hhmm(seconds):
+    """Local HH:MM of a Unix time."""
+    return datetime.fromtimestamp(seconds).strftime('%H:%M')
+
+
+def arrival_hhmm(result):
+    """Local HH:MM of the last point, or None for tracks without times."""
+    if result['finished_at'] is None:
+        return None
+    return hhmm(result['finished_at'])
+
+
+def save(db, entry_id, result):
+    def iso(seconds):
+        return None if seconds is None else datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+    db.execute(
+        'INSERT OR REPLACE INTO entry_tracks (entry_id, points, spikes, distance_m, started_at, finished_at, polyline)'
+        ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (entry_id, result['points'], result['spikes'], result['distance_m'],
+         iso(result['started_at']), iso(result['finished_at']), result['polyline'])
+    )
+
+
+def delete(db, entry_id):
+    """Drop an entry's track; returns whether it had one."""
+    return db.execute('DELETE FROM entry_tracks WHERE entry_id = ?', (entry_id,)).rowcount > 0
+
+
+def km(distance_m):
+    # Track distances are kept to 0.1 km, like odometer readings
+    return round(distance_m / 1000, 1)
+
+
+# --- benchmark ---
+
+def synthetic_gpx(points, lat=52.09, lon=5.12):
+    """A GPX track of `points` points, one per second at 50 km/h, with jitter and an occasional spike."""
+    started = 1714550400
+    step = 50 / 3.6 / EARTH_RADIUS_M * 180 / math.pi # Degrees of latitude per second at 50 km/h
+    lines = ['<?xml version="1.0"?>',
+             '<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1"><trk><trkseg>']
+    for i in range(points):
+        heading = math.sin(i / 300.0) * 1.5
+        lat += step * math.cos(heading)
+        lon += step * math.sin(heading) / math.cos(math.radians(lat))
+        # A few meters of jitter, and every 5000 points a spike several km off the road
+        jitter = 0.00002 * math.sin(i * 7.3)
+        spike = 0.05 if i % 5000 == 2500 else 0.0
+        stamp = datetime.fromtimestamp(started + i, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        lines.append(f'<trkpt lat="{lat + jitter + spike:.7f}" lon="{lon + jitter:.7f}"><time>{stamp}</time></trkpt>')
+    lines.append('</trkseg></trk></gpx>')
+    return '\n'.join(lines).encode()
+
+
+def benchmark(points=100000, repeat=3):
+    data = synthetic_gpx(points)
+    started = time.perf_counter()
+    track = parse(io.BytesIO(data), 'bench.gpx', max_points=points)
+    parse_seconds = time.perf_counter() - started
+    print(f"{points} points, {len(data) / 1e6:.1f} MB GPX: parsed in {parse_seconds:.2f}s")
+    modes = [False] + ([True] if np is not None else [])
+    for vectorized in modes:
+        best = math.inf
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = analyse(track, vectorized=vectorized)
+            best = min(best, time.perf_counter() - started)
+        print(f"  {'numpy ' if vectorized else 'python'}: analysed in {best:.3f}s,"
+              f" {result['distance_m'] / 1000:.2f} km, {result['spikes']} spikes dropped,"
+              f" {result['kept_points']} points kept, polyline {len(result['polyline'])} bytes")
+    if np is None:
+        print("  numpy is not installed; only the pure Python path was measured")
+
+
+if __name__ == '__main__':
+    import sys
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
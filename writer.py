@@ -0,0 +1,215 @@
+"""Group-commit writer for SQLite.
+
+SQLite allows a single writer at a time and every ``commit()`` costs an
+fsync. During the finish rush all marshals submit entries within a couple of
+minutes, so instead of every request committing on its own, write jobs are
+handed to one writer thread. The thread collects the jobs that arrive within
+a few milliseconds (or up to ``max_batch`` jobs), runs them in a single
+transaction and commits once. Each submitter waits until the transaction
+containing its job is committed, so durability is the same as before.
+
+A submitter that stops waiting (``result(timeout=...)``) withdraws its job if
+the writer hasn't picked it up yet, so a write reported as failed is never
+committed later behind the caller's back; a job that is already running is
+waited for instead.
+"""
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+
+
+class WriteTicket:
+    """Handed back by ``GroupCommitWriter.submit``; ``result()`` blocks until committed."""
+
+    def __init__(self, job):
+        self.job = job
+        self._done = threading.Event()
+        self._value = None
+        self._error = None
+        # None while queued, then 'running' (claimed by the writer) or 'cancelled', whichever comes first
+        self._state = None
+        self._state_lock = threading.Lock()
+
+    def _claim(self):
+        # The writer calls this right before running the job; False when the submitter gave up on it
+        with self._state_lock:
+            if self._state is None:
+                self._state = 'running'
+            return self._state == 'running'
+
+    def cancel(self):
+        """Withdraw a job that hasn't started yet; returns False when the writer already runs it."""
+        with self._state_lock:
+            if self._state is None:
+                self._state = 'cancelled'
+            return self._state == 'cancelled'
+
+    def _resolve(self, value=None, error=None):
+        self._value = value
+        self._error = error
+        self._done.set()
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            if self.cancel():
+                raise TimeoutError('Write was not committed in time')
+            # Too late to withdraw it: the job is part of a transaction that is being written,
+            # so its outcome is near and the caller must hear it instead of resubmitting
+            self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class GroupCommitWriter:
+    def __init__(self, db_path, max_batch=100, max_delay=0.005, busy_timeout=30.0, attach=None):
+        self.db_path = db_path
+        # {schema: path} of databases to attach to the writer connection (e.g. the shard catalog)
+        self.attach = dict(attach or {})
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.busy_timeout = busy_timeout
+        # Called as hook(conn, done) inside the transaction, right before COMMIT,
+        # where done is a list of (job, value) pairs for the jobs that succeeded
+        self.before_commit_hooks = []
+        # Called as hook(done) after a batch has been committed
+        self.after_commit_hooks = []
+        self.stats = {'jobs': 0, 'batches': 0, 'failed_jobs': 0, 'largest_batch': 0, 'cancelled_jobs': 0}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, job):
+        """Queue ``job(conn)`` for the next batch and return a WriteTicket."""
+        if self._stopping:
+            raise RuntimeError('Writer is shutting down')
+        ticket = WriteTicket(job)
+        self._queue.put(ticket)
+        self.start()
+        return ticket
+
+    def stop(self, timeout=5.0):
+        # Pending jobs are still written before the thread exits
+        self._stopping = True
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout,
+                               isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON;")
+        for schema, path in self.attach.items():
+            conn.execute(f'ATTACH DATABASE ? AS {schema}', (path,))
+        return conn
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                ticket = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if ticket is None:
+                self._stopping = True
+                break
+            batch.append(ticket)
+        return batch
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                if self._stopping and self._queue.empty():
+                    break
+                first = self._queue.get()
+                if first is None:
+                    continue
+                self._write_batch(conn, self._collect_batch(first))
+        finally:
+            conn.close()
+
+    def _write_batch(self, conn, batch):
+        results = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for ticket in batch:
+                if not ticket._claim():
+                    # Timed out while queued; its submitter has already reported the failure
+                    self.stats['cancelled_jobs'] += 1
+                    continue
+                # A savepoint per job so one bad submission doesn't fail the whole batch
+                conn.execute('SAVEPOINT job')
+                try:
+                    value = ticket.job(conn)
+                    conn.execute('RELEASE job')
+                    results.append((ticket, value, None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO job')
+                    conn.execute('RELEASE job')
+                    results.append((ticket, None, e))
+            done = [(ticket.job, value) for ticket, value, error in results if error is None]
+            for hook in self.before_commit_hooks:
+                hook(conn, done)
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for ticket in batch:
+                ticket._resolve(error=e)
+            self.stats['failed_jobs'] += sum(1 for ticket in batch if ticket._state != 'cancelled')
+            return
+
+        self.stats['batches'] += 1
+        self.stats['jobs'] += len(results)
+        self.stats['largest_batch'] = max(self.stats['largest_batch'], len(results))
+        for ticket, value, error in results:
+            if error is not None:
+                self.stats['failed_jobs'] += 1
+            ticket._resolve(value, error)
+        for hook in self.after_commit_hooks:
+            try:
+                hook(done)
+            except Exception as e:
+                print(f"Error in writer after-commit hook: {e}")
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(db_path, **options):
+    """Return the process-wide writer for ``db_path``, creating it on first use."""
+    with _writers_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = GroupCommitWriter(db_path, **options)
+            _writers[db_path] = writer
+        return writer
+
+
+def shutdown_writers():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.stop()
+
+
+atexit.register(shutdown_writers)